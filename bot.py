@@ -77,8 +77,8 @@ from core.topics import (
 )
 
 # ============= ИНФРАСТРУКТУРА (из core/) =============
-from core.storage import PostgresStorage
-from core.middleware import MaintenanceMiddleware, LoggingMiddleware, TracingMiddleware
+from core.storage import PostgresStorage, CachedPostgresStorage
+from core.middleware import MaintenanceMiddleware, LoggingMiddleware, TracingMiddleware, FSMSnapshotMiddleware
 
 # ============= СОСТОЯНИЯ FSM (re-exports для обратной совместимости) =============
 from handlers.onboarding import OnboardingStates
@@ -109,6 +109,22 @@ async def main():
     from core.error_handler import setup_error_handler
     await setup_error_handler()
 
+    # Учёт токенов и TTFT Claude API (llm_usage)
+    from core.llm_usage import setup_llm_usage
+    await setup_llm_usage()
+
+    # Трейсы, сессии и last_active_date — в БД пачками
+    from core.telemetry import setup_telemetry
+    await setup_telemetry()
+
+    # Индекс метаданных тем (topics/*.yaml) — до первого запроса
+    from core.helpers import get_topic_index
+    get_topic_index()
+
+    # Локальный BM25-индекс чанков MCP — с диска в отдельном потоке
+    from engines.shared.retrieval import setup_local_index
+    await setup_local_index()
+
     # Создаём bot с transport-layer Markdown→HTML intercept
     from core.safe_bot import SafeBot
     bot = SafeBot(token=BOT_TOKEN)
@@ -152,7 +168,16 @@ async def main():
     from core.dispatcher import Dispatcher as BotDispatcher
     bot_dispatcher = BotDispatcher(state_machine, bot)
 
-    dp = Dispatcher(storage=PostgresStorage())
+    from config.settings import FSM_CACHE_ENABLED
+    storage = CachedPostgresStorage() if FSM_CACHE_ENABLED else PostgresStorage()
+    if FSM_CACHE_ENABLED:
+        logger.info("✅ FSM: write-behind кэш включён")
+    dp = Dispatcher(storage=storage)
+
+    # Снимок fsm_states на апдейт — снаружи FSMContextMiddleware (она первой читает state)
+    dp.update.outer_middleware.unregister(dp.fsm)
+    dp.update.outer_middleware(FSMSnapshotMiddleware())
+    dp.update.outer_middleware(dp.fsm)
 
     # Регистрируем middleware (порядок важен: Maintenance → Logging → Tracing)
     dp.message.middleware(MaintenanceMiddleware())
@@ -302,6 +327,12 @@ async def main():
     try:
         await dp.start_polling(bot)
     finally:
+        # Прерванные задачи job_queue — обратно в очередь
+        # (до закрытия HTTP-сессий: иначе работающие задачи упадут на закрытой
+        # сессии и уйдут в fail_job с потерей попытки вместо release)
+        from core.job_queue import shutdown_job_worker
+        await shutdown_job_worker()
+
         # Закрываем singleton sessions (Claude + MCP)
         from clients.claude import ClaudeClient
         from clients.mcp import MCPClient
@@ -309,6 +340,18 @@ async def main():
         await MCPClient.close_session()
         logger.info("🔒 HTTP sessions закрыты")
 
+        from core.scheduler import close_scheduler_bot
+        await close_scheduler_bot()
+
+        from engines.shared.retrieval import save_local_index
+        await save_local_index()
+
+        from core.llm_usage import shutdown_llm_usage
+        await shutdown_llm_usage()
+
+        from core.telemetry import shutdown_telemetry
+        await shutdown_telemetry()
+
         from core.error_handler import shutdown_error_handler
         await shutdown_error_handler()
         if oauth_runner:
@@ -7,12 +7,20 @@ ClaudeClient - асинхронный клиент для генерации к
 - Генерацию вопросов по уровням сложности (Блум)
 - Генерацию введений к практическим заданиям
 - Интеграцию с MCP для получения контекста
+- Prompt caching: стабильный префикс system prompt помечается cache_control
+- Потоковый вывод: stream() / on_chunk — фрагменты ответа по мере генерации
 """
 
-from typing import Optional, List, Dict, Any, Callable, Awaitable
+from typing import (
+    Optional, List, Dict, Any, Callable, Awaitable, AsyncIterator, NamedTuple, Sequence, Union,
+)
 import asyncio
+import functools
+import hashlib
 import json
 import time
+from contextvars import ContextVar
+from enum import IntEnum
 
 import aiohttp
 
@@ -27,13 +35,21 @@ from config import (
     ONTOLOGY_RULES,
     TELEGRAM_MARKDOWN_RULES,
 )
+from config.settings import (
+    CLAUDE_CONCURRENCY_INITIAL,
+    CLAUDE_CONCURRENCY_MIN,
+    CLAUDE_CONCURRENCY_MAX,
+)
 from core.helpers import (
     get_personalization_prompt,
     load_topic_metadata,
-    get_search_keys,
+    get_topic_search_queries,
     get_bloom_questions,
 )
 from core.knowledge import get_topic_title
+from core.llm_usage import record_llm_usage
+from helpers.adaptive_limiter import AdaptiveLimiter
+from helpers.singleflight import SingleFlight
 from i18n.prompts import (
     get_content_prompts,
     get_practice_prompts,
@@ -43,18 +59,157 @@ from i18n.prompts import (
 
 logger = get_logger(__name__)
 
+# system prompt: строка или список text-блоков (см. cached_system)
+SystemPrompt = Union[str, List[Dict[str, Any]]]
+
+_EPHEMERAL = {"type": "ephemeral"}
+
+class StreamChunk(NamedTuple):
+    """Фрагмент потокового ответа.
+
+    reset=True — выведенный текст раунда оказался преамбулой к tool_use
+    (или попытка оборвалась и повторяется): ответ начнётся заново.
+    """
+    text: str
+    reset: bool = False
+
+
+ChunkCallback = Callable[[StreamChunk], Awaitable[None]]
+
+_STREAM_RESET = StreamChunk("", reset=True)
+
+class Priority(IntEnum):
+    """Полосы лимитера Claude API: меньше — важнее."""
+    INTERACTIVE = 0  # живой пользователь ждёт ответа
+    DELIVERY = 1     # доставка по расписанию
+    PREGEN = 2       # пре-генерация наперёд
+
+
+# Доля лимита, доступная полосе: пре-генерация не займёт больше половины слотов
+_LANE_SHARES = (1.0, 0.8, 0.5)
+
+_priority: ContextVar[Priority] = ContextVar('claude_priority', default=Priority.INTERACTIVE)
+
+
+class claude_priority:
+    """Приоритет вызовов Claude в текущем контексте.
+
+    Usage:
+        with claude_priority(Priority.DELIVERY):
+            await claude.generate(...)
+
+        @claude_priority(Priority.PREGEN)
+        async def pre_generate_upcoming(): ...
+    """
+
+    def __init__(self, priority: Priority):
+        self.priority = priority
+        self._tokens = []
+
+    def __enter__(self):
+        self._tokens.append(_priority.set(self.priority))
+        return self
+
+    def __exit__(self, *exc):
+        _priority.reset(self._tokens.pop())
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with claude_priority(self.priority):
+                return await fn(*args, **kwargs)
+        return wrapper
+
+
+_USAGE_FIELDS = (
+    "input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens",
+)
+
+
+def cached_system(stable: Sequence[str], dynamic: Sequence[str] = ()) -> SystemPrompt:
+    """System prompt для prompt caching: стабильный префикс + персональный суффикс.
+
+    Стабильные сегменты (правила, онтология, знания о боте, методология)
+    идут первыми и помечаются cache_control — Anthropic кэширует префикс
+    до этой точки. Персональные сегменты (имя, профиль, контекст) — после
+    неё, их изменение не сбрасывает кэш. Префикс короче минимума модели
+    (1024 токена Sonnet, 2048 Haiku) API просто не кэширует.
+
+    Args:
+        stable: сегменты, одинаковые для многих пользователей
+        dynamic: сегменты конкретного запроса
+
+    Returns:
+        Список text-блоков для поля "system"
+    """
+    stable_text = "\n\n".join(part for part in stable if part and part.strip())
+    dynamic_text = "\n\n".join(part for part in dynamic if part and part.strip())
+    if not stable_text:
+        return dynamic_text
+    blocks = [{"type": "text", "text": stable_text, "cache_control": _EPHEMERAL}]
+    if dynamic_text:
+        blocks.append({"type": "text", "text": dynamic_text})
+    return blocks
+
+
+def _collect_usage(event: dict, usage: dict) -> None:
+    """Usage из SSE-событий: message_start (вход + кэш) и message_delta (выход)."""
+    event_type = event.get("type")
+    if event_type == "message_start":
+        usage.update(event.get("message", {}).get("usage") or {})
+    elif event_type == "message_delta":
+        usage.update(event.get("usage") or {})
+
+
+def _with_tools_breakpoint(tools: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Копия tools с cache_control на последнем инструменте (кэшируются все)."""
+    if not tools:
+        return tools
+    return [*tools[:-1], {**tools[-1], "cache_control": _EPHEMERAL}]
+
+
+def _with_messages_breakpoint(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Копия диалога с cache_control на последнем блоке последнего сообщения.
+
+    Следующий раунд tool_use читает весь предыдущий диалог из кэша.
+    """
+    if not messages:
+        return messages
+    last = messages[-1]
+    content = last.get("content")
+    if isinstance(content, str):
+        blocks = [{"type": "text", "text": content}]
+    elif isinstance(content, list) and content:
+        blocks = list(content)
+    else:
+        return messages
+    blocks[-1] = {**blocks[-1], "cache_control": _EPHEMERAL}
+    return [*messages[:-1], {**last, "content": blocks}]
+
 
 class ClaudeClient:
     """Клиент для работы с Claude API
 
     Включает:
     - Singleton aiohttp session (переиспользование TCP-соединений)
-    - Semaphore для ограничения concurrent запросов
+    - Адаптивный лимит concurrent запросов (AIMD) с приоритетами Priority
+    - Singleflight: одинаковые одновременные generate() — один запрос к API
     - Retry с exponential backoff (1 retry)
     """
 
-    # Ограничение concurrent запросов к Claude API
-    _semaphore = asyncio.Semaphore(20)
+    # Ограничение concurrent запросов к Claude API: сжимается при 429/529
+    # и росте TTFT, растёт при здоровом API; полосы — Priority
+    _limiter = AdaptiveLimiter(
+        initial=CLAUDE_CONCURRENCY_INITIAL,
+        min_limit=CLAUDE_CONCURRENCY_MIN,
+        max_limit=CLAUDE_CONCURRENCY_MAX,
+        lane_shares=_LANE_SHARES,
+    )
+    # Запросы generate() в полёте по хешу (model, system, user, max_tokens)
+    _inflight = SingleFlight()
+    # Суммарный usage с запуска (для /health: доля входа из prompt cache)
+    _usage_totals: Dict[str, int] = {field: 0 for field in _USAGE_FIELDS}
+    _usage_totals["requests"] = 0
     _session: Optional[aiohttp.ClientSession] = None
 
     def __init__(self):
@@ -81,6 +236,53 @@ class ClaudeClient:
             await cls._session.close()
             cls._session = None
 
+    @classmethod
+    def _record_usage(
+        cls, usage: dict, span_metadata: dict,
+        model: str, feature: str, lang: Optional[str],
+    ) -> None:
+        """Учесть usage одного вызова API.
+
+        Токены суммируются в span (раунды tool_use) и в итоги процесса,
+        TTFT — первого раунда. Строка вызова уходит в llm_usage.
+        """
+        if not any(usage.get(field) for field in _USAGE_FIELDS):
+            return  # вызов не дошёл до ответа API
+        cls._usage_totals["requests"] += 1
+        for field in _USAGE_FIELDS:
+            value = usage.get(field) or 0
+            cls._usage_totals[field] += value
+            span_metadata[field] = span_metadata.get(field, 0) + value
+        if usage.get("ttft_ms") is not None:
+            span_metadata.setdefault("ttft_ms", usage["ttft_ms"])
+        span_metadata["model"] = model
+        span_metadata["feature"] = feature
+        record_llm_usage(feature, model, lang, usage)
+        logger.debug(
+            f"[Claude] usage {feature}: in={usage.get('input_tokens', 0)} "
+            f"cache_read={usage.get('cache_read_input_tokens', 0)} "
+            f"cache_write={usage.get('cache_creation_input_tokens', 0)} "
+            f"out={usage.get('output_tokens', 0)} ttft={usage.get('ttft_ms')}ms"
+        )
+
+    @classmethod
+    def get_limiter_stats(cls) -> dict:
+        """Текущий адаптивный лимит, занятые слоты и очередь по полосам."""
+        return cls._limiter.stats()
+
+    @classmethod
+    def get_prompt_cache_stats(cls) -> dict:
+        """Токены входа с запуска: обычные / прочитанные из кэша / записанные в кэш."""
+        totals = dict(cls._usage_totals)
+        prompt_total = (
+            totals["input_tokens"] + totals["cache_read_input_tokens"]
+            + totals["cache_creation_input_tokens"]
+        )
+        totals["cache_hit_ratio"] = (
+            totals["cache_read_input_tokens"] / prompt_total if prompt_total else 0.0
+        )
+        return totals
+
     async def _api_call(self, payload: dict, timeout: float = 45) -> Optional[dict]:
         """Non-streaming API call (used by generate_with_tools).
 
@@ -101,6 +303,7 @@ class ClaudeClient:
                     if resp.status == 200:
                         return await resp.json()
                     elif resp.status == 429:
+                        self._limiter.on_overload()
                         retry_after = float(resp.headers.get("retry-after", 2 ** (attempt + 1)))
                         logger.warning(f"Claude API rate limit (429), retry after {retry_after}s")
                         if attempt == 0:
@@ -108,6 +311,7 @@ class ClaudeClient:
                             continue
                         return None
                     elif resp.status == 529:
+                        self._limiter.on_overload()
                         logger.warning(f"Claude API overloaded (529), attempt {attempt + 1}")
                         if attempt == 0:
                             await asyncio.sleep(2 ** (attempt + 1))
@@ -132,7 +336,8 @@ class ClaudeClient:
         return None
 
     async def _api_call_streaming(
-        self, payload: dict, inactivity_timeout: float = 15, allow_partial: bool = True
+        self, payload: dict, inactivity_timeout: float = 15, allow_partial: bool = True,
+        usage: Optional[dict] = None, on_chunk: Optional[ChunkCallback] = None,
     ) -> Optional[str]:
         """Streaming API call with inactivity timeout.
 
@@ -147,15 +352,28 @@ class ClaudeClient:
                 truncated text. Use False for pre-generated content (lessons)
                 where partial = broken UX. Use True (default) for real-time
                 responses where partial > nothing.
+            usage: если передан — заполняется usage из message_start/message_delta
+                (input_tokens, cache_read_input_tokens, cache_creation_input_tokens,
+                output_tokens) и ttft_ms — время до первого токена текста
+            on_chunk: вызывается на каждый фрагмент текста по мере прихода
         """
         session = await self.get_session()
         headers = {"x-api-key": self.api_key}
         payload = {**payload, "stream": True}
 
-        # Accumulate text across retry attempts — don't lose partial content
+        # Текст текущей попытки; частичный ответ прошлой — запасной вариант,
+        # если и повтор оборвётся (повтор генерирует ответ заново — не склеиваем)
         collected_text: list[str] = []
+        fallback_text = ''
 
         for attempt in range(2):
+            if attempt and collected_text:
+                if on_chunk:
+                    await on_chunk(_STREAM_RESET)
+                fallback_text = ''.join(collected_text)
+                collected_text = []
+            # TTFT — от начала попытки: пауза retry-after после 429/529 не латентность API
+            started = time.perf_counter()
             try:
                 async with session.post(
                     self.base_url,
@@ -182,12 +400,20 @@ class ClaudeClient:
                                 event = json.loads(data_str)
                             except json.JSONDecodeError:
                                 continue
-                            if event.get('type') == 'content_block_delta':
+                            event_type = event.get('type')
+                            if event_type == 'content_block_delta':
                                 delta = event.get('delta', {})
                                 if delta.get('type') == 'text_delta':
+                                    if usage is not None and not collected_text:
+                                        usage['ttft_ms'] = round((time.perf_counter() - started) * 1000, 1)
                                     collected_text.append(delta['text'])
+                                    if on_chunk:
+                                        await on_chunk(StreamChunk(delta['text']))
+                            elif usage is not None:
+                                _collect_usage(event, usage)
                         return ''.join(collected_text) if collected_text else None
                     elif resp.status == 429:
+                        self._limiter.on_overload()
                         retry_after = float(resp.headers.get("retry-after", 2 ** (attempt + 1)))
                         logger.warning(f"Claude API rate limit (429), retry after {retry_after}s")
                         if attempt == 0:
@@ -195,6 +421,7 @@ class ClaudeClient:
                             continue
                         return None
                     elif resp.status == 529:
+                        self._limiter.on_overload()
                         logger.warning(f"Claude API overloaded (529), attempt {attempt + 1}")
                         if attempt == 0:
                             await asyncio.sleep(2 ** (attempt + 1))
@@ -216,8 +443,8 @@ class ClaudeClient:
                     await asyncio.sleep(1)
                     continue
                 # Both attempts failed — return partial content if allowed
-                if collected_text:
-                    partial = ''.join(collected_text)
+                partial = max(''.join(collected_text), fallback_text, key=len)
+                if partial:
                     logger.error(
                         f"Streaming partial content ({len(partial)} chars) after "
                         f"timeout — {'returning' if allow_partial else 'discarding'}"
@@ -230,8 +457,8 @@ class ClaudeClient:
                     await asyncio.sleep(1)
                     continue
                 # Return partial content on connection error (if allowed)
-                if collected_text:
-                    partial = ''.join(collected_text)
+                partial = max(''.join(collected_text), fallback_text, key=len)
+                if partial:
                     logger.error(
                         f"Streaming partial content ({len(partial)} chars) after "
                         f"connection error — {'returning' if allow_partial else 'discarding'}"
@@ -240,7 +467,10 @@ class ClaudeClient:
                 return None
         return None
 
-    async def _api_call_streaming_full(self, payload: dict, inactivity_timeout: float = 15) -> Optional[dict]:
+    async def _api_call_streaming_full(
+        self, payload: dict, inactivity_timeout: float = 15,
+        on_chunk: Optional[ChunkCallback] = None,
+    ) -> Optional[dict]:
         """Streaming API call returning full response dict (like _api_call).
 
         Handles both text and tool_use content blocks via SSE.
@@ -250,20 +480,38 @@ class ClaudeClient:
         On timeout: preserves already-received blocks and returns them
         (partial content is better than no content).
 
+        on_chunk получает текст по мере прихода; начало блока tool_use
+        сбрасывает выведенный текст раунда (это преамбула, не ответ).
+
         Returns:
-            dict {"stop_reason": str, "content": list} or None on error
+            dict {"stop_reason": str, "content": list, "usage": dict} or None on error.
+            usage дополняется ttft_ms — время до первого блока ответа.
         """
         session = await self.get_session()
         headers = {"x-api-key": self.api_key}
         payload = {**payload, "stream": True}
 
-        # Accumulate across retry attempts
+        # Блоки текущей попытки; частичные блоки прошлой — запасной вариант
+        # (повтор генерирует ответ заново — не склеиваем с оборванным)
         content_blocks: list[dict] = []
+        fallback_blocks: list[dict] = []
         current_block: Optional[dict] = None
         stop_reason: Optional[str] = None
         input_json_parts: list[str] = []
+        usage: dict = {}
 
         for attempt in range(2):
+            if attempt:
+                if on_chunk:
+                    await on_chunk(_STREAM_RESET)
+                if content_blocks:
+                    fallback_blocks = content_blocks
+                content_blocks = []
+                current_block = None
+                input_json_parts = []
+                usage.pop('ttft_ms', None)
+            # TTFT — от начала попытки: пауза retry-after после 429/529 не латентность API
+            started = time.perf_counter()
             try:
                 async with session.post(
                     self.base_url,
@@ -294,10 +542,13 @@ class ClaudeClient:
                             event_type = event.get('type')
 
                             if event_type == 'content_block_start':
+                                usage.setdefault('ttft_ms', round((time.perf_counter() - started) * 1000, 1))
                                 block = event.get('content_block', {})
                                 if block.get('type') == 'text':
                                     current_block = {"type": "text", "text": ""}
                                 elif block.get('type') == 'tool_use':
+                                    if on_chunk:
+                                        await on_chunk(_STREAM_RESET)
                                     current_block = {
                                         "type": "tool_use",
                                         "id": block.get("id", ""),
@@ -310,6 +561,8 @@ class ClaudeClient:
                                 delta = event.get('delta', {})
                                 if delta.get('type') == 'text_delta' and current_block and current_block['type'] == 'text':
                                     current_block['text'] += delta.get('text', '')
+                                    if on_chunk:
+                                        await on_chunk(StreamChunk(delta.get('text', '')))
                                 elif delta.get('type') == 'input_json_delta' and current_block and current_block['type'] == 'tool_use':
                                     input_json_parts.append(delta.get('partial_json', ''))
 
@@ -328,15 +581,21 @@ class ClaudeClient:
                                 delta = event.get('delta', {})
                                 if 'stop_reason' in delta:
                                     stop_reason = delta['stop_reason']
+                                _collect_usage(event, usage)
+
+                            elif event_type == 'message_start':
+                                _collect_usage(event, usage)
 
                         if content_blocks:
                             return {
                                 "stop_reason": stop_reason or "end_turn",
                                 "content": content_blocks,
+                                "usage": usage,
                             }
                         return None
 
                     elif resp.status == 429:
+                        self._limiter.on_overload()
                         retry_after = float(resp.headers.get("retry-after", 2 ** (attempt + 1)))
                         logger.warning(f"Claude API rate limit (429), retry after {retry_after}s")
                         if attempt == 0:
@@ -344,6 +603,7 @@ class ClaudeClient:
                             continue
                         return None
                     elif resp.status == 529:
+                        self._limiter.on_overload()
                         logger.warning(f"Claude API overloaded (529), attempt {attempt + 1}")
                         if attempt == 0:
                             await asyncio.sleep(2 ** (attempt + 1))
@@ -369,6 +629,7 @@ class ClaudeClient:
                     await asyncio.sleep(1)
                     continue
                 # Return partial blocks if we have text content
+                content_blocks = content_blocks or fallback_blocks
                 if content_blocks:
                     logger.warning(
                         f"Returning partial streaming_full response ({partial_count} blocks)"
@@ -376,6 +637,7 @@ class ClaudeClient:
                     return {
                         "stop_reason": "timeout_partial",
                         "content": content_blocks,
+                        "usage": usage,
                     }
                 return None
             except aiohttp.ClientError as e:
@@ -383,21 +645,26 @@ class ClaudeClient:
                 if attempt == 0:
                     await asyncio.sleep(1)
                     continue
+                content_blocks = content_blocks or fallback_blocks
                 if content_blocks:
                     return {
                         "stop_reason": "error_partial",
                         "content": content_blocks,
+                        "usage": usage,
                     }
                 return None
         return None
 
     async def generate(
         self,
-        system_prompt: str,
+        system_prompt: SystemPrompt,
         user_prompt: str,
         max_tokens: int = 4000,
         model: str = None,
         allow_partial: bool = True,
+        feature: str = "other",
+        lang: Optional[str] = None,
+        on_chunk: Optional[ChunkCallback] = None,
     ) -> Optional[str]:
         """Базовый метод генерации текста через Claude API (streaming).
 
@@ -405,13 +672,17 @@ class ClaudeClient:
         failures on long outputs. Inactivity timeout scales with max_tokens.
 
         Args:
-            system_prompt: системный промпт
+            system_prompt: системный промпт — строка или cached_system(...)
             user_prompt: пользовательский промпт
             max_tokens: максимальное количество токенов ответа
             model: модель Claude (default: CLAUDE_MODEL_SONNET)
             allow_partial: если False — при timeout вернёт None вместо
                 обрезанного текста. Для pre-gen контента (уроки) ставить False,
                 для real-time (консультант) — True.
+            feature: фича-потребитель для учёта токенов и TTFT (llm_usage)
+            lang: язык пользователя (для llm_usage)
+            on_chunk: получать фрагменты текста по мере генерации
+                (такие вызовы не склеиваются с одинаковыми)
 
         Returns:
             Сгенерированный текст или None при ошибке
@@ -424,8 +695,17 @@ class ClaudeClient:
         # ~200 tok/s streaming speed, 15s minimum, scales gently with output size
         inactivity_timeout = max(15, max_tokens / 200)
 
-        async with span("claude.api", max_tokens=max_tokens):
-            async with self._semaphore:
+        # Утренний пик расписания: много пользователей с одной темой/уровнем/языком
+        # одновременно промахиваются мимо кеша — одинаковые запросы склеиваем
+        key = hashlib.sha256(json.dumps(
+            [model, system_prompt, user_prompt, max_tokens, allow_partial],
+            ensure_ascii=False,
+        ).encode('utf-8')).hexdigest()
+
+        usage: dict = {}
+
+        async def _call() -> Optional[str]:
+            async with self._limiter.acquire(_priority.get()):
                 payload = {
                     "model": model,
                     "max_tokens": max_tokens,
@@ -433,21 +713,78 @@ class ClaudeClient:
                     "messages": [{"role": "user", "content": user_prompt}]
                 }
 
-                return await self._api_call_streaming(
+                started = time.perf_counter()
+                result = await self._api_call_streaming(
                     payload,
                     inactivity_timeout=inactivity_timeout,
                     allow_partial=allow_partial,
+                    usage=usage,
+                    on_chunk=on_chunk,
                 )
+                usage["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                if result is not None:
+                    self._limiter.on_success(usage.get("ttft_ms"), model)
+                return result
+
+        async with span("claude.api", max_tokens=max_tokens) as s:
+            if on_chunk:
+                # Фрагменты нужны именно этому вызывающему — без singleflight
+                try:
+                    return await _call()
+                finally:
+                    self._record_usage(usage, s.metadata, model, feature, lang)
+            if key in self._inflight:
+                s.metadata["coalesced"] = True
+                logger.debug(f"[Claude] Coalesced identical request {key[:12]}")
+            try:
+                return await self._inflight.do(key, _call)
+            finally:
+                # Usage есть только у вызова, который реально ходил в API
+                self._record_usage(usage, s.metadata, model, feature, lang)
+
+    async def stream(
+        self,
+        system_prompt: SystemPrompt,
+        user_prompt: str,
+        max_tokens: int = 4000,
+        model: str = None,
+        feature: str = "other",
+        lang: Optional[str] = None,
+    ) -> AsyncIterator[StreamChunk]:
+        """Потоковая генерация: async-итератор фрагментов ответа.
+
+        Usage:
+            async for chunk in claude.stream(system_prompt, user_prompt):
+                ...
+
+        Ошибка генерации пробрасывается после последнего фрагмента.
+        Если потребитель прервал итерацию — запрос к API отменяется.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(self.generate(
+            system_prompt, user_prompt, max_tokens=max_tokens, model=model,
+            feature=feature, lang=lang, on_chunk=queue.put,
+        ))
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while (chunk := await queue.get()) is not None:
+                yield chunk
+            await task
+        finally:
+            task.cancel()
 
     async def generate_with_tools(
         self,
-        system_prompt: str,
+        system_prompt: SystemPrompt,
         messages: List[Dict[str, Any]],
         tools: List[Dict[str, Any]],
         tool_executor: Callable[[str, Dict[str, Any]], Awaitable[str]],
         max_tokens: int = 4000,
         max_tool_rounds: int = 5,
         model: str = None,
+        feature: str = "consultation",
+        lang: Optional[str] = None,
+        on_chunk: Optional[ChunkCallback] = None,
     ) -> Optional[str]:
         """Генерация с поддержкой tool_use (Claude решает когда вызывать tools).
 
@@ -455,12 +792,16 @@ class ClaudeClient:
         до получения финального текстового ответа или исчерпания лимита раундов.
 
         Args:
-            system_prompt: системный промпт
+            system_prompt: системный промпт — строка или cached_system(...)
             messages: история сообщений [{"role": "user"|"assistant", "content": ...}]
             tools: определения инструментов в формате Anthropic API
             tool_executor: async функция (tool_name, tool_input) -> result_str
             max_tokens: максимальное количество токенов ответа
             max_tool_rounds: максимум раундов tool_use (защита от бесконечного цикла)
+            feature: фича-потребитель для учёта токенов и TTFT (llm_usage)
+            lang: язык пользователя (для llm_usage)
+            on_chunk: получать текст ответа по мере генерации (StreamChunk.reset —
+                раунд ушёл в tool_use, выведенный текст не войдёт в ответ)
 
         Returns:
             Финальный текстовый ответ или None при ошибке
@@ -472,25 +813,35 @@ class ClaudeClient:
         # Adaptive inactivity timeout for streaming
         inactivity_timeout = max(15, max_tokens / 200)
 
-        async with span("claude.tool_use", max_tokens=max_tokens, tools=len(tools)):
+        # Prompt caching: tools + system неизменны между раундами,
+        # диалог растёт — кэшируем и его (breakpoint на последнем сообщении)
+        cached_tools = _with_tools_breakpoint(tools)
+
+        async with span("claude.tool_use", max_tokens=max_tokens, tools=len(tools)) as s:
             conversation = list(messages)  # Копируем, чтобы не мутировать оригинал
 
             for round_num in range(max_tool_rounds):
-                async with self._semaphore:
+                async with self._limiter.acquire(_priority.get()):
                     payload = {
                         "model": model,
                         "max_tokens": max_tokens,
                         "system": system_prompt,
-                        "messages": conversation,
-                        "tools": tools,
+                        "messages": _with_messages_breakpoint(conversation),
+                        "tools": cached_tools,
                     }
 
+                    started = time.perf_counter()
                     data = await self._api_call_streaming_full(
-                        payload, inactivity_timeout=inactivity_timeout
+                        payload, inactivity_timeout=inactivity_timeout, on_chunk=on_chunk,
                     )
                     if not data:
                         logger.error(f"Claude API failed (tool_use round {round_num})")
                         return None
+                    self._limiter.on_success(data.get("usage", {}).get("ttft_ms"), f"{model}+tools")
+
+                usage = data.get("usage") or {}
+                usage["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                self._record_usage(usage, s.metadata, model, feature, lang)
 
                 stop_reason = data.get("stop_reason")
                 content_blocks = data.get("content", [])
@@ -570,20 +921,9 @@ class ClaudeClient:
         metadata = load_topic_metadata(topic_id) if topic_id else None
 
         # Используем ключи поиска из метаданных или формируем общий запрос
+        search_keys = get_topic_search_queries(topic, metadata or {})
         if metadata:
-            search_keys = get_search_keys(metadata, "guides_mcp") + get_search_keys(metadata, "knowledge_mcp")
-            # Deduplicate
-            seen = set()
-            unique_keys = []
-            for k in search_keys:
-                if k not in seen:
-                    seen.add(k)
-                    unique_keys.append(k)
-            search_keys = unique_keys
             logger.info(f"Загружены метаданные темы {topic_id}: {len(search_keys)} search keys")
-        else:
-            default_query = f"{topic.get('title')} {topic.get('main_concept')}"
-            search_keys = [default_query]
 
         # Получаем контекст из unified Knowledge MCP
         client = mcp_client or knowledge_client
@@ -657,8 +997,10 @@ class ClaudeClient:
             context_instruction = lp['use_context']
 
         bloom_instr = BLOOM_INSTRUCTION.get(min(bloom, 3), BLOOM_INSTRUCTION[1])
-        system_prompt = f"""Ты — персональный наставник по системному мышлению и личному развитию.
-{get_personalization_prompt(intern)}
+        # Prompt caching: правила одинаковы для (язык, длительность, уровень),
+        # персонализация — в конце, после точки кэширования
+        system_prompt = cached_system(
+            stable=[f"""Ты — персональный наставник по системному мышлению и личному развитию.
 
 {lp['lang_instruction']}
 
@@ -671,12 +1013,9 @@ class ClaudeClient:
 {lp['forbidden_questions']}
 {lp['forbidden_headers']}
 {lp['forbidden_end']}
-{lp['question_later']}
-{context_instruction}
-
-{ONTOLOGY_RULES}
-
-{TELEGRAM_MARKDOWN_RULES}"""
+{lp['question_later']}""", ONTOLOGY_RULES, TELEGRAM_MARKDOWN_RULES],
+            dynamic=[get_personalization_prompt(intern), context_instruction],
+        )
 
         pain_point = topic.get('pain_point', '')
         key_insight = topic.get('key_insight', '')
@@ -704,6 +1043,7 @@ class ClaudeClient:
         result = await self.generate(
             system_prompt, user_prompt, max_tokens=max_tokens, model=model,
             allow_partial=False,  # Lesson: partial = broken UX, better retry
+            feature="content", lang=lang,
         )
         if result:
             return result
@@ -720,7 +1060,7 @@ class ClaudeClient:
         Returns:
             Dict с ключами: intro, task, work_product, examples (все на языке пользователя)
         """
-        from db.queries.cache import cache_get, cache_set
+        from db.queries.cache import cache_get_or_create
 
         # Получаем локализованные промпты из единого модуля
         lang = intern.get('language', 'ru')
@@ -729,10 +1069,6 @@ class ClaudeClient:
         # Кеш per-user: practice персонализирована (имя, профессия, цели)
         chat_id = intern.get('chat_id', '')
         cache_key = f"practice:{topic_id}:{lang}:{chat_id}" if topic_id and chat_id else None
-        if cache_key:
-            cached = await cache_get(cache_key)
-            if cached:
-                return self._parse_practice_response(cached, topic)
         lp = get_practice_prompts(lang)
 
         task_ru = topic.get('task', '')
@@ -740,8 +1076,8 @@ class ClaudeClient:
         wp_examples = topic.get('wp_examples', [])
         wp_examples_text = "\n".join(f"• {ex}" for ex in wp_examples) if wp_examples else ""
 
-        system_prompt = f"""Ты — персональный наставник по системному мышлению.
-{get_personalization_prompt(intern)}
+        system_prompt = cached_system(
+            stable=[f"""Ты — персональный наставник по системному мышлению.
 
 {lp['lang_instruction']}
 
@@ -754,11 +1090,9 @@ class ClaudeClient:
 INTRO: (2-4 предложения)
 TASK: (переведённое задание)
 WORK_PRODUCT: (рабочий продукт)
-EXAMPLES: (примеры, каждый с новой строки начиная с •)
-
-{ONTOLOGY_RULES}
-
-{TELEGRAM_MARKDOWN_RULES}"""
+EXAMPLES: (примеры, каждый с новой строки начиная с •)""", ONTOLOGY_RULES, TELEGRAM_MARKDOWN_RULES],
+            dynamic=[get_personalization_prompt(intern)],
+        )
 
         user_prompt = f"""{lp['task_header']}: {topic.get('title')}
 Concept: {topic.get('main_concept')}
@@ -771,10 +1105,17 @@ Examples:
 
 Translate and adapt everything to the target language."""
 
-        result = await self.generate(
-            system_prompt, user_prompt, model=model,
-            allow_partial=False,  # Practice: partial = broken UX, better retry
-        )
+        async def _generate() -> Optional[str]:
+            return await self.generate(
+                system_prompt, user_prompt, model=model,
+                allow_partial=False,  # Practice: partial = broken UX, better retry
+                feature="practice", lang=lang,
+            )
+
+        if cache_key:
+            result = await cache_get_or_create(cache_key, 'practice', _generate)
+        else:
+            result = await _generate()
 
         if not result:
             # Fallback: возвращаем оригинал на русском
@@ -785,10 +1126,6 @@ Translate and adapt everything to the target language."""
                 'examples': wp_examples_text
             }
 
-        # Сохраняем в кеш
-        if cache_key:
-            await cache_set(cache_key, 'practice', result)
-
         # Парсим ответ
         parsed = {
             'intro': '',
@@ -836,38 +1173,6 @@ Translate and adapt everything to the target language."""
 
         return parsed
 
-    @staticmethod
-    def _parse_practice_response(raw: str, topic: dict) -> dict:
-        """Парсим INTRO/TASK/WORK_PRODUCT/EXAMPLES из сырого ответа Claude."""
-        parsed = {
-            'intro': '',
-            'task': topic.get('task', ''),
-            'work_product': topic.get('work_product', ''),
-            'examples': "\n".join(f"• {ex}" for ex in (topic.get('wp_examples', []) or []))
-        }
-        try:
-            lines = raw.split('\n')
-            current_key = None
-            current_value = []
-            for line in lines:
-                for prefix, key in [('INTRO:', 'intro'), ('TASK:', 'task'),
-                                     ('WORK_PRODUCT:', 'work_product'), ('EXAMPLES:', 'examples')]:
-                    if line.startswith(prefix):
-                        if current_key and current_value:
-                            parsed[current_key] = '\n'.join(current_value).strip()
-                        current_key = key
-                        current_value = [line[len(prefix):].strip()]
-                        break
-                else:
-                    if current_key:
-                        current_value.append(line)
-            if current_key and current_value:
-                parsed[current_key] = '\n'.join(current_value).strip()
-        except Exception as e:
-            logger.warning(f"Error parsing practice intro: {e}")
-            parsed['intro'] = raw
-        return parsed
-
     async def generate_question(self, topic: dict, intern: dict, bloom_level: int = None) -> str:
         """Генерирует вопрос по теме с учётом уровня сложности и метаданных темы
 
@@ -885,7 +1190,7 @@ Translate and adapt everything to the target language."""
         Returns:
             Сгенерированный вопрос
         """
-        from db.queries.cache import cache_get, cache_set
+        from db.queries.cache import cache_get_or_create
 
         # Получаем язык пользователя
         lang = intern.get('language', 'ru')
@@ -902,9 +1207,19 @@ Translate and adapt everything to the target language."""
         topic_id = topic.get('id', '')
         cache_key = f"question:{topic_id}:{level}:{lang}:{occupation}" if topic_id else None
         if cache_key:
-            cached = await cache_get(cache_key)
-            if cached:
-                return cached
+            # Ключ общий для многих пользователей: одновременные промахи → одна генерация
+            result = await cache_get_or_create(
+                cache_key, 'question',
+                lambda: self._generate_question(topic, intern, level, occupation, study_duration),
+            )
+        else:
+            result = await self._generate_question(topic, intern, level, occupation, study_duration)
+        return result or qp['error_generation']
+
+    async def _generate_question(self, topic: dict, intern: dict, level: int,
+                                 occupation: str, study_duration: int) -> Optional[str]:
+        """Генерация вопроса без кеша (см. generate_question)."""
+        topic_id = topic.get('id', '')
 
         # Пробуем загрузить метаданные темы
         metadata = load_topic_metadata(topic_id) if topic_id else None
@@ -956,13 +1271,11 @@ Translate and adapt everything to the target language."""
 
 {qp['output_only_question']}"""
 
-        result = await self.generate(
+        return await self.generate(
             system_prompt, user_prompt,
             allow_partial=False,  # Question: partial = broken UX, better retry
+            feature="question", lang=lang,
         )
-        if result and cache_key:
-            await cache_set(cache_key, 'question', result)
-        return result or qp['error_generation']
 
 
 # Создаём экземпляр клиента
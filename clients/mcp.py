@@ -4,15 +4,24 @@
 MCPClient - универсальный клиент для JSON-RPC взаимодействия с MCP серверами.
 Поддерживает:
 - Knowledge MCP (SYS.017): unified search по Pack + guides + DS
+- Кэш результатов search() (TTL + LRU в памяти, опционально content_cache)
+- Офлайн-снапшот статичных запросов (clients/mcp_snapshot.py)
 """
 
 import json
 import asyncio
-from typing import Optional, List
+import hashlib
+from typing import Optional, List, Tuple
 
 import aiohttp
 
 from config import get_logger, KNOWLEDGE_MCP_URL
+from config.settings import (
+    MCP_CACHE_TTL_SEC, MCP_CACHE_MAX_ENTRIES, MCP_CACHE_MAX_BYTES, MCP_CACHE_PERSIST_DAYS,
+)
+from clients.mcp_snapshot import get_snapshot, normalize_search_key, snapshot_key
+from helpers.singleflight import SingleFlight
+from helpers.ttl_cache import TTLCache
 
 logger = get_logger(__name__)
 
@@ -24,6 +33,8 @@ class MCPClient:
     - Circuit breaker: если сервер недоступен, запросы fail-fast
       без ожидания таймаута. Автоматически восстанавливается через 60 секунд.
     - Singleton aiohttp session (переиспользование TCP-соединений)
+    - Кэш search() по нормализованным (query, limit, source, source_type):
+      одни и те же ключевые слова каталога ищутся для всех пользователей
     """
 
     # Настройки таймаутов и retry
@@ -41,6 +52,13 @@ class MCPClient:
     # Singleton session
     _session: Optional[aiohttp.ClientSession] = None
 
+    # Кэш search(): JSON-строка результатов (копия на каждое чтение — вызывающий
+    # код свободно мутирует dict'ы результатов)
+    _search_cache = TTLCache(maxsize=MCP_CACHE_MAX_ENTRIES, ttl=MCP_CACHE_TTL_SEC,
+                             max_bytes=MCP_CACHE_MAX_BYTES)
+    _search_flight = SingleFlight()
+    _search_stats = {'snapshot_hits': 0, 'hits': 0, 'persisted_hits': 0, 'misses': 0, 'stored': 0}
+
     def __init__(self, url: str, name: str = "MCP"):
         """
         Args:
@@ -201,6 +219,9 @@ class MCPClient:
                      source: str = None, source_type: str = None) -> List[dict]:
         """Семантический поиск по unified Knowledge MCP
 
+        Сначала — офлайн-снапшот (если свежий), затем кэш (MCP_CACHE_TTL_SEC);
+        одновременные одинаковые запросы склеиваются в один вызов сервера.
+
         Args:
             query: поисковый запрос
             limit: максимальное количество результатов
@@ -219,6 +240,68 @@ class MCPClient:
         if source_type:
             args["source_type"] = source_type
 
+        snapshot = get_snapshot()
+        if snapshot is not None and snapshot.server == self.base_url:
+            results = snapshot.lookup(snapshot_key(query, limit, source, source_type))
+            if results is not None:
+                MCPClient._search_stats['snapshot_hits'] += 1
+                return results
+
+        if MCP_CACHE_TTL_SEC <= 0:
+            results, _ = await self._search_remote(args)
+            return results
+
+        key = self._search_key(query, limit, source, source_type)
+        raw = MCPClient._search_cache.get(key)
+        if raw is not None:
+            MCPClient._search_stats['hits'] += 1
+            logger.debug(f"{self.name} search: cache hit for {query[:50]!r}")
+            return json.loads(raw)
+
+        raw = await MCPClient._search_flight.do(key, lambda: self._search_fill(key, args))
+        return json.loads(raw)
+
+    def _search_key(self, query: str, limit: int,
+                    source: Optional[str], source_type: Optional[str]) -> tuple:
+        """Ключ кэша: сервер + нормализованные параметры запроса."""
+        return (self.base_url,) + normalize_search_key(query, limit, source, source_type)
+
+    async def _search_fill(self, key: tuple, args: dict) -> str:
+        """Промах кэша: content_cache (если включён) → сервер. Возвращает JSON."""
+        persist_key = None
+        if MCP_CACHE_PERSIST_DAYS > 0:
+            digest = hashlib.sha256(
+                json.dumps(key, ensure_ascii=False).encode("utf-8")
+            ).hexdigest()[:32]
+            persist_key = f"mcp_search:{digest}"
+            try:
+                from db.queries.cache import cache_get
+                raw = await cache_get(persist_key)
+            except Exception as e:
+                logger.debug(f"{self.name} search: persisted cache unavailable: {e}")
+                raw = None
+            if raw is not None:
+                MCPClient._search_stats['persisted_hits'] += 1
+                self._search_cache.set(key, raw, size=len(raw.encode("utf-8")))
+                return raw
+
+        MCPClient._search_stats['misses'] += 1
+        results, cacheable = await self._search_remote(args)
+        raw = json.dumps(results, ensure_ascii=False)
+        # Пустой ответ может означать сбой/circuit breaker — не запоминаем
+        if cacheable and results:
+            MCPClient._search_stats['stored'] += 1
+            self._search_cache.set(key, raw, size=len(raw.encode("utf-8")))
+            if persist_key:
+                try:
+                    from db.queries.cache import cache_set
+                    await cache_set(persist_key, "mcp_search", raw, ttl_days=MCP_CACHE_PERSIST_DAYS)
+                except Exception as e:
+                    logger.debug(f"{self.name} search: failed to persist cache: {e}")
+        return raw
+
+    async def _search_remote(self, args: dict) -> Tuple[List[dict], bool]:
+        """Вызов search на сервере. Возвращает (результаты, можно ли кэшировать)."""
         result = await self._call("search", args)
         if result and "content" in result:
             for item in result.get("content", []):
@@ -229,12 +312,33 @@ class MCPClient:
                         data = json.loads(raw_text)
                         parsed_count = len(data) if isinstance(data, list) else 1
                         logger.debug(f"{self.name} search: parsed {parsed_count} items")
-                        return data if isinstance(data, list) else [data]
+                        return (data if isinstance(data, list) else [data]), True
                     except json.JSONDecodeError as e:
                         logger.warning(f"{self.name} search: JSON parse error: {e}, returning as text")
-                        return [{"text": raw_text}]
+                        return [{"text": raw_text}], False
         logger.debug(f"{self.name} search: no content in result")
-        return []
+        return [], False
+
+    @classmethod
+    def get_search_cache_stats(cls) -> dict:
+        """Счётчики кэша search() (для /health)."""
+        l1 = cls._search_cache.stats()
+        return {
+            **cls._search_stats,
+            'entries': l1['size'],
+            'bytes': l1['bytes'],
+            'evictions': l1['evictions'],
+            'coalesced': cls._search_flight.coalesced,
+        }
+
+    @classmethod
+    def get_circuit_stats(cls) -> dict:
+        """Состояние circuit breaker по серверам (хост → {open, failures})."""
+        from urllib.parse import urlparse
+        return {
+            urlparse(url).netloc or url: {'open': state['open'], 'failures': state['failures']}
+            for url, state in cls._circuit_state.items()
+        }
 
     async def get_document(self, filename: str, source: str = None) -> Optional[dict]:
         """Получить документ по имени файла
@@ -0,0 +1,317 @@
+"""
+Офлайн-снапшот Knowledge MCP: заранее выполненные поисковые запросы.
+
+Запросы по темам марафона (search_keys из topics/*.yaml) и по каталогу ленты
+(GUIDE_TOPIC_CATALOG) статичны. Их результаты собираются заранее, и
+MCPClient.search() отдаёт их локально — generate_content и
+generate_multi_topic_digest не ходят в сеть.
+
+Формат (KNOWLEDGE_SNAPSHOT_PATH):
+- <path>            — JSONL, одна строка = один запрос с результатами
+- <path>.index.json — {built_at, server, entries: {ключ: [offset, length]}}
+
+JSONL отображается в память (mmap), строка читается по смещению из индекса.
+Снапшот старше KNOWLEDGE_SNAPSHOT_MAX_AGE_HOURS не используется.
+
+Использование:
+    python -m clients.mcp_snapshot build    # пересобрать снапшот
+    python -m clients.mcp_snapshot check    # свежесть и покрытие (exit 1 при проблемах)
+"""
+
+import argparse
+import asyncio
+import json
+import mmap
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+
+from config import get_logger
+from config.settings import KNOWLEDGE_SNAPSHOT_PATH, KNOWLEDGE_SNAPSHOT_MAX_AGE_HOURS
+
+logger = get_logger(__name__)
+
+INDEX_SUFFIX = ".index.json"
+RELOAD_INTERVAL = 60  # секунд между проверками mtime индекса
+
+
+def normalize_search_key(query: str, limit: int,
+                         source: Optional[str] = None, source_type: Optional[str] = None) -> tuple:
+    """Нормализованные параметры search(): регистр и пробелы запроса не важны."""
+    return (
+        " ".join((query or "").lower().split()),
+        int(limit),
+        (source or "").strip().lower() or None,
+        (source_type or "").strip().lower() or None,
+    )
+
+
+def snapshot_key(query: str, limit: int,
+                 source: Optional[str] = None, source_type: Optional[str] = None) -> str:
+    """Ключ записи в индексе снапшота."""
+    return json.dumps(normalize_search_key(query, limit, source, source_type), ensure_ascii=False)
+
+
+def _index_path(path: Path) -> Path:
+    return path.with_name(path.name + INDEX_SUFFIX)
+
+
+class KnowledgeSnapshot:
+    """Снапшот на диске: индекс в памяти, данные через mmap."""
+
+    def __init__(self, path: Path):
+        index = json.loads(_index_path(path).read_text(encoding="utf-8"))
+        self.path = path
+        self.built_at = datetime.fromisoformat(index["built_at"])
+        self.server = index.get("server", "")
+        self._entries = index.get("entries", {})
+        self._mmap = None
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size > 0:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @property
+    def age_hours(self) -> float:
+        return (datetime.now(timezone.utc) - self.built_at).total_seconds() / 3600
+
+    def is_fresh(self, max_age_hours: float = KNOWLEDGE_SNAPSHOT_MAX_AGE_HOURS) -> bool:
+        return self.age_hours <= max_age_hours
+
+    def lookup(self, key: str) -> Optional[List[dict]]:
+        """Результаты запроса или None, если его нет в снапшоте."""
+        entry = self._entries.get(key)
+        if entry is None or self._mmap is None:
+            return None
+        offset, length = entry
+        return json.loads(self._mmap[offset:offset + length])["results"]
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# ═══════════════════════════════════════════════════════════
+# Текущий снапшот процесса
+# ═══════════════════════════════════════════════════════════
+
+_snapshot: Optional[KnowledgeSnapshot] = None
+_loaded_mtime: Optional[float] = None
+_checked_at: Optional[float] = None
+_stale_logged = False
+
+
+def get_snapshot() -> Optional[KnowledgeSnapshot]:
+    """Снапшот, если он есть и свежий. Перечитывается после пересборки."""
+    global _snapshot, _loaded_mtime, _checked_at, _stale_logged
+
+    now = time.monotonic()
+    if _checked_at is None or now - _checked_at >= RELOAD_INTERVAL:
+        _checked_at = now
+        try:
+            mtime = _index_path(KNOWLEDGE_SNAPSHOT_PATH).stat().st_mtime
+        except OSError:
+            mtime = None
+        if mtime != _loaded_mtime:
+            _loaded_mtime = mtime
+            old, _snapshot = _snapshot, None
+            if mtime is not None:
+                try:
+                    _snapshot = KnowledgeSnapshot(KNOWLEDGE_SNAPSHOT_PATH)
+                    _stale_logged = False
+                    logger.info(
+                        f"[Snapshot] Загружен снапшот знаний: {len(_snapshot)} запросов, "
+                        f"собран {_snapshot.built_at:%Y-%m-%d %H:%M} UTC"
+                    )
+                except Exception as e:
+                    logger.warning(f"[Snapshot] Не удалось загрузить {KNOWLEDGE_SNAPSHOT_PATH}: {e}")
+            # lookup() синхронный — старый mmap можно закрыть сразу
+            if old is not None:
+                old.close()
+
+    if _snapshot is None:
+        return None
+    if not _snapshot.is_fresh():
+        if not _stale_logged:
+            _stale_logged = True
+            logger.warning(
+                f"[Snapshot] Снапшот устарел ({_snapshot.age_hours:.0f} ч), поиск идёт в MCP. "
+                f"Обновите: python -m clients.mcp_snapshot build"
+            )
+        return None
+    return _snapshot
+
+
+# ═══════════════════════════════════════════════════════════
+# Сборка и проверка
+# ═══════════════════════════════════════════════════════════
+
+def collect_queries() -> List[dict]:
+    """Статичные запросы — с теми же параметрами, что у вызывающего кода."""
+    from core.helpers import get_topic_search_queries
+    from core.knowledge import load_knowledge_structure
+    from engines.feed.planner import GUIDE_TOPIC_CATALOG
+
+    queries = {}
+
+    def add(query: str, limit: int, source_type: Optional[str] = None) -> None:
+        if query and query.strip():
+            queries.setdefault(snapshot_key(query, limit, None, source_type), {
+                "query": query, "limit": limit, "source": None, "source_type": source_type,
+            })
+
+    topics, _ = load_knowledge_structure()
+    for topic in topics:
+        # ClaudeClient.generate_content
+        for query in get_topic_search_queries(topic)[:4]:
+            add(query, 3)
+
+    for item in GUIDE_TOPIC_CATALOG:
+        # generate_multi_topic_digest: по названию темы
+        add(item["title"], 3, "guides")
+        # generate_topic_content: по ключевым словам темы
+        add(" ".join(item.get("keywords", [])) or item["title"], 4, "guides")
+
+    return list(queries.values())
+
+
+async def build_snapshot(path: Path = KNOWLEDGE_SNAPSHOT_PATH, client=None,
+                         concurrency: int = 4) -> dict:
+    """Выполнить все запросы в MCP и атомарно записать снапшот.
+
+    Returns:
+        {"queries": всего, "stored": записано, "failed": [запросы с ошибкой]}
+    """
+    from clients.mcp import mcp_knowledge
+
+    client = client or mcp_knowledge
+    queries = collect_queries()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(q: dict):
+        args = {"query": q["query"], "limit": q["limit"]}
+        if q["source_type"]:
+            args["source_type"] = q["source_type"]
+        async with semaphore:
+            # Мимо кэша и текущего снапшота — нужны свежие данные сервера
+            results, ok = await client._search_remote(args)
+        return q, results, ok
+
+    done = await asyncio.gather(*(run(q) for q in queries))
+
+    entries = {}
+    failed = []
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_data = path.with_name(path.name + ".tmp")
+    with open(tmp_data, "wb") as f:
+        for q, results, ok in done:
+            if not ok:
+                failed.append(q["query"])
+                continue
+            line = json.dumps({**q, "results": results}, ensure_ascii=False).encode("utf-8")
+            entries[snapshot_key(q["query"], q["limit"], q["source"], q["source_type"])] = [f.tell(), len(line)]
+            f.write(line + b"\n")
+
+    if not entries:
+        tmp_data.unlink()
+        logger.error("[Snapshot] MCP не ответил ни на один запрос, снапшот не изменён")
+        return {"queries": len(queries), "stored": 0, "failed": failed}
+
+    index = {
+        "built_at": datetime.now(timezone.utc).isoformat(),
+        "server": client.base_url,
+        "entries": entries,
+    }
+    tmp_index = _index_path(tmp_data)
+    tmp_index.write_text(json.dumps(index, ensure_ascii=False), encoding="utf-8")
+    # Данные раньше индекса: индекс всегда указывает на уже записанный файл
+    os.replace(tmp_data, path)
+    os.replace(tmp_index, _index_path(path))
+
+    logger.info(f"[Snapshot] Собран снапшот: {len(entries)}/{len(queries)} запросов → {path}")
+    return {"queries": len(queries), "stored": len(entries), "failed": failed}
+
+
+def check_snapshot(path: Path = KNOWLEDGE_SNAPSHOT_PATH,
+                   max_age_hours: float = KNOWLEDGE_SNAPSHOT_MAX_AGE_HOURS) -> List[str]:
+    """Проблемы снапшота: нет файла, устарел, другой сервер, не покрыты запросы."""
+    from config import KNOWLEDGE_MCP_URL
+
+    try:
+        snapshot = KnowledgeSnapshot(path)
+    except FileNotFoundError:
+        return [f"снапшот не найден: {path}"]
+    except Exception as e:
+        return [f"снапшот повреждён: {e}"]
+
+    problems = []
+    try:
+        if not snapshot.is_fresh(max_age_hours):
+            problems.append(f"устарел: {snapshot.age_hours:.0f} ч (допустимо {max_age_hours:.0f} ч)")
+        if snapshot.server != KNOWLEDGE_MCP_URL:
+            problems.append(f"собран для другого сервера: {snapshot.server}")
+        queries = collect_queries()
+        missing = [
+            q["query"] for q in queries
+            if snapshot_key(q["query"], q["limit"], q["source"], q["source_type"]) not in snapshot
+        ]
+        if missing:
+            problems.append(
+                f"не покрыто {len(missing)} из {len(queries)} запросов: "
+                + ", ".join(missing[:5]) + ("…" if len(missing) > 5 else "")
+            )
+    finally:
+        snapshot.close()
+    return problems
+
+
+async def _build_cli(path: Path) -> int:
+    from clients.mcp import MCPClient
+
+    try:
+        report = await build_snapshot(path)
+    finally:
+        await MCPClient.close_session()
+    print(f"Запросов: {report['queries']}, записано: {report['stored']}, ошибок: {len(report['failed'])}")
+    for query in report["failed"]:
+        print(f"  ✗ {query}")
+    return 0 if report["stored"] and not report["failed"] else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline knowledge snapshot (Knowledge MCP)")
+    parser.add_argument("--path", type=Path, default=KNOWLEDGE_SNAPSHOT_PATH, help="Snapshot JSONL path")
+    subparsers = parser.add_subparsers(dest="command", help="Commands")
+
+    subparsers.add_parser("build", help="Run all static queries against MCP and write the snapshot")
+    check_parser = subparsers.add_parser("check", help="Check freshness and coverage")
+    check_parser.add_argument("--max-age-hours", type=float, default=KNOWLEDGE_SNAPSHOT_MAX_AGE_HOURS)
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        sys.exit(asyncio.run(_build_cli(args.path)))
+
+    elif args.command == "check":
+        problems = check_snapshot(args.path, args.max_age_hours)
+        if problems:
+            for problem in problems:
+                print(f"✗ {problem}")
+            sys.exit(1)
+        print("✓ Снапшот свежий и покрывает все запросы")
+
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
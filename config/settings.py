@@ -377,6 +377,118 @@ WP_VALIDATION_ENABLED = os.getenv("WP_VALIDATION_ENABLED", "true").lower() == "t
 # Включить запись фиксаций в fleeting-notes (для GitHub-пользователей)
 FIXATION_ENABLED = os.getenv("FIXATION_ENABLED", "true").lower() == "true"
 
+# ============= FSM CACHE =============
+
+# Write-behind кэш FSM поверх PostgresStorage (чтения из памяти, записи батчами)
+FSM_CACHE_ENABLED = os.getenv("FSM_CACHE_ENABLED", "false").lower() == "true"
+FSM_CACHE_MAX_ENTRIES = int(os.getenv("FSM_CACHE_MAX_ENTRIES", "5000"))  # Размер LRU (чатов)
+FSM_CACHE_FLUSH_MS = int(os.getenv("FSM_CACHE_FLUSH_MS", "200"))  # Окно склейки записей
+FSM_CACHE_TTL_SEC = int(os.getenv("FSM_CACHE_TTL_SEC", "300"))  # Страховка, если LISTEN недоступен
+
+# ============= КЭШ ПРОФИЛЕЙ (interns) =============
+
+# Процессный TTL-кэш get_intern (поверх identity map на время апдейта).
+# Записи через update_intern/update_user_state обновляют кэш сразу;
+# TTL ограничивает устаревание от записей из других процессов. 0 = выключен.
+INTERN_CACHE_TTL_SEC = float(os.getenv("INTERN_CACHE_TTL_SEC", "30"))
+INTERN_CACHE_MAX_ENTRIES = int(os.getenv("INTERN_CACHE_MAX_ENTRIES", "5000"))
+
+# ============= КЭШ КОНТЕНТА (L1 перед content_cache) =============
+
+CONTENT_L1_MAX_ENTRIES = int(os.getenv("CONTENT_L1_MAX_ENTRIES", "2000"))
+CONTENT_L1_MAX_BYTES = int(os.getenv("CONTENT_L1_MAX_BYTES", str(16 * 1024 * 1024)))  # 16 MB
+CONTENT_L1_TTL_SEC = float(os.getenv("CONTENT_L1_TTL_SEC", "900"))
+CONTENT_L1_NEGATIVE_TTL_SEC = float(os.getenv("CONTENT_L1_NEGATIVE_TTL_SEC", "30"))  # «в L2 нет»
+
+# ============= КЭШ ПОИСКА MCP =============
+
+MCP_CACHE_TTL_SEC = float(os.getenv("MCP_CACHE_TTL_SEC", "3600"))  # 0 = кэш выключен
+MCP_CACHE_MAX_ENTRIES = int(os.getenv("MCP_CACHE_MAX_ENTRIES", "2000"))
+MCP_CACHE_MAX_BYTES = int(os.getenv("MCP_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))  # 32 MB
+# Хранить результаты и в content_cache (переживают рестарт); 0 = только память
+MCP_CACHE_PERSIST_DAYS = int(os.getenv("MCP_CACHE_PERSIST_DAYS", "0"))
+
+# ============= СНАПШОТ ЗНАНИЙ (offline MCP) =============
+# Заранее выполненные запросы по темам марафона и каталогу ленты
+# (python -m clients.mcp_snapshot build). Нет файла — поиск идёт в сеть.
+
+KNOWLEDGE_SNAPSHOT_PATH = Path(os.getenv("KNOWLEDGE_SNAPSHOT_PATH", str(BASE_DIR / "data" / "knowledge_snapshot.jsonl")))
+KNOWLEDGE_SNAPSHOT_MAX_AGE_HOURS = float(os.getenv("KNOWLEDGE_SNAPSHOT_MAX_AGE_HOURS", "168"))  # старше — не используется
+
+# ============= ЛОКАЛЬНЫЙ BM25-ИНДЕКС (fallback при недоступном MCP) =============
+
+LOCAL_INDEX_ENABLED = os.getenv("LOCAL_INDEX_ENABLED", "true").lower() == "true"
+LOCAL_INDEX_PATH = Path(os.getenv("LOCAL_INDEX_PATH", str(BASE_DIR / "data" / "local_bm25.json")))
+LOCAL_INDEX_MAX_DOCS = int(os.getenv("LOCAL_INDEX_MAX_DOCS", "20000"))
+LOCAL_INDEX_SAVE_INTERVAL_SEC = float(os.getenv("LOCAL_INDEX_SAVE_INTERVAL_SEC", "300"))
+
+# ============= ИНДЕКС МЕТАДАННЫХ ТЕМ (topics/*.yaml) =============
+
+TOPIC_INDEX_CACHE_PATH = Path(os.getenv("TOPIC_INDEX_CACHE_PATH", str(BASE_DIR / "data" / "topic_index.pickle")))
+TOPIC_INDEX_CHECK_SEC = float(os.getenv("TOPIC_INDEX_CHECK_SEC", "30"))  # как часто проверять изменения файлов
+
+# ============= БУФЕР ТЕЛЕМЕТРИИ (трейсы, сессии, last_active) =============
+
+TELEMETRY_FLUSH_INTERVAL_MS = int(os.getenv("TELEMETRY_FLUSH_INTERVAL_MS", "1000"))
+TELEMETRY_BATCH_SIZE = int(os.getenv("TELEMETRY_BATCH_SIZE", "500"))      # трейсов — выгрузить досрочно
+TELEMETRY_MAX_TRACES = int(os.getenv("TELEMETRY_MAX_TRACES", "20000"))    # больше — отбрасывать
+TELEMETRY_MAX_USERS = int(os.getenv("TELEMETRY_MAX_USERS", "20000"))     # открытых сессий
+SESSION_CHECKPOINT_SEC = float(os.getenv("SESSION_CHECKPOINT_SEC", "300"))  # запись открытых сессий
+
+# ============= МЕТРИКИ (/metrics, Prometheus) =============
+# Отдаются OAuth-сервером (oauth_server.py) на OAUTH_SERVER_PORT.
+# Нужен заголовок "Authorization: Bearer <METRICS_TOKEN>"; без METRICS_TOKEN
+# эндпоинт выключен (404) — сервер публичный, метрики без токена не отдаём.
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+METRICS_MAX_SERIES = int(os.getenv("METRICS_MAX_SERIES", "200"))  # имён span; остальные → "other"
+
+# ============= ИНСТРУМЕНТАЦИЯ ЗАПРОСОВ К БД (db/instrumentation.py) =============
+
+DB_QUERY_STATS_ENABLED = os.getenv("DB_QUERY_STATS_ENABLED", "true").lower() == "true"
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "300"))          # дольше — в лог (warning)
+DB_QUERY_STATS_MAX = int(os.getenv("DB_QUERY_STATS_MAX", "500"))        # отпечатков запросов в памяти
+
+# ============= ЛИМИТ ЗАПРОСОВ К CLAUDE API =============
+# Адаптивный (AIMD): стартует с INITIAL, сжимается при 429/529, растёт до MAX
+
+CLAUDE_CONCURRENCY_INITIAL = int(os.getenv("CLAUDE_CONCURRENCY_INITIAL", "20"))
+CLAUDE_CONCURRENCY_MIN = int(os.getenv("CLAUDE_CONCURRENCY_MIN", "4"))
+CLAUDE_CONCURRENCY_MAX = int(os.getenv("CLAUDE_CONCURRENCY_MAX", "48"))
+
+# ============= ОЧЕРЕДЬ ЗАДАЧ (job_queue) =============
+# Пре-генерация и повторы доставки. Worker в процессе бота (0 — не запускать)
+# и/или отдельные процессы: python -m core.job_queue
+
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "8"))
+JOB_WORKER_PROCESS_CONCURRENCY = int(os.getenv("JOB_WORKER_PROCESS_CONCURRENCY", "16"))
+JOB_POLL_INTERVAL_SEC = float(os.getenv("JOB_POLL_INTERVAL_SEC", "2"))
+JOB_STALE_MINUTES = int(os.getenv("JOB_STALE_MINUTES", "15"))  # running дольше — worker упал
+
+# ============= ПЛАНИРОВЩИК ПРЕ-ГЕНЕРАЦИИ МАРАФОНА =============
+# Генерация распределяется по окну до доставки с ровным темпом, а не пиком в одну минуту
+
+PREGEN_LEAD_HOURS = float(os.getenv("PREGEN_LEAD_HOURS", "3"))          # за сколько до слота ставить задачи
+PREGEN_TARGET_PER_MIN = float(os.getenv("PREGEN_TARGET_PER_MIN", "10"))  # обычный темп (задач/мин)
+PREGEN_SAFETY_MIN = float(os.getenv("PREGEN_SAFETY_MIN", "20"))          # закончить не позже чем за N мин до слота
+PREGEN_JOB_EST_SEC = float(os.getenv("PREGEN_JOB_EST_SEC", "90"))        # оценка длительности одной задачи
+
+# ============= ЛИМИТ ОТПРАВКИ В TELEGRAM =============
+# Token bucket на бота и на чат (helpers/send_limiter.py); рассылки не трогают
+# последние RESERVE токенов — они для ответов пользователям
+
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "25"))      # сообщений/сек (лимит ~30)
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))           # сообщений/сек в личный чат
+TELEGRAM_CHAT_BURST = float(os.getenv("TELEGRAM_CHAT_BURST", "3"))
+TELEGRAM_BROADCAST_RESERVE = float(os.getenv("TELEGRAM_BROADCAST_RESERVE", "5"))
+TELEGRAM_RETRY_AFTER_MAX_SEC = 60   # дольше — не ждать, отдать ошибку вызывающему
+
+# ============= ПОТОКОВЫЙ ВЫВОД КОНСУЛЬТАЦИЙ =============
+# Ответ показывается по абзацам по мере генерации (правка сообщения)
+
+CONSULTATION_STREAMING = os.getenv("CONSULTATION_STREAMING", "true").lower() == "true"
+STREAM_EDIT_INTERVAL_SEC = float(os.getenv("STREAM_EDIT_INTERVAL_SEC", "1.2"))  # не чаще — лимит правок Telegram
+
 # ============= КАТЕГОРИИ РАБОЧИХ ПРОДУКТОВ =============
 
 WORK_PRODUCT_CATEGORIES = {
@@ -157,6 +157,7 @@ async def evaluate_answer(
             user_prompt=user_prompt,
             max_tokens=500,
             model=CLAUDE_MODEL_HAIKU,
+            feature="evaluation", lang=lang,
         )
         if not raw:
             logger.warning("Evaluator: Claude returned empty response")
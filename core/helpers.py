@@ -3,17 +3,23 @@
 
 Содержит:
 - get_user_mode_state: определение целевого стейта по режиму пользователя
-- load_topic_metadata: загрузка метаданных темы из YAML
+- load_topic_metadata: метаданные темы из индекса topics/*.yaml (get_topic_index)
 - get_search_keys: получение ключей поиска для MCP
+- get_topic_search_queries: запросы к MCP для теоретической темы марафона
 - get_bloom_questions: настройки вопросов по уровню Блума
 - get_personalization_prompt: промпт для персонализации контента
 """
 
+import os
+import pickle
+import time
 from pathlib import Path
-from typing import Optional, List
+from types import MappingProxyType
+from typing import Mapping, Optional, List
 import yaml
 
 from config import get_logger, STUDY_DURATIONS, TOPICS_DIR
+from config.settings import TOPIC_INDEX_CACHE_PATH, TOPIC_INDEX_CHECK_SEC
 
 logger = get_logger(__name__)
 
@@ -45,33 +51,109 @@ def get_user_mode_state(user) -> str:
     return MODE_STATE_MAP.get(mode or 'marathon', MODE_STATE_MAP['marathon'])
 
 
-def load_topic_metadata(topic_id: str) -> Optional[dict]:
-    """Загружает метаданные темы из YAML файла
+# ============= ИНДЕКС МЕТАДАННЫХ ТЕМ =============
+# topic_id → метаданные из topics/*.yaml. Строится один раз (C-загрузчик libyaml,
+# если есть), кэшируется на диске в pickle с подписью файлов (имя, mtime, размер).
+# Изменения файлов проверяются не чаще раза в TOPIC_INDEX_CHECK_SEC.
 
-    Args:
-        topic_id: ID темы (например, "1-1-three-states")
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+_TOPIC_INDEX_VERSION = 1
 
-    Returns:
-        Словарь с метаданными или None если файл не найден
-    """
-    if not TOPICS_DIR.exists():
-        return None
+_topic_index: Mapping[str, dict] = MappingProxyType({})
+_topic_index_signature: Optional[tuple] = None
+_topic_index_checked_at = float('-inf')
 
-    # Пробуем найти файл по ID
+
+def _topic_files_signature() -> tuple:
+    """(имя, mtime_ns, размер) всех topics/*.yaml, кроме служебных (_*)."""
+    if not TOPICS_DIR.exists():
+        return ()
+    files = []
     for yaml_file in TOPICS_DIR.glob("*.yaml"):
         if yaml_file.name.startswith("_"):  # Пропускаем служебные файлы
             continue
+        st = yaml_file.stat()
+        files.append((yaml_file.name, st.st_mtime_ns, st.st_size))
+    return tuple(sorted(files))
+
+
+def _parse_topic_files(signature: tuple) -> dict:
+    index = {}
+    for name, _, _ in signature:
         try:
-            with open(yaml_file, 'r', encoding='utf-8') as f:
-                data = yaml.safe_load(f)
-                if data and data.get('id') == topic_id:
-                    return data
+            with open(TOPICS_DIR / name, 'r', encoding='utf-8') as f:
+                data = yaml.load(f, Loader=_YAML_LOADER)
+            if data and data.get('id'):
+                index[data['id']] = data
         except Exception as e:
-            logger.error(f"Ошибка загрузки метаданных {yaml_file}: {e}")
-
+            logger.error(f"Ошибка загрузки метаданных {name}: {e}")
+    return index
+
+
+def _read_index_cache(signature: tuple) -> Optional[dict]:
+    try:
+        with open(TOPIC_INDEX_CACHE_PATH, 'rb') as f:
+            cached = pickle.load(f)
+        if cached.get('version') == _TOPIC_INDEX_VERSION and cached.get('signature') == signature:
+            return cached['index']
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"TopicIndex: кэш {TOPIC_INDEX_CACHE_PATH} не прочитан: {e}")
     return None
 
 
+def _write_index_cache(signature: tuple, index: dict) -> None:
+    """Атомарно записать кэш (ошибка записи не мешает работе)."""
+    try:
+        TOPIC_INDEX_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp = TOPIC_INDEX_CACHE_PATH.with_name(TOPIC_INDEX_CACHE_PATH.name + '.tmp')
+        with open(tmp, 'wb') as f:
+            pickle.dump(
+                {'version': _TOPIC_INDEX_VERSION, 'signature': signature, 'index': index},
+                f, protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(tmp, TOPIC_INDEX_CACHE_PATH)
+    except Exception as e:
+        logger.warning(f"TopicIndex: кэш {TOPIC_INDEX_CACHE_PATH} не сохранён: {e}")
+
+
+def get_topic_index(force: bool = False) -> Mapping[str, dict]:
+    """Индекс topic_id → метаданные (только для чтения; перестраивается при изменении файлов)."""
+    global _topic_index, _topic_index_signature, _topic_index_checked_at
+    now = time.monotonic()
+    if not force and now - _topic_index_checked_at < TOPIC_INDEX_CHECK_SEC:
+        return _topic_index
+    _topic_index_checked_at = now
+
+    signature = _topic_files_signature()
+    if not force and signature == _topic_index_signature:
+        return _topic_index
+
+    index = None if force else _read_index_cache(signature)
+    source = "кэш"
+    if index is None:
+        index = _parse_topic_files(signature)
+        _write_index_cache(signature, index)
+        source = "YAML"
+    _topic_index = MappingProxyType(index)
+    _topic_index_signature = signature
+    logger.info(f"TopicIndex: {len(index)} тем ({source})")
+    return _topic_index
+
+
+def load_topic_metadata(topic_id: str) -> Optional[dict]:
+    """Метаданные темы из индекса topics/*.yaml
+
+    Args:
+        topic_id: ID темы (например, "1-1-three-states")
+
+    Returns:
+        Словарь с метаданными (не изменять — общий для всех) или None
+    """
+    return get_topic_index().get(topic_id)
+
+
 def get_bloom_questions(metadata: dict, bloom_level: int, study_duration: int) -> dict:
     """Получает настройки вопросов для заданного уровня Блума и времени
 
@@ -113,6 +195,27 @@ def get_search_keys(metadata: dict, mcp_type: str = "guides_mcp") -> List[str]:
     return search_keys.get(mcp_type, [])
 
 
+def get_topic_search_queries(topic: dict, metadata: Optional[dict] = None) -> List[str]:
+    """Запросы к Knowledge MCP для теоретической темы марафона
+
+    Общий источник для generate_content и снапшота знаний (clients/mcp_snapshot.py).
+
+    Args:
+        topic: тема из knowledge_structure.yaml
+        metadata: метаданные темы (topics/*.yaml), если уже загружены
+
+    Returns:
+        Ключи guides_mcp + knowledge_mcp без дублей, либо «title main_concept»
+    """
+    if metadata is None and topic.get('id'):
+        metadata = load_topic_metadata(topic['id'])
+    if not metadata:
+        return [f"{topic.get('title')} {topic.get('main_concept')}"]
+
+    keys = get_search_keys(metadata, "guides_mcp") + get_search_keys(metadata, "knowledge_mcp")
+    return list(dict.fromkeys(keys))
+
+
 def get_personalization_prompt(intern: dict) -> str:
     """Генерирует промпт для персонализации на основе профиля стажера
 
@@ -0,0 +1,308 @@
+"""
+Очередь фоновых задач в Postgres (таблица job_queue): пре-генерация марафона,
+повторы доставки урока и дайджеста Ленты.
+
+Архитектура:
+- Постановка: enqueue() — идемпотентно по (kind, chat_id, topic_index),
+  поэтому каждая реплика может ставить одни и те же задачи без дублей
+- Обработчики регистрируются по kind: register_job_handler() (core/scheduler.py)
+- JobWorker забирает задачи через FOR UPDATE SKIP LOCKED и выполняет
+  до concurrency штук параллельно; приоритет задачи = полоса Claude API (Priority)
+- Ошибка (или retry_current_job() из обработчика) → повтор с экспоненциальным
+  backoff, после max_attempts — статус failed
+- Задачи, зависшие в running (упал процесс), возвращаются в очередь
+- Задачи переживают редеплой: состояние в БД, а не в памяти APScheduler
+
+Usage:
+    # В процессе бота — init_scheduler() запускает worker сам (JOB_WORKER_CONCURRENCY)
+    # Отдельные процессы:
+    python -m core.job_queue
+"""
+
+import asyncio
+import os
+import signal
+import socket
+import time
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional
+
+from clients.claude import Priority, claude_priority
+from config import get_logger
+from config.settings import JOB_POLL_INTERVAL_SEC, JOB_STALE_MINUTES
+
+logger = get_logger(__name__)
+
+JobFn = Callable[[int, Optional[int]], Awaitable[None]]
+
+
+class JobHandler(NamedTuple):
+    fn: JobFn                    # async fn(chat_id, topic_index)
+    backoff_sec: float           # пауза перед 2-й попыткой, далее ×2
+    max_attempts: int
+    priority: Priority
+    timeout_sec: float
+
+
+_handlers: Dict[str, JobHandler] = {}
+_current_job: ContextVar[Optional[dict]] = ContextVar('current_job', default=None)
+_worker: Optional['JobWorker'] = None
+
+
+def register_job_handler(
+    kind: str,
+    fn: JobFn,
+    backoff_sec: float = 600,
+    max_attempts: int = 3,
+    priority: Priority = Priority.PREGEN,
+    timeout_sec: float = 300,
+) -> None:
+    """Зарегистрировать обработчик задач вида kind."""
+    _handlers[kind] = JobHandler(fn, backoff_sec, max_attempts, priority, timeout_sec)
+
+
+def retry_current_job() -> bool:
+    """Пометить выполняемую задачу как неудачную (без исключения).
+
+    Для кода, который сам ловит ошибки и не бросает их наружу:
+    worker повторит задачу с backoff. False — вызов вне задачи.
+    """
+    job = _current_job.get()
+    if job is None:
+        return False
+    job['retry'] = True
+    return True
+
+
+async def enqueue(
+    kind: str,
+    chat_id: int,
+    topic_index: Optional[int] = None,
+    delay_sec: float = 0,
+) -> bool:
+    """Поставить задачу kind в очередь (параметры — из зарегистрированного обработчика).
+
+    Если это та самая задача, что сейчас выполняется, — вместо новой
+    постановки текущая повторится с backoff (retry_current_job).
+
+    Returns:
+        True — задача добавлена
+    """
+    job = _current_job.get()
+    if job and (job['kind'], job['chat_id'], job['topic_index']) == (kind, chat_id, topic_index):
+        return not retry_current_job()
+
+    handler = _handlers.get(kind)
+    if handler is None:
+        raise ValueError(f"No job handler registered for '{kind}'")
+
+    from db.queries.jobs import enqueue_job
+    return await enqueue_job(
+        kind, chat_id, topic_index,
+        priority=int(handler.priority),
+        delay_sec=delay_sec,
+        max_attempts=handler.max_attempts,
+    )
+
+
+async def enqueue_many(kind: str, keys: list, run_at: list = None, deadline: list = None) -> int:
+    """Поставить пачку задач kind: keys = [(chat_id, topic_index), ...].
+
+    run_at / deadline — по элементу на задачу (см. db.queries.jobs.enqueue_jobs).
+    """
+    handler = _handlers.get(kind)
+    if handler is None:
+        raise ValueError(f"No job handler registered for '{kind}'")
+
+    from db.queries.jobs import enqueue_jobs
+    return await enqueue_jobs(
+        kind, keys,
+        priority=int(handler.priority),
+        max_attempts=handler.max_attempts,
+        run_at=run_at,
+        deadline=deadline,
+    )
+
+
+class JobWorker:
+    """Пул исполнителей задач из job_queue в одном процессе."""
+
+    def __init__(self, concurrency: int = 4, poll_interval: float = JOB_POLL_INTERVAL_SEC):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._running: Dict[asyncio.Task, int] = {}  # task → job id
+        self._task: Optional[asyncio.Task] = None
+        self._last_reap = 0.0
+        self.completed = 0
+        self.failed = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Остановить приём задач; прерванные вернуть в очередь."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        interrupted = list(self._running.values())
+        for task in list(self._running):
+            task.cancel()
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+        if interrupted:
+            try:
+                from db.queries.jobs import release_jobs
+                await release_jobs(interrupted)
+                logger.info(f"[JobQueue] Released {len(interrupted)} interrupted jobs")
+            except Exception as e:
+                logger.warning(f"[JobQueue] Failed to release jobs: {e}")
+
+    async def _loop(self):
+        """Background task: забирать задачи, пока есть свободные слоты."""
+        from db.queries.jobs import claim_jobs, requeue_stale_jobs
+
+        while True:
+            free = self.concurrency - len(self._running)
+            jobs = []
+            try:
+                if time.monotonic() - self._last_reap > JOB_STALE_MINUTES * 60 / 2:
+                    self._last_reap = time.monotonic()
+                    await requeue_stale_jobs(JOB_STALE_MINUTES)
+                if free > 0:
+                    jobs = await claim_jobs(self.worker_id, list(_handlers), free)
+            except Exception as e:
+                logger.warning(f"[JobQueue] claim error: {e}")
+
+            for job in jobs:
+                task = asyncio.create_task(self._run(job))
+                self._running[task] = job['id']
+                task.add_done_callback(self._running.pop)
+
+            if free <= 0:
+                # Все слоты заняты — ждать освобождения, а не полного интервала
+                await asyncio.wait(
+                    list(self._running), timeout=self.poll_interval,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+            elif len(jobs) < free:
+                await asyncio.sleep(self.poll_interval)  # очередь пуста
+
+    async def _run(self, job: dict):
+        from db.queries.jobs import complete_job, fail_job
+
+        handler = _handlers[job['kind']]
+        label = f"{job['kind']} chat={job['chat_id']} topic={job['topic_index']} #{job['attempts']}"
+        token = _current_job.set(job)
+        error = None
+        try:
+            with claude_priority(Priority(job['priority'])):
+                await asyncio.wait_for(
+                    handler.fn(job['chat_id'], job['topic_index']),
+                    timeout=handler.timeout_sec,
+                )
+            if job.get('retry'):
+                error = 'retry requested by handler'
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            error = f'timeout ({handler.timeout_sec:.0f}s)'
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+        finally:
+            _current_job.reset(token)
+
+        try:
+            if error is None:
+                await complete_job(job['id'])
+                self.completed += 1
+                logger.info(f"[JobQueue] Done {label}")
+                return
+            self.failed += 1
+            retry_in = handler.backoff_sec * 2 ** (job['attempts'] - 1)
+            status = await fail_job(job['id'], error, retry_in)
+            if status == 'failed':
+                logger.error(f"[JobQueue] Gave up {label}: {error}")
+            else:
+                logger.warning(f"[JobQueue] Failed {label}: {error}, retry in {retry_in:.0f}s")
+        except Exception as e:
+            logger.warning(f"[JobQueue] Failed to record result of {label}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            'worker_id': self.worker_id,
+            'concurrency': self.concurrency,
+            'running': len(self._running),
+            'completed': self.completed,
+            'failed': self.failed,
+        }
+
+
+def start_job_worker(concurrency: int) -> Optional[JobWorker]:
+    """Запустить worker в текущем event loop (0 — не запускать)."""
+    global _worker
+    if concurrency <= 0 or _worker is not None:
+        return _worker
+    _worker = JobWorker(concurrency=concurrency)
+    _worker.start()
+    logger.info(f"[JobQueue] Worker {_worker.worker_id} started (concurrency={concurrency})")
+    return _worker
+
+
+async def shutdown_job_worker():
+    """Остановить worker, вернув незавершённые задачи в очередь."""
+    global _worker
+    if _worker:
+        await _worker.stop()
+    _worker = None
+
+
+def get_worker_stats() -> Optional[dict]:
+    return _worker.stats() if _worker else None
+
+
+async def main():
+    """Отдельный процесс-worker: python -m core.job_queue."""
+    import logging
+    import sys
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        stream=sys.stdout
+    )
+
+    from config import BOT_TOKEN
+    from config.settings import JOB_WORKER_PROCESS_CONCURRENCY
+    from db import init_db
+    from db.connection import close_pool
+    from core.llm_usage import setup_llm_usage, shutdown_llm_usage
+    from core.scheduler import register_job_handlers, close_scheduler_bot
+
+    await init_db()
+    await setup_llm_usage()
+    register_job_handlers(BOT_TOKEN)
+    start_job_worker(JOB_WORKER_PROCESS_CONCURRENCY)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    logger.info("[JobQueue] Shutting down worker")
+    await shutdown_job_worker()
+    await close_scheduler_bot()
+    from clients.claude import ClaudeClient
+    await ClaudeClient.close_session()
+    await shutdown_llm_usage()
+    await close_pool()
+
+
+if __name__ == "__main__":
+    # Через импорт, а не из __main__: реестр обработчиков должен быть общим
+    # с core.scheduler (иначе модуль загрузится дважды)
+    from core.job_queue import main as _main
+    asyncio.run(_main())
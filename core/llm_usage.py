@@ -0,0 +1,129 @@
+"""
+Учёт вызовов Claude API: токены, TTFT, длительность → таблица llm_usage.
+
+Архитектура:
+- ClaudeClient после каждого вызова API вызывает record_llm_usage()
+- Запись кладётся в asyncio.Queue (без ожидания БД)
+- Фоновая задача раз в flush_interval секунд выгружает очередь одним COPY
+- Без запущенного recorder (скрипты, тесты) записи просто не копятся
+
+Usage:
+    from core.llm_usage import setup_llm_usage, shutdown_llm_usage
+    await setup_llm_usage()      # после init_db()
+    ...
+    await shutdown_llm_usage()   # перед shutdown — дописать остаток
+"""
+
+import asyncio
+from datetime import datetime, timezone
+from typing import Optional
+
+from config import get_logger
+
+logger = get_logger(__name__)
+
+_recorder: Optional['LLMUsageRecorder'] = None
+
+
+class LLMUsageRecorder:
+    """Буфер записей llm_usage с периодической пакетной выгрузкой."""
+
+    def __init__(self, flush_interval: float = 10.0, max_queue: int = 10000):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._flush_interval = flush_interval
+        self._task: Optional[asyncio.Task] = None
+        self._dropped = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._flush_loop())
+
+    def record(self, row: tuple) -> None:
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self._dropped += 1
+
+    async def _flush_loop(self):
+        """Background task: выгружать очередь каждые flush_interval секунд."""
+        while True:
+            try:
+                await asyncio.sleep(self._flush_interval)
+                await self.flush()
+            except asyncio.CancelledError:
+                await self.flush()
+                return
+            except Exception as e:
+                logger.warning(f"[LLMUsage] flush_loop error: {e}")
+
+    async def flush(self):
+        """Выгрузить очередь в llm_usage одним COPY."""
+        rows = []
+        while not self._queue.empty():
+            rows.append(self._queue.get_nowait())
+        if not rows:
+            return
+
+        if self._dropped:
+            logger.warning(f"[LLMUsage] Queue overflow, dropped {self._dropped} rows")
+            self._dropped = 0
+
+        try:
+            from db.queries.llm_usage import insert_llm_usage
+            await insert_llm_usage(rows)
+        except Exception as e:
+            logger.warning(f"[LLMUsage] Failed to write {len(rows)} rows: {e}")
+
+
+def record_llm_usage(
+    feature: str,
+    model: str,
+    lang: Optional[str],
+    usage: dict,
+) -> None:
+    """Поставить в очередь usage одного вызова API (non-blocking).
+
+    Args:
+        feature: что вызывало Claude ('content', 'consultation', 'feed_digest', ...)
+        model: модель Claude
+        lang: язык пользователя (если известен)
+        usage: input_tokens, output_tokens, cache_*_input_tokens, ttft_ms, duration_ms
+    """
+    if _recorder is None:
+        return
+
+    from core.tracing import get_current_trace
+    trace = get_current_trace()
+
+    _recorder.record((
+        feature,
+        model,
+        lang,
+        trace.user_id if trace else None,
+        usage.get('input_tokens') or 0,
+        usage.get('output_tokens') or 0,
+        usage.get('cache_read_input_tokens') or 0,
+        usage.get('cache_creation_input_tokens') or 0,
+        usage.get('ttft_ms'),
+        usage.get('duration_ms'),
+        datetime.now(timezone.utc),
+    ))
+
+
+async def setup_llm_usage():
+    """Запустить фоновую выгрузку llm_usage. Вызывать после init_db()."""
+    global _recorder
+    _recorder = LLMUsageRecorder()
+    _recorder.start()
+    logger.info("[LLMUsage] Usage recording initialized")
+
+
+async def shutdown_llm_usage():
+    """Дописать оставшиеся записи перед shutdown."""
+    global _recorder
+    if _recorder and _recorder._task:
+        _recorder._task.cancel()
+        try:
+            await _recorder._task
+        except asyncio.CancelledError:
+            pass
+    _recorder = None
@@ -0,0 +1,221 @@
+"""
+Метрики процесса в памяти + экспорт в формате Prometheus (GET /metrics).
+
+Раньше латентность была только в request_traces, и дашборды ходили в Neon.
+Теперь:
+- каждый span (core/tracing.py) и каждый запрос целиком попадают
+  в логарифмическую гистограмму (helpers/histogram.py) — без БД
+- операции вне трейса (сброс/загрузка FSM) пишутся через observe()
+- запросы к БД — отдельная семья по месту вызова (observe_db_query),
+  со своим лимитом серий: не вытесняют имена span
+- счётчики кэшей, circuit breaker MCP, пул БД, лимитеры — снимаются
+  с существующих get_*_stats() в момент запроса /metrics
+
+Гистограммы накопительные с запуска процесса (как counter в Prometheus):
+перцентили за окно — histogram_quantile(rate(...)) на стороне Grafana.
+Границы le — степени двойки: совпадают с границами корзин, значения точные.
+
+Usage:
+    from core.metrics import observe
+    observe("fsm.flush", duration_ms)
+"""
+
+from typing import Dict, List
+
+from config import get_logger
+from config.settings import METRICS_MAX_SERIES
+from helpers.histogram import BUCKETS, SUB_BUCKETS, LogHistogram
+
+logger = get_logger(__name__)
+
+_OTHER = "other"
+
+_spans: Dict[str, LogHistogram] = {}
+_requests: Dict[str, LogHistogram] = {}
+_db_queries: Dict[str, LogHistogram] = {}   # своя семья и свой лимит — не вытесняют span
+
+
+def _observe(series: Dict[str, LogHistogram], name: str, duration_ms: float) -> None:
+    hist = series.get(name)
+    if hist is None:
+        if len(series) >= METRICS_MAX_SERIES:
+            name = _OTHER
+        hist = series.setdefault(name, LogHistogram())
+    hist.record(duration_ms)
+
+
+def observe(name: str, duration_ms: float) -> None:
+    """Длительность операции (span) в мс."""
+    _observe(_spans, name, duration_ms)
+
+
+def observe_db_query(callsite: str, duration_ms: float) -> None:
+    """Длительность запроса к БД по месту вызова (db/instrumentation.py)."""
+    _observe(_db_queries, callsite, duration_ms)
+
+
+def observe_request(category: str, duration_ms: float) -> None:
+    """Длительность запроса целиком, по категории SLA (nav / heavy / consultation)."""
+    _observe(_requests, category, duration_ms)
+
+
+# ─── Экспорт ───
+
+
+def _label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class _Exposition:
+    """Сборка текста в формате Prometheus text exposition 0.0.4."""
+
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def family(self, name: str, kind: str, help_text: str) -> None:
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name: str, value, **labels) -> None:
+        if labels:
+            body = ",".join(f'{k}="{_label(v)}"' for k, v in labels.items())
+            self.lines.append(f"{name}{{{body}}} {value}")
+        else:
+            self.lines.append(f"{name} {value}")
+
+    def histogram(self, name: str, label: str, series: Dict[str, LogHistogram]) -> None:
+        for key, hist in sorted(series.items()):
+            cumulative = 0
+            for i, n in enumerate(hist.counts):
+                cumulative += n
+                if (i + 1) % SUB_BUCKETS == 0 and i + 1 < BUCKETS:
+                    self.sample(f"{name}_bucket", cumulative, **{label: key, 'le': 2 ** ((i + 1) // SUB_BUCKETS)})
+            self.sample(f"{name}_bucket", hist.count, **{label: key, 'le': '+Inf'})
+            self.sample(f"{name}_sum", round(hist.total, 3), **{label: key})
+            self.sample(f"{name}_count", hist.count, **{label: key})
+
+    def text(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+def render_metrics() -> str:
+    """Все метрики процесса в формате Prometheus."""
+    out = _Exposition()
+
+    out.family("aist_span_duration_ms", "histogram", "Span duration (core/tracing.span, FSM) in ms")
+    out.histogram("aist_span_duration_ms", "span", _spans)
+    out.family("aist_request_duration_ms", "histogram", "Request duration by SLA category in ms")
+    out.histogram("aist_request_duration_ms", "category", _requests)
+    out.family("aist_db_query_duration_ms", "histogram", "DB query duration by callsite in ms")
+    out.histogram("aist_db_query_duration_ms", "callsite", _db_queries)
+
+    # Источники снимаются независимо: ошибка одного не ломает весь ответ
+    for collect in (_collect_caches, _collect_circuit_breakers, _collect_db_pool,
+                    _collect_limiters, _collect_telemetry):
+        try:
+            collect(out)
+        except Exception as e:
+            logger.warning(f"[Metrics] {collect.__name__} failed: {e}")
+    return out.text()
+
+
+def _collect_caches(out: _Exposition) -> None:
+    from db.queries.cache import get_cache_stats
+    from clients.mcp import MCPClient
+    from clients.claude import ClaudeClient
+    from core.storage import get_fsm_cache_stats
+
+    out.family("aist_cache_hits_total", "counter", "Cache hits since start")
+    content = get_cache_stats()
+    out.sample("aist_cache_hits_total", content['l1_hits'], cache="content", tier="memory")
+    out.sample("aist_cache_hits_total", content['l2_hits'], cache="content", tier="db")
+    out.sample("aist_cache_hits_total", content['negative_hits'], cache="content", tier="negative")
+    mcp = MCPClient.get_search_cache_stats()
+    out.sample("aist_cache_hits_total", mcp['snapshot_hits'], cache="mcp_search", tier="snapshot")
+    out.sample("aist_cache_hits_total", mcp['hits'], cache="mcp_search", tier="memory")
+    out.sample("aist_cache_hits_total", mcp['persisted_hits'], cache="mcp_search", tier="db")
+    fsm = get_fsm_cache_stats()
+    if fsm:
+        out.sample("aist_cache_hits_total", fsm['hits'], cache="fsm", tier="memory")
+
+    out.family("aist_cache_misses_total", "counter", "Cache misses since start")
+    out.sample("aist_cache_misses_total", content['misses'], cache="content")
+    out.sample("aist_cache_misses_total", mcp['misses'], cache="mcp_search")
+    if fsm:
+        out.sample("aist_cache_misses_total", fsm['misses'], cache="fsm")
+
+    out.family("aist_cache_evictions_total", "counter", "Cache evictions since start")
+    out.sample("aist_cache_evictions_total", content['evictions'], cache="content")
+    out.sample("aist_cache_evictions_total", mcp['evictions'], cache="mcp_search")
+
+    prompt = ClaudeClient.get_prompt_cache_stats()
+    out.family("aist_claude_prompt_tokens_total", "counter", "Claude input tokens by prompt cache status")
+    out.sample("aist_claude_prompt_tokens_total", prompt['input_tokens'], kind="uncached")
+    out.sample("aist_claude_prompt_tokens_total", prompt['cache_read_input_tokens'], kind="cache_read")
+    out.sample("aist_claude_prompt_tokens_total", prompt['cache_creation_input_tokens'], kind="cache_write")
+
+
+def _collect_circuit_breakers(out: _Exposition) -> None:
+    from clients.mcp import MCPClient
+
+    circuits = MCPClient.get_circuit_stats()
+    out.family("aist_circuit_breaker_open", "gauge", "MCP circuit breaker state (1 = open)")
+    for server, state in sorted(circuits.items()):
+        out.sample("aist_circuit_breaker_open", int(state['open']), server=server)
+    out.family("aist_circuit_breaker_failures", "gauge", "Consecutive MCP failures")
+    for server, state in sorted(circuits.items()):
+        out.sample("aist_circuit_breaker_failures", state['failures'], server=server)
+
+
+def _collect_db_pool(out: _Exposition) -> None:
+    from db.connection import get_pool_stats
+
+    pool = get_pool_stats()
+    if not pool:
+        return
+    out.family("aist_db_pool_connections", "gauge", "asyncpg pool connections")
+    out.sample("aist_db_pool_connections", pool['size'] - pool['idle'], state="in_use")
+    out.sample("aist_db_pool_connections", pool['idle'], state="idle")
+    out.family("aist_db_pool_max_connections", "gauge", "asyncpg pool max_size")
+    out.sample("aist_db_pool_max_connections", pool['max_size'])
+
+
+def _collect_limiters(out: _Exposition) -> None:
+    from clients.claude import ClaudeClient
+    from core.safe_bot import get_send_limiter_stats
+
+    limiter = ClaudeClient.get_limiter_stats()
+    out.family("aist_claude_limit", "gauge", "Adaptive Claude concurrency limit")
+    out.sample("aist_claude_limit", limiter['limit'])
+    out.family("aist_claude_inflight", "gauge", "Claude requests in flight by lane")
+    for lane, n in enumerate(limiter['inflight_by_lane']):
+        out.sample("aist_claude_inflight", n, lane=lane)
+    out.family("aist_claude_waiting", "gauge", "Claude requests waiting for a slot by lane")
+    for lane, n in enumerate(limiter['waiting_by_lane']):
+        out.sample("aist_claude_waiting", n, lane=lane)
+
+    sends = get_send_limiter_stats()
+    lanes = ("interactive", "broadcast")
+    out.family("aist_telegram_sent_total", "counter", "Telegram sends by lane")
+    for lane, n in zip(lanes, sends['sent']):
+        out.sample("aist_telegram_sent_total", n, lane=lane)
+    out.family("aist_telegram_waiting", "gauge", "Telegram sends waiting for rate limit by lane")
+    for lane, n in zip(lanes, sends['waiting']):
+        out.sample("aist_telegram_waiting", n, lane=lane)
+    out.family("aist_telegram_retry_after_total", "counter", "Telegram RetryAfter responses")
+    out.sample("aist_telegram_retry_after_total", sends['retry_afters'])
+
+
+def _collect_telemetry(out: _Exposition) -> None:
+    from core.telemetry import get_telemetry_stats
+
+    telemetry = get_telemetry_stats()
+    if not telemetry:
+        return
+    out.family("aist_telemetry_queued_traces", "gauge", "Traces waiting for the batched writer")
+    out.sample("aist_telemetry_queued_traces", telemetry['queued_traces'])
+    out.family("aist_open_sessions", "gauge", "Open user sessions in memory")
+    out.sample("aist_open_sessions", telemetry['open_sessions'])
+    out.family("aist_telemetry_dropped_total", "counter", "Telemetry records dropped")
+    for kind, n in sorted(telemetry['dropped'].items()):
+        out.sample("aist_telemetry_dropped_total", n, kind=kind)
@@ -1,8 +1,10 @@
 """
 Middleware для aiogram.
 
+FSMSnapshotMiddleware — снимок fsm_states на время апдейта (core/storage.py).
 LoggingMiddleware — логирование входящих сообщений.
-TracingMiddleware — request-scoped трейсинг с записью в Neon.
+TracingMiddleware — request-scoped трейсинг с записью в Neon
+                    (+ identity map профилей на время апдейта).
 """
 
 import asyncio
@@ -53,6 +55,20 @@ class MaintenanceMiddleware(BaseMiddleware):
         return  # не пропускаем дальше
 
 
+class FSMSnapshotMiddleware(BaseMiddleware):
+    """Открывает снимок fsm_states на время одного апдейта.
+
+    Регистрируется outer-middleware апдейта перед FSMContextMiddleware:
+    та первой читает state, а следующие get_state/get_data апдейта
+    берутся из снимка.
+    """
+
+    async def __call__(self, handler, event: TelegramObject, data: dict):
+        from core.storage import fsm_snapshot_scope
+        with fsm_snapshot_scope():
+            return await handler(event, data)
+
+
 class LoggingMiddleware(BaseMiddleware):
     """Middleware для логирования всех входящих сообщений"""
 
@@ -132,23 +148,20 @@ class TracingMiddleware(BaseMiddleware):
         )
 
         try:
-            result = await handler(event, data)
+            # Identity map профилей: все get_intern(user_id) в апдейте — один SELECT
+            from db.queries.users import intern_scope
+            with intern_scope():
+                result = await handler(event, data)
             return result
         finally:
             try:
                 await finish_trace(trace)
             except Exception as e:
                 logger.warning(f"[TracingMiddleware] Failed to finish trace: {e}")
-            # Session tracking (fire-and-forget, не блокирует запрос)
+            # Сессия + DAU (last_active_date): в буфер телеметрии, без запросов к БД
             if user_id:
                 try:
-                    from db.queries.sessions import get_or_create_session
-                    asyncio.create_task(get_or_create_session(user_id, command))
-                except Exception:
-                    pass
-                # DAU: обновить last_active_date при любом взаимодействии
-                try:
-                    from db.queries.activity import touch_last_active_date
-                    asyncio.create_task(touch_last_active_date(user_id))
+                    from core.telemetry import record_request
+                    record_request(user_id, command)
                 except Exception:
                     pass
@@ -0,0 +1,202 @@
+"""
+Планировщик пре-генерации марафона: ровная нагрузка на Claude API.
+
+Раньше пре-генерация шла за ровно PREGEN_HOURS_AHEAD до слота: популярный
+слот (09:00) давал минутный пик в сотни генераций, а остаток часа простаивал.
+
+Теперь раз в минуту:
+- новые слоты окна (now, now + PREGEN_LEAD_HOURS] ставятся в job_queue
+  (marathon_pregen) со сроком deadline = время доставки;
+- время запуска задач идёт после хвоста очереди с шагом 1/rate, где rate —
+  обычный темп PREGEN_TARGET_PER_MIN или минимально достаточный, чтобы каждая
+  группа закончилась за PREGEN_SAFETY_MIN до своего слота (required_rate);
+- для каждого слота запоминается прогноз завершения; когда слот наступает,
+  прогноз сверяется с фактом из job_queue и пишется в лог и /delivery.
+
+Нагрузка по слотам — агрегат get_marathon_slot_load (как get_slot_load),
+пользователи запрашиваются только для непустых слотов.
+"""
+
+import asyncio
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config import get_logger
+from config.settings import (
+    PREGEN_LEAD_HOURS,
+    PREGEN_TARGET_PER_MIN,
+    PREGEN_SAFETY_MIN,
+    PREGEN_JOB_EST_SEC,
+)
+
+logger = get_logger(__name__)
+
+PREGEN_KIND = 'marathon_pregen'
+
+
+def required_rate(
+    now: datetime,
+    backlog: Sequence[Tuple[datetime, int]],
+    target_per_min: float = PREGEN_TARGET_PER_MIN,
+    safety_min: float = PREGEN_SAFETY_MIN,
+) -> float:
+    """Темп (задач/мин), при котором вся очередь успевает к своим срокам.
+
+    Очередь выполняется по возрастанию срока, поэтому к сроку k должны быть
+    готовы все задачи со сроками <= k: rate >= cum_k / (минут до срока k - запас).
+    Не ниже target_per_min — обычного темпа.
+    """
+    rate = max(target_per_min, 0.1)
+    total = 0
+    for deadline, count in sorted(backlog):
+        total += count
+        minutes = (deadline - now).total_seconds() / 60 - safety_min
+        rate = max(rate, total / max(minutes, 1.0))
+    return rate
+
+
+def spread_run_times(start: datetime, count: int, rate: float) -> List[datetime]:
+    """count моментов запуска от start с шагом 1/rate минут."""
+    step = timedelta(minutes=1 / rate)
+    return [start + step * i for i in range(count)]
+
+
+class PregenPlanner:
+    """Раскладка пре-генерации по окну до доставки + прогноз против факта."""
+
+    def __init__(self, lead_hours: float = PREGEN_LEAD_HOURS, max_reports: int = 48):
+        self.lead = timedelta(hours=lead_hours)
+        self._planned: set = set()                         # слоты (datetime), уже разложенные
+        self.projections: Dict[datetime, dict] = {}        # слот → {jobs, projected_done, rate}
+        self.reports: deque = deque(maxlen=max_reports)    # сверка прогноза с фактом
+
+    def _window(self, now: datetime) -> List[datetime]:
+        base = now.replace(second=0, microsecond=0)
+        minutes = int(self.lead.total_seconds() // 60)
+        return [base + timedelta(minutes=k) for k in range(1, minutes + 1)]
+
+    async def run(self, now: datetime) -> int:
+        """Разложить новые слоты окна и сверить наступившие. Возвращает число новых задач."""
+        await self._report_due(now)
+
+        slots = [s for s in self._window(now) if s not in self._planned]
+        self._planned = {s for s in self._planned if s > now}
+        if not slots:
+            return 0
+
+        from db.queries.users import get_marathon_slot_load
+        by_label = {f"{s:%H:%M}": s for s in slots}
+        load = await get_marathon_slot_load(list(by_label))
+
+        added = 0
+        if load:
+            keys, deadlines = await self._collect([by_label[label] for label in load])
+            if keys:
+                added = await self._enqueue(now, keys, deadlines)
+        # Только после успешной постановки: при ошибке слоты разложатся в следующую минуту
+        self._planned.update(slots)
+        return added
+
+    async def _collect(self, slots: List[datetime]) -> Tuple[list, list]:
+        """Пользователи слотов → [(chat_id, topic_index)] и сроки, по возрастанию срока."""
+        from core.topics import get_next_topic_index
+        from db.queries import get_intern
+        from db.queries.marathon import get_marathon_content
+        from db.queries.users import get_marathon_users_in_slots
+
+        by_label = {f"{s:%H:%M}": s for s in slots}
+        users = await get_marathon_users_in_slots(list(by_label))
+        sem = asyncio.Semaphore(20)
+
+        async def _next_topic(chat_id: int, label: str) -> Optional[tuple]:
+            async with sem:
+                try:
+                    intern = await get_intern(chat_id)
+                    if not intern or intern.get('marathon_status') != 'active':
+                        return None
+                    topic_index = get_next_topic_index(intern)
+                    if topic_index is None:
+                        return None
+                    existing = await get_marathon_content(chat_id, topic_index)
+                    if existing and existing.get('status') == 'pending':
+                        return None  # уже пре-генерирован
+                    return by_label[label], (chat_id, topic_index)
+                except Exception as e:
+                    logger.error(f"[PreGen] Error for {chat_id}: {e}")
+                    return None
+
+        found = [r for r in await asyncio.gather(*[_next_topic(c, l) for c, l in users]) if r]
+        found.sort(key=lambda r: r[0])
+        return [key for _, key in found], [deadline for deadline, _ in found]
+
+    async def _enqueue(self, now: datetime, keys: list, deadlines: list) -> int:
+        from core.job_queue import enqueue_many
+        from db.queries.jobs import get_pending_backlog
+
+        backlog = await get_pending_backlog(PREGEN_KIND)
+        demand = list(backlog['by_deadline'])
+        for deadline in sorted(set(deadlines)):
+            demand.append((deadline, deadlines.count(deadline)))
+        rate = required_rate(now, demand)
+
+        start = now
+        if backlog['tail'] is not None:
+            tail = backlog['tail'].astimezone(now.tzinfo)
+            start = max(start, tail + timedelta(minutes=1 / rate))
+        run_at = spread_run_times(start, len(keys), rate)
+
+        added = await enqueue_many(PREGEN_KIND, keys, run_at=run_at, deadline=deadlines)
+
+        est = timedelta(seconds=PREGEN_JOB_EST_SEC)
+        for deadline in sorted(set(deadlines)):
+            last = max(r for r, d in zip(run_at, deadlines) if d == deadline)
+            projected = last + est
+            self.projections[deadline] = {
+                'jobs': deadlines.count(deadline),
+                'projected_done': projected,
+                'rate': rate,
+            }
+            if projected > deadline - timedelta(minutes=PREGEN_SAFETY_MIN):
+                logger.warning(f"[PreGen] Slot {deadline:%H:%M} at risk: projected {projected:%H:%M}")
+
+        logger.info(f"[PreGen] Queued {added}/{len(keys)} jobs for {len(set(deadlines))} slots, "
+                    f"rate {rate:.1f}/min, from {start:%H:%M:%S} to {run_at[-1]:%H:%M:%S}")
+        return added
+
+    async def _report_due(self, now: datetime) -> None:
+        """Для наступивших слотов — сравнить прогноз с фактом."""
+        due = sorted(d for d in self.projections if d <= now)
+        if not due:
+            return
+        from db.queries.jobs import get_deadline_report
+        try:
+            actual = {r['deadline']: r for r in await get_deadline_report(PREGEN_KIND, due[0], due[-1])}
+        except Exception as e:
+            logger.warning(f"[PreGen] Report query failed: {e}")
+            return
+        for deadline in due:
+            projection = self.projections.pop(deadline)
+            fact = actual.get(deadline) or {}
+            report = {
+                'slot': deadline,
+                'jobs': fact.get('total', projection['jobs']),
+                'on_time': fact.get('on_time', 0),
+                'failed': fact.get('failed', 0),
+                'projected_done': projection['projected_done'],
+                'actual_done': fact.get('last_done_at'),
+            }
+            self.reports.append(report)
+            done = report['actual_done']
+            actual_str = f"{done.astimezone(deadline.tzinfo):%H:%M}" if done else "—"
+            logger.info(
+                f"[PreGen] Slot {deadline:%H:%M}: {report['on_time']}/{report['jobs']} ready on time, "
+                f"failed {report['failed']}, projected {report['projected_done']:%H:%M}, actual {actual_str}"
+            )
+
+
+_planner = PregenPlanner()
+
+
+def get_pregen_planner() -> PregenPlanner:
+    return _planner
@@ -11,15 +11,74 @@ Coverage:
 
 HTML parse_mode is deterministic: invalid markup shows as plain text,
 never crashes.
+
+Rate limiting (helpers/send_limiter.py):
+every send/edit/copy/forward goes through one process-wide token bucket
+(global + per-chat). A SafeBot created with broadcast=True (scheduler, job
+queue) yields to interactive replies. TelegramRetryAfter pauses the chat;
+sends are retried after the pause, edits are not (a stale edit is useless —
+the caller decides, see helpers/telegram_stream.py).
 """
 
+import logging
+from typing import Optional, Union
+
 from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
 from aiogram.types import Message
-from typing import Union
+
+from config.settings import (
+    TELEGRAM_GLOBAL_RATE,
+    TELEGRAM_CHAT_RATE,
+    TELEGRAM_CHAT_BURST,
+    TELEGRAM_BROADCAST_RESERVE,
+    TELEGRAM_RETRY_AFTER_MAX_SEC,
+)
+from helpers.send_limiter import BROADCAST, INTERACTIVE, SendLimiter
+
+logger = logging.getLogger(__name__)
+
+_RATE_LIMITED = ('Send', 'Edit', 'Copy', 'Forward')
+_NOT_LIMITED = ('SendChatAction',)
+_MAX_RETRIES = 3
+
+# Один на процесс: лимиты Telegram — на токен бота, а не на экземпляр Bot
+_send_limiter = SendLimiter(
+    global_rate=TELEGRAM_GLOBAL_RATE,
+    chat_rate=TELEGRAM_CHAT_RATE,
+    chat_burst=TELEGRAM_CHAT_BURST,
+    broadcast_reserve=TELEGRAM_BROADCAST_RESERVE,
+)
+
+
+def get_send_limiter_stats() -> dict:
+    return _send_limiter.stats()
 
 
 class SafeBot(Bot):
-    """Bot subclass that auto-converts Markdown → HTML at transport layer."""
+    """Bot subclass: Markdown → HTML and rate-limited sends at transport layer."""
+
+    def __init__(self, *args, broadcast: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lane = BROADCAST if broadcast else INTERACTIVE
+
+    async def __call__(self, method, request_timeout: Optional[int] = None):
+        name = type(method).__name__
+        chat_id = getattr(method, 'chat_id', None)
+        if (not name.startswith(_RATE_LIMITED) or name in _NOT_LIMITED
+                or not isinstance(chat_id, int)):
+            return await super().__call__(method, request_timeout=request_timeout)
+
+        for attempt in range(_MAX_RETRIES + 1):
+            await _send_limiter.acquire(chat_id, self.lane)
+            try:
+                return await super().__call__(method, request_timeout=request_timeout)
+            except TelegramRetryAfter as e:
+                _send_limiter.pause(chat_id, e.retry_after, self.lane)
+                logger.warning(f"[SafeBot] {name} chat {chat_id}: RetryAfter {e.retry_after}s")
+                if (name.startswith('Edit') or attempt == _MAX_RETRIES
+                        or e.retry_after > TELEGRAM_RETRY_AFTER_MAX_SEC):
+                    raise
 
     async def send_message(
         self,
@@ -8,6 +8,7 @@ import asyncio
 import logging
 import os
 from datetime import timedelta
+from functools import partial
 from typing import Optional
 
 from aiogram import Bot
@@ -16,10 +17,13 @@ from aiogram.fsm.storage.base import StorageKey
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
+from clients.claude import Priority, claude_priority
 from config import MOSCOW_TZ, MAX_TOPICS_PER_DAY, MARATHON_DAYS
+from config.settings import JOB_WORKER_CONCURRENCY
+from core.job_queue import enqueue, register_job_handler, start_job_worker
 from db.queries import get_intern, update_intern, get_all_scheduled_interns, get_topics_today
-from db.queries.marathon import save_marathon_content, get_marathon_content, cleanup_expired_content
-from db.queries.users import moscow_now, moscow_today, get_marathon_users_at_time
+from db.queries.marathon import save_marathon_content, get_marathon_content, get_marathon_contents, cleanup_expired_content
+from db.queries.users import moscow_now, moscow_today, get_interns
 from db.queries.feed import get_current_feed_week, get_feed_session, create_feed_session, expire_old_feed_sessions, update_feed_week
 from i18n import t
 
@@ -30,49 +34,89 @@ _scheduler: Optional[AsyncIOScheduler] = None
 _aiogram_dispatcher = None  # aiogram Dispatcher (for FSM storage access)
 _bot_dispatcher = None      # core.dispatcher.Dispatcher (for SM routing)
 _bot_token: str = None
+_bot: Optional[Bot] = None  # общий Bot рассылок: одна HTTP-сессия на процесс
 
 
-_RETRY_DELAYS_MINUTES = [30, 60]  # exponential backoff: 30min, then 60min
+def _get_bot() -> Bot:
+    """Общий Bot планировщика и job_queue (создаётся при первом обращении).
 
+    Полоса рассылок SafeBot: уступает интерактивным ответам бота.
+    """
+    global _bot
+    if _bot is None:
+        from core.safe_bot import SafeBot
+        _bot = SafeBot(token=_bot_token, broadcast=True)
+    return _bot
 
-def _schedule_retry(chat_id: int, content_type: str, attempt: int = 0):
-    """Schedule a one-off retry for failed pre-generation with exponential backoff."""
-    if not _scheduler:
-        return
-    if attempt >= len(_RETRY_DELAYS_MINUTES):
-        logger.warning(f"[Scheduler] Max retries ({len(_RETRY_DELAYS_MINUTES)}) exhausted for {chat_id} ({content_type})")
-        return
-    job_id = f"retry_{content_type}_{chat_id}"
-    if _scheduler.get_job(job_id):
-        logger.info(f"[Scheduler] Retry already pending for {chat_id} ({content_type}), skip")
-        return
-    delay = _RETRY_DELAYS_MINUTES[attempt]
-    run_at = moscow_now() + timedelta(minutes=delay)
-    _scheduler.add_job(
-        _execute_retry,
-        'date',
-        run_date=run_at,
-        id=job_id,
-        args=[chat_id, content_type, attempt],
-        replace_existing=True,
-    )
-    logger.info(f"[Scheduler] Retry #{attempt+1} scheduled for {chat_id} ({content_type}) at +{delay}min")
+
+async def close_scheduler_bot():
+    """Закрыть HTTP-сессию общего Bot (при остановке процесса)."""
+    global _bot
+    if _bot is not None:
+        await _bot.session.close()
+        _bot = None
+
+
+_RETRY_DELAY_MINUTES = 30  # первый повтор через 30 мин, второй — ещё через 60
+_REMINDER_CHUNK = 500       # напоминаний за один claim / одну запись слота
+_REMINDER_CONCURRENCY = 50  # одновременных отправок (темп ограничивает SafeBot)
 
 
-async def _execute_retry(chat_id: int, content_type: str, attempt: int = 0):
-    """Execute a single retry for failed pre-generation."""
-    bot = Bot(token=_bot_token)
+async def _schedule_retry(chat_id: int, content_type: str):
+    """Поставить повтор неудачной доставки в job_queue (переживает редеплой).
+
+    Вызов изнутри самого повтора не создаёт новую задачу — worker повторит
+    текущую с backoff (не больше max_attempts).
+    """
     try:
-        if content_type == 'marathon':
-            await send_scheduled_topic(chat_id, bot)
-        elif content_type == 'feed':
-            await pre_generate_feed_digest(chat_id, bot)
-        logger.info(f"[Scheduler] Retry #{attempt+1} successful for {chat_id} ({content_type})")
+        added = await enqueue(f'retry_{content_type}', chat_id, delay_sec=_RETRY_DELAY_MINUTES * 60)
+        if added:
+            logger.info(f"[Scheduler] Retry scheduled for {chat_id} ({content_type}) at +{_RETRY_DELAY_MINUTES}min")
     except Exception as e:
-        logger.error(f"[Scheduler] Retry #{attempt+1} failed for {chat_id} ({content_type}): {e}")
-        _schedule_retry(chat_id, content_type, attempt + 1)
-    finally:
-        await bot.session.close()
+        logger.error(f"[Scheduler] Failed to schedule retry for {chat_id} ({content_type}): {e}")
+
+
+async def _execute_retry(content_type: str, chat_id: int, topic_index: Optional[int] = None):
+    """Повтор доставки (обработчик задач retry_marathon / retry_feed)."""
+    bot = _get_bot()
+    if content_type == 'marathon':
+        await send_scheduled_topic(chat_id, bot)
+    elif content_type == 'feed':
+        await pre_generate_feed_digest(chat_id, bot)
+
+
+async def _pregen_job(chat_id: int, topic_index: int):
+    """Пре-генерация темы марафона (обработчик задач marathon_pregen)."""
+    intern = await get_intern(chat_id)
+    if not intern or intern.get('marathon_status') != 'active':
+        return
+
+    existing = await get_marathon_content(chat_id, topic_index)
+    if existing and (existing.get('status') == 'pending'
+                     or len(existing.get('lesson_content') or '') > 200):
+        return  # уже есть
+
+    if not await _generate_and_save_content(chat_id, intern, topic_index):
+        raise RuntimeError("content generation failed")
+    logger.info(f"[PreGen] Content ready for {chat_id}, topic {topic_index}")
+
+
+def register_job_handlers(bot_token: str):
+    """Зарегистрировать обработчики job_queue (бот и отдельный worker)."""
+    global _bot_token
+    _bot_token = bot_token
+    register_job_handler(
+        'retry_marathon', partial(_execute_retry, 'marathon'),
+        backoff_sec=3600, max_attempts=2, priority=Priority.DELIVERY,
+    )
+    register_job_handler(
+        'retry_feed', partial(_execute_retry, 'feed'),
+        backoff_sec=3600, max_attempts=2, priority=Priority.DELIVERY,
+    )
+    register_job_handler(
+        'marathon_pregen', _pregen_job,
+        backoff_sec=600, max_attempts=3, priority=Priority.PREGEN,
+    )
 
 
 def init_scheduler(bot_dispatcher, aiogram_dispatcher, bot_token: str) -> AsyncIOScheduler:
@@ -83,32 +127,33 @@ def init_scheduler(bot_dispatcher, aiogram_dispatcher, bot_token: str) -> AsyncI
         aiogram_dispatcher: aiogram Dispatcher (FSM storage)
         bot_token: Telegram bot token
     """
+    # Постановка задач в job_queue работает и без планировщика
+    register_job_handlers(bot_token)
+
     # DISABLE_SCHEDULER=true — отключает scheduler (для тестовых инстансов с общей БД)
     if os.getenv("DISABLE_SCHEDULER", "false").lower() == "true":
         logger.info("[Scheduler] DISABLE_SCHEDULER=true — планировщик отключён")
         return None
 
-    global _scheduler, _bot_dispatcher, _aiogram_dispatcher, _bot_token
+    global _scheduler, _bot_dispatcher, _aiogram_dispatcher
     _bot_dispatcher = bot_dispatcher
     _aiogram_dispatcher = aiogram_dispatcher
-    _bot_token = bot_token
 
     _scheduler = AsyncIOScheduler(timezone=MOSCOW_TZ)
     _scheduler.add_job(scheduled_check, 'cron', minute='*')
-    _scheduler.add_job(pre_generate_upcoming, 'cron', minute='*')  # Pre-gen за 3ч до доставки
+    _scheduler.add_job(pre_generate_upcoming, 'cron', minute='*')  # Pre-gen: окно 3ч до доставки
     _scheduler.add_job(_neon_keep_alive, 'cron', minute='*/4')  # Keep-alive каждые 4 мин
+    _scheduler.add_job(_refresh_rollups, 'cron', minute='*/5')  # Агрегаты для /latency, /analytics
     _scheduler.add_job(_discourse_scheduled_publish, 'cron', minute='*/30')  # Discourse: scheduled posts
     _scheduler.add_job(_discourse_check_comments, 'cron', minute='*/15')  # Discourse: comment polling
     _scheduler.add_job(_smart_publisher_scan, 'cron', hour=3, minute=0)  # Publisher: daily scan 06:00 MSK = 03:00 UTC
     _scheduler.start()
+    start_job_worker(JOB_WORKER_CONCURRENCY)
 
     logger.info("[Scheduler] Планировщик инициализирован (+ Neon keep-alive + pre-gen + Discourse)")
     return _scheduler
 
 
-PREGEN_HOURS_AHEAD = 3
-
-
 async def _generate_and_save_content(chat_id: int, intern: dict, topic_index: int) -> bool:
     """Сгенерировать урок+вопрос+практику и сохранить в marathon_content.
 
@@ -215,7 +260,7 @@ async def _generate_and_save_content(chat_id: int, intern: dict, topic_index: in
 
 
 async def pregen_next_for_user(chat_id: int, intern: dict, current_topic_index: int):
-    """Look-ahead: пре-генерация следующей темы после текущей (fire-and-forget).
+    """Look-ahead: поставить в job_queue пре-генерацию следующей темы (fire-and-forget).
 
     Вызывается из lesson.py / task.py после доставки контента пользователю.
     Если следующая тема уже пре-генерирована — пропускаем.
@@ -238,67 +283,26 @@ async def pregen_next_for_user(chat_id: int, intern: dict, current_topic_index:
             existing = await get_marathon_content(chat_id, next_idx)
             if existing and existing.get('lesson_content') and len(existing['lesson_content']) > 200:
                 continue  # уже есть
-            success = await _generate_and_save_content(chat_id, intern, next_idx)
-            if success:
-                logger.info(f"[LookAhead] Pre-generated topic {next_idx} for {chat_id}")
-            break  # генерируем только одну тему за раз (не блокировать API)
+            if await enqueue('marathon_pregen', chat_id, next_idx):
+                logger.info(f"[LookAhead] Queued topic {next_idx} for {chat_id}")
+            break  # одна тема за раз (не блокировать API)
 
     except Exception as e:
         logger.warning(f"[LookAhead] Failed for {chat_id}: {e}")
 
 
 async def pre_generate_upcoming():
-    """Пре-генерация контента марафона за PREGEN_HOURS_AHEAD часов до доставки.
+    """Пре-генерация контента марафона до доставки (каждую минуту).
 
-    Запускается каждую минуту. Находит пользователей, чьё schedule_time наступит
-    через 3 часа, и генерирует контент заранее — чтобы в момент доставки
-    не нагружать Claude API.
+    Новые слоты окна PREGEN_LEAD_HOURS ставятся в job_queue с ровным темпом
+    (core/pregen_planner.py) — без минутных пиков на популярных слотах.
+    Постановка идемпотентна, поэтому реплики не создают дублей.
     """
-    now = moscow_now()
-    target = now + timedelta(hours=PREGEN_HOURS_AHEAD)
-
-    users = await get_marathon_users_at_time(target.hour, target.minute)
-    if not users:
-        return
-
-    from core.topics import get_next_topic_index
-
-    logger.info(f"[PreGen] Found {len(users)} marathon users for {target.hour:02d}:{target.minute:02d} "
-                f"(delivery in {PREGEN_HOURS_AHEAD}h)")
-
-    sem = asyncio.Semaphore(20)
+    from core.pregen_planner import get_pregen_planner
+    await get_pregen_planner().run(moscow_now())
 
-    async def _pregen_one(chat_id: int):
-        async with sem:
-            try:
-                intern = await get_intern(chat_id)
-                if not intern or intern.get('marathon_status') != 'active':
-                    return
-
-                topic_index = get_next_topic_index(intern)
-                if topic_index is None:
-                    return
-
-                # Уже пре-генерирован?
-                existing = await get_marathon_content(chat_id, topic_index)
-                if existing and existing.get('status') == 'pending':
-                    return
-
-                success = await _generate_and_save_content(chat_id, intern, topic_index)
-                if success:
-                    logger.info(f"[PreGen] Content ready for {chat_id}, topic {topic_index}")
-                else:
-                    _schedule_retry(chat_id, 'marathon')
-            except asyncio.TimeoutError:
-                logger.error(f"[PreGen] Timeout for {chat_id}")
-                _schedule_retry(chat_id, 'marathon')
-            except Exception as e:
-                logger.error(f"[PreGen] Error for {chat_id}: {e}")
 
-    await asyncio.gather(*[_pregen_one(cid) for cid in users])
-
-
-async def pre_generate_feed_digest(chat_id: int, bot: Bot):
+async def pre_generate_feed_digest(chat_id: int, bot: Bot, intern: Optional[dict] = None):
     """Пре-генерация дайджеста Ленты и отправка уведомления.
 
     Паттерн аналогичен send_scheduled_topic() для Марафона:
@@ -312,7 +316,8 @@ async def pre_generate_feed_digest(chat_id: int, bot: Bot):
     from engines.feed.planner import generate_multi_topic_digest
     from config import FeedWeekStatus, FEED_SESSION_DURATION_MAX, FEED_SESSION_DURATION_MIN
 
-    intern = await get_intern(chat_id)
+    if intern is None:
+        intern = await get_intern(chat_id)
     if not intern:
         return
 
@@ -372,7 +377,7 @@ async def pre_generate_feed_digest(chat_id: int, bot: Bot):
 
         if not content or not content.get('topics_detail'):
             logger.error(f"[Scheduler] Feed: digest generation returned empty for {chat_id}")
-            _schedule_retry(chat_id, 'feed')
+            await _schedule_retry(chat_id, 'feed')
             return
 
         # Сохраняем как pending (не показана пользователю)
@@ -390,11 +395,11 @@ async def pre_generate_feed_digest(chat_id: int, bot: Bot):
 
     except asyncio.TimeoutError:
         logger.error(f"[Scheduler] Feed: pre-generation timeout (120s) for {chat_id}")
-        _schedule_retry(chat_id, 'feed')
+        await _schedule_retry(chat_id, 'feed')
         return
     except Exception as e:
         logger.error(f"[Scheduler] Feed: pre-generation error for {chat_id}: {e}")
-        _schedule_retry(chat_id, 'feed')
+        await _schedule_retry(chat_id, 'feed')
         return
 
     # Отправляем уведомление с кнопкой «Получить дайджест»
@@ -417,17 +422,28 @@ async def pre_generate_feed_digest(chat_id: int, bot: Bot):
             logger.error(f"[Scheduler] Error sending feed notification to {chat_id}: {e}")
 
 
-async def send_scheduled_topic(chat_id: int, bot: Bot):
+async def send_scheduled_topic(
+    chat_id: int,
+    bot: Bot,
+    intern: Optional[dict] = None,
+    contents: Optional[dict] = None,
+    reminders: Optional[list] = None,
+):
     """Отправка уведомления о готовности урока марафона по расписанию.
 
     Проверяет, пре-генерирован ли контент (за 3ч через pre_generate_upcoming).
     Если да — сразу уведомление. Если нет — fallback на генерацию сейчас.
+
+    scheduled_check передаёт данные слота, загруженные заранее:
+    intern — профиль, contents — {(chat_id, topic_index): контент},
+    reminders — список chat_id, которым напоминания ставятся пачкой.
     """
     from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
     from core.topics import get_marathon_day, get_next_topic_index, get_topic, get_total_topics, get_lessons_tasks_progress
     from core.knowledge import get_topic_title
 
-    intern = await get_intern(chat_id)
+    if intern is None:
+        intern = await get_intern(chat_id)
     lang = intern.get('language', 'ru') or 'ru' if intern else 'ru'
 
     # Проверяем что марафон активен
@@ -491,7 +507,10 @@ async def send_scheduled_topic(chat_id: int, bot: Bot):
     # current_topic_index обновляется в lesson.py при реальном взаимодействии пользователя.
 
     # ─── Проверяем: контент уже пре-генерирован (за 3h)? ───
-    existing = await get_marathon_content(chat_id, topic_index)
+    if contents is not None:
+        existing = contents.get((chat_id, topic_index))
+    else:
+        existing = await get_marathon_content(chat_id, topic_index)
     if existing and existing.get('status') == 'pending' and existing.get('lesson_content'):
         logger.info(f"[Scheduler] Pre-generated content found for {chat_id}, topic {topic_index} — skip generation")
     else:
@@ -500,20 +519,23 @@ async def send_scheduled_topic(chat_id: int, bot: Bot):
             success = await _generate_and_save_content(chat_id, intern, topic_index)
             if not success:
                 logger.error(f"[Scheduler] Lesson generation failed for {chat_id}, topic {topic_index}")
-                _schedule_retry(chat_id, 'marathon')
+                await _schedule_retry(chat_id, 'marathon')
                 return
             logger.info(f"[Scheduler] On-demand generation for {chat_id}, topic {topic_index}")
         except asyncio.TimeoutError:
             logger.error(f"[Scheduler] Pre-generation timeout (120s) for {chat_id}, topic {topic_index}")
-            _schedule_retry(chat_id, 'marathon')
+            await _schedule_retry(chat_id, 'marathon')
             return
         except Exception as e:
             logger.error(f"[Scheduler] Pre-generation error for {chat_id}: {e}")
-            _schedule_retry(chat_id, 'marathon')
+            await _schedule_retry(chat_id, 'marathon')
             return
 
     # Планируем напоминания (+1ч и +3ч)
-    await schedule_reminders(chat_id, intern)
+    if reminders is not None:
+        reminders.append(chat_id)
+    else:
+        await schedule_reminders([chat_id])
 
     # Определяем: catch-up (урок с прошлого дня) или обычный
     is_catchup = topic['day'] < marathon_day
@@ -549,37 +571,39 @@ async def send_scheduled_topic(chat_id: int, bot: Bot):
         logger.info(f"[Scheduler] Sent marathon notification to {chat_id}, topic: {topic_title}")
 
 
-async def schedule_reminders(chat_id: int, intern: dict):
-    """Планирует напоминания для пользователя."""
+async def schedule_reminders(chat_ids: list):
+    """Планирует напоминания (+1ч и +3ч) пачке пользователей — двумя запросами."""
+    if not chat_ids:
+        return
     from db import get_pool
 
     now = moscow_now()
+    # Убираем timezone для совместимости с TIMESTAMP (без timezone)
+    times = [(now + timedelta(hours=hours)).replace(tzinfo=None) for hours in (1, 3)]
 
     async with (await get_pool()).acquire() as conn:
-        # Удаляем старые неотправленные напоминания
-        await conn.execute(
-            'DELETE FROM reminders WHERE chat_id = $1 AND sent = FALSE',
-            chat_id
-        )
-
-        # Планируем напоминания +1ч и +3ч
-        for hours in [1, 3]:
-            reminder_time = now + timedelta(hours=hours)
-            # Убираем timezone для совместимости с TIMESTAMP (без timezone)
-            reminder_time_naive = reminder_time.replace(tzinfo=None)
+        async with conn.transaction():
+            # Удаляем старые неотправленные напоминания
+            await conn.execute(
+                'DELETE FROM reminders WHERE chat_id = ANY($1::bigint[]) AND sent = FALSE',
+                chat_ids
+            )
             await conn.execute(
                 '''INSERT INTO reminders (chat_id, reminder_type, scheduled_for)
-                   VALUES ($1, $2, $3)''',
-                chat_id, f'+{hours}h', reminder_time_naive
+                   SELECT c.chat_id, r.reminder_type, r.scheduled_for
+                   FROM unnest($1::bigint[]) AS c(chat_id)
+                   CROSS JOIN unnest($2::text[], $3::timestamp[]) AS r(reminder_type, scheduled_for)''',
+                chat_ids, ['+1h', '+3h'], times
             )
 
 
-async def send_reminder(chat_id: int, reminder_type: str, bot: Bot):
+async def send_reminder(chat_id: int, reminder_type: str, bot: Bot, intern: Optional[dict] = None):
     """Отправляет напоминание с кнопкой «Получить урок»."""
     from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
     from core.topics import get_marathon_day
 
-    intern = await get_intern(chat_id)
+    if intern is None:
+        intern = await get_intern(chat_id)
     lang = intern.get('language', 'ru') or 'ru' if intern else 'ru'
     topics_today = get_topics_today(intern)
 
@@ -620,46 +644,64 @@ async def send_reminder(chat_id: int, reminder_type: str, bot: Bot):
 
 
 async def check_reminders():
-    """Проверяет и отправляет запланированные напоминания."""
-    from db import get_pool
+    """Проверяет и отправляет запланированные напоминания.
 
-    now = moscow_now()
-    now_naive = now.replace(tzinfo=None)
+    Забирает наступившие пачками по _REMINDER_CHUNK, отправляет пачку
+    параллельно (темп держит SafeBot) и отмечает итог одним запросом;
+    соединение с БД на время отправки не удерживается.
+    """
+    from db.queries.reminders import release_reminders
 
-    async with (await get_pool()).acquire() as conn:
-        rows = await conn.fetch(
-            '''SELECT id, chat_id, reminder_type FROM reminders
-               WHERE sent = FALSE AND scheduled_for <= $1''',
-            now_naive
-        )
+    now_naive = moscow_now().replace(tzinfo=None)
+    bot = _get_bot()
+    sem = asyncio.Semaphore(_REMINDER_CONCURRENCY)
+    failed = []  # вернуть в очередь в конце: иначе их заберёт следующая пачка
 
-        if not rows:
-            return
+    try:
+        while await _send_reminder_chunk(now_naive, bot, sem, failed):
+            pass
+    finally:
+        await release_reminders(failed)
 
-        bot = Bot(token=_bot_token)
 
-        for row in rows:
+async def _send_reminder_chunk(now_naive, bot: Bot, sem: asyncio.Semaphore, failed: list) -> bool:
+    """Одна пачка check_reminders. True — пачка полная, возможно есть ещё."""
+    from db.queries.reminders import claim_due_reminders, mark_reminders_sent
+
+    rows = await claim_due_reminders(now_naive, _REMINDER_CHUNK)
+    if not rows:
+        return False
+    try:
+        interns = await get_interns([row['chat_id'] for row in rows])
+    except Exception as e:
+        logger.warning(f"Reminder prefetch failed, loading per user: {e}")
+        interns = {}
+    done = []
+
+    async def _send(row):
+        async with sem:
             try:
-                await send_reminder(row['chat_id'], row['reminder_type'], bot)
-                await conn.execute(
-                    'UPDATE reminders SET sent = TRUE WHERE id = $1',
-                    row['id']
+                await send_reminder(
+                    row['chat_id'], row['reminder_type'], bot,
+                    intern=interns.get(row['chat_id']),
                 )
+                done.append(row['id'])
                 logger.info(f"Sent {row['reminder_type']} reminder to {row['chat_id']}")
             except Exception as e:
                 error_msg = str(e).lower()
                 if 'blocked' in error_msg or 'deactivated' in error_msg or 'chat not found' in error_msg:
                     logger.warning(f"User {row['chat_id']} blocked bot, marking reminder {row['id']} as sent")
-                    await conn.execute(
-                        'UPDATE reminders SET sent = TRUE WHERE id = $1',
-                        row['id']
-                    )
+                    done.append(row['id'])
                 else:
                     logger.error(f"Failed to send reminder to {row['chat_id']}: {e}")
+                    failed.append(row['id'])
 
-        await bot.session.close()
+    await asyncio.gather(*[_send(row) for row in rows])
+    await mark_reminders_sent(done)
+    return len(rows) == _REMINDER_CHUNK
 
 
+@claude_priority(Priority.DELIVERY)
 async def scheduled_check():
     """Проверка расписания каждую минуту."""
     now = moscow_now()
@@ -673,17 +715,49 @@ async def scheduled_check():
 
     if scheduled:
         logger.info(f"[Scheduler] {time_str} MSK — найдено {len(scheduled)} пользователей для отправки")
-        bot = Bot(token=_bot_token)
-        me = await bot.get_me()
-        logger.info(f"[Scheduler] Bot ID: {bot.id}, username: {me.username}")
+        bot = _get_bot()
+
+        # Профили и пре-генерированный контент всего слота — двумя запросами
+        # вместо двух на пользователя. При ошибке — поштучная загрузка.
+        interns, contents = {}, None
+        try:
+            from core.topics import get_next_topic_index
+            interns = await get_interns([cid for cid, _ in scheduled])
+            content_keys = []
+            for cid, send_type in scheduled:
+                intern = interns.get(cid)
+                if intern and send_type in ('marathon', 'both'):
+                    topic_index = get_next_topic_index(intern)
+                    if topic_index is not None:
+                        content_keys.append((cid, topic_index))
+            contents = await get_marathon_contents(content_keys)
+        except Exception as e:
+            logger.warning(f"[Scheduler] Slot prefetch failed, loading per user: {e}")
+        # Напоминания пишутся пачками по мере доставки и в finally —
+        # сбой посреди слота не теряет их у уже получивших урок
+        reminder_chat_ids = []
+
+        async def _flush_reminders():
+            batch = reminder_chat_ids[:]
+            reminder_chat_ids.clear()
+            try:
+                await schedule_reminders(batch)
+            except Exception as e:
+                logger.error(f"[Scheduler] Failed to schedule reminders: {e}")
 
         async def _process_user(chat_id: int, send_type: str):
             """Обработка одного пользователя (marathon + feed)."""
+            intern = interns.get(chat_id)
             try:
                 if send_type in ('marathon', 'both'):
-                    await send_scheduled_topic(chat_id, bot)
+                    await send_scheduled_topic(
+                        chat_id, bot, intern=intern,
+                        contents=contents, reminders=reminder_chat_ids,
+                    )
+                    if len(reminder_chat_ids) >= _REMINDER_CHUNK:
+                        await _flush_reminders()
                 if send_type in ('feed', 'both'):
-                    await pre_generate_feed_digest(chat_id, bot)
+                    await pre_generate_feed_digest(chat_id, bot, intern=intern)
                 logger.info(f"[Scheduler] Sent {send_type} to {chat_id}")
             except Exception as e:
                 error_msg = str(e).lower()
@@ -693,15 +767,17 @@ async def scheduled_check():
                     logger.error(f"[Scheduler] Ошибка отправки пользователю {chat_id}: {e}", exc_info=True)
 
         # Параллельная обработка пользователей (max 40 одновременно)
-        # Telegram rate limit: 30 msg/sec, но Claude генерация (5-10с) stagger-ит сообщения
+        # Telegram rate limit (30 msg/sec, 1 msg/sec на чат) соблюдает SafeBot
         sem = asyncio.Semaphore(40)
 
         async def _bounded(chat_id, send_type):
             async with sem:
                 await _process_user(chat_id, send_type)
 
-        await asyncio.gather(*[_bounded(cid, st) for cid, st in scheduled])
-        await bot.session.close()
+        try:
+            await asyncio.gather(*[_bounded(cid, st) for cid, st in scheduled])
+        finally:
+            await _flush_reminders()
 
     # Проверяем напоминания
     await check_reminders()
@@ -756,12 +832,9 @@ async def scheduled_check():
         try:
             alert = await _check_schedule_integrity(now)
             if alert:
-                bot = Bot(token=_bot_token)
-                try:
-                    await bot.send_message(int(dev_chat_id), alert, parse_mode="HTML")
-                    logger.warning(f"[Scheduler] Schedule integrity alert sent")
-                finally:
-                    await bot.session.close()
+                bot = _get_bot()
+                await bot.send_message(int(dev_chat_id), alert, parse_mode="HTML")
+                logger.warning(f"[Scheduler] Schedule integrity alert sent")
         except Exception as e:
             logger.error(f"[Scheduler] Schedule integrity check error: {e}")
 
@@ -771,12 +844,9 @@ async def scheduled_check():
             from db.queries.traces import check_latency_alerts
             alert_text = await check_latency_alerts(minutes=15)
             if alert_text:
-                bot = Bot(token=_bot_token)
-                try:
-                    await bot.send_message(int(dev_chat_id), alert_text, parse_mode="HTML")
-                    logger.info("[Scheduler] Latency alert sent to developer")
-                finally:
-                    await bot.session.close()
+                bot = _get_bot()
+                await bot.send_message(int(dev_chat_id), alert_text, parse_mode="HTML")
+                logger.info("[Scheduler] Latency alert sent to developer")
         except Exception as e:
             logger.error(f"[Scheduler] Latency alert error: {e}")
 
@@ -786,12 +856,9 @@ async def scheduled_check():
             from db.queries.errors import check_error_alerts
             alert_text = await check_error_alerts(minutes=15)
             if alert_text:
-                bot = Bot(token=_bot_token)
-                try:
-                    await bot.send_message(int(dev_chat_id), alert_text, parse_mode="HTML")
-                    logger.info("[Scheduler] Error alert sent to developer")
-                finally:
-                    await bot.session.close()
+                bot = _get_bot()
+                await bot.send_message(int(dev_chat_id), alert_text, parse_mode="HTML")
+                logger.info("[Scheduler] Error alert sent to developer")
         except Exception as e:
             logger.error(f"[Scheduler] Error alert error: {e}")
 
@@ -801,12 +868,9 @@ async def scheduled_check():
             from core.error_classifier import check_escalation
             escalation_text = await check_escalation()
             if escalation_text:
-                bot = Bot(token=_bot_token)
-                try:
-                    await bot.send_message(int(dev_chat_id), escalation_text, parse_mode="HTML")
-                    logger.info("[Scheduler] Escalation alert sent to developer")
-                finally:
-                    await bot.session.close()
+                bot = _get_bot()
+                await bot.send_message(int(dev_chat_id), escalation_text, parse_mode="HTML")
+                logger.info("[Scheduler] Escalation alert sent to developer")
         except Exception as e:
             logger.error(f"[Scheduler] Escalation check error: {e}")
 
@@ -814,13 +878,10 @@ async def scheduled_check():
     if now.minute % 15 == 0 and dev_chat_id:
         try:
             from core.autofix import run_autofix_cycle
-            bot = Bot(token=_bot_token)
-            try:
-                proposals = await run_autofix_cycle(bot, dev_chat_id)
-                if proposals > 0:
-                    logger.info(f"[Scheduler] AutoFix: {proposals} proposals sent")
-            finally:
-                await bot.session.close()
+            bot = _get_bot()
+            proposals = await run_autofix_cycle(bot, dev_chat_id)
+            if proposals > 0:
+                logger.info(f"[Scheduler] AutoFix: {proposals} proposals sent")
         except Exception as e:
             logger.error(f"[Scheduler] AutoFix cycle error: {e}")
 
@@ -828,13 +889,10 @@ async def scheduled_check():
     if now.minute % 15 == 0 and dev_chat_id:
         try:
             from core.health_check import run_l3_health_check
-            bot = Bot(token=_bot_token)
-            try:
-                restarted = await run_l3_health_check(bot, dev_chat_id)
-                if restarted:
-                    logger.warning("[Scheduler] L3: Railway restart triggered")
-            finally:
-                await bot.session.close()
+            bot = _get_bot()
+            restarted = await run_l3_health_check(bot, dev_chat_id)
+            if restarted:
+                logger.warning("[Scheduler] L3: Railway restart triggered")
         except Exception as e:
             logger.error(f"[Scheduler] L3 health check error: {e}")
 
@@ -849,6 +907,16 @@ async def scheduled_check():
             await cleanup_old_traces(days=7)
         except Exception as e:
             logger.error(f"[Scheduler] Traces cleanup error: {e}")
+        try:
+            from db.queries.llm_usage import cleanup_old_llm_usage
+            await cleanup_old_llm_usage(days=30)
+        except Exception as e:
+            logger.error(f"[Scheduler] LLM usage cleanup error: {e}")
+        try:
+            from db.queries.jobs import cleanup_old_jobs
+            await cleanup_old_jobs(days=7)
+        except Exception as e:
+            logger.error(f"[Scheduler] Job queue cleanup error: {e}")
         try:
             from db.queries.errors import cleanup_old_errors
             await cleanup_old_errors(days=7)
@@ -932,6 +1000,8 @@ async def _check_schedule_integrity(now) -> Optional[str]:
             # Auto-fix
             await conn.execute("UPDATE interns SET schedule_time = LPAD(schedule_time, 5, '0') WHERE schedule_time ~ '^[0-9]:'")
             await conn.execute("UPDATE interns SET feed_schedule_time = LPAD(feed_schedule_time, 5, '0') WHERE feed_schedule_time ~ '^[0-9]:'")
+            from db.queries.users import invalidate_intern
+            invalidate_intern()
 
         # 2. Contradictory states: has progress but status = 'not_started'
         contradictions = await conn.fetch('''
@@ -971,6 +1041,15 @@ async def _neon_keep_alive():
         logger.warning(f"[Scheduler] Neon keep-alive failed: {e}")
 
 
+async def _refresh_rollups():
+    """Дописать часовые/дневные агрегаты dev-отчётов (каждые 5 минут)."""
+    try:
+        from db.queries.rollups import refresh_rollups
+        await refresh_rollups()
+    except Exception as e:
+        logger.error(f"[Scheduler] Rollups refresh error: {e}")
+
+
 # ═══════════════════════════════════════════════════════════
 # DIGITAL TWIN SYNC RETRY
 # ═══════════════════════════════════════════════════════════
@@ -1004,40 +1083,37 @@ async def send_subscription_launch_notification():
     from db import get_pool
 
     price = get_current_price()
-    bot = Bot(token=_bot_token)
+    bot = _get_bot()
 
-    try:
-        pool = await get_pool()
-        async with pool.acquire() as conn:
-            rows = await conn.fetch(
-                'SELECT chat_id FROM interns WHERE onboarding_completed = TRUE'
-            )
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            'SELECT chat_id FROM interns WHERE onboarding_completed = TRUE'
+        )
 
-        sent = 0
-        for row in rows:
-            chat_id = row['chat_id']
-            intern = await get_intern(chat_id)
-            lang = intern.get('language', 'ru') or 'ru'
+    sent = 0
+    for row in rows:
+        chat_id = row['chat_id']
+        intern = await get_intern(chat_id)
+        lang = intern.get('language', 'ru') or 'ru'
 
-            text = t('subscription.launch_notification', lang, price=price)
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(
-                    text=t('subscription.subscribe_button', lang, price=price),
-                    callback_data="subscribe",
-                )]
-            ])
+        text = t('subscription.launch_notification', lang, price=price)
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(
+                text=t('subscription.subscribe_button', lang, price=price),
+                callback_data="subscribe",
+            )]
+        ])
 
-            try:
-                await bot.send_message(chat_id, text, reply_markup=keyboard, parse_mode="Markdown")
-                sent += 1
-            except Exception as e:
-                error_msg = str(e).lower()
-                if 'blocked' not in error_msg and 'deactivated' not in error_msg:
-                    logger.error(f"[Scheduler] Launch notification error for {chat_id}: {e}")
+        try:
+            await bot.send_message(chat_id, text, reply_markup=keyboard, parse_mode="Markdown")
+            sent += 1
+        except Exception as e:
+            error_msg = str(e).lower()
+            if 'blocked' not in error_msg and 'deactivated' not in error_msg:
+                logger.error(f"[Scheduler] Launch notification error for {chat_id}: {e}")
 
-        logger.info(f"[Scheduler] Subscription launch notification sent to {sent}/{len(rows)} users")
-    finally:
-        await bot.session.close()
+    logger.info(f"[Scheduler] Subscription launch notification sent to {sent}/{len(rows)} users")
 
 
 # ═══════════════════════════════════════════════════════════
@@ -1051,36 +1127,33 @@ async def send_trial_expiry_notifications():
     from db.queries.subscription import get_trial_expiring_users
 
     price = get_current_price()
-    bot = Bot(token=_bot_token)
+    bot = _get_bot()
 
-    try:
-        for days_ahead in [1, 0]:
-            chat_ids = await get_trial_expiring_users(days_ahead)
-            for chat_id in chat_ids:
-                intern = await get_intern(chat_id)
-                lang = intern.get('language', 'ru') or 'ru'
-
-                if days_ahead == 1:
-                    text = t('subscription.trial_expiring', lang)
-                else:
-                    text = t('subscription.trial_expired', lang)
+    for days_ahead in [1, 0]:
+        chat_ids = await get_trial_expiring_users(days_ahead)
+        for chat_id in chat_ids:
+            intern = await get_intern(chat_id)
+            lang = intern.get('language', 'ru') or 'ru'
 
-                keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(
-                        text=t('subscription.subscribe_button', lang, price=price),
-                        callback_data="subscribe",
-                    )]
-                ])
+            if days_ahead == 1:
+                text = t('subscription.trial_expiring', lang)
+            else:
+                text = t('subscription.trial_expired', lang)
 
-                try:
-                    await bot.send_message(chat_id, text, reply_markup=keyboard, parse_mode="Markdown")
-                    logger.info(f"[Scheduler] Trial expiry notification sent to {chat_id} (days_ahead={days_ahead})")
-                except Exception as e:
-                    error_msg = str(e).lower()
-                    if 'blocked' not in error_msg and 'deactivated' not in error_msg:
-                        logger.error(f"[Scheduler] Trial notification error for {chat_id}: {e}")
-    finally:
-        await bot.session.close()
+            keyboard = InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(
+                    text=t('subscription.subscribe_button', lang, price=price),
+                    callback_data="subscribe",
+                )]
+            ])
+
+            try:
+                await bot.send_message(chat_id, text, reply_markup=keyboard, parse_mode="Markdown")
+                logger.info(f"[Scheduler] Trial expiry notification sent to {chat_id} (days_ahead={days_ahead})")
+            except Exception as e:
+                error_msg = str(e).lower()
+                if 'blocked' not in error_msg and 'deactivated' not in error_msg:
+                    logger.error(f"[Scheduler] Trial notification error for {chat_id}: {e}")
 
 
 # ═══════════════════════════════════════════════════════════
@@ -1096,92 +1169,89 @@ async def send_milestone_notifications():
     )
     from config.settings import PLATFORM_URLS
 
-    bot = Bot(token=_bot_token)
+    bot = _get_bot()
     total_sent = 0
 
-    try:
-        for day in MILESTONE_DAYS:
-            milestone = f"day_{day}"
-            users = await get_milestone_eligible_users(day)
+    for day in MILESTONE_DAYS:
+        milestone = f"day_{day}"
+        users = await get_milestone_eligible_users(day)
 
-            for user in users:
-                chat_id = user['chat_id']
-                lang = user.get('language', 'ru') or 'ru'
+        for user in users:
+            chat_id = user['chat_id']
+            lang = user.get('language', 'ru') or 'ru'
 
-                try:
-                    completed = json.loads(user.get('completed_topics', '[]') or '[]')
-                except (json.JSONDecodeError, TypeError):
-                    completed = []
-                topics_count = len(completed)
-                active_days = user.get('active_days_total', 0) or 0
-                streak = user.get('longest_streak', 0) or 0
-                bloom = user.get('complexity_level', 1) or 1
-
-                # Базовое сообщение
-                text = t(f'milestones.day_{day}', lang,
-                         topics=topics_count,
-                         active_days=active_days,
-                         streak=streak,
-                         bloom=bloom,
-                         marathon_status='')
-
-                # Специальные вставки для day_7 и day_14
-                if day == 7:
-                    trial_text = t('milestones.day_7_trial', lang)
-                    text += trial_text
-
-                if day == 14:
-                    marathon_done = user.get('marathon_status') == 'completed'
-                    if marathon_done:
-                        ms = t('milestones.day_14_marathon_done', lang)
-                    else:
-                        ms = t('milestones.day_14_marathon_progress', lang,
-                               completed=topics_count)
-                    text = text.replace('{marathon_status}', ms)
-
-                # Кнопки: day_30 и ниже → предложить ЛР, day_60 → twin
-                keyboard = None
-                if day in (30, 90):
+            try:
+                completed = json.loads(user.get('completed_topics', '[]') or '[]')
+            except (json.JSONDecodeError, TypeError):
+                completed = []
+            topics_count = len(completed)
+            active_days = user.get('active_days_total', 0) or 0
+            streak = user.get('longest_streak', 0) or 0
+            bloom = user.get('complexity_level', 1) or 1
+
+            # Базовое сообщение
+            text = t(f'milestones.day_{day}', lang,
+                     topics=topics_count,
+                     active_days=active_days,
+                     streak=streak,
+                     bloom=bloom,
+                     marathon_status='')
+
+            # Специальные вставки для day_7 и day_14
+            if day == 7:
+                trial_text = t('milestones.day_7_trial', lang)
+                text += trial_text
+
+            if day == 14:
+                marathon_done = user.get('marathon_status') == 'completed'
+                if marathon_done:
+                    ms = t('milestones.day_14_marathon_done', lang)
+                else:
+                    ms = t('milestones.day_14_marathon_progress', lang,
+                           completed=topics_count)
+                text = text.replace('{marathon_status}', ms)
+
+            # Кнопки: day_30 и ниже → предложить ЛР, day_60 → twin
+            keyboard = None
+            if day in (30, 90):
+                keyboard = InlineKeyboardMarkup(inline_keyboard=[
+                    [InlineKeyboardButton(
+                        text=t('milestones.btn_program', lang),
+                        url=PLATFORM_URLS['lr'],
+                    )]
+                ])
+            elif day == 60:
+                keyboard = InlineKeyboardMarkup(inline_keyboard=[
+                    [InlineKeyboardButton(
+                        text=t('milestones.btn_twin', lang),
+                        callback_data="cmd_twin",
+                    )]
+                ])
+            elif day == 14:
+                marathon_done = user.get('marathon_status') == 'completed'
+                if marathon_done:
                     keyboard = InlineKeyboardMarkup(inline_keyboard=[
                         [InlineKeyboardButton(
                             text=t('milestones.btn_program', lang),
                             url=PLATFORM_URLS['lr'],
                         )]
                     ])
-                elif day == 60:
-                    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                        [InlineKeyboardButton(
-                            text=t('milestones.btn_twin', lang),
-                            callback_data="cmd_twin",
-                        )]
-                    ])
-                elif day == 14:
-                    marathon_done = user.get('marathon_status') == 'completed'
-                    if marathon_done:
-                        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                            [InlineKeyboardButton(
-                                text=t('milestones.btn_program', lang),
-                                url=PLATFORM_URLS['lr'],
-                            )]
-                        ])
 
-                try:
-                    await bot.send_message(
-                        chat_id, text,
-                        reply_markup=keyboard,
-                        parse_mode="Markdown",
-                    )
-                    await log_conversion_event(chat_id, 'C3', milestone)
-                    total_sent += 1
-                    logger.info(f"[Scheduler] Milestone {milestone} sent to {chat_id}")
-                except Exception as e:
-                    error_msg = str(e).lower()
-                    if any(x in error_msg for x in ('blocked', 'deactivated', 'chat not found')):
-                        logger.warning(f"[Scheduler] Milestone {milestone}: user {chat_id} unavailable, skipping")
-                    else:
-                        logger.error(f"[Scheduler] Milestone {milestone} error for {chat_id}: {e}")
-    finally:
-        await bot.session.close()
+            try:
+                await bot.send_message(
+                    chat_id, text,
+                    reply_markup=keyboard,
+                    parse_mode="Markdown",
+                )
+                await log_conversion_event(chat_id, 'C3', milestone)
+                total_sent += 1
+                logger.info(f"[Scheduler] Milestone {milestone} sent to {chat_id}")
+            except Exception as e:
+                error_msg = str(e).lower()
+                if any(x in error_msg for x in ('blocked', 'deactivated', 'chat not found')):
+                    logger.warning(f"[Scheduler] Milestone {milestone}: user {chat_id} unavailable, skipping")
+                else:
+                    logger.error(f"[Scheduler] Milestone {milestone} error for {chat_id}: {e}")
 
     if total_sent > 0:
         logger.info(f"[Scheduler] Milestone notifications: {total_sent} sent")
@@ -1210,56 +1280,53 @@ async def send_event_notifications():
                WHERE onboarding_completed = TRUE'''
         )
 
-    bot = Bot(token=_bot_token)
+    bot = _get_bot()
     total_sent = 0
 
-    try:
-        for event in events:
-            event_name = event.get("name_ru", "")
-            event_url = event.get("url", "")
-            days_until = event.get("days_until", 0)
-            event_date = event["date"].strftime("%d.%m")
-            milestone_key = f"event:{event_name[:40]}"
-
-            for row in rows:
-                chat_id = row['chat_id']
-                lang = row.get('language', 'ru') or 'ru'
-
-                # Dedup: не отправляли ли уже C7 для этого события
-                if await was_milestone_sent(chat_id, milestone_key):
-                    continue
+    for event in events:
+        event_name = event.get("name_ru", "")
+        event_url = event.get("url", "")
+        days_until = event.get("days_until", 0)
+        event_date = event["date"].strftime("%d.%m")
+        milestone_key = f"event:{event_name[:40]}"
 
-                name = event.get(f"name_{lang}", event_name)
-                if lang == 'ru':
-                    text = (
-                        f"📅 *Событие через {days_until} дн. ({event_date})*\n\n"
-                        f"*{name}*\n\n"
-                        f"Зарегистрироваться можно по ссылке ниже."
-                    )
-                else:
-                    text = (
-                        f"📅 *Event in {days_until} days ({event_date})*\n\n"
-                        f"*{name}*\n\n"
-                        f"Register using the link below."
-                    )
+        for row in rows:
+            chat_id = row['chat_id']
+            lang = row.get('language', 'ru') or 'ru'
 
-                keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(
-                        text="📅 " + ("Зарегистрироваться" if lang == 'ru' else "Register"),
-                        url=event_url,
-                    )]
-                ])
+            # Dedup: не отправляли ли уже C7 для этого события
+            if await was_milestone_sent(chat_id, milestone_key):
+                continue
 
-                try:
-                    await bot.send_message(chat_id, text, reply_markup=keyboard, parse_mode="Markdown")
-                    await log_conversion_event(chat_id, 'C7', milestone_key)
-                    total_sent += 1
-                except Exception as e:
-                    error_msg = str(e).lower()
-                    if 'blocked' not in error_msg and 'deactivated' not in error_msg:
-                        logger.error(f"[Scheduler] Event notification error for {chat_id}: {e}")
-    finally:
-        await bot.session.close()
+            name = event.get(f"name_{lang}", event_name)
+            if lang == 'ru':
+                text = (
+                    f"📅 *Событие через {days_until} дн. ({event_date})*\n\n"
+                    f"*{name}*\n\n"
+                    f"Зарегистрироваться можно по ссылке ниже."
+                )
+            else:
+                text = (
+                    f"📅 *Event in {days_until} days ({event_date})*\n\n"
+                    f"*{name}*\n\n"
+                    f"Register using the link below."
+                )
+
+            keyboard = InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(
+                    text="📅 " + ("Зарегистрироваться" if lang == 'ru' else "Register"),
+                    url=event_url,
+                )]
+            ])
+
+            try:
+                await bot.send_message(chat_id, text, reply_markup=keyboard, parse_mode="Markdown")
+                await log_conversion_event(chat_id, 'C7', milestone_key)
+                total_sent += 1
+            except Exception as e:
+                error_msg = str(e).lower()
+                if 'blocked' not in error_msg and 'deactivated' not in error_msg:
+                    logger.error(f"[Scheduler] Event notification error for {chat_id}: {e}")
 
     if total_sent > 0:
         logger.info(f"[Scheduler] Event notifications: {total_sent} sent for {len(events)} events")
@@ -1277,7 +1344,7 @@ async def send_feedback_daily_digest(dev_chat_id: int):
     if not reports:
         return
 
-    bot = Bot(token=_bot_token)
+    bot = _get_bot()
     lines = [f"\U0001f7e1 <b>{len(reports)} новых отчётов за день:</b>\n"]
     for r in reports:
         scenario = r.get('scenario', 'other')
@@ -1291,8 +1358,6 @@ async def send_feedback_daily_digest(dev_chat_id: int):
         logger.info(f"[Scheduler] Sent feedback daily digest: {len(reports)} reports")
     except Exception as e:
         logger.error(f"[Scheduler] Feedback daily digest error: {e}")
-    finally:
-        await bot.session.close()
 
 
 async def send_feedback_weekly_digest(dev_chat_id: int):
@@ -1303,7 +1368,7 @@ async def send_feedback_weekly_digest(dev_chat_id: int):
     if not reports:
         return
 
-    bot = Bot(token=_bot_token)
+    bot = _get_bot()
     lines = [f"\U0001f7e2 <b>{len(reports)} предложений за неделю:</b>\n"]
     for r in reports:
         msg = (r.get('message', '') or '')[:60]
@@ -1316,8 +1381,6 @@ async def send_feedback_weekly_digest(dev_chat_id: int):
         logger.info(f"[Scheduler] Sent feedback weekly digest: {len(reports)} reports")
     except Exception as e:
         logger.error(f"[Scheduler] Feedback weekly digest error: {e}")
-    finally:
-        await bot.session.close()
 
 
 # ═══════════════════════════════════════════════════════════
@@ -1339,65 +1402,62 @@ async def _discourse_scheduled_publish():
     if not pubs:
         return
 
-    bot = Bot(token=_bot_token)
-    try:
-        for pub in pubs:
-            try:
-                result = await discourse.create_topic(
-                    category_id=pub["category_id"],
-                    title=pub["title"],
-                    raw=pub["raw"],
-                    username=pub["discourse_username"],
-                )
-                topic_id = result.get("topic_id")
-                post_id = result.get("id")
-
-                await mark_publication_done(pub["id"], topic_id)
-                await save_published_post(
-                    chat_id=pub["chat_id"],
-                    discourse_topic_id=topic_id,
-                    discourse_post_id=post_id,
-                    title=pub["title"],
-                    category_id=pub["category_id"],
-                    source_file=pub.get("source_file"),
-                )
-
-                # Обновить frontmatter (status → published) если есть source_file
-                source_file = pub.get("source_file")
-                if source_file:
-                    try:
-                        from clients.github_content import github_content, update_frontmatter_field
-                        if github_content:
-                            file_result = await github_content.read_file(source_file)
-                            if file_result:
-                                content, sha = file_result
-                                new_content = update_frontmatter_field(content, "status", "published")
-                                await github_content.update_file(
-                                    source_file, new_content, sha,
-                                    f"Published to club: {pub['title']}"
-                                )
-                    except Exception as fm_err:
-                        logger.warning(f"[Publisher] Frontmatter update failed for {source_file}: {fm_err}")
-
-                # Уведомить пользователя
-                slug = result.get("topic_slug", "")
-                url = f"https://systemsworld.club/t/{slug}/{topic_id}"
+    bot = _get_bot()
+    for pub in pubs:
+        try:
+            result = await discourse.create_topic(
+                category_id=pub["category_id"],
+                title=pub["title"],
+                raw=pub["raw"],
+                username=pub["discourse_username"],
+            )
+            topic_id = result.get("topic_id")
+            post_id = result.get("id")
+
+            await mark_publication_done(pub["id"], topic_id)
+            await save_published_post(
+                chat_id=pub["chat_id"],
+                discourse_topic_id=topic_id,
+                discourse_post_id=post_id,
+                title=pub["title"],
+                category_id=pub["category_id"],
+                source_file=pub.get("source_file"),
+            )
 
-                from db.queries.discourse import get_scheduled_count
-                queue_count = await get_scheduled_count(pub["chat_id"])
+            # Обновить frontmatter (status → published) если есть source_file
+            source_file = pub.get("source_file")
+            if source_file:
+                try:
+                    from clients.github_content import github_content, update_frontmatter_field
+                    if github_content:
+                        file_result = await github_content.read_file(source_file)
+                        if file_result:
+                            content, sha = file_result
+                            new_content = update_frontmatter_field(content, "status", "published")
+                            await github_content.update_file(
+                                source_file, new_content, sha,
+                                f"Published to club: {pub['title']}"
+                            )
+                except Exception as fm_err:
+                    logger.warning(f"[Publisher] Frontmatter update failed for {source_file}: {fm_err}")
+
+            # Уведомить пользователя
+            slug = result.get("topic_slug", "")
+            url = f"https://systemsworld.club/t/{slug}/{topic_id}"
+
+            from db.queries.discourse import get_scheduled_count
+            queue_count = await get_scheduled_count(pub["chat_id"])
 
-                await bot.send_message(
-                    pub["chat_id"],
-                    f"Опубликовано в клуб: «{pub['title']}»\n"
-                    f"{url}\n"
-                    f"В очереди: {queue_count}",
-                )
-                logger.info(f"[Publisher] Scheduled post published: topic_id={topic_id}, queue={queue_count}")
-            except Exception as e:
-                logger.error(f"[Discourse] Scheduled publish error for pub_id={pub['id']}: {e}")
-                await mark_publication_failed(pub["id"])
-    finally:
-        await bot.session.close()
+            await bot.send_message(
+                pub["chat_id"],
+                f"Опубликовано в клуб: «{pub['title']}»\n"
+                f"{url}\n"
+                f"В очереди: {queue_count}",
+            )
+            logger.info(f"[Publisher] Scheduled post published: topic_id={topic_id}, queue={queue_count}")
+        except Exception as e:
+            logger.error(f"[Discourse] Scheduled publish error for pub_id={pub['id']}: {e}")
+            await mark_publication_failed(pub["id"])
 
 
 async def _smart_publisher_scan():
@@ -1460,7 +1520,7 @@ async def _smart_publisher_scan():
     logger.info(f"[Publisher] Scanned {len(all_posts)} posts from index")
 
     # Для каждого пользователя с привязанным Discourse
-    bot = Bot(token=_bot_token)
+    bot = _get_bot()
     try:
         for account in accounts:
             chat_id = account["chat_id"]
@@ -1582,8 +1642,6 @@ async def _smart_publisher_scan():
                 )
     except Exception as e:
         logger.error(f"[Publisher] Smart scan error: {e}", exc_info=True)
-    finally:
-        await bot.session.close()
 
 
 async def _discourse_check_comments():
@@ -1598,38 +1656,35 @@ async def _discourse_check_comments():
     if not posts:
         return
 
-    bot = Bot(token=_bot_token)
-    try:
-        for post in posts:
-            try:
-                topic = await discourse.get_topic(post["discourse_topic_id"])
-                if not topic:
-                    continue
+    bot = _get_bot()
+    for post in posts:
+        try:
+            topic = await discourse.get_topic(post["discourse_topic_id"])
+            if not topic:
+                continue
 
-                new_count = topic.get("posts_count", 1)
-                old_count = post.get("posts_count", 1)
+            new_count = topic.get("posts_count", 1)
+            old_count = post.get("posts_count", 1)
 
-                if new_count > old_count:
-                    # Есть новые комментарии
-                    await update_post_comments_count(post["discourse_topic_id"], new_count)
+            if new_count > old_count:
+                # Есть новые комментарии
+                await update_post_comments_count(post["discourse_topic_id"], new_count)
 
-                    diff = new_count - old_count
-                    slug = topic.get("slug", "")
-                    topic_id = post["discourse_topic_id"]
-                    url = f"https://systemsworld.club/t/{slug}/{topic_id}"
-                    title = post.get("title", "")
+                diff = new_count - old_count
+                slug = topic.get("slug", "")
+                topic_id = post["discourse_topic_id"]
+                url = f"https://systemsworld.club/t/{slug}/{topic_id}"
+                title = post.get("title", "")
 
-                    word = "комментарий" if diff == 1 else "комментариев" if diff > 4 else "комментария"
-                    await bot.send_message(
-                        post["chat_id"],
-                        f"Новый {word} ({diff}) к посту *{title}*\n\n{url}",
-                        parse_mode="Markdown",
-                    )
-                    logger.info(f"[Discourse] New comments for topic {topic_id}: {old_count} -> {new_count}")
-                elif new_count == old_count:
-                    # Обновить last_checked_at
-                    await update_post_comments_count(post["discourse_topic_id"], new_count)
-            except Exception as e:
-                logger.error(f"[Discourse] Comment check error for topic {post.get('discourse_topic_id')}: {e}")
-    finally:
-        await bot.session.close()
+                word = "комментарий" if diff == 1 else "комментариев" if diff > 4 else "комментария"
+                await bot.send_message(
+                    post["chat_id"],
+                    f"Новый {word} ({diff}) к посту *{title}*\n\n{url}",
+                    parse_mode="Markdown",
+                )
+                logger.info(f"[Discourse] New comments for topic {topic_id}: {old_count} -> {new_count}")
+            elif new_count == old_count:
+                # Обновить last_checked_at
+                await update_post_comments_count(post["discourse_topic_id"], new_count)
+        except Exception as e:
+            logger.error(f"[Discourse] Comment check error for topic {post.get('discourse_topic_id')}: {e}")
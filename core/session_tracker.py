@@ -0,0 +1,125 @@
+"""
+Активные сессии пользователей в памяти процесса (вместо SELECT + UPDATE на запрос).
+
+Сессия = непрерывный период активности: закрывается, когда с последнего
+запроса прошло SESSION_TIMEOUT_MINUTES. Сроки — на колесе таймеров:
+слот = минута, в которую истекает сессия; при каждом запросе сессия
+переезжает в новый слот (старая запись в слоте становится устаревшей
+и пропускается при обходе). expire() обходит только наступившие слоты.
+
+В БД (user_sessions) сессия попадает при закрытии и на контрольных точках
+(checkpoint) — чтобы рестарт не терял открытые сессии. Запись — core/telemetry.py.
+Рассчитан на один event loop.
+"""
+
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+
+@dataclass
+class TrackedSession:
+    chat_id: int
+    started_at: datetime
+    last_at: datetime
+    entry_point: str
+    exit_point: str
+    request_count: int = 1
+    commands: List[str] = field(default_factory=list)
+    id: Optional[int] = None        # строка user_sessions (после первой записи)
+    ended: bool = False
+    dirty: bool = True
+    slot: int = -1
+
+    def row(self) -> dict:
+        """Снимок для записи в user_sessions."""
+        return {
+            'id': self.id,
+            'chat_id': self.chat_id,
+            'started_at': self.started_at,
+            'last_at': self.last_at,
+            'request_count': self.request_count,
+            'commands': json.dumps(self.commands),
+            'entry_point': self.entry_point,
+            'exit_point': self.exit_point,
+            'ended_at': self.last_at if self.ended else None,
+            'duration_seconds': int((self.last_at - self.started_at).total_seconds()) if self.ended else None,
+        }
+
+
+class SessionTracker:
+    """Открытые сессии по chat_id + колесо таймеров их истечения."""
+
+    def __init__(self, timeout_sec: float = 1800, tick_sec: float = 60, max_sessions: int = 20000):
+        self.timeout_sec = timeout_sec
+        self.tick_sec = tick_sec
+        self.max_sessions = max_sessions
+        self._sessions: Dict[int, TrackedSession] = {}
+        self._wheel: Dict[int, Set[int]] = {}
+        self._closed: List[TrackedSession] = []
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _schedule(self, session: TrackedSession) -> None:
+        deadline = session.last_at.timestamp() + self.timeout_sec
+        slot = -int(-deadline // self.tick_sec)  # ceil: слот наступает не раньше срока
+        if slot != session.slot:
+            session.slot = slot
+            self._wheel.setdefault(slot, set()).add(session.chat_id)
+
+    def _close(self, session: TrackedSession) -> None:
+        del self._sessions[session.chat_id]
+        session.ended = True
+        session.dirty = True
+        self._closed.append(session)
+
+    def touch(self, chat_id: int, command: str, now: datetime) -> bool:
+        """Запрос пользователя. False — сессий слишком много, запрос не учтён."""
+        session = self._sessions.get(chat_id)
+        if session and (now - session.last_at).total_seconds() >= self.timeout_sec:
+            self._close(session)  # истекла, но колесо ещё не дошло
+            session = None
+        if session is None:
+            if len(self._sessions) >= self.max_sessions:
+                return False
+            session = TrackedSession(
+                chat_id=chat_id, started_at=now, last_at=now,
+                entry_point=command, exit_point=command, commands=[command],
+            )
+            self._sessions[chat_id] = session
+        else:
+            session.last_at = now
+            session.request_count += 1
+            session.exit_point = command
+            if command not in session.commands:
+                session.commands.append(command)
+            session.dirty = True
+        self._schedule(session)
+        return True
+
+    def restore(self, session: TrackedSession) -> None:
+        """Вернуть открытую сессию из БД (после рестарта)."""
+        if session.chat_id not in self._sessions:
+            session.dirty = False
+            self._sessions[session.chat_id] = session
+            self._schedule(session)
+
+    def expire(self, now: datetime) -> List[TrackedSession]:
+        """Закрыть истёкшие сессии; вернуть все закрытые с прошлого вызова."""
+        current = int(now.timestamp() // self.tick_sec)
+        for slot in sorted(s for s in self._wheel if s <= current):
+            for chat_id in self._wheel.pop(slot):
+                session = self._sessions.get(chat_id)
+                if session and session.slot == slot:
+                    self._close(session)
+        closed, self._closed = self._closed, []
+        return closed
+
+    def dirty(self) -> List[TrackedSession]:
+        """Открытые сессии, изменившиеся с прошлой контрольной точки."""
+        return [s for s in self._sessions.values() if s.dirty]
+
+    def active(self) -> List[TrackedSession]:
+        return list(self._sessions.values())
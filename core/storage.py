@@ -2,15 +2,33 @@
 Персистентное хранилище FSM состояний в PostgreSQL.
 
 Включает retry для устойчивости к транзиентным ошибкам Neon (cold start, connection reset).
+
+Чтение state и data — одним запросом; соседние вызовы в рамках апдейта
+обслуживаются из снимка строки. update_data сливает дельту на стороне БД
+(data || $2::jsonb), не пересериализуя весь blob.
+
+CachedPostgresStorage — write-behind кэш поверх PostgresStorage:
+чтения обслуживаются из LRU в памяти процесса, записи склеиваются
+и сбрасываются в БД одним запросом раз в FSM_CACHE_FLUSH_MS.
+Строки fsm_states версионируются (version), чтобы вторая реплика
+не затёрла чужую запись и могла инвалидировать свой кэш (LISTEN/NOTIFY).
 """
 
 import asyncio
+import copy
 import json
 import logging
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
 from typing import Optional
 
 from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
 
+from core.metrics import observe
 from db import get_pool
 
 logger = logging.getLogger(__name__)
@@ -35,9 +53,98 @@ async def _retry_db(operation, description: str):
                 raise last_error
 
 
+# Снимок строк fsm_states на время одного апдейта (открывает FSMSnapshotMiddleware):
+# middleware и FSMContext вызывают get_state/get_data подряд — второй вызов
+# обслуживается из снимка, без повторного SELECT. Вне fsm_snapshot_scope()
+# снимка нет — каждое чтение идёт в хранилище.
+_NO_DATA = object()  # data уже отдана вызывающему или неизвестна
+
+
+class _UpdateSnapshot:
+    """Записи [state, data] по chat_id; closed — апдейт завершён."""
+
+    __slots__ = ('entries', 'closed')
+
+    def __init__(self):
+        self.entries: dict = {}
+        self.closed = False
+
+
+_snapshot: ContextVar[Optional[_UpdateSnapshot]] = ContextVar('fsm_snapshot', default=None)
+
+
+@contextmanager
+def fsm_snapshot_scope():
+    """Снимок fsm_states на время обработки одного апдейта.
+
+    Задачи, порождённые хендлером, наследуют контекст — после выхода из scope
+    снимок закрывается, и они читают хранилище, а не устаревшие данные.
+    """
+    snapshot = _UpdateSnapshot()
+    token = _snapshot.set(snapshot)
+    try:
+        yield
+    finally:
+        snapshot.closed = True
+        snapshot.entries.clear()
+        _snapshot.reset(token)
+
+
+def _open_snapshot() -> Optional[_UpdateSnapshot]:
+    snapshot = _snapshot.get()
+    if snapshot is None or snapshot.closed:
+        return None
+    return snapshot
+
+
+def _snapshot_get(chat_id: int) -> Optional[list]:
+    snapshot = _open_snapshot()
+    if snapshot is None:
+        return None
+    return snapshot.entries.get(chat_id)
+
+
+def _snapshot_put(chat_id: int, state: Optional[str], data) -> None:
+    snapshot = _open_snapshot()
+    if snapshot is not None:
+        snapshot.entries[chat_id] = [state, data]
+
+
+def _snapshot_forget(chat_id: int) -> None:
+    snapshot = _open_snapshot()
+    if snapshot is not None:
+        snapshot.entries.pop(chat_id, None)
+
+
+def _decode_data(raw) -> dict:
+    """fsm_states.data (JSONB без кодека приходит строкой) → dict."""
+    if not raw:
+        return {}
+    if isinstance(raw, dict):
+        return raw
+    return json.loads(raw)
+
+
 class PostgresStorage(BaseStorage):
     """Персистентное хранилище FSM состояний в PostgreSQL"""
 
+    async def _fetch_row(self, chat_id: int):
+        """Одна выборка state + data + version (общий путь чтения)."""
+        async def _do():
+            async with (await get_pool()).acquire() as conn:
+                return await conn.fetchrow(
+                    'SELECT state, data, version FROM fsm_states WHERE chat_id = $1', chat_id
+                )
+
+        return await _retry_db(_do, f"fetch(chat_id={chat_id})")
+
+    async def get_record(self, key: StorageKey) -> tuple[Optional[str], dict]:
+        """Получить состояние и данные за один запрос."""
+        row = await self._fetch_row(key.chat_id)
+        if row is None:
+            return None, {}
+        return row['state'], _decode_data(row['data'])
+
     async def set_state(self, key: StorageKey, state: StateType = None) -> None:
         """Установить состояние"""
         if state is None:
@@ -53,23 +160,25 @@ class PostgresStorage(BaseStorage):
                 await conn.execute('''
                     INSERT INTO fsm_states (chat_id, state, updated_at)
                     VALUES ($1, $2, NOW())
-                    ON CONFLICT (chat_id) DO UPDATE SET state = $2, updated_at = NOW()
+                    ON CONFLICT (chat_id) DO UPDATE
+                    SET state = $2, updated_at = NOW(), version = fsm_states.version + 1
                 ''', key.chat_id, state_str)
 
         await _retry_db(_do, f"set_state(chat_id={key.chat_id})")
+        entry = _snapshot_get(key.chat_id)
+        if entry is not None:
+            entry[0] = state_str
 
     async def get_state(self, key: StorageKey) -> Optional[str]:
-        """Получить состояние"""
-        async def _do():
-            async with (await get_pool()).acquire() as conn:
-                row = await conn.fetchrow(
-                    'SELECT state FROM fsm_states WHERE chat_id = $1', key.chat_id
-                )
-                result = row['state'] if row else None
-                logger.debug(f"[FSM] get_state: chat_id={key.chat_id}, user_id={key.user_id}, bot_id={key.bot_id}, state={result}")
-                return result
+        """Получить состояние (заодно читает data в снимок запроса)"""
+        entry = _snapshot_get(key.chat_id)
+        if entry is not None:
+            return entry[0]
 
-        return await _retry_db(_do, f"get_state(chat_id={key.chat_id})")
+        state, data = await self.get_record(key)
+        _snapshot_put(key.chat_id, state, data)
+        logger.debug(f"[FSM] get_state: chat_id={key.chat_id}, user_id={key.user_id}, bot_id={key.bot_id}, state={state}")
+        return state
 
     async def set_data(self, key: StorageKey, data: dict) -> None:
         """Установить данные состояния"""
@@ -79,25 +188,391 @@ class PostgresStorage(BaseStorage):
             async with (await get_pool()).acquire() as conn:
                 await conn.execute('''
                     INSERT INTO fsm_states (chat_id, data, updated_at)
-                    VALUES ($1, $2, NOW())
-                    ON CONFLICT (chat_id) DO UPDATE SET data = $2, updated_at = NOW()
+                    VALUES ($1, $2::jsonb, NOW())
+                    ON CONFLICT (chat_id) DO UPDATE
+                    SET data = EXCLUDED.data, updated_at = NOW(), version = fsm_states.version + 1
                 ''', key.chat_id, data_str)
 
         await _retry_db(_do, f"set_data(chat_id={key.chat_id})")
+        entry = _snapshot_get(key.chat_id)
+        if entry is not None:
+            entry[1] = _NO_DATA
 
     async def get_data(self, key: StorageKey) -> dict:
         """Получить данные состояния"""
+        entry = _snapshot_get(key.chat_id)
+        if entry is not None and entry[1] is not _NO_DATA:
+            # Снимок отдаётся один раз: вызывающий владеет dict и может его менять
+            data, entry[1] = entry[1], _NO_DATA
+            return data
+
+        state, data = await self.get_record(key)
+        _snapshot_put(key.chat_id, state, _NO_DATA)
+        return data
+
+    async def update_data(self, key: StorageKey, data: dict) -> dict:
+        """Слить данные в одном UPDATE (jsonb ||), без перезаписи всего blob.
+
+        Сериализуется только дельта. Итоговый dict собирается локально,
+        если текущие данные уже в снимке запроса, иначе — из RETURNING.
+        """
+        delta_str = json.dumps(data, ensure_ascii=False)
+        entry = _snapshot_get(key.chat_id)
+        known = entry[1] if entry is not None and entry[1] is not _NO_DATA else None
+
         async def _do():
             async with (await get_pool()).acquire() as conn:
-                row = await conn.fetchrow(
-                    'SELECT data FROM fsm_states WHERE chat_id = $1', key.chat_id
-                )
-                if row and row['data']:
-                    return json.loads(row['data'])
-                return {}
+                sql = '''
+                    INSERT INTO fsm_states (chat_id, data, updated_at)
+                    VALUES ($1, $2::jsonb, NOW())
+                    ON CONFLICT (chat_id) DO UPDATE
+                    SET data = COALESCE(fsm_states.data, '{}'::jsonb) || EXCLUDED.data,
+                        updated_at = NOW(), version = fsm_states.version + 1
+                '''
+                if known is not None:
+                    await conn.execute(sql, key.chat_id, delta_str)
+                    return None
+                return await conn.fetchval(sql + ' RETURNING data', key.chat_id, delta_str)
 
-        return await _retry_db(_do, f"get_data(chat_id={key.chat_id})")
+        returned = await _retry_db(_do, f"update_data(chat_id={key.chat_id})")
+        if known is not None:
+            known.update(data)
+            merged = known
+            entry[1] = _NO_DATA
+        else:
+            merged = _decode_data(returned)
+        return merged.copy()
 
     async def close(self) -> None:
         """Закрыть соединение (не требуется, используем общий пул)"""
         pass
+
+
+# ═══════════════════════════════════════════════════════════
+# WRITE-BEHIND КЭШ
+# ═══════════════════════════════════════════════════════════
+
+_NOTIFY_CHANNEL = 'fsm_states_changed'
+
+# Активный экземпляр кэша — для модулей, которые пишут в fsm_states напрямую
+_active_cache: Optional['CachedPostgresStorage'] = None
+
+
+@dataclass
+class _CachedRecord:
+    """Запись кэша: состояние + данные одного чата."""
+    state: Optional[str]
+    data: dict
+    version: int  # Версия строки в БД, на которой основана запись
+    loaded_at: float
+    dirty: bool = False
+
+
+class CachedPostgresStorage(PostgresStorage):
+    """Write-behind кэш FSM поверх PostgresStorage.
+
+    - get_state/get_data: из LRU (промах = один SELECT state+data+version)
+    - set_state/set_data: в память + пометка dirty; фоновая задача
+      сбрасывает все dirty-записи одним INSERT ... SELECT FROM unnest
+    - Оптимистичная блокировка: запись применяется, только если версия
+      в БД совпадает с той, на которой основан кэш. Иначе (писала другая
+      реплика) запись кэша сбрасывается и перечитывается.
+    - После записи — NOTIFY, другие реплики инвалидируют свои копии.
+      Если LISTEN недоступен (pgbouncer), страхует TTL записи.
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        flush_interval_ms: Optional[int] = None,
+        ttl_seconds: Optional[int] = None,
+        listen: bool = True,
+    ):
+        from config.settings import FSM_CACHE_MAX_ENTRIES, FSM_CACHE_FLUSH_MS, FSM_CACHE_TTL_SEC
+
+        self._max_entries = max_entries or FSM_CACHE_MAX_ENTRIES
+        self._flush_interval = (flush_interval_ms or FSM_CACHE_FLUSH_MS) / 1000
+        self._ttl = ttl_seconds or FSM_CACHE_TTL_SEC
+        self._listen = listen
+
+        self._entries: 'OrderedDict[int, _CachedRecord]' = OrderedDict()
+        self._dirty: set[int] = set()
+        self._loading: dict[int, asyncio.Future] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._listener_conn = None
+        self._instance_id = uuid.uuid4().hex[:12]
+
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'flushes': 0,
+            'rows_flushed': 0,
+            'conflicts': 0,
+            'invalidations': 0,
+        }
+
+        global _active_cache
+        _active_cache = self
+
+    # ─── BaseStorage API ───────────────────────────────────────
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        """Установить состояние (в память, запись в БД — отложенно)"""
+        if state is None:
+            state_str = None
+        elif isinstance(state, str):
+            state_str = state
+        else:
+            state_str = state.state
+        record = await self._get_record(key.chat_id)
+        record.state = state_str
+        self._mark_dirty(key.chat_id, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        """Получить состояние"""
+        return (await self._get_record(key.chat_id)).state
+
+    async def set_data(self, key: StorageKey, data: dict) -> None:
+        """Установить данные состояния (в память, запись в БД — отложенно)"""
+        record = await self._get_record(key.chat_id)
+        record.data = copy.deepcopy(data)
+        self._mark_dirty(key.chat_id, record)
+
+    async def get_data(self, key: StorageKey) -> dict:
+        """Получить данные состояния (копия — мутации не попадают в кэш)"""
+        return copy.deepcopy((await self._get_record(key.chat_id)).data)
+
+    async def update_data(self, key: StorageKey, data: dict) -> dict:
+        """Слить данные в памяти (в БД уйдёт при следующем сбросе)"""
+        record = await self._get_record(key.chat_id)
+        record.data.update(copy.deepcopy(data))
+        self._mark_dirty(key.chat_id, record)
+        return copy.deepcopy(record.data)
+
+    async def close(self) -> None:
+        """Сбросить незаписанные изменения и остановить фоновые задачи"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+        if self._listener_conn is not None:
+            try:
+                await self._listener_conn.close()
+            except Exception:
+                pass
+            self._listener_conn = None
+
+    # ─── Кэш ───────────────────────────────────────────────────
+
+    async def _get_record(self, chat_id: int) -> _CachedRecord:
+        """Запись из кэша или из БД (конкурентные промахи склеиваются)."""
+        self._ensure_started()
+
+        record = self._entries.get(chat_id)
+        if record is not None:
+            if record.dirty or time.monotonic() - record.loaded_at < self._ttl:
+                self._entries.move_to_end(chat_id)
+                self.stats['hits'] += 1
+                return record
+            del self._entries[chat_id]
+
+        pending = self._loading.get(chat_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        self.stats['misses'] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._loading[chat_id] = future
+        try:
+            start = time.perf_counter()
+            record = await self._load(chat_id)
+            observe("fsm.load", (time.perf_counter() - start) * 1000)
+            # Пока шёл SELECT, запись могла появиться (set_* после discard)
+            record = self._entries.get(chat_id) or record
+            self._put(chat_id, record)
+            future.set_result(record)
+            return record
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже проброшено вызывающему — не логируем "never retrieved"
+            future.exception()
+            raise
+        finally:
+            self._loading.pop(chat_id, None)
+
+    async def _load(self, chat_id: int) -> _CachedRecord:
+        row = await self._fetch_row(chat_id)
+        if row is None:
+            return _CachedRecord(state=None, data={}, version=0, loaded_at=time.monotonic())
+        return _CachedRecord(
+            state=row['state'],
+            data=_decode_data(row['data']),
+            version=row['version'] or 0,
+            loaded_at=time.monotonic(),
+        )
+
+    def _put(self, chat_id: int, record: _CachedRecord) -> None:
+        self._entries[chat_id] = record
+        self._entries.move_to_end(chat_id)
+        if len(self._entries) <= self._max_entries:
+            return
+        # Вытесняем самые старые чистые записи; dirty ждут сброса
+        for old_id in list(self._entries):
+            if len(self._entries) <= self._max_entries:
+                break
+            if old_id != chat_id and not self._entries[old_id].dirty:
+                del self._entries[old_id]
+
+    def _mark_dirty(self, chat_id: int, record: _CachedRecord) -> None:
+        record.dirty = True
+        self._dirty.add(chat_id)
+        self._entries.move_to_end(chat_id)
+
+    def discard(self, chat_id: int) -> None:
+        """Забыть запись без сброса в БД (строку удалили/перезаписали извне)."""
+        self._entries.pop(chat_id, None)
+        self._dirty.discard(chat_id)
+
+    async def flush_chat(self, chat_id: int) -> None:
+        """Записать изменения чата в БД и выбросить его из кэша."""
+        if chat_id in self._dirty:
+            await self.flush()
+        self.discard(chat_id)
+
+    # ─── Сброс в БД ────────────────────────────────────────────
+
+    def _ensure_started(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+            if self._listen:
+                self._listen = False  # одна попытка подписки
+                asyncio.create_task(self._start_listener())
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"[FSM] flush loop error: {e}")
+
+    async def flush(self) -> None:
+        """Записать все dirty-записи одним запросом."""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+
+            chat_ids, states, datas, versions = [], [], [], []
+            for chat_id in self._dirty:
+                record = self._entries.get(chat_id)
+                if record is None:
+                    continue
+                record.dirty = False
+                chat_ids.append(chat_id)
+                states.append(record.state)
+                datas.append(json.dumps(record.data, ensure_ascii=False))
+                versions.append(record.version)
+            self._dirty.clear()
+            if not chat_ids:
+                return
+
+            async def _do():
+                async with (await get_pool()).acquire() as conn:
+                    return await conn.fetch('''
+                        WITH written AS (
+                            INSERT INTO fsm_states (chat_id, state, data, version, updated_at)
+                            SELECT t.chat_id, t.state, t.data, t.version + 1, NOW()
+                            FROM unnest($1::bigint[], $2::text[], $3::jsonb[], $4::bigint[])
+                                AS t(chat_id, state, data, version)
+                            ON CONFLICT (chat_id) DO UPDATE
+                            SET state = EXCLUDED.state, data = EXCLUDED.data,
+                                version = fsm_states.version + 1, updated_at = NOW()
+                            WHERE fsm_states.version = EXCLUDED.version - 1
+                            RETURNING chat_id, version
+                        )
+                        SELECT chat_id, version,
+                               pg_notify($5, $6 || ':' || chat_id || ':' || version) AS notified
+                        FROM written
+                    ''', chat_ids, states, datas, versions, _NOTIFY_CHANNEL, self._instance_id)
+
+            try:
+                start = time.perf_counter()
+                rows = await _retry_db(_do, f"flush({len(chat_ids)} chats)")
+                observe("fsm.flush", (time.perf_counter() - start) * 1000)
+            except Exception:
+                # Вернём записи в очередь — попробуем в следующем цикле
+                for chat_id in chat_ids:
+                    record = self._entries.get(chat_id)
+                    if record is not None:
+                        record.dirty = True
+                        self._dirty.add(chat_id)
+                return
+
+            self.stats['flushes'] += 1
+            self.stats['rows_flushed'] += len(rows)
+
+            written = {row['chat_id']: row['version'] for row in rows}
+            for chat_id in chat_ids:
+                record = self._entries.get(chat_id)
+                if chat_id in written:
+                    if record is not None:
+                        record.version = written[chat_id]
+                    continue
+                # Версия в БД ушла вперёд — писала другая реплика. Её запись новее
+                # нашего снимка: выбрасываем локальную копию, следующий доступ перечитает.
+                self.stats['conflicts'] += 1
+                logger.warning(f"[FSM] version conflict for chat_id={chat_id}, dropping cached entry")
+                self.discard(chat_id)
+
+    # ─── Инвалидация от других реплик ──────────────────────────
+
+    async def _start_listener(self) -> None:
+        try:
+            import asyncpg
+            from config import DATABASE_URL
+
+            self._listener_conn = await asyncpg.connect(DATABASE_URL, statement_cache_size=0)
+            await self._listener_conn.add_listener(_NOTIFY_CHANNEL, self._on_notify)
+            logger.info(f"[FSM] cache listener started (instance={self._instance_id})")
+        except Exception as e:
+            self._listener_conn = None
+            logger.warning(f"[FSM] LISTEN unavailable, relying on TTL={self._ttl}s: {e}")
+
+    def _on_notify(self, connection, pid, channel, payload: str) -> None:
+        try:
+            instance_id, chat_id, version = payload.split(':')
+            chat_id, version = int(chat_id), int(version)
+        except ValueError:
+            return
+        if instance_id == self._instance_id:
+            return
+        record = self._entries.get(chat_id)
+        if record is not None and record.version < version:
+            self.stats['invalidations'] += 1
+            self.discard(chat_id)
+
+
+def get_fsm_cache_stats() -> Optional[dict]:
+    """Счётчики кэша FSM (для /metrics). None — кэш выключен."""
+    if _active_cache is None:
+        return None
+    return {**_active_cache.stats, 'entries': len(_active_cache._entries), 'dirty': len(_active_cache._dirty)}
+
+
+async def flush_fsm_chat(chat_id: int) -> None:
+    """Сбросить кэш FSM чата перед прямым чтением/записью fsm_states."""
+    _snapshot_forget(chat_id)
+    if _active_cache is not None:
+        await _active_cache.flush_chat(chat_id)
+
+
+def discard_fsm_chat(chat_id: int) -> None:
+    """Забыть кэш FSM чата (строка fsm_states удалена напрямую)."""
+    _snapshot_forget(chat_id)
+    if _active_cache is not None:
+        _active_cache.discard(chat_id)
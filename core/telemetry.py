@@ -0,0 +1,245 @@
+"""
+Буфер телеметрии запросов: трейсы, сессии, last_active_date → БД пачками.
+
+Раньше TracingMiddleware на каждый апдейт запускал три задачи, и каждая брала
+своё соединение из пула (INSERT трейса, SELECT + UPDATE сессии, UPDATE interns).
+Под всплеском они конкурировали с обработкой запросов за 50 соединений.
+
+Архитектура:
+- record_trace / record_request кладут данные в память (без ожидания БД)
+- трейсы — ограниченная очередь; выгрузка одним COPY
+- сессии — в памяти (core/session_tracker.py); в user_sessions пишутся
+  закрытые и, раз в SESSION_CHECKPOINT_SEC, изменившиеся открытые —
+  одним INSERT ... unnest + executemany (save_sessions)
+- last_active_date — не больше одного UPDATE на пользователя в день:
+  уже отмеченные сегодня не попадают в пачку
+- фоновая задача выгружает всё раз в TELEMETRY_FLUSH_INTERVAL_MS
+  или раньше, когда трейсов набралось TELEMETRY_BATCH_SIZE
+- переполнение (БД не успевает) — запись отбрасывается, счётчик dropped
+
+Usage:
+    from core.telemetry import setup_telemetry, shutdown_telemetry
+    await setup_telemetry()      # после init_db()
+    ...
+    await shutdown_telemetry()   # перед shutdown — дописать остаток
+"""
+
+import asyncio
+import time
+from datetime import date, datetime, timezone
+from typing import Optional
+
+from config import get_logger
+from config.settings import (
+    TELEMETRY_FLUSH_INTERVAL_MS,
+    TELEMETRY_BATCH_SIZE,
+    TELEMETRY_MAX_TRACES,
+    TELEMETRY_MAX_USERS,
+    SESSION_CHECKPOINT_SEC,
+)
+from core.session_tracker import SessionTracker, TrackedSession
+
+logger = get_logger(__name__)
+
+_writer: Optional['TelemetryWriter'] = None
+
+
+class TelemetryWriter:
+    """Накопление телеметрии в памяти и периодическая пакетная выгрузка."""
+
+    def __init__(
+        self,
+        flush_interval: float = TELEMETRY_FLUSH_INTERVAL_MS / 1000,
+        batch_size: int = TELEMETRY_BATCH_SIZE,
+        max_traces: int = TELEMETRY_MAX_TRACES,
+        max_users: int = TELEMETRY_MAX_USERS,
+        checkpoint_interval: float = SESSION_CHECKPOINT_SEC,
+    ):
+        from db.queries.sessions import SESSION_TIMEOUT_MINUTES
+
+        self._flush_interval = flush_interval
+        self._batch_size = batch_size
+        self._max_traces = max_traces
+        self._checkpoint_interval = checkpoint_interval
+        self._last_checkpoint = time.monotonic()
+
+        self._traces: list = []
+        self.sessions = SessionTracker(timeout_sec=SESSION_TIMEOUT_MINUTES * 60, max_sessions=max_users)
+        self._active: set = set()
+        self._active_today: set = set()   # уже отмечены сегодня (в БД)
+        self._active_day: Optional[date] = None
+
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self.dropped = {'traces': 0, 'sessions': 0}
+        self.written = {'traces': 0, 'sessions': 0, 'last_active': 0}
+        self.failed_flushes = 0
+        self.last_flush_ms = 0.0
+
+    def start(self):
+        self._task = asyncio.create_task(self._flush_loop())
+
+    # ─── Запись (non-blocking) ───
+
+    def record_trace(self, row: tuple) -> None:
+        if len(self._traces) >= self._max_traces:
+            self.dropped['traces'] += 1
+            return
+        self._traces.append(row)
+        if len(self._traces) >= self._batch_size:
+            self._wakeup.set()
+
+    def record_request(self, chat_id: int, command: str, today: date) -> None:
+        """Активность пользователя: сессия + last_active_date."""
+        if not self.sessions.touch(chat_id, command, datetime.now(timezone.utc)):
+            self.dropped['sessions'] += 1
+
+        if today != self._active_day:
+            self._active_day = today
+            self._active_today.clear()
+        if chat_id not in self._active_today:
+            self._active.add(chat_id)
+
+    # ─── Выгрузка ───
+
+    async def _flush_loop(self):
+        """Background task: выгружать каждые flush_interval или по заполнению пачки."""
+        while True:
+            try:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self._flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                await self.flush()
+            except asyncio.CancelledError:
+                await self.flush(checkpoint=True)
+                return
+            except Exception as e:
+                logger.warning(f"[Telemetry] flush_loop error: {e}")
+
+    async def load_sessions(self):
+        """Вернуть в память открытые сессии из БД (после рестарта)."""
+        from db.queries.sessions import load_open_sessions
+        for row in await load_open_sessions():
+            self.sessions.restore(TrackedSession(
+                chat_id=row['chat_id'], started_at=row['started_at'], last_at=row['last_active_at'],
+                entry_point=row['entry_point'], exit_point=row['exit_point'] or row['entry_point'],
+                request_count=row['request_count'], commands=row['commands'], id=row['id'],
+            ))
+
+    async def flush(self, checkpoint: bool = False):
+        """Выгрузить накопленное: трейсы, сессии, last_active_date.
+
+        checkpoint=True — записать и все изменившиеся открытые сессии (shutdown).
+        """
+        async with self._flush_lock:
+            traces, self._traces = self._traces, []
+            active, self._active = self._active, set()
+            day = self._active_day
+            sessions = self.sessions.expire(datetime.now(timezone.utc))
+            if checkpoint or time.monotonic() - self._last_checkpoint >= self._checkpoint_interval:
+                self._last_checkpoint = time.monotonic()
+                sessions += self.sessions.dirty()
+            if not (traces or sessions or active):
+                return
+
+            start = time.perf_counter()
+            if traces:
+                try:
+                    from db.queries.traces import insert_traces
+                    await insert_traces(traces)
+                    self.written['traces'] += len(traces)
+                except Exception as e:
+                    self.failed_flushes += 1
+                    self.dropped['traces'] += len(traces)
+                    logger.warning(f"[Telemetry] Failed to write {len(traces)} traces: {e}")
+            if sessions:
+                await self._save_sessions(sessions)
+            if active:
+                try:
+                    from db.queries.activity import touch_last_active_dates
+                    await touch_last_active_dates(list(active), day)
+                    if day == self._active_day:
+                        self._active_today |= active
+                    self.written['last_active'] += len(active)
+                except Exception as e:
+                    self.failed_flushes += 1
+                    self._active |= active  # повторить в следующий раз
+                    logger.warning(f"[Telemetry] Failed to touch {len(active)} users: {e}")
+            self.last_flush_ms = (time.perf_counter() - start) * 1000
+
+    async def _save_sessions(self, sessions: list):
+        from db.queries.sessions import save_sessions
+
+        rows = []
+        for session in sessions:
+            rows.append(session.row())
+            session.dirty = False
+        try:
+            ids = await save_sessions(rows)
+        except Exception as e:
+            self.failed_flushes += 1
+            logger.warning(f"[Telemetry] Failed to write {len(rows)} sessions: {e}")
+            for session in sessions:
+                if session.ended:
+                    self.dropped['sessions'] += 1
+                else:
+                    session.dirty = True  # повторить на следующей контрольной точке
+            return
+        # Объект тот же, даже если сессия за время записи закрылась
+        for session, session_id in zip(sessions, ids):
+            session.id = session_id
+        self.written['sessions'] += len(rows)
+
+    def stats(self) -> dict:
+        return {
+            'queued_traces': len(self._traces),
+            'open_sessions': len(self.sessions),
+            'written': dict(self.written),
+            'dropped': dict(self.dropped),
+            'failed_flushes': self.failed_flushes,
+            'last_flush_ms': round(self.last_flush_ms, 1),
+        }
+
+
+def record_trace(row: tuple) -> None:
+    """Поставить трейс в очередь (строка в порядке TRACE_COLUMNS)."""
+    if _writer is not None:
+        _writer.record_trace(row)
+
+
+def record_request(chat_id: int, command: str) -> None:
+    """Отметить запрос пользователя (сессия + DAU)."""
+    if _writer is not None:
+        from db.queries.users import moscow_today
+        _writer.record_request(chat_id, command, moscow_today())
+
+
+def get_telemetry_stats() -> Optional[dict]:
+    return _writer.stats() if _writer else None
+
+
+async def setup_telemetry():
+    """Запустить фоновую выгрузку телеметрии. Вызывать после init_db()."""
+    global _writer
+    _writer = TelemetryWriter()
+    try:
+        await _writer.load_sessions()
+    except Exception as e:
+        logger.warning(f"[Telemetry] Failed to load open sessions: {e}")
+    _writer.start()
+    logger.info("[Telemetry] Batched writer initialized")
+
+
+async def shutdown_telemetry():
+    """Дописать накопленное перед shutdown."""
+    global _writer
+    if _writer and _writer._task:
+        _writer._task.cancel()
+        try:
+            await _writer._task
+        except asyncio.CancelledError:
+            pass
+    _writer = None
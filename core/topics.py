@@ -13,6 +13,7 @@ from typing import Optional, List
 import yaml
 
 from config import MARATHON_DAYS, MAX_TOPICS_PER_DAY, STUDY_DURATIONS
+from core.helpers import load_topic_metadata  # noqa: F401 (реэкспорт)
 from db.queries import get_topics_today
 from db.queries.users import moscow_today
 
@@ -20,28 +21,7 @@ logger = logging.getLogger(__name__)
 
 
 # ============= ЗАГРУЗКА МЕТАДАННЫХ ТЕМ =============
-
-TOPICS_DIR = Path(__file__).parent.parent / "topics"
-
-
-def load_topic_metadata(topic_id: str) -> Optional[dict]:
-    """Загружает метаданные темы из YAML файла"""
-    if not TOPICS_DIR.exists():
-        return None
-
-    for yaml_file in TOPICS_DIR.glob("*.yaml"):
-        if yaml_file.name.startswith("_"):
-            continue
-        try:
-            with open(yaml_file, 'r', encoding='utf-8') as f:
-                data = yaml.safe_load(f)
-                if data and data.get('id') == topic_id:
-                    return data
-        except Exception as e:
-            logger.error(f"Ошибка загрузки метаданных {yaml_file}: {e}")
-
-    return None
-
+# load_topic_metadata — индекс topics/*.yaml из core/helpers.py (один на процесс)
 
 def get_bloom_questions(metadata: dict, bloom_level: int, study_duration: int) -> dict:
     """Получает настройки вопросов для заданного уровня Блума и времени"""
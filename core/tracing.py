@@ -4,8 +4,11 @@
 Архитектура:
 - Каждый входящий message/callback → Trace (uuid, user_id, command, state)
 - Внутри запроса — span("name") добавляет span к текущему trace
-- В конце запроса — save_trace() записывает всё в таблицу request_traces
+- В конце запроса — finish_trace() отдаёт trace в буфер телеметрии,
+  который пишет request_traces пачками (core/telemetry.py)
 - ContextVar обеспечивает изоляцию между concurrent запросами
+- Длительности span и запросов — ещё и в гистограммы процесса
+  (core/metrics.py → GET /metrics), без обращения к БД
 
 Использование:
     from core.tracing import span, start_trace, finish_trace
@@ -20,7 +23,6 @@
         result = await claude.generate(...)
 """
 
-import asyncio
 import json
 import time
 import uuid
@@ -28,8 +30,11 @@ import logging
 from contextvars import ContextVar
 from contextlib import asynccontextmanager
 from dataclasses import dataclass, field
+from datetime import datetime, timezone
 from typing import Optional, List
 
+from core.metrics import observe, observe_request
+
 logger = logging.getLogger(__name__)
 
 # Request-scoped trace context
@@ -58,11 +63,36 @@ class Trace:
     state: str
     spans: List[Span] = field(default_factory=list)
     start: float = field(default_factory=time.perf_counter)
+    # Запросы к БД (db/instrumentation.py) — одной суммой, не span на каждый
+    db_count: int = 0
+    db_ms: float = 0.0
+    db_rows: int = 0
+    db_slowest_ms: float = 0.0
+    db_slowest: str = ""
 
     @property
     def total_ms(self) -> float:
         return (time.perf_counter() - self.start) * 1000
 
+    def add_db_query(self, callsite: str, duration_ms: float, rows: int) -> None:
+        self.db_count += 1
+        self.db_ms += duration_ms
+        self.db_rows += rows
+        if duration_ms > self.db_slowest_ms:
+            self.db_slowest_ms = duration_ms
+            self.db_slowest = callsite
+
+    def db_span(self) -> Optional[Span]:
+        """Один span "db" на весь запрос: число запросов, время, самый медленный."""
+        if not self.db_count:
+            return None
+        return Span(name="db", start=0.0, end=self.db_ms / 1000, metadata={
+            'count': self.db_count,
+            'rows': self.db_rows,
+            'slowest': self.db_slowest,
+            'slowest_ms': round(self.db_slowest_ms, 1),
+        })
+
 
 def start_trace(user_id: int, command: str, state: str) -> Trace:
     """Начать новый trace для текущего запроса."""
@@ -97,6 +127,7 @@ async def span(name: str, **metadata):
         yield s
     finally:
         s.end = time.perf_counter()
+        observe(name, s.duration_ms)
         trace = _current_trace.get()
         if trace:
             trace.spans.append(s)
@@ -111,6 +142,13 @@ async def finish_trace(trace: Trace) -> None:
     total = trace.total_ms
     _current_trace.set(None)
 
+    from db.queries.traces import classify_command
+    observe_request(classify_command(trace.command), total)
+
+    db_span = trace.db_span()
+    if db_span:
+        trace.spans.append(db_span)
+
     # Логируем summary
     spans_summary = ", ".join(
         f"{s.name}={s.duration_ms:.0f}ms" for s in trace.spans
@@ -120,31 +158,18 @@ async def finish_trace(trace: Trace) -> None:
         f"user={trace.user_id} state={trace.state} | {spans_summary}"
     )
 
-    # Записываем в БД (true fire-and-forget: не ждём DB write)
-    asyncio.create_task(_save_trace_to_db(trace))
-
-
-async def _save_trace_to_db(trace: Trace) -> None:
-    """Записать trace в таблицу request_traces (fire-and-forget task)."""
-    try:
-        from db.connection import acquire
-
-        spans_json = json.dumps([
-            {"name": s.name, "duration_ms": round(s.duration_ms, 1), **s.metadata}
-            for s in trace.spans
-        ])
-
-        async with await acquire() as conn:
-            await conn.execute(
-                """INSERT INTO request_traces
-                   (trace_id, user_id, command, state, total_ms, spans, created_at)
-                   VALUES ($1, $2, $3, $4, $5, $6::jsonb, NOW())""",
-                trace.trace_id,
-                trace.user_id,
-                trace.command[:100],
-                trace.state,
-                round(trace.total_ms, 1),
-                spans_json,
-            )
-    except Exception as e:
-        logger.warning(f"[TRACE] Failed to save trace: {e}")
+    # В буфер телеметрии: запись в БД пачкой (core/telemetry.py)
+    from core.telemetry import record_trace
+    spans_json = json.dumps([
+        {"name": s.name, "duration_ms": round(s.duration_ms, 1), **s.metadata}
+        for s in trace.spans
+    ])
+    record_trace((
+        trace.trace_id,
+        trace.user_id,
+        trace.command[:100],
+        trace.state,
+        round(trace.total_ms, 1),
+        spans_json,
+        datetime.now(timezone.utc),
+    ))
@@ -141,6 +141,7 @@ SUGGESTION: <если false — предложи исправленную фор
             user_prompt=user_prompt,
             max_tokens=150,
             model=CLAUDE_MODEL_HAIKU,
+            feature="wp_validation",
         )
         if not raw:
             return {"valid": True, "suggestion": ""}  # при ошибке — пропускаем
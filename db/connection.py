@@ -8,6 +8,7 @@ import asyncpg
 from typing import Optional
 
 from config import DATABASE_URL, get_logger
+from config.settings import DB_QUERY_STATS_ENABLED
 
 logger = get_logger(__name__)
 
@@ -15,6 +16,14 @@ logger = get_logger(__name__)
 _pool: Optional[asyncpg.Pool] = None
 
 
+def _connection_class():
+    """Класс соединений пула: с замером запросов (db/instrumentation.py) или обычный."""
+    if DB_QUERY_STATS_ENABLED:
+        from db.instrumentation import InstrumentedConnection
+        return InstrumentedConnection
+    return asyncpg.Connection
+
+
 async def get_pool() -> asyncpg.Pool:
     """Получить пул соединений (создать если не существует)"""
     global _pool
@@ -26,6 +35,7 @@ async def get_pool() -> asyncpg.Pool:
                 min_size=10,
                 max_size=50,
                 command_timeout=30,
+                connection_class=_connection_class(),
             )
             logger.info("✅ Пул соединений создан (min=10, max=50)")
         except Exception as e:
@@ -43,6 +53,18 @@ async def close_pool():
         logger.info("🔒 Пул соединений закрыт")
 
 
+def get_pool_stats() -> Optional[dict]:
+    """Заполненность пула (для /metrics). None — пул ещё не создан."""
+    if _pool is None:
+        return None
+    return {
+        'size': _pool.get_size(),
+        'idle': _pool.get_idle_size(),
+        'min_size': _pool.get_min_size(),
+        'max_size': _pool.get_max_size(),
+    }
+
+
 async def acquire():
     """Получить соединение из пула (для использования в async with)"""
     try:
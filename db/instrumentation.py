@@ -0,0 +1,224 @@
+"""
+Инструментация запросов asyncpg: время, строки и место вызова каждого запроса.
+
+Пул создаётся с connection_class=InstrumentedConnection (db/connection.py),
+поэтому все запросы из db/queries/*.py замеряются без правок в самих модулях:
+
+- место вызова — первая функция вне asyncpg и этого модуля
+  (например, db/queries/users.py:get_intern)
+- в текущем трейсе (core/tracing.py) копится сумма: в request_traces
+  попадает один span "db" (число запросов, время, строки, самый медленный)
+- /metrics — отдельная гистограмма aist_db_query_duration_ms по месту вызова
+- агрегаты по отпечатку запроса (SQL без литералов, пробелы схлопнуты):
+  count, p50/p95 (helpers/histogram.py), суммарное время, строки;
+  топ по суммарному времени — в /latency
+- дольше DB_SLOW_QUERY_MS — warning в лог (не чаще раза в минуту на отпечаток)
+
+asyncpg.Connection.add_query_logger не подходит: колбэк вызывается
+после запроса через call_soon — ни стека вызова, ни числа строк.
+"""
+
+import os
+import re
+import sys
+import time
+from typing import Dict, List, Optional
+
+import asyncpg
+
+from config import get_logger
+from config.settings import BASE_DIR, DB_QUERY_STATS_MAX, DB_SLOW_QUERY_MS
+from helpers.histogram import LogHistogram
+
+logger = get_logger(__name__)
+
+_SLOW_LOG_INTERVAL = 60.0
+_OTHER = "other"
+
+_SKIP_FILES = (os.path.dirname(asyncpg.__file__), __file__)
+_TX_CONTROL = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w$])\d+(?:\.\d+)?")
+_SPACE_RE = re.compile(r"\s+")
+
+
+class QueryStats:
+    """Агрегат одного отпечатка запроса."""
+
+    __slots__ = ('fingerprint', 'callsite', 'hist', 'rows', 'errors', 'last_slow_log')
+
+    def __init__(self, fingerprint: str, callsite: str):
+        self.fingerprint = fingerprint
+        self.callsite = callsite
+        self.hist = LogHistogram()
+        self.rows = 0
+        self.errors = 0
+        self.last_slow_log = 0.0
+
+    def row(self) -> dict:
+        h = self.hist
+        return {
+            'fingerprint': self.fingerprint,
+            'callsite': self.callsite,
+            'count': h.count,
+            'p50_ms': round(h.percentile(0.5)),
+            'p95_ms': round(h.percentile(0.95)),
+            'total_ms': round(h.total),
+            'avg_rows': round(self.rows / h.count, 1) if h.count else 0,
+            'errors': self.errors,
+        }
+
+
+_stats: Dict[str, QueryStats] = {}
+_fingerprints: Dict[str, Optional[str]] = {}   # текст запроса → отпечаток (None — не учитывать)
+_callsites: dict = {}                           # code object → "path.py:function"
+
+
+def fingerprint(query: str) -> Optional[str]:
+    """Нормализованный SQL; None для BEGIN/COMMIT и т.п."""
+    cached = _fingerprints.get(query, False)
+    if cached is not False:
+        return cached
+    text = _SPACE_RE.sub(' ', query).strip()
+    if text.upper().startswith(_TX_CONTROL):
+        result = None
+    else:
+        result = _NUMBER_RE.sub('?', _STRING_RE.sub('?', text))
+    if len(_fingerprints) < DB_QUERY_STATS_MAX * 4:
+        _fingerprints[query] = result
+    return result
+
+
+def _callsite(depth: int = 2) -> str:
+    """"путь:функция" первого кадра вне asyncpg и этого модуля."""
+    frame = sys._getframe(depth)
+    while frame is not None and frame.f_code.co_filename.startswith(_SKIP_FILES):
+        frame = frame.f_back
+    if frame is None:
+        return '?'
+    code = frame.f_code
+    site = _callsites.get(code)
+    if site is None:
+        path = os.path.relpath(code.co_filename, BASE_DIR)
+        if path.startswith('..'):
+            path = os.path.basename(code.co_filename)
+        site = f"{path}:{code.co_name}"
+        _callsites[code] = site
+    return site
+
+
+def _rows_from_status(status) -> int:
+    """'UPDATE 5' / 'INSERT 0 3' / 'COPY 100' → число строк."""
+    if isinstance(status, str):
+        tail = status.rsplit(' ', 1)[-1]
+        if tail.isdigit():
+            return int(tail)
+    return 0
+
+
+def record_query(query_fp: Optional[str], callsite: str, start: float, rows: int, failed: bool = False) -> None:
+    """Учесть выполненный запрос: агрегат, трейс, метрики, лог медленных."""
+    if query_fp is None:
+        return
+    try:
+        _record(query_fp, callsite, start, rows, failed)
+    except Exception as e:  # учёт не должен ломать сам запрос
+        logger.debug(f"[DB] query stats error: {e}")
+
+
+def _record(query_fp: str, callsite: str, start: float, rows: int, failed: bool) -> None:
+    end = time.perf_counter()
+    duration_ms = (end - start) * 1000
+
+    stats = _stats.get(query_fp)
+    if stats is None:
+        key = query_fp if len(_stats) < DB_QUERY_STATS_MAX else _OTHER
+        stats = _stats.get(key)
+        if stats is None:
+            stats = _stats[key] = QueryStats(key, callsite if key != _OTHER else _OTHER)
+    stats.hist.record(duration_ms)
+    stats.rows += rows
+    if failed:
+        stats.errors += 1
+
+    from core.tracing import get_current_trace
+    from core.metrics import observe_db_query
+    observe_db_query(callsite, duration_ms)
+    trace = get_current_trace()
+    if trace is not None:
+        trace.add_db_query(callsite, duration_ms, rows)
+
+    if duration_ms >= DB_SLOW_QUERY_MS and end - stats.last_slow_log >= _SLOW_LOG_INTERVAL:
+        stats.last_slow_log = end
+        logger.warning(
+            f"[DB] slow query {duration_ms:.0f}ms rows={rows} at {callsite}: {query_fp[:300]}"
+        )
+
+
+def get_query_stats(limit: int = 10) -> List[dict]:
+    """Топ отпечатков по суммарному времени (с запуска процесса)."""
+    top = sorted(_stats.values(), key=lambda s: s.hist.total, reverse=True)[:limit]
+    return [s.row() for s in top]
+
+
+def reset_query_stats() -> None:
+    _stats.clear()
+
+
+class InstrumentedConnection(asyncpg.Connection):
+    """asyncpg.Connection с замером каждого запроса (см. модуль)."""
+
+    async def execute(self, query, *args, **kwargs):
+        site, start, rows, failed = _callsite(), time.perf_counter(), 0, True
+        try:
+            result = await super().execute(query, *args, **kwargs)
+            rows, failed = _rows_from_status(result), False
+            return result
+        finally:
+            record_query(fingerprint(query), site, start, rows, failed)
+
+    async def executemany(self, command, args, **kwargs):
+        site, start, failed = _callsite(), time.perf_counter(), True
+        try:
+            result = await super().executemany(command, args, **kwargs)
+            failed = False
+            return result
+        finally:
+            record_query(fingerprint(command), site, start, len(args) if hasattr(args, '__len__') else 0, failed)
+
+    async def fetch(self, query, *args, **kwargs):
+        site, start, rows, failed = _callsite(), time.perf_counter(), 0, True
+        try:
+            result = await super().fetch(query, *args, **kwargs)
+            rows, failed = len(result), False
+            return result
+        finally:
+            record_query(fingerprint(query), site, start, rows, failed)
+
+    async def fetchrow(self, query, *args, **kwargs):
+        site, start, rows, failed = _callsite(), time.perf_counter(), 0, True
+        try:
+            result = await super().fetchrow(query, *args, **kwargs)
+            rows, failed = int(result is not None), False
+            return result
+        finally:
+            record_query(fingerprint(query), site, start, rows, failed)
+
+    async def fetchval(self, query, *args, **kwargs):
+        site, start, rows, failed = _callsite(), time.perf_counter(), 0, True
+        try:
+            result = await super().fetchval(query, *args, **kwargs)
+            rows, failed = int(result is not None), False
+            return result
+        finally:
+            record_query(fingerprint(query), site, start, rows, failed)
+
+    async def copy_records_to_table(self, table_name, **kwargs):
+        site, start, rows, failed = _callsite(), time.perf_counter(), 0, True
+        try:
+            result = await super().copy_records_to_table(table_name, **kwargs)
+            rows, failed = _rows_from_status(result), False
+            return result
+        finally:
+            record_query(f"COPY {table_name}", site, start, rows, failed)
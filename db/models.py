@@ -136,6 +136,30 @@ async def create_tables(pool: asyncpg.Pool):
                 if 'already exists' not in str(e).lower():
                     logger.warning(f"Миграция пропущена: {e}")
 
+        # Частичные индексы для выборки слота доставки (scheduled_check, pre-gen):
+        # в индексе только активные пользователи
+        schedule_indexes = [
+            '''CREATE INDEX IF NOT EXISTS idx_interns_marathon_schedule
+               ON interns (schedule_time)
+               WHERE marathon_status = 'active' AND onboarding_completed = TRUE''',
+            '''CREATE INDEX IF NOT EXISTS idx_interns_feed_schedule
+               ON interns (feed_schedule_time)
+               WHERE feed_status = 'active' AND onboarding_completed = TRUE''',
+            '''CREATE INDEX IF NOT EXISTS idx_interns_feed_fallback_schedule
+               ON interns (schedule_time)
+               WHERE feed_schedule_time IS NULL AND feed_status = 'active'
+                 AND onboarding_completed = TRUE''',
+        ]
+        for index_sql in schedule_indexes:
+            try:
+                await conn.execute(index_sql)
+            except Exception as e:
+                logger.warning(f"Индекс пропущен: {e}")
+
+        # JSON-поля interns разбираются в Python (db/queries/users.py);
+        # plpgsql-обёртка с EXCEPTION открывала подтранзакцию на каждое значение
+        await conn.execute('DROP FUNCTION IF EXISTS try_json(TEXT)')
+
         # ═══════════════════════════════════════════════════════════
         # ОТВЕТЫ И РАБОЧИЕ ПРОДУКТЫ
         # ═══════════════════════════════════════════════════════════
@@ -193,6 +217,17 @@ async def create_tables(pool: asyncpg.Pool):
             )
         ''')
 
+        # claimed_at — напоминание забрано на отправку (check_reminders)
+        for migration in [
+            'ALTER TABLE reminders ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP',
+            '''CREATE INDEX IF NOT EXISTS idx_reminders_due
+               ON reminders (scheduled_for) WHERE sent = FALSE''',
+        ]:
+            try:
+                await conn.execute(migration)
+            except Exception:
+                pass
+
         # ═══════════════════════════════════════════════════════════
         # ЛЕНТА: НЕДЕЛЬНЫЕ ПЛАНЫ (NEW)
         # ═══════════════════════════════════════════════════════════
@@ -335,6 +370,12 @@ async def create_tables(pool: asyncpg.Pool):
             ON activity_log(chat_id, activity_date)
         ''')
 
+        # По дню — для activity_daily (DAU/WAU без полного прохода)
+        await conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_activity_log_day
+            ON activity_log (activity_date)
+        ''')
+
         # ═══════════════════════════════════════════════════════════
         # ВОПРОСЫ И ОТВЕТЫ (NEW)
         # ═══════════════════════════════════════════════════════════
@@ -567,11 +608,37 @@ async def create_tables(pool: asyncpg.Pool):
             CREATE TABLE IF NOT EXISTS fsm_states (
                 chat_id BIGINT PRIMARY KEY,
                 state TEXT,
-                data TEXT DEFAULT '{}',
+                data JSONB DEFAULT '{}'::jsonb,
                 updated_at TIMESTAMP DEFAULT NOW()
             )
         ''')
 
+        # Миграция fsm_states.data: TEXT → JSONB (слияние data || delta в одном UPDATE)
+        try:
+            data_type = await conn.fetchval('''
+                SELECT data_type FROM information_schema.columns
+                WHERE table_name = 'fsm_states' AND column_name = 'data'
+            ''')
+            if data_type == 'text':
+                await conn.execute('''
+                    ALTER TABLE fsm_states
+                        ALTER COLUMN data DROP DEFAULT,
+                        ALTER COLUMN data TYPE JSONB
+                            USING COALESCE(NULLIF(data, ''), '{}')::jsonb,
+                        ALTER COLUMN data SET DEFAULT '{}'::jsonb
+                ''')
+                logger.info("✅ fsm_states.data мигрирована в JSONB")
+        except Exception as e:
+            logger.warning(f"⚠️ Миграция fsm_states.data в JSONB не удалась: {e}")
+
+        # Миграция fsm_states: version (оптимистичная блокировка write-behind кэша FSM)
+        try:
+            await conn.execute(
+                'ALTER TABLE fsm_states ADD COLUMN IF NOT EXISTS version BIGINT DEFAULT 0'
+            )
+        except Exception:
+            pass
+
         # ═══════════════════════════════════════════════════════════
         # АГРЕГИРОВАННЫЙ ПРОФИЛЬ ЗНАНИЙ (VIEW)
         # PG не позволяет менять порядок/имена колонок через REPLACE →
@@ -648,6 +715,74 @@ async def create_tables(pool: asyncpg.Pool):
             ON request_traces (user_id, created_at DESC)
         ''')
 
+        # ═══════════════════════════════════════════════════════════
+        # USAGE CLAUDE API (токены, TTFT — для планирования пиков)
+        # ═══════════════════════════════════════════════════════════
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS llm_usage (
+                id BIGSERIAL PRIMARY KEY,
+                feature TEXT NOT NULL,
+                model TEXT NOT NULL,
+                lang TEXT,
+                user_id BIGINT,
+                input_tokens INTEGER DEFAULT 0,
+                output_tokens INTEGER DEFAULT 0,
+                cache_read_tokens INTEGER DEFAULT 0,
+                cache_write_tokens INTEGER DEFAULT 0,
+                ttft_ms REAL,
+                duration_ms REAL,
+                created_at TIMESTAMPTZ DEFAULT NOW()
+            )
+        ''')
+
+        await conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_llm_usage_created
+            ON llm_usage (created_at DESC)
+        ''')
+
+        # ═══════════════════════════════════════════════════════════
+        # ОЧЕРЕДЬ ЗАДАЧ (пре-генерация, повторы доставки — core/job_queue.py)
+        # ═══════════════════════════════════════════════════════════
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS job_queue (
+                id BIGSERIAL PRIMARY KEY,
+                kind TEXT NOT NULL,
+                chat_id BIGINT NOT NULL,
+                topic_index INTEGER NOT NULL DEFAULT -1,
+                priority SMALLINT NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 3,
+                run_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                locked_by TEXT,
+                locked_at TIMESTAMPTZ,
+                last_error TEXT,
+                created_at TIMESTAMPTZ DEFAULT NOW(),
+                updated_at TIMESTAMPTZ DEFAULT NOW()
+            )
+        ''')
+
+        # Ключ идемпотентности: одна активная задача на (kind, chat_id, topic_index)
+        await conn.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_job_queue_key
+            ON job_queue (kind, chat_id, topic_index)
+            WHERE status IN ('pending', 'running')
+        ''')
+
+        await conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_job_queue_ready
+            ON job_queue (priority, run_at)
+            WHERE status = 'pending'
+        ''')
+
+        # Migration: deadline — к какому сроку нужен результат (слот доставки)
+        try:
+            await conn.execute(
+                'ALTER TABLE job_queue ADD COLUMN IF NOT EXISTS deadline TIMESTAMPTZ'
+            )
+        except Exception:
+            pass
+
         # ═══════════════════════════════════════════════════════════
         # МОНИТОРИНГ ОШИБОК
         # ═══════════════════════════════════════════════════════════
@@ -763,6 +898,59 @@ async def create_tables(pool: asyncpg.Pool):
             ON user_sessions (started_at DESC)
         ''')
 
+        # last_active_at — последний запрос (контрольные точки core/session_tracker.py)
+        try:
+            await conn.execute('ALTER TABLE user_sessions ADD COLUMN IF NOT EXISTS last_active_at TIMESTAMPTZ')
+        except Exception:
+            pass
+
+        # ═══════════════════════════════════════════════════════════
+        # АГРЕГАТЫ ДЛЯ DEV-ОТЧЁТОВ (db/queries/rollups.py)
+        # ═══════════════════════════════════════════════════════════
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS trace_rollups (
+                bucket TIMESTAMPTZ NOT NULL,
+                kind TEXT NOT NULL,
+                name TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                total_ms DOUBLE PRECISION NOT NULL,
+                max_ms DOUBLE PRECISION NOT NULL,
+                red_count INTEGER DEFAULT 0,
+                slow_count INTEGER DEFAULT 0,
+                hist INTEGER[] NOT NULL,
+                PRIMARY KEY (bucket, kind, name)
+            )
+        ''')
+
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS rollup_state (
+                name TEXT PRIMARY KEY,
+                watermark TIMESTAMPTZ NOT NULL,
+                updated_at TIMESTAMPTZ DEFAULT NOW()
+            )
+        ''')
+
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS activity_daily (
+                day DATE PRIMARY KEY,
+                dau INTEGER DEFAULT 0,
+                wau INTEGER DEFAULT 0,
+                sessions INTEGER DEFAULT 0,
+                updated_at TIMESTAMPTZ DEFAULT NOW()
+            )
+        ''')
+
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS retention_cohorts (
+                cohort_date DATE PRIMARY KEY,
+                size INTEGER DEFAULT 0,
+                d1 INTEGER DEFAULT 0,
+                d7 INTEGER DEFAULT 0,
+                d30 INTEGER DEFAULT 0,
+                updated_at TIMESTAMPTZ DEFAULT NOW()
+            )
+        ''')
+
         # ═══════════════════════════════════════════════════════════
         # КОНВЕРСИОННЫЕ СОБЫТИЯ (DP.ARCH.002 § 12.8)
         # ═══════════════════════════════════════════════════════════
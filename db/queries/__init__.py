@@ -13,6 +13,7 @@ from .users import (
     get_intern,
     update_intern,
     update_user_state,
+    invalidate_intern,
     get_all_scheduled_interns,
     get_topics_today,
     moscow_now,
@@ -101,6 +102,7 @@ __all__ = [
     'get_intern',
     'update_intern',
     'update_user_state',
+    'invalidate_intern',
     'get_all_scheduled_interns',
     'get_topics_today',
     'moscow_now',
@@ -11,23 +11,26 @@ from db.connection import get_pool
 logger = get_logger(__name__)
 
 
-async def touch_last_active_date(chat_id: int):
-    """Обновить last_active_date если ещё не сегодня. 1 lightweight UPDATE.
+async def touch_last_active_dates(chat_ids: List[int], today) -> None:
+    """Обновить last_active_date пачке пользователей одним UPDATE.
 
-    Вызывается fire-and-forget из TracingMiddleware на КАЖДЫЙ запрос.
-    Условие WHERE гарантирует: max 1 реальный UPDATE/день на пользователя.
+    Вызывается из core.telemetry: каждый пользователь попадает в пачку
+    не больше раза в день; WHERE отсекает уже отмеченных.
     """
-    from .users import moscow_today
-
+    if not chat_ids:
+        return
     pool = await get_pool()
-    today = moscow_today()
     async with pool.acquire() as conn:
-        await conn.execute('''
+        rows = await conn.fetch('''
             UPDATE interns
             SET last_active_date = $2
-            WHERE chat_id = $1
+            WHERE chat_id = ANY($1::bigint[])
               AND (last_active_date IS NULL OR last_active_date < $2)
-        ''', chat_id, today)
+            RETURNING chat_id
+        ''', list(chat_ids), today)
+    from .users import patch_cached_intern
+    for row in rows:
+        patch_cached_intern(row['chat_id'], last_active_date=today)
 
 
 async def record_active_day(chat_id: int, activity_type: str,
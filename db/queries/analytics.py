@@ -2,10 +2,12 @@
 Аналитические запросы для /analytics команды.
 
 Агрегирует данные из нескольких таблиц:
-- interns + activity_log → DAU/WAU/MAU, retention
+- interns → DAU/WAU/MAU
+- retention_cohorts, activity_daily → retention, тренды (db/queries/rollups.py)
 - user_sessions → сессии (длина, частота, entry/exit)
-- request_traces → latency, quality
+- trace_rollups + свежие request_traces → latency, quality
 - qa_history → helpful rate
+- llm_usage → токены и TTFT Claude API
 """
 
 import logging
@@ -19,7 +21,7 @@ async def get_analytics_report(hours: int = 24) -> dict:
     """Полный аналитический отчёт для /analytics.
 
     Returns:
-        {users, sessions, quality, retention, trends}
+        {users, sessions, quality, retention, trends, llm}
     """
     pool = await get_pool()
     async with pool.acquire() as conn:
@@ -28,6 +30,7 @@ async def get_analytics_report(hours: int = 24) -> dict:
         quality = await _safe(conn, _get_quality_metrics, conn, hours)
         retention = await _safe(conn, _get_retention_metrics, conn)
         trends = await _safe(conn, _get_trend_metrics, conn)
+        llm = await _safe(conn, _get_llm_metrics, conn, hours)
 
     return {
         'users': users or {'dau': 0, 'wau': 0, 'mau': 0, 'total': 0, 'new_today': 0, 'new_week': 0},
@@ -35,6 +38,7 @@ async def get_analytics_report(hours: int = 24) -> dict:
         'quality': quality or {'total_requests': 0, 'avg_ms': 0, 'p95_ms': 0, 'red_zone': 0, 'qa_total': 0, 'qa_helpful_rate': 0},
         'retention': retention or {'d1': 0, 'd7': 0, 'd30': 0},
         'trends': trends or {'dau_this_week': 0, 'dau_last_week': 0, 'dau_change_pct': 0, 'sessions_this_week': 0, 'sessions_last_week': 0, 'sessions_change_pct': 0},
+        'llm': llm or {'calls': 0, 'input_tokens': 0, 'output_tokens': 0, 'cache_read_tokens': 0, 'ttft_p50_ms': 0, 'ttft_p95_ms': 0, 'top_features': []},
     }
 
 
@@ -98,15 +102,9 @@ async def _get_session_metrics(conn, hours: int) -> dict:
 
 async def _get_quality_metrics(conn, hours: int) -> dict:
     """Latency + QA quality."""
-    latency = await conn.fetchrow('''
-        SELECT
-            COUNT(*) as total_requests,
-            COALESCE(AVG(total_ms), 0)::INTEGER as avg_ms,
-            COALESCE(percentile_cont(0.95) WITHIN GROUP (ORDER BY total_ms), 0)::INTEGER as p95_ms,
-            COUNT(*) FILTER (WHERE total_ms > 8000) as red_zone
-        FROM request_traces
-        WHERE created_at > NOW() - ($1 || ' hours')::INTERVAL
-    ''', str(hours))
+    from db.queries.rollups import get_trace_stats, summarize
+
+    latency = summarize(await get_trace_stats(conn, hours), 'command')
 
     qa = await conn.fetchrow('''
         SELECT
@@ -122,85 +120,66 @@ async def _get_quality_metrics(conn, hours: int) -> dict:
     helpful_rate = round(qa_helpful / qa_total * 100) if qa_total > 0 else 0
 
     return {
-        'total_requests': latency['total_requests'] if latency else 0,
-        'avg_ms': latency['avg_ms'] if latency else 0,
-        'p95_ms': latency['p95_ms'] if latency else 0,
-        'red_zone': latency['red_zone'] if latency else 0,
+        'total_requests': latency.hist.count,
+        'avg_ms': int(latency.hist.mean),
+        'p95_ms': int(latency.hist.percentile(0.95)),
+        'red_zone': latency.slow,
         'qa_total': qa_total,
         'qa_helpful_rate': helpful_rate,
     }
 
 
+async def _get_llm_metrics(conn, hours: int) -> dict:
+    """Токены Claude API и TTFT + самые затратные фичи."""
+    totals = await conn.fetchrow('''
+        SELECT
+            COUNT(*) as calls,
+            COALESCE(SUM(input_tokens), 0) as input_tokens,
+            COALESCE(SUM(output_tokens), 0) as output_tokens,
+            COALESCE(SUM(cache_read_tokens), 0) as cache_read_tokens,
+            COALESCE(percentile_cont(0.5) WITHIN GROUP (ORDER BY ttft_ms), 0)::INTEGER as ttft_p50_ms,
+            COALESCE(percentile_cont(0.95) WITHIN GROUP (ORDER BY ttft_ms), 0)::INTEGER as ttft_p95_ms
+        FROM llm_usage
+        WHERE created_at > NOW() - ($1 || ' hours')::INTERVAL
+    ''', str(hours))
+
+    top_features = await conn.fetch('''
+        SELECT feature,
+               COUNT(*) as calls,
+               SUM(input_tokens + cache_read_tokens + cache_write_tokens) as input_tokens,
+               SUM(output_tokens) as output_tokens
+        FROM llm_usage
+        WHERE created_at > NOW() - ($1 || ' hours')::INTERVAL
+        GROUP BY feature
+        ORDER BY output_tokens DESC
+        LIMIT 5
+    ''', str(hours))
+
+    return {
+        **dict(totals),
+        'top_features': [dict(r) for r in top_features],
+    }
+
+
 async def _get_retention_metrics(conn) -> dict:
-    """Retention D1/D7/D30 на основе activity_log и interns.created_at."""
-    result = {}
-    for days, label in [(1, 'd1'), (7, 'd7'), (30, 'd30')]:
-        row = await conn.fetchrow('''
-            WITH cohort AS (
-                SELECT chat_id, created_at::date as cohort_date
-                FROM interns
-                WHERE onboarding_completed = TRUE
-                  AND created_at < NOW() - make_interval(days := $1)
-            ),
-            retained AS (
-                SELECT DISTINCT c.chat_id
-                FROM cohort c
-                JOIN activity_log a ON c.chat_id = a.chat_id
-                  AND a.activity_date = c.cohort_date + $1
-            )
-            SELECT
-                (SELECT COUNT(*) FROM cohort) as cohort_size,
-                (SELECT COUNT(*) FROM retained) as retained_count
-        ''', days)
-
-        cohort_size = row['cohort_size'] if row else 0
-        retained = row['retained_count'] if row else 0
-        result[label] = round(retained / cohort_size * 100) if cohort_size > 0 else 0
-
-    return result
+    """Retention D1/D7/D30 — из когорт retention_cohorts (db/queries/rollups.py)."""
+    from db.queries.rollups import get_retention
+    return await get_retention(conn)
 
 
 async def _get_trend_metrics(conn) -> dict:
-    """Week-over-week trends: DAU, sessions."""
-    row = await conn.fetchrow('''
-        WITH this_week AS (
-            SELECT
-                COUNT(DISTINCT chat_id) as dau_avg
-            FROM activity_log
-            WHERE activity_date >= (NOW() AT TIME ZONE 'Europe/Moscow')::date - 6
-        ),
-        last_week AS (
-            SELECT
-                COUNT(DISTINCT chat_id) as dau_avg
-            FROM activity_log
-            WHERE activity_date BETWEEN (NOW() AT TIME ZONE 'Europe/Moscow')::date - 13 AND (NOW() AT TIME ZONE 'Europe/Moscow')::date - 7
-        )
-        SELECT
-            tw.dau_avg as this_week_dau,
-            lw.dau_avg as last_week_dau
-        FROM this_week tw, last_week lw
-    ''')
+    """Week-over-week trends: DAU, sessions (из activity_daily)."""
+    from db.queries.rollups import get_activity_trend
+    from db.queries.users import moscow_today
 
-    this_w = row['this_week_dau'] if row else 0
-    last_w = row['last_week_dau'] if row else 0
-    dau_change = round((this_w - last_w) / last_w * 100) if last_w > 0 else 0
+    row = await get_activity_trend(conn, moscow_today())
 
-    # Session trends
-    sess_row = await conn.fetchrow('''
-        WITH this_week AS (
-            SELECT COUNT(*) as cnt FROM user_sessions
-            WHERE started_at >= NOW() - INTERVAL '7 days'
-        ),
-        last_week AS (
-            SELECT COUNT(*) as cnt FROM user_sessions
-            WHERE started_at BETWEEN NOW() - INTERVAL '14 days' AND NOW() - INTERVAL '7 days'
-        )
-        SELECT tw.cnt as this_week, lw.cnt as last_week
-        FROM this_week tw, last_week lw
-    ''')
+    this_w = row['wau_this']
+    last_w = row['wau_last']
+    dau_change = round((this_w - last_w) / last_w * 100) if last_w > 0 else 0
 
-    this_s = sess_row['this_week'] if sess_row else 0
-    last_s = sess_row['last_week'] if sess_row else 0
+    this_s = row['sessions_this']
+    last_s = row['sessions_last']
     sess_change = round((this_s - last_s) / last_s * 100) if last_s > 0 else 0
 
     return {
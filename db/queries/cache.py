@@ -1,25 +1,56 @@
 """
 Кеш контента — экономия Claude API на повторной генерации.
 
+Два уровня:
+- L1: LRU в памяти процесса (бюджет по байтам + TTL), включая
+  негативные записи «в L2 нет» с коротким TTL
+- L2: таблица content_cache в PostgreSQL
+
+cache_get_or_create() дополнительно склеивает одновременные промахи
+по одному ключу (singleflight): генерация запускается один раз.
+
 Cache key format:
-- practice:{topic_id}:{lang}         — практическое задание
-- question:{topic_id}:{bloom}:{lang} — вопрос по теме
+- practice:{topic_id}:{lang}:{chat_id}            — практическое задание
+- question:{topic_id}:{bloom}:{lang}:{occupation} — вопрос по теме
+- mcp_search:{sha256[:32]}                        — результаты MCPClient.search
 """
 
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Awaitable, Callable, Optional
 
 from config import get_logger, MOSCOW_TZ
+from config.settings import (
+    CONTENT_L1_MAX_BYTES, CONTENT_L1_MAX_ENTRIES, CONTENT_L1_TTL_SEC, CONTENT_L1_NEGATIVE_TTL_SEC,
+)
 from db.connection import get_pool
+from helpers.singleflight import SingleFlight
+from helpers.ttl_cache import TTLCache
 
 logger = get_logger(__name__)
 
 # TTL по умолчанию: 7 дней (контент программы меняется редко)
 DEFAULT_TTL_DAYS = 7
 
+_NEGATIVE = object()  # L1: ключа нет в L2
 
-async def cache_get(cache_key: str) -> Optional[str]:
-    """Получить контент из кеша. Возвращает None если нет или истёк."""
+_l1 = TTLCache(maxsize=CONTENT_L1_MAX_ENTRIES, ttl=CONTENT_L1_TTL_SEC, max_bytes=CONTENT_L1_MAX_BYTES)
+_flight = SingleFlight()
+
+_stats = {
+    'l1_hits': 0,
+    'l2_hits': 0,
+    'negative_hits': 0,
+    'misses': 0,
+    'sets': 0,
+}
+
+
+def _l1_put(cache_key: str, content: str) -> None:
+    """Положить в L1 (TTL L1 — минуты, L2 — дни: L1 не переживает L2)."""
+    _l1.set(cache_key, content, size=len(content.encode('utf-8')))
+
+
+async def _l2_get(cache_key: str) -> Optional[str]:
     pool = await get_pool()
     async with pool.acquire() as conn:
         row = await conn.fetchrow(
@@ -28,13 +59,34 @@ async def cache_get(cache_key: str) -> Optional[str]:
             cache_key
         )
     if row:
-        logger.info(f"[Cache] HIT: {cache_key}")
+        _stats['l2_hits'] += 1
+        _l1_put(cache_key, row['content'])
         return row['content']
+    _stats['misses'] += 1
+    _l1.set(cache_key, _NEGATIVE, ttl=CONTENT_L1_NEGATIVE_TTL_SEC)
     return None
 
 
+async def cache_get(cache_key: str) -> Optional[str]:
+    """Получить контент из кеша. Возвращает None если нет или истёк."""
+    content = _l1.get(cache_key)
+    if content is _NEGATIVE:
+        _stats['negative_hits'] += 1
+        return None
+    if content is not None:
+        _stats['l1_hits'] += 1
+        logger.debug(f"[Cache] L1 HIT: {cache_key}")
+        return content
+
+    # Одновременные промахи L1 по ключу — один SELECT
+    content = await _flight.do(('l2', cache_key), lambda: _l2_get(cache_key))
+    if content is not None:
+        logger.debug(f"[Cache] L2 HIT: {cache_key}")
+    return content
+
+
 async def cache_set(cache_key: str, content_type: str, content: str, ttl_days: int = DEFAULT_TTL_DAYS):
-    """Сохранить контент в кеш."""
+    """Сохранить контент в кеш (L2 + L1)."""
     pool = await get_pool()
     expires = datetime.now(MOSCOW_TZ) + timedelta(days=ttl_days)
     async with pool.acquire() as conn:
@@ -45,9 +97,50 @@ async def cache_set(cache_key: str, content_type: str, content: str, ttl_days: i
                DO UPDATE SET content = $3, expires_at = $4, created_at = NOW()''',
             cache_key, content_type, content, expires
         )
+    _stats['sets'] += 1
+    _l1_put(cache_key, content)
     logger.info(f"[Cache] SET: {cache_key} (expires {expires.date()})")
 
 
+async def cache_get_or_create(
+    cache_key: str,
+    content_type: str,
+    factory: Callable[[], Awaitable[Optional[str]]],
+    ttl_days: int = DEFAULT_TTL_DAYS,
+) -> Optional[str]:
+    """Контент из кеша или сгенерированный factory() (один раз на ключ).
+
+    Пустой результат factory не кешируется.
+    """
+    content = await cache_get(cache_key)
+    if content is not None:
+        return content
+
+    async def _create() -> Optional[str]:
+        # Пока ждали, ключ мог записать другой вызов
+        existing = _l1.get(cache_key)
+        if existing is not None and existing is not _NEGATIVE:
+            return existing
+        created = await factory()
+        if created:
+            await cache_set(cache_key, content_type, created, ttl_days)
+        return created
+
+    return await _flight.do(('create', cache_key), _create)
+
+
+def get_cache_stats() -> dict:
+    """Счётчики кеша контента (для /health)."""
+    l1 = _l1.stats()
+    return {
+        **_stats,
+        'l1_entries': l1['size'],
+        'l1_bytes': l1['bytes'],
+        'evictions': l1['evictions'],
+        'coalesced': _flight.coalesced,
+    }
+
+
 async def cache_cleanup():
     """Удалить истекшие записи. Вызывается из scheduler раз в сутки."""
     pool = await get_pool()
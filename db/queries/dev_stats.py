@@ -151,7 +151,11 @@ async def get_qa_top_topics(limit: int = 10) -> List[dict]:
 # === /health — техническое состояние ===
 
 async def get_table_sizes() -> List[dict]:
-    """Количество записей в каждой таблице."""
+    """Количество записей в каждой таблице.
+
+    Оценка планировщика (pg_class.reltuples) — без COUNT(*) по таблицам;
+    точный COUNT только для таблиц, которые ещё не анализировались.
+    """
     pool = await get_pool()
     tables = [
         'interns', 'answers', 'activity_log', 'qa_history',
@@ -161,12 +165,23 @@ async def get_table_sizes() -> List[dict]:
     ]
     results = []
     async with pool.acquire() as conn:
-        for table in tables:
-            try:
-                row = await conn.fetchrow(f'SELECT COUNT(*) AS cnt FROM {table}')
-                results.append({'table': table, 'count': row['cnt']})
-            except Exception:
-                results.append({'table': table, 'count': -1})
+        rows = await conn.fetch('''
+            SELECT t.name, c.reltuples::bigint AS estimate
+            FROM unnest($1::text[]) WITH ORDINALITY AS t(name, pos)
+            LEFT JOIN pg_class c ON c.oid = to_regclass(t.name)
+            ORDER BY t.pos
+        ''', tables)
+        for r in rows:
+            if r['estimate'] is None:
+                results.append({'table': r['name'], 'count': -1, 'estimated': False})
+            elif r['estimate'] > 0:
+                results.append({'table': r['name'], 'count': r['estimate'], 'estimated': True})
+            else:
+                try:
+                    cnt = await conn.fetchval(f'SELECT COUNT(*) FROM {r["name"]}')
+                    results.append({'table': r['name'], 'count': cnt, 'estimated': False})
+                except Exception:
+                    results.append({'table': r['name'], 'count': -1, 'estimated': False})
     return results
 
 
@@ -0,0 +1,250 @@
+"""
+Запросы для таблицы job_queue (очередь задач пре-генерации и повторов доставки).
+
+Задачу забирает ровно один worker: SELECT ... FOR UPDATE SKIP LOCKED —
+реплики и отдельные процессы не блокируют друг друга и не берут одно и то же.
+Ключ идемпотентности (kind, chat_id, topic_index) — не больше одной
+активной (pending/running) задачи; повторная постановка ничего не делает.
+topic_index = -1 — задача без темы (дайджест Ленты).
+"""
+
+from datetime import datetime
+from typing import List, Optional, Sequence
+
+from db.connection import acquire
+from config import get_logger
+
+logger = get_logger(__name__)
+
+NO_TOPIC = -1
+
+_UPSERT_CONFLICT = """
+    ON CONFLICT (kind, chat_id, topic_index) WHERE status IN ('pending', 'running')
+    DO NOTHING
+"""
+
+
+async def enqueue_job(
+    kind: str,
+    chat_id: int,
+    topic_index: Optional[int] = None,
+    priority: int = 0,
+    delay_sec: float = 0,
+    max_attempts: int = 3,
+) -> bool:
+    """Поставить задачу в очередь. False — такая задача уже ждёт или выполняется."""
+    async with await acquire() as conn:
+        job_id = await conn.fetchval(f"""
+            INSERT INTO job_queue (kind, chat_id, topic_index, priority, max_attempts, run_at)
+            VALUES ($1, $2, $3, $4, $5, NOW() + make_interval(secs => $6))
+            {_UPSERT_CONFLICT}
+            RETURNING id
+        """, kind, chat_id, NO_TOPIC if topic_index is None else topic_index,
+            priority, max_attempts, float(delay_sec))
+    return job_id is not None
+
+
+async def enqueue_jobs(
+    kind: str,
+    keys: Sequence[tuple],
+    priority: int = 0,
+    max_attempts: int = 3,
+    run_at: Optional[Sequence[datetime]] = None,
+    deadline: Optional[Sequence[datetime]] = None,
+) -> int:
+    """Поставить пачку задач одного вида одним запросом.
+
+    Args:
+        keys: [(chat_id, topic_index), ...]
+        run_at: время запуска каждой задачи (по умолчанию — сразу)
+        deadline: к какому сроку нужен результат (для отчёта о пре-генерации)
+
+    Returns:
+        Сколько задач добавлено (без уже активных)
+    """
+    if not keys:
+        return 0
+    chat_ids = [chat_id for chat_id, _ in keys]
+    topics = [NO_TOPIC if topic is None else topic for _, topic in keys]
+    run_at = list(run_at) if run_at is not None else [None] * len(keys)
+    deadline = list(deadline) if deadline is not None else [None] * len(keys)
+    async with await acquire() as conn:
+        rows = await conn.fetch(f"""
+            INSERT INTO job_queue (kind, chat_id, topic_index, priority, max_attempts, run_at, deadline)
+            SELECT $1, k.chat_id, k.topic_index, $4, $5, COALESCE(k.run_at, NOW()), k.deadline
+            FROM unnest($2::bigint[], $3::int[], $6::timestamptz[], $7::timestamptz[])
+                 AS k(chat_id, topic_index, run_at, deadline)
+            {_UPSERT_CONFLICT}
+            RETURNING id
+        """, kind, chat_ids, topics, priority, max_attempts, run_at, deadline)
+    return len(rows)
+
+
+async def get_pending_backlog(kind: str) -> dict:
+    """Очередь задач kind, ещё не выполненных: хвост и объём по срокам.
+
+    Returns:
+        {tail: max run_at ожидающих задач | None,
+         by_deadline: [(deadline, count), ...]} (без срока — не учитываются)
+    """
+    async with await acquire() as conn:
+        tail = await conn.fetchval(
+            "SELECT MAX(run_at) FROM job_queue WHERE kind = $1 AND status = 'pending'",
+            kind,
+        )
+        rows = await conn.fetch("""
+            SELECT deadline, COUNT(*) AS cnt FROM job_queue
+            WHERE kind = $1 AND status IN ('pending', 'running') AND deadline IS NOT NULL
+            GROUP BY deadline ORDER BY deadline
+        """, kind)
+    return {'tail': tail, 'by_deadline': [(r['deadline'], r['cnt']) for r in rows]}
+
+
+async def get_deadline_report(kind: str, since: datetime, until: datetime) -> List[dict]:
+    """Фактическое выполнение задач kind по срокам в [since, until].
+
+    Returns:
+        [{deadline, total, done, on_time, failed, last_done_at}]
+        on_time — выполнены не позже срока
+    """
+    async with await acquire() as conn:
+        rows = await conn.fetch("""
+            SELECT deadline,
+                   COUNT(*) AS total,
+                   COUNT(*) FILTER (WHERE status = 'done') AS done,
+                   COUNT(*) FILTER (WHERE status = 'done' AND updated_at <= deadline) AS on_time,
+                   COUNT(*) FILTER (WHERE status = 'failed') AS failed,
+                   MAX(updated_at) FILTER (WHERE status = 'done') AS last_done_at
+            FROM job_queue
+            WHERE kind = $1 AND deadline BETWEEN $2 AND $3
+            GROUP BY deadline ORDER BY deadline
+        """, kind, since, until)
+    return [dict(r) for r in rows]
+
+
+async def claim_jobs(worker_id: str, kinds: Sequence[str], limit: int) -> List[dict]:
+    """Забрать до limit готовых задач (по приоритету, затем по времени)."""
+    if limit <= 0 or not kinds:
+        return []
+    async with await acquire() as conn:
+        rows = await conn.fetch("""
+            UPDATE job_queue j
+            SET status = 'running', locked_by = $1, locked_at = NOW(),
+                attempts = j.attempts + 1, updated_at = NOW()
+            FROM (
+                SELECT id FROM job_queue
+                WHERE status = 'pending' AND run_at <= NOW() AND kind = ANY($2::text[])
+                ORDER BY priority, run_at
+                LIMIT $3
+                FOR UPDATE SKIP LOCKED
+            ) ready
+            WHERE j.id = ready.id
+            RETURNING j.id, j.kind, j.chat_id, j.topic_index, j.priority,
+                      j.attempts, j.max_attempts
+        """, worker_id, list(kinds), limit)
+    jobs = []
+    for row in rows:
+        job = dict(row)
+        if job['topic_index'] == NO_TOPIC:
+            job['topic_index'] = None
+        jobs.append(job)
+    return jobs
+
+
+async def complete_job(job_id: int) -> None:
+    async with await acquire() as conn:
+        await conn.execute("""
+            UPDATE job_queue
+            SET status = 'done', locked_by = NULL, locked_at = NULL, updated_at = NOW()
+            WHERE id = $1
+        """, job_id)
+
+
+async def fail_job(job_id: int, error: str, retry_in_sec: float) -> str:
+    """Неудача: вернуть в очередь через retry_in_sec или пометить failed.
+
+    Returns:
+        Новый статус ('pending' или 'failed')
+    """
+    async with await acquire() as conn:
+        return await conn.fetchval("""
+            UPDATE job_queue
+            SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'pending' END,
+                run_at = NOW() + make_interval(secs => $3),
+                last_error = $2,
+                locked_by = NULL, locked_at = NULL, updated_at = NOW()
+            WHERE id = $1
+            RETURNING status
+        """, job_id, error[:1000], float(retry_in_sec))
+
+
+async def release_jobs(job_ids: Sequence[int]) -> None:
+    """Вернуть прерванные (shutdown) задачи в очередь без траты попытки."""
+    if not job_ids:
+        return
+    async with await acquire() as conn:
+        await conn.execute("""
+            UPDATE job_queue
+            SET status = 'pending', attempts = GREATEST(attempts - 1, 0),
+                locked_by = NULL, locked_at = NULL, updated_at = NOW()
+            WHERE id = ANY($1::bigint[]) AND status = 'running'
+        """, list(job_ids))
+
+
+async def requeue_stale_jobs(minutes: int) -> int:
+    """Вернуть в очередь задачи, зависшие в running (процесс worker упал)."""
+    async with await acquire() as conn:
+        result = await conn.execute("""
+            UPDATE job_queue
+            SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'pending' END,
+                last_error = 'stale: worker ' || COALESCE(locked_by, '?') || ' lost',
+                locked_by = NULL, locked_at = NULL, updated_at = NOW()
+            WHERE status = 'running' AND locked_at < NOW() - INTERVAL '1 minute' * $1
+        """, minutes)
+    count = int(result.split()[-1]) if result else 0
+    if count > 0:
+        logger.warning(f"[JobQueue] Requeued {count} stale running jobs")
+    return count
+
+
+async def cleanup_old_jobs(days: int = 7) -> int:
+    """Удалить завершённые и проваленные задачи старше N дней."""
+    async with await acquire() as conn:
+        result = await conn.execute("""
+            DELETE FROM job_queue
+            WHERE status IN ('done', 'failed') AND updated_at < NOW() - INTERVAL '1 day' * $1
+        """, days)
+    count = int(result.split()[-1]) if result else 0
+    if count > 0:
+        logger.info(f"[JobQueue] Cleaned up {count} jobs older than {days} days")
+    return count
+
+
+async def get_job_stats() -> dict:
+    """Состояние очереди для /health.
+
+    Returns:
+        {by_status: {status: count}, ready: N, oldest_ready_sec: float|None,
+         failed_24h: [{kind, count}]}
+    """
+    async with await acquire() as conn:
+        status_rows = await conn.fetch(
+            "SELECT status, COUNT(*) AS cnt FROM job_queue GROUP BY status"
+        )
+        ready = await conn.fetchrow("""
+            SELECT COUNT(*) AS cnt,
+                   EXTRACT(EPOCH FROM NOW() - MIN(run_at)) AS oldest_sec
+            FROM job_queue
+            WHERE status = 'pending' AND run_at <= NOW()
+        """)
+        failed_rows = await conn.fetch("""
+            SELECT kind, COUNT(*) AS cnt FROM job_queue
+            WHERE status = 'failed' AND updated_at > NOW() - INTERVAL '24 hours'
+            GROUP BY kind ORDER BY cnt DESC
+        """)
+    return {
+        'by_status': {r['status']: r['cnt'] for r in status_rows},
+        'ready': ready['cnt'],
+        'oldest_ready_sec': float(ready['oldest_sec']) if ready['oldest_sec'] is not None else None,
+        'failed_24h': [{'kind': r['kind'], 'count': r['cnt']} for r in failed_rows],
+    }
@@ -0,0 +1,104 @@
+"""
+Запросы для таблицы llm_usage (токены и латентность вызовов Claude API).
+
+Одна строка = один вызов API (раунд tool_use — отдельный вызов).
+Пишется пачками из core.llm_usage через COPY, читается отчётами /latency и /analytics.
+"""
+
+from typing import Sequence
+
+from db.connection import acquire
+from config import get_logger
+
+logger = get_logger(__name__)
+
+LLM_USAGE_COLUMNS = (
+    'feature', 'model', 'lang', 'user_id',
+    'input_tokens', 'output_tokens', 'cache_read_tokens', 'cache_write_tokens',
+    'ttft_ms', 'duration_ms', 'created_at',
+)
+
+
+async def insert_llm_usage(records: Sequence[tuple]) -> None:
+    """Bulk insert (COPY) строк в порядке LLM_USAGE_COLUMNS."""
+    if not records:
+        return
+    async with await acquire() as conn:
+        await conn.copy_records_to_table(
+            'llm_usage', records=records, columns=LLM_USAGE_COLUMNS,
+        )
+
+
+async def cleanup_old_llm_usage(days: int = 30) -> int:
+    """Удалить записи старше N дней. Возвращает количество удалённых."""
+    async with await acquire() as conn:
+        result = await conn.execute(
+            "DELETE FROM llm_usage WHERE created_at < NOW() - INTERVAL '1 day' * $1",
+            days,
+        )
+        count = int(result.split()[-1]) if result else 0
+        if count > 0:
+            logger.info(f"[LLMUsage] Cleaned up {count} rows older than {days} days")
+        return count
+
+
+async def get_llm_usage_report(hours: int = 24) -> dict:
+    """Токены и TTFT по фичам за последние N часов.
+
+    Returns dict with:
+      - summary: {calls, input_tokens, output_tokens, cache_read_tokens,
+                  cache_write_tokens, ttft_p50_ms, ttft_p95_ms}
+      - by_feature: [{feature, model, lang, calls, input_tokens, output_tokens,
+                      cache_read_tokens, ttft_p50_ms, ttft_p95_ms, tps_p50}]
+      - peak_hour: {hour, calls, output_tokens} — самый нагруженный час
+    """
+    async with await acquire() as conn:
+        summary = await conn.fetchrow("""
+            SELECT COUNT(*) AS calls,
+                   COALESCE(SUM(input_tokens), 0) AS input_tokens,
+                   COALESCE(SUM(output_tokens), 0) AS output_tokens,
+                   COALESCE(SUM(cache_read_tokens), 0) AS cache_read_tokens,
+                   COALESCE(SUM(cache_write_tokens), 0) AS cache_write_tokens,
+                   COALESCE(percentile_cont(0.5) WITHIN GROUP (ORDER BY ttft_ms)::int, 0) AS ttft_p50_ms,
+                   COALESCE(percentile_cont(0.95) WITHIN GROUP (ORDER BY ttft_ms)::int, 0) AS ttft_p95_ms
+            FROM llm_usage
+            WHERE created_at > NOW() - INTERVAL '1 hour' * $1
+        """, hours)
+
+        # Скорость генерации: выходные токены / время после первого токена
+        by_feature = await conn.fetch("""
+            SELECT feature, model, COALESCE(lang, '') AS lang,
+                   COUNT(*) AS calls,
+                   SUM(input_tokens) AS input_tokens,
+                   SUM(output_tokens) AS output_tokens,
+                   SUM(cache_read_tokens) AS cache_read_tokens,
+                   COALESCE(percentile_cont(0.5) WITHIN GROUP (ORDER BY ttft_ms)::int, 0) AS ttft_p50_ms,
+                   COALESCE(percentile_cont(0.95) WITHIN GROUP (ORDER BY ttft_ms)::int, 0) AS ttft_p95_ms,
+                   COALESCE(percentile_cont(0.5) WITHIN GROUP (
+                       ORDER BY output_tokens * 1000.0 / NULLIF(duration_ms - ttft_ms, 0)
+                   )::int, 0) AS tps_p50
+            FROM llm_usage
+            WHERE created_at > NOW() - INTERVAL '1 hour' * $1
+            GROUP BY feature, model, lang
+            ORDER BY output_tokens DESC
+        """, hours)
+
+        peak_hour = await conn.fetchrow("""
+            SELECT date_trunc('hour', created_at AT TIME ZONE 'Europe/Moscow') AS hour,
+                   COUNT(*) AS calls,
+                   SUM(output_tokens) AS output_tokens
+            FROM llm_usage
+            WHERE created_at > NOW() - INTERVAL '1 hour' * $1
+            GROUP BY hour
+            ORDER BY calls DESC
+            LIMIT 1
+        """, hours)
+
+    return {
+        'summary': dict(summary) if summary else {
+            'calls': 0, 'input_tokens': 0, 'output_tokens': 0, 'cache_read_tokens': 0,
+            'cache_write_tokens': 0, 'ttft_p50_ms': 0, 'ttft_p95_ms': 0,
+        },
+        'by_feature': [dict(r) for r in by_feature],
+        'peak_hour': dict(peak_hour) if peak_hour else None,
+    }
@@ -62,7 +62,33 @@ async def get_marathon_content(chat_id: int, topic_index: int) -> dict | None:
 
     if not row:
         return None
+    return _row_to_content(row)
 
+
+async def get_marathon_contents(keys: list) -> dict:
+    """Пре-генерированный контент пачки пользователей одним запросом.
+
+    Args:
+        keys: [(chat_id, topic_index), ...]
+
+    Returns:
+        {(chat_id, topic_index): content} — только найденные (формат как get_marathon_content)
+    """
+    if not keys:
+        return {}
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            '''SELECT mc.* FROM marathon_content mc
+               JOIN unnest($1::bigint[], $2::int[]) AS k(chat_id, topic_index)
+                 ON mc.chat_id = k.chat_id AND mc.topic_index = k.topic_index
+               WHERE mc.chat_id = ANY($1::bigint[])''',
+            [chat_id for chat_id, _ in keys], [topic for _, topic in keys],
+        )
+    return {(row['chat_id'], row['topic_index']): _row_to_content(row) for row in rows}
+
+
+def _row_to_content(row) -> dict:
     result = dict(row)
     # Parse practice_content JSON
     if result.get('practice_content'):
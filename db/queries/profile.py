@@ -39,6 +39,10 @@ async def delete_all_user_data(chat_id: int) -> dict:
 
     Ref: DP.D.028 (User Data Tiers — протокол удаления).
     """
+    # fsm_states удаляется ниже — незаписанный кэш FSM не должен её воскресить
+    from core.storage import discard_fsm_chat
+    discard_fsm_chat(chat_id)
+
     pool = await get_pool()
     result = {}
 
@@ -79,6 +83,9 @@ async def delete_all_user_data(chat_id: int) -> dict:
             )
             result['interns'] = _parse_delete_count(deleted)
 
+    from .users import invalidate_intern
+    invalidate_intern(chat_id)
+
     total = sum(result.values())
     logger.info(f"[DELETE] user {chat_id}: {total} rows deleted from {len(result)} tables")
     return result
@@ -95,6 +102,10 @@ async def reset_learning_data(chat_id: int) -> dict:
 
     Returns: dict с количеством удалённых строк по таблицам.
     """
+    # fsm_states удаляется ниже — незаписанный кэш FSM не должен её воскресить
+    from core.storage import discard_fsm_chat
+    discard_fsm_chat(chat_id)
+
     pool = await get_pool()
     result = {}
 
@@ -147,6 +158,9 @@ async def reset_learning_data(chat_id: int) -> dict:
             ''', chat_id)
             result['interns_reset'] = 1
 
+    from .users import invalidate_intern
+    invalidate_intern(chat_id)
+
     total = sum(result.values())
     logger.info(f"[RESET] user {chat_id}: learning data reset, {total} rows affected across {len(result)} tables")
     return result
@@ -0,0 +1,64 @@
+"""
+Запросы для таблицы reminders (напоминания марафона +1ч / +3ч).
+
+Отправка — «забрать и отправить»: claim_due_reminders помечает пачку
+claimed_at (FOR UPDATE SKIP LOCKED — реплики не берут одно и то же),
+соединение освобождается на время отправки, итог пишется одним запросом
+на пачку. Забранное, но не отмеченное (процесс упал) через
+REMINDER_CLAIM_TIMEOUT_MIN снова доступно.
+"""
+
+from datetime import datetime
+from typing import List, Sequence
+
+from db.connection import acquire
+
+REMINDER_CLAIM_TIMEOUT_MIN = 5
+
+
+async def claim_due_reminders(now: datetime, limit: int) -> List[dict]:
+    """Забрать до limit наступивших неотправленных напоминаний.
+
+    Args:
+        now: текущее время без timezone (колонка TIMESTAMP)
+
+    Returns:
+        [{id, chat_id, reminder_type}]
+    """
+    async with await acquire() as conn:
+        rows = await conn.fetch("""
+            UPDATE reminders r SET claimed_at = NOW()
+            FROM (
+                SELECT id FROM reminders
+                WHERE sent = FALSE AND scheduled_for <= $1
+                  AND (claimed_at IS NULL
+                       OR claimed_at < NOW() - INTERVAL '1 minute' * $3)
+                ORDER BY scheduled_for
+                LIMIT $2
+                FOR UPDATE SKIP LOCKED
+            ) due
+            WHERE r.id = due.id
+            RETURNING r.id, r.chat_id, r.reminder_type
+        """, now, limit, REMINDER_CLAIM_TIMEOUT_MIN)
+    return [dict(r) for r in rows]
+
+
+async def mark_reminders_sent(ids: Sequence[int]) -> None:
+    if not ids:
+        return
+    async with await acquire() as conn:
+        await conn.execute(
+            'UPDATE reminders SET sent = TRUE WHERE id = ANY($1::int[])',
+            list(ids)
+        )
+
+
+async def release_reminders(ids: Sequence[int]) -> None:
+    """Вернуть неотправленные (ошибка) — повтор на следующей проверке."""
+    if not ids:
+        return
+    async with await acquire() as conn:
+        await conn.execute(
+            'UPDATE reminders SET claimed_at = NULL WHERE id = ANY($1::int[])',
+            list(ids)
+        )
@@ -0,0 +1,306 @@
+"""
+Предагрегированные таблицы для dev-отчётов (/latency, /analytics).
+
+Раньше каждый отчёт считал percentile_cont, разворачивал spans (jsonb_array_elements)
+и когорты retention по сырым request_traces / activity_log / interns —
+время ответа росло вместе с таблицами. Теперь периодическая задача
+(refresh_rollups, раз в 5 минут из core/scheduler.py) ведёт:
+
+- trace_rollups — часовые корзины по команде и по span: count, сумма, max,
+  красная зона и логарифмическая гистограмма (helpers/histogram.py);
+  закрываются только завершённые часы, граница — rollup_state('traces')
+- activity_daily — по дням (МСК): DAU, WAU (уникальные за 7 дней), начатые сессии
+- retention_cohorts — когорты по дате регистрации: размер и вернувшиеся на D1/D7/D30
+
+Отчёт = готовые часы из trace_rollups + сырые трейсы после границы (≤ ~1 часа).
+Окно отчёта выравнивается по началу часа.
+"""
+
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+from config import get_logger
+from db.connection import get_pool
+from db.queries.traces import THRESHOLDS, classify_command
+from helpers.histogram import BUCKETS, SUB_BUCKETS, LogHistogram
+
+logger = get_logger(__name__)
+
+TRACE_ROLLUP_RETENTION_DAYS = 90
+_CLOSE_DELAY = timedelta(minutes=2)    # трейсы доходят до БД через буфер телеметрии
+_MAX_HOURS_PER_RUN = 24                # первичное заполнение — порциями, не одной транзакцией
+_RECENT_DAYS = 2                       # activity_daily: сегодня и вчера пересчитываются всегда
+_COHORT_OPEN_DAYS = 31                 # когорта меняется, пока не прошло D30
+_LOCK_ID = 0x524F4C4C                  # pg advisory lock: один пересчёт на все инстансы
+
+# Номер корзины гистограммы — та же формула, что helpers.histogram.bucket_index
+BUCKET_SQL = f"LEAST({BUCKETS - 1}, FLOOR(LOG(2, GREATEST({{value}}, 1)::numeric) * {SUB_BUCKETS}))::int"
+
+# Красная зона для команды — выше жёлтого порога её категории
+_MIN_RED_MS = min(yellow for _, yellow in THRESHOLDS.values())
+_SLOW_MS = 8000  # /analytics: «Red-zone (>8s)»
+
+
+@dataclass
+class LatencyAggregate:
+    """Латентность команды или span за период."""
+    hist: LogHistogram = field(default_factory=LogHistogram)
+    red: int = 0
+    slow: int = 0
+
+    def merge(self, other: 'LatencyAggregate') -> None:
+        self.hist.merge(other.hist)
+        self.red += other.red
+        self.slow += other.slow
+
+
+# Ключ: (kind, name), kind — 'command' | 'span'
+TraceStats = Dict[Tuple[str, str], LatencyAggregate]
+
+
+# ============= ЧТЕНИЕ =============
+
+async def get_trace_stats(conn, hours: int) -> TraceStats:
+    """Латентность по командам и span за последние N часов (rollup + хвост сырых трейсов)."""
+    now = datetime.now(timezone.utc)
+    since = (now - timedelta(hours=hours)).replace(minute=0, second=0, microsecond=0)
+    watermark = await conn.fetchval("SELECT watermark FROM rollup_state WHERE name = 'traces'")
+
+    stats: TraceStats = {}
+    if watermark and watermark > since:
+        rows = await conn.fetch('''
+            SELECT kind, name, count, total_ms, max_ms, red_count, slow_count, hist
+            FROM trace_rollups
+            WHERE bucket >= $1 AND bucket < $2
+        ''', since, watermark)
+        for r in rows:
+            agg = LatencyAggregate(LogHistogram(r['hist'], r['total_ms'], r['max_ms']), r['red_count'], r['slow_count'])
+            _merge_into(stats, (r['kind'], r['name']), agg)
+        since = watermark
+
+    for (_, kind, name), agg in (await _aggregate_traces(conn, since)).items():
+        _merge_into(stats, (kind, name), agg)
+    return stats
+
+
+def summarize(stats: TraceStats, kind: str) -> LatencyAggregate:
+    """Свести все команды (или все span) в один агрегат."""
+    total = LatencyAggregate()
+    for (k, _), agg in stats.items():
+        if k == kind:
+            total.merge(agg)
+    return total
+
+
+def _merge_into(stats: dict, key, agg: LatencyAggregate) -> None:
+    if key in stats:
+        stats[key].merge(agg)
+    else:
+        stats[key] = agg
+
+
+async def _aggregate_traces(conn, start: datetime, end: Optional[datetime] = None) -> dict:
+    """Сгруппировать сырые трейсы [start, end) по (час, kind, name).
+
+    БД отдаёт уже сгруппированные по корзинам гистограммы строки — не сами трейсы.
+    """
+    upper = "AND t.created_at < $2" if end else ""
+    args = (start, end) if end else (start,)
+    result: dict = {}
+
+    def get(bucket, kind, name) -> LatencyAggregate:
+        key = (bucket, kind, name)
+        if key not in result:
+            result[key] = LatencyAggregate()
+        return result[key]
+
+    commands = await conn.fetch(f'''
+        SELECT date_trunc('hour', t.created_at) AS bucket, COALESCE(t.command, '') AS name,
+               {BUCKET_SQL.format(value='t.total_ms')} AS idx,
+               COUNT(*) AS n, SUM(t.total_ms) AS total, MAX(t.total_ms) AS max_ms
+        FROM request_traces t
+        WHERE t.created_at >= $1 {upper}
+        GROUP BY 1, 2, 3
+    ''', *args)
+    for r in commands:
+        get(r['bucket'], 'command', r['name']).hist.add_bucket(r['idx'], r['n'], r['total'], r['max_ms'])
+
+    spans = await conn.fetch(f'''
+        SELECT date_trunc('hour', t.created_at) AS bucket, s->>'name' AS name,
+               {BUCKET_SQL.format(value="(s->>'duration_ms')::numeric")} AS idx,
+               COUNT(*) AS n, SUM((s->>'duration_ms')::numeric)::float8 AS total,
+               MAX((s->>'duration_ms')::numeric)::float8 AS max_ms
+        FROM request_traces t, jsonb_array_elements(t.spans) AS s
+        WHERE t.created_at >= $1 {upper} AND s->>'name' IS NOT NULL
+        GROUP BY 1, 2, 3
+    ''', *args)
+    for r in spans:
+        get(r['bucket'], 'span', r['name']).hist.add_bucket(r['idx'], r['n'], r['total'], r['max_ms'])
+
+    # Красная зона зависит от категории команды (classify_command) — медленных трейсов мало
+    slow = await conn.fetch(f'''
+        SELECT date_trunc('hour', t.created_at) AS bucket, COALESCE(t.command, '') AS name, t.total_ms
+        FROM request_traces t
+        WHERE t.created_at >= $1 {upper} AND t.total_ms > ${len(args) + 1}
+    ''', *args, _MIN_RED_MS)
+    for r in slow:
+        agg = get(r['bucket'], 'command', r['name'])
+        _, yellow_max = THRESHOLDS.get(classify_command(r['name']), THRESHOLDS['nav'])
+        if r['total_ms'] > yellow_max:
+            agg.red += 1
+        if r['total_ms'] > _SLOW_MS:
+            agg.slow += 1
+    return result
+
+
+async def get_red_traces(conn, hours: int, limit: int = 5) -> list:
+    """Последние красные трейсы (по порогу категории команды)."""
+    rows = await conn.fetch('''
+        SELECT command, total_ms, state, created_at
+        FROM request_traces
+        WHERE created_at > NOW() - INTERVAL '1 hour' * $1 AND total_ms > $2
+        ORDER BY created_at DESC
+        LIMIT 200
+    ''', hours, _MIN_RED_MS)
+    red = []
+    for r in rows:
+        _, yellow_max = THRESHOLDS.get(classify_command(r['command']), THRESHOLDS['nav'])
+        if r['total_ms'] > yellow_max:
+            red.append(dict(r))
+            if len(red) >= limit:
+                break
+    return red
+
+
+async def get_activity_trend(conn, today: date) -> dict:
+    """WAU и сессии: эта неделя vs прошлая (из activity_daily)."""
+    row = await conn.fetchrow('''
+        SELECT
+            COALESCE(MAX(wau) FILTER (WHERE day = $1), 0) AS wau_this,
+            COALESCE(MAX(wau) FILTER (WHERE day = $1 - 7), 0) AS wau_last,
+            COALESCE(SUM(sessions) FILTER (WHERE day > $1 - 7), 0) AS sessions_this,
+            COALESCE(SUM(sessions) FILTER (WHERE day <= $1 - 7), 0) AS sessions_last
+        FROM activity_daily
+        WHERE day > $1 - 14
+    ''', today)
+    return dict(row) if row else {'wau_this': 0, 'wau_last': 0, 'sessions_this': 0, 'sessions_last': 0}
+
+
+async def get_retention(conn) -> dict:
+    """Retention D1/D7/D30 (%) по всем когортам, для которых срок уже наступил."""
+    row = await conn.fetchrow('''
+        SELECT
+            SUM(size) FILTER (WHERE cohort_date <= CURRENT_DATE - 1) AS size_d1,
+            SUM(d1) FILTER (WHERE cohort_date <= CURRENT_DATE - 1) AS d1,
+            SUM(size) FILTER (WHERE cohort_date <= CURRENT_DATE - 7) AS size_d7,
+            SUM(d7) FILTER (WHERE cohort_date <= CURRENT_DATE - 7) AS d7,
+            SUM(size) FILTER (WHERE cohort_date <= CURRENT_DATE - 30) AS size_d30,
+            SUM(d30) FILTER (WHERE cohort_date <= CURRENT_DATE - 30) AS d30
+        FROM retention_cohorts
+    ''')
+    result = {}
+    for label in ('d1', 'd7', 'd30'):
+        size = (row[f'size_{label}'] or 0) if row else 0
+        retained = (row[label] or 0) if row else 0
+        result[label] = round(retained / size * 100) if size > 0 else 0
+    return result
+
+
+# ============= ПЕРЕСЧЁТ =============
+
+async def refresh_rollups() -> dict:
+    """Дописать закрытые часы трейсов, пересчитать свежие дни и открытые когорты."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            if not await conn.fetchval('SELECT pg_try_advisory_xact_lock($1)', _LOCK_ID):
+                return {}
+            hours = await _refresh_trace_rollups(conn)
+            days = await _refresh_activity_daily(conn)
+            cohorts = await _refresh_retention_cohorts(conn)
+    if hours:
+        logger.info(f"[Rollups] {hours} trace hours, {days} days, {cohorts} cohorts")
+    return {'hours': hours, 'days': days, 'cohorts': cohorts}
+
+
+async def _refresh_trace_rollups(conn) -> int:
+    watermark = await conn.fetchval("SELECT watermark FROM rollup_state WHERE name = 'traces'")
+    end = (datetime.now(timezone.utc) - _CLOSE_DELAY).replace(minute=0, second=0, microsecond=0)
+    if watermark is None:
+        first = await conn.fetchval('SELECT MIN(created_at) FROM request_traces')
+        watermark = first.replace(minute=0, second=0, microsecond=0) if first else end
+    end = min(end, watermark + timedelta(hours=_MAX_HOURS_PER_RUN))
+
+    hours = 0
+    if end > watermark:
+        aggregates = await _aggregate_traces(conn, watermark, end)
+        await conn.executemany('''
+            INSERT INTO trace_rollups (bucket, kind, name, count, total_ms, max_ms, red_count, slow_count, hist)
+            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+            ON CONFLICT (bucket, kind, name) DO UPDATE SET
+                count = EXCLUDED.count, total_ms = EXCLUDED.total_ms, max_ms = EXCLUDED.max_ms,
+                red_count = EXCLUDED.red_count, slow_count = EXCLUDED.slow_count, hist = EXCLUDED.hist
+        ''', [
+            (bucket, kind, name, agg.hist.count, agg.hist.total, agg.hist.max, agg.red, agg.slow, agg.hist.counts)
+            for (bucket, kind, name), agg in aggregates.items()
+        ])
+        hours = int((end - watermark).total_seconds() // 3600)
+
+    await conn.execute('''
+        INSERT INTO rollup_state (name, watermark, updated_at) VALUES ('traces', $1, NOW())
+        ON CONFLICT (name) DO UPDATE SET watermark = EXCLUDED.watermark, updated_at = NOW()
+    ''', end if end > watermark else watermark)
+    await conn.execute(
+        "DELETE FROM trace_rollups WHERE bucket < NOW() - INTERVAL '1 day' * $1",
+        TRACE_ROLLUP_RETENTION_DAYS,
+    )
+    return hours
+
+
+async def _refresh_activity_daily(conn) -> int:
+    """Сегодня/вчера — всегда; за 2 недели назад — недостающие дни (первый запуск)."""
+    today = await conn.fetchval("SELECT (NOW() AT TIME ZONE 'Europe/Moscow')::date")
+    result = await conn.execute('''
+        INSERT INTO activity_daily (day, dau, wau, sessions, updated_at)
+        SELECT d.day,
+               (SELECT COUNT(DISTINCT chat_id) FROM activity_log WHERE activity_date = d.day),
+               (SELECT COUNT(DISTINCT chat_id) FROM activity_log
+                WHERE activity_date BETWEEN d.day - 6 AND d.day),
+               (SELECT COUNT(*) FROM user_sessions
+                WHERE started_at >= d.day::timestamp AT TIME ZONE 'Europe/Moscow'
+                  AND started_at < (d.day + 1)::timestamp AT TIME ZONE 'Europe/Moscow'),
+               NOW()
+        FROM (SELECT g::date AS day FROM generate_series($1::date, $2::date, INTERVAL '1 day') g) d
+        WHERE d.day > $2::date - $3
+           OR NOT EXISTS (SELECT 1 FROM activity_daily a WHERE a.day = d.day)
+        ON CONFLICT (day) DO UPDATE SET
+            dau = EXCLUDED.dau, wau = EXCLUDED.wau, sessions = EXCLUDED.sessions, updated_at = NOW()
+    ''', today - timedelta(days=13), today, _RECENT_DAYS)
+    return int(result.split()[-1]) if result else 0
+
+
+async def _refresh_retention_cohorts(conn) -> int:
+    """Когорты моложе D30 — каждый раз; все остальные — один раз при первом запуске."""
+    has_rows = await conn.fetchval('SELECT EXISTS (SELECT 1 FROM retention_cohorts)')
+    since = datetime.now() - timedelta(days=_COHORT_OPEN_DAYS) if has_rows else datetime(1970, 1, 1)
+    result = await conn.execute('''
+        INSERT INTO retention_cohorts (cohort_date, size, d1, d7, d30, updated_at)
+        SELECT c.cohort_date, COUNT(*),
+               COUNT(*) FILTER (WHERE EXISTS (SELECT 1 FROM activity_log a
+                   WHERE a.chat_id = c.chat_id AND a.activity_date = c.cohort_date + 1)),
+               COUNT(*) FILTER (WHERE EXISTS (SELECT 1 FROM activity_log a
+                   WHERE a.chat_id = c.chat_id AND a.activity_date = c.cohort_date + 7)),
+               COUNT(*) FILTER (WHERE EXISTS (SELECT 1 FROM activity_log a
+                   WHERE a.chat_id = c.chat_id AND a.activity_date = c.cohort_date + 30)),
+               NOW()
+        FROM (
+            SELECT chat_id, created_at::date AS cohort_date
+            FROM interns
+            WHERE onboarding_completed = TRUE AND created_at >= $1::date
+        ) c
+        GROUP BY c.cohort_date
+        ON CONFLICT (cohort_date) DO UPDATE SET
+            size = EXCLUDED.size, d1 = EXCLUDED.d1, d7 = EXCLUDED.d7, d30 = EXCLUDED.d30, updated_at = NOW()
+    ''', since.date())
+    return int(result.split()[-1]) if result else 0
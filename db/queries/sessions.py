@@ -4,12 +4,15 @@
 Сессия = непрерывный период активности пользователя.
 Новая сессия создаётся, если прошло >SESSION_TIMEOUT минут с последнего запроса.
 
+Открытые сессии живут в памяти (core/session_tracker.py), сюда пишутся
+при закрытии и на контрольных точках (core/telemetry.py).
+
 Используется для аналитики: средняя длина сессии, requests/session, entry/exit points.
 """
 
 import json
 import logging
-from datetime import datetime, timezone
+from typing import List
 
 from db.connection import get_pool
 
@@ -18,74 +21,94 @@ logger = logging.getLogger(__name__)
 SESSION_TIMEOUT_MINUTES = 30
 
 
-async def get_or_create_session(chat_id: int, command: str):
-    """Найти активную сессию или создать новую.
+async def save_sessions(rows: List[dict]) -> List[int]:
+    """Записать снимки сессий (TrackedSession.row()): закрытые и контрольные точки.
+
+    С id — UPDATE (executemany), без id — один INSERT ... unnest.
 
-    Вызывается fire-and-forget из TracingMiddleware на каждый запрос.
-    Если active session < SESSION_TIMEOUT — обновить.
-    Если нет — финализировать старую + создать новую.
+    Returns:
+        id строки user_sessions для каждой записи, в порядке rows
     """
+    if not rows:
+        return []
+    update = [r for r in rows if r['id'] is not None]
+    insert = [r for r in rows if r['id'] is None]
     pool = await get_pool()
     async with pool.acquire() as conn:
-        # Найти последнюю незакрытую сессию пользователя
-        row = await conn.fetchrow('''
-            SELECT id, started_at, request_count, commands
-            FROM user_sessions
-            WHERE chat_id = $1 AND ended_at IS NULL
-            ORDER BY started_at DESC
-            LIMIT 1
-        ''', chat_id)
-
-        now = datetime.now(timezone.utc)
-
-        if row:
-            elapsed = (now - row['started_at']).total_seconds() / 60.0
-            if elapsed < SESSION_TIMEOUT_MINUTES:
-                # Обновить существующую сессию
-                commands = json.loads(row['commands']) if row['commands'] else []
-                if command not in commands:
-                    commands.append(command)
-                await conn.execute('''
+        async with conn.transaction():
+            if update:
+                await conn.executemany('''
                     UPDATE user_sessions
-                    SET request_count = request_count + 1,
-                        exit_point = $2,
-                        commands = $3::jsonb
+                    SET request_count = $2,
+                        exit_point = $3,
+                        commands = $4::jsonb,
+                        last_active_at = $5,
+                        ended_at = $6,
+                        duration_seconds = $7
                     WHERE id = $1
-                ''', row['id'], command, json.dumps(commands))
-                return
-
-            # Сессия истекла — финализировать
-            duration = int((now - row['started_at']).total_seconds())
-            await conn.execute('''
-                UPDATE user_sessions
-                SET ended_at = $2,
-                    duration_seconds = $3
-                WHERE id = $1
-            ''', row['id'], now, duration)
-
-        # Создать новую сессию
-        await conn.execute('''
-            INSERT INTO user_sessions (chat_id, started_at, entry_point, commands)
-            VALUES ($1, $2, $3, $4::jsonb)
-        ''', chat_id, now, command, json.dumps([command]))
+                ''', [(r['id'], r['request_count'], r['exit_point'], r['commands'],
+                       r['last_at'], r['ended_at'], r['duration_seconds']) for r in update])
+            created = {}
+            if insert:
+                result = await conn.fetch('''
+                    INSERT INTO user_sessions
+                        (chat_id, started_at, last_active_at, request_count, commands,
+                         entry_point, exit_point, ended_at, duration_seconds)
+                    SELECT chat_id, started_at, last_at, request_count, commands::jsonb,
+                           entry_point, exit_point, ended_at, duration_seconds
+                    FROM unnest($1::bigint[], $2::timestamptz[], $3::timestamptz[], $4::int[],
+                                $5::text[], $6::text[], $7::text[], $8::timestamptz[], $9::int[])
+                         AS s(chat_id, started_at, last_at, request_count, commands,
+                              entry_point, exit_point, ended_at, duration_seconds)
+                    RETURNING id, chat_id, started_at
+                ''', *[[r[k] for r in insert] for k in (
+                    'chat_id', 'started_at', 'last_at', 'request_count', 'commands',
+                    'entry_point', 'exit_point', 'ended_at', 'duration_seconds')])
+                created = {(r['chat_id'], r['started_at']): r['id'] for r in result}
+    return [r['id'] if r['id'] is not None else created.get((r['chat_id'], r['started_at']))
+            for r in rows]
+
+
+async def load_open_sessions(timeout_minutes: int = SESSION_TIMEOUT_MINUTES) -> List[dict]:
+    """Незакрытые сессии с активностью не старше timeout (восстановление после рестарта)."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch('''
+            SELECT DISTINCT ON (chat_id)
+                   id, chat_id, started_at, last_active_at, request_count,
+                   commands, entry_point, exit_point
+            FROM user_sessions
+            WHERE ended_at IS NULL
+              AND last_active_at > NOW() - INTERVAL '1 minute' * $1
+            ORDER BY chat_id, started_at DESC
+        ''', timeout_minutes)
+    return [
+        {**dict(r), 'commands': json.loads(r['commands']) if r['commands'] else []}
+        for r in rows
+    ]
 
 
 async def finalize_stale_sessions():
-    """Финализировать все сессии без ended_at, у которых last update > timeout.
+    """Финализировать все сессии без ended_at, неактивные дольше timeout.
 
+    Обычно сессии закрывает core/session_tracker.py; здесь — оставшиеся
+    после падения процесса. Конец — last_active_at (контрольная точка),
+    для старых строк без неё — оценка по числу запросов.
     Вызывается из scheduler midnight cleanup.
     """
     pool = await get_pool()
     async with pool.acquire() as conn:
         result = await conn.execute('''
             UPDATE user_sessions
-            SET ended_at = started_at + (request_count * INTERVAL '1 second' * 30),
+            SET ended_at = COALESCE(last_active_at,
+                                    started_at + (request_count * INTERVAL '1 second' * 30)),
                 duration_seconds = EXTRACT(EPOCH FROM
-                    (started_at + (request_count * INTERVAL '1 second' * 30)) - started_at
+                    COALESCE(last_active_at,
+                             started_at + (request_count * INTERVAL '1 second' * 30)) - started_at
                 )::INTEGER
             WHERE ended_at IS NULL
-              AND started_at < NOW() - INTERVAL '30 minutes'
-        ''')
+              AND COALESCE(last_active_at, started_at) < NOW() - INTERVAL '1 minute' * $1
+        ''', SESSION_TIMEOUT_MINUTES)
         count = int(result.split()[-1]) if result and result != 'UPDATE 0' else 0
         if count > 0:
             logger.info(f"[Sessions] Finalized {count} stale sessions")
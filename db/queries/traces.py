@@ -10,12 +10,24 @@
     green <8000, yellow <20000, red >=20000
 """
 
-from typing import List, Optional
+from typing import List, Optional, Sequence
 from db.connection import acquire
 from config import get_logger
 
 logger = get_logger(__name__)
 
+TRACE_COLUMNS = ('trace_id', 'user_id', 'command', 'state', 'total_ms', 'spans', 'created_at')
+
+
+async def insert_traces(records: Sequence[tuple]) -> None:
+    """Bulk insert (COPY) трейсов в порядке TRACE_COLUMNS (spans — JSON-строка)."""
+    if not records:
+        return
+    async with await acquire() as conn:
+        await conn.copy_records_to_table(
+            'request_traces', records=records, columns=TRACE_COLUMNS,
+        )
+
 # --- Thresholds (ms) ---
 # (green_max, yellow_max) — выше yellow_max = red
 THRESHOLDS = {
@@ -81,73 +93,48 @@ async def cleanup_old_traces(days: int = 7) -> int:
 async def get_latency_report(hours: int = 24) -> dict:
     """Get latency report for the last N hours.
 
+    Считается по часовым агрегатам (db/queries/rollups.py) + свежему хвосту трейсов;
+    p95 — по гистограмме (погрешность ≤ ~9%), окно выровнено по началу часа.
+
     Returns dict with:
       - summary: {total_requests, avg_ms, p95_ms, red_count}
       - by_command: [{command, avg_ms, p95_ms, max_ms, count, color}]
       - red_traces: [{command, total_ms, state, created_at}] (last 5 red)
       - slowest_spans: [{name, avg_ms, max_ms, count}]
     """
+    from db.queries.rollups import get_red_traces, get_trace_stats, summarize
+
     async with await acquire() as conn:
-        # Summary
-        summary = await conn.fetchrow("""
-            SELECT COUNT(*) AS total,
-                   COALESCE(AVG(total_ms)::int, 0) AS avg_ms,
-                   COALESCE(percentile_cont(0.95) WITHIN GROUP (ORDER BY total_ms)::int, 0) AS p95_ms
-            FROM request_traces
-            WHERE created_at > NOW() - INTERVAL '1 hour' * $1
-        """, hours)
-
-        # By command
-        by_command = await conn.fetch("""
-            SELECT command,
-                   AVG(total_ms)::int AS avg_ms,
-                   percentile_cont(0.95) WITHIN GROUP (ORDER BY total_ms)::int AS p95_ms,
-                   MAX(total_ms)::int AS max_ms,
-                   COUNT(*) AS count
-            FROM request_traces
-            WHERE created_at > NOW() - INTERVAL '1 hour' * $1
-            GROUP BY command
-            ORDER BY avg_ms DESC
-        """, hours)
-
-        # Slowest spans
-        slowest_spans = await conn.fetch("""
-            SELECT s->>'name' AS name,
-                   AVG((s->>'duration_ms')::numeric)::int AS avg_ms,
-                   MAX((s->>'duration_ms')::numeric)::int AS max_ms,
-                   COUNT(*) AS count
-            FROM request_traces, jsonb_array_elements(spans) AS s
-            WHERE created_at > NOW() - INTERVAL '1 hour' * $1
-            GROUP BY name
-            ORDER BY avg_ms DESC
-            LIMIT 10
-        """, hours)
-
-        # Count red traces
-        all_traces = await conn.fetch("""
-            SELECT command, total_ms, state, created_at
-            FROM request_traces
-            WHERE created_at > NOW() - INTERVAL '1 hour' * $1
-            ORDER BY created_at DESC
-        """, hours)
-
-    # Classify and find red
-    red_traces = []
-    red_count = 0
-    for t in all_traces:
-        cat = classify_command(t['command'])
-        _, yellow_max = THRESHOLDS.get(cat, THRESHOLDS['nav'])
-        if t['total_ms'] > yellow_max:
-            red_count += 1
-            if len(red_traces) < 5:
-                red_traces.append(dict(t))
+        stats = await get_trace_stats(conn, hours)
+        red_traces = await get_red_traces(conn, hours)
+
+    def row(agg) -> dict:
+        h = agg.hist
+        return {
+            'avg_ms': int(h.mean), 'p95_ms': int(h.percentile(0.95)),
+            'max_ms': int(h.max), 'count': h.count,
+        }
+
+    total = summarize(stats, 'command')
+    by_command = sorted(
+        ({'command': name, **row(agg)} for (kind, name), agg in stats.items() if kind == 'command'),
+        key=lambda r: r['avg_ms'], reverse=True,
+    )
+    slowest_spans = sorted(
+        ({'name': name, **row(agg)} for (kind, name), agg in stats.items() if kind == 'span'),
+        key=lambda r: r['avg_ms'], reverse=True,
+    )[:10]
 
     return {
-        'summary': dict(summary) if summary else {'total': 0, 'avg_ms': 0, 'p95_ms': 0},
-        'red_count': red_count,
-        'by_command': [dict(r) for r in by_command],
+        'summary': {
+            'total': total.hist.count,
+            'avg_ms': int(total.hist.mean),
+            'p95_ms': int(total.hist.percentile(0.95)),
+        },
+        'red_count': total.red,
+        'by_command': by_command,
         'red_traces': red_traces,
-        'slowest_spans': [dict(r) for r in slowest_spans],
+        'slowest_spans': slowest_spans,
     }
 
 
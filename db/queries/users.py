@@ -3,15 +3,100 @@
 """
 
 import asyncio
+import copy
 import json
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime, date, timedelta
 from typing import Optional, List
 
 from config import get_logger, MOSCOW_TZ
+from config.settings import INTERN_CACHE_TTL_SEC, INTERN_CACHE_MAX_ENTRIES
 from db.connection import get_pool
+from helpers.ttl_cache import TTLCache
 
 logger = get_logger(__name__)
 
+# ═══════════════════════════════════════════════════════════
+# КЭШ ПРОФИЛЕЙ
+# ═══════════════════════════════════════════════════════════
+# Два уровня:
+# 1. Identity map на время апдейта (ContextVar, открывает TracingMiddleware):
+#    все get_intern(chat_id) внутри апдейта — один SELECT.
+# 2. Процессный TTL-кэш: соседние апдейты, планировщик.
+# update_intern/update_user_state пишут в оба уровня (write-through).
+# Прямые UPDATE interns вне этого модуля обязаны вызвать invalidate_intern().
+
+_request_interns: ContextVar[Optional[dict]] = ContextVar('request_interns', default=None)
+_intern_cache = TTLCache(
+    maxsize=INTERN_CACHE_MAX_ENTRIES if INTERN_CACHE_TTL_SEC > 0 else 0,
+    ttl=INTERN_CACHE_TTL_SEC,
+)
+
+_JSON_FIELDS = ('interests', 'completed_topics', 'current_context')
+_DATE_FIELDS = ('marathon_start_date', 'last_topic_date', 'feed_started_at',
+                'last_active_date', 'stats_reset_date')
+
+
+@contextmanager
+def intern_scope():
+    """Identity map профилей на время обработки одного апдейта."""
+    token = _request_interns.set({})
+    try:
+        yield
+    finally:
+        _request_interns.reset(token)
+
+
+def _copy_profile(profile: dict) -> dict:
+    """Копия профиля: вызывающий может менять dict и списки, не трогая кэш."""
+    result = dict(profile)
+    result['interests'] = list(profile['interests'])
+    result['completed_topics'] = list(profile['completed_topics'])
+    result['current_context'] = copy.deepcopy(profile['current_context'])
+    return result
+
+
+def _cached_profiles(chat_id: int) -> list:
+    """Закэшированные экземпляры профиля (request scope + процессный кэш)."""
+    profiles = []
+    scope = _request_interns.get()
+    if scope is not None and chat_id in scope:
+        profiles.append(scope[chat_id])
+    cached = _intern_cache.get(chat_id)
+    if cached is not None and all(cached is not p for p in profiles):
+        profiles.append(cached)
+    return profiles
+
+
+def _write_through(chat_id: int, fields: dict) -> None:
+    """Применить записанные в БД поля к закэшированным профилям."""
+    for profile in _cached_profiles(chat_id):
+        for key, value in fields.items():
+            if key in profile:
+                profile[key] = value
+
+
+def patch_cached_intern(chat_id: int, **fields) -> None:
+    """Обновить поля профиля в кэше после прямого UPDATE interns (значения как в БД)."""
+    _write_through(chat_id, fields)
+
+
+def invalidate_intern(chat_id: Optional[int] = None) -> None:
+    """Сбросить кэш профиля (после прямого UPDATE/DELETE interns).
+
+    Без chat_id — сбросить весь процессный кэш (массовые UPDATE).
+    """
+    scope = _request_interns.get()
+    if chat_id is None:
+        _intern_cache.clear()
+        if scope is not None:
+            scope.clear()
+        return
+    _intern_cache.pop(chat_id)
+    if scope is not None:
+        scope.pop(chat_id, None)
+
 
 def moscow_now() -> datetime:
     """Получить текущее время по Москве"""
@@ -24,11 +109,25 @@ def moscow_today() -> date:
 
 
 async def get_intern(chat_id: int) -> dict:
-    """Получить профиль пользователя из БД"""
+    """Получить профиль пользователя (identity map апдейта → TTL-кэш → БД)"""
+    scope = _request_interns.get()
+    profile = scope.get(chat_id) if scope is not None else None
+    if profile is None:
+        profile = _intern_cache.get(chat_id)
+        if profile is None:
+            profile = await _fetch_intern(chat_id)
+            _intern_cache.set(chat_id, profile)
+        if scope is not None:
+            scope[chat_id] = profile
+    return _copy_profile(profile)
+
+
+async def _fetch_intern(chat_id: int) -> dict:
+    """Прочитать профиль из БД (создать пользователя, если его нет)"""
     pool = await get_pool()
     async with pool.acquire() as conn:
         row = await conn.fetchrow(
-            'SELECT * FROM interns WHERE chat_id = $1', chat_id
+            INTERN_SELECT + ' WHERE chat_id = $1', chat_id
         )
         
         if row:
@@ -42,92 +141,146 @@ async def get_intern(chat_id: int) -> dict:
             return _get_default_intern(chat_id)
 
 
-def _row_to_dict(row) -> dict:
-    """Преобразовать строку БД в словарь"""
-    def safe_get(key, default=''):
-        return row[key] if key in row.keys() and row[key] is not None else default
-    
-    def safe_json(key, default=None):
-        if default is None:
-            default = []
-        val = safe_get(key, '[]')
-        try:
-            return json.loads(val) if isinstance(val, str) else val
-        except:
-            return default
-
-    return {
-        'chat_id': row['chat_id'],
-        'name': safe_get('name', ''),
-        'occupation': safe_get('occupation', ''),
-        'role': safe_get('role', ''),
-        'domain': safe_get('domain', ''),
-        'interests': safe_json('interests', []),
-        'motivation': safe_get('motivation', ''),
-        'experience_level': safe_get('experience_level', ''),
-        'difficulty_preference': safe_get('difficulty_preference', ''),
-        'learning_style': safe_get('learning_style', ''),
-        'study_duration': safe_get('study_duration', 15),
-        'current_problems': safe_get('current_problems', ''),
-        'desires': safe_get('desires', ''),
-        'goals': safe_get('goals', ''),
-        'schedule_time': safe_get('schedule_time', '09:00'),
-        'schedule_time_2': safe_get('schedule_time_2', None),
-        'topic_order': safe_get('topic_order', 'default'),
-        
-        # Режимы
-        'mode': safe_get('mode', 'marathon'),
-        'current_context': safe_json('current_context', {}),
-
-        # State Machine
-        'current_state': safe_get('current_state', None),
-        
-        # Марафон
-        'marathon_status': safe_get('marathon_status', 'not_started'),
-        'marathon_start_date': safe_get('marathon_start_date', None),
-        'marathon_paused_at': safe_get('marathon_paused_at', None),
-        'current_topic_index': safe_get('current_topic_index', 0),
-        'completed_topics': safe_json('completed_topics', []),
-        'topics_today': safe_get('topics_today', 0),
-        'last_topic_date': safe_get('last_topic_date', None),
-        
-        # Сложность (используем coalesce-логику, но с учётом 0 как валидного значения)
-        'complexity_level': safe_get('complexity_level', None) if safe_get('complexity_level', None) is not None else (safe_get('bloom_level', 1) or 1),
-        'topics_at_current_complexity': safe_get('topics_at_current_complexity', None) if safe_get('topics_at_current_complexity', None) is not None else (safe_get('topics_at_current_bloom', 0) or 0),
-        # Для обратной совместимости (синхронизируем значения)
-        'bloom_level': safe_get('complexity_level', None) if safe_get('complexity_level', None) is not None else (safe_get('bloom_level', 1) or 1),
-        'topics_at_current_bloom': safe_get('topics_at_current_complexity', None) if safe_get('topics_at_current_complexity', None) is not None else (safe_get('topics_at_current_bloom', 0) or 0),
-        
-        # Лента
-        'feed_status': safe_get('feed_status', 'not_started'),
-        'feed_started_at': safe_get('feed_started_at', None),
-        'feed_schedule_time': safe_get('feed_schedule_time', None),
-        
-        # Систематичность
-        'active_days_total': safe_get('active_days_total', 0),
-        'active_days_streak': safe_get('active_days_streak', 0),
-        'longest_streak': safe_get('longest_streak', 0),
-        'last_active_date': safe_get('last_active_date', None),
-        
-        # Оценка
-        'assessment_state': safe_get('assessment_state', None),
-        'assessment_date': safe_get('assessment_date', None),
+# ═══════════════════════════════════════════════════════════
+# ROW → DICT (компилируемый маппер)
+# ═══════════════════════════════════════════════════════════
+# JSON-колонки interns хранятся как TEXT и разбираются json.loads в маппере:
+# NULL → [] (как в прежнем safe_json), битое значение → default поля.
+
+_PLAIN, _JSON, _COALESCE = 0, 1, 2
+
+# (ключ профиля, колонка, default, вид[, колонка-fallback, default-fallback])
+_PROFILE_FIELDS = (
+    ('chat_id', 'chat_id', None, _PLAIN),
+    ('name', 'name', '', _PLAIN),
+    ('occupation', 'occupation', '', _PLAIN),
+    ('role', 'role', '', _PLAIN),
+    ('domain', 'domain', '', _PLAIN),
+    ('interests', 'interests', [], _JSON),
+    ('motivation', 'motivation', '', _PLAIN),
+    ('experience_level', 'experience_level', '', _PLAIN),
+    ('difficulty_preference', 'difficulty_preference', '', _PLAIN),
+    ('learning_style', 'learning_style', '', _PLAIN),
+    ('study_duration', 'study_duration', 15, _PLAIN),
+    ('current_problems', 'current_problems', '', _PLAIN),
+    ('desires', 'desires', '', _PLAIN),
+    ('goals', 'goals', '', _PLAIN),
+    ('schedule_time', 'schedule_time', '09:00', _PLAIN),
+    ('schedule_time_2', 'schedule_time_2', None, _PLAIN),
+    ('topic_order', 'topic_order', 'default', _PLAIN),
+
+    # Режимы
+    ('mode', 'mode', 'marathon', _PLAIN),
+    ('current_context', 'current_context', {}, _JSON),
+
+    # State Machine
+    ('current_state', 'current_state', None, _PLAIN),
+
+    # Марафон
+    ('marathon_status', 'marathon_status', 'not_started', _PLAIN),
+    ('marathon_start_date', 'marathon_start_date', None, _PLAIN),
+    ('marathon_paused_at', 'marathon_paused_at', None, _PLAIN),
+    ('current_topic_index', 'current_topic_index', 0, _PLAIN),
+    ('completed_topics', 'completed_topics', [], _JSON),
+    ('topics_today', 'topics_today', 0, _PLAIN),
+    ('last_topic_date', 'last_topic_date', None, _PLAIN),
+
+    # Сложность: complexity_* с fallback на legacy bloom_* (0 — валидное значение)
+    ('complexity_level', 'complexity_level', None, _COALESCE, 'bloom_level', 1),
+    ('topics_at_current_complexity', 'topics_at_current_complexity', None, _COALESCE,
+     'topics_at_current_bloom', 0),
+    # Для обратной совместимости (синхронизируем значения)
+    ('bloom_level', 'complexity_level', None, _COALESCE, 'bloom_level', 1),
+    ('topics_at_current_bloom', 'topics_at_current_complexity', None, _COALESCE,
+     'topics_at_current_bloom', 0),
+
+    # Лента
+    ('feed_status', 'feed_status', 'not_started', _PLAIN),
+    ('feed_started_at', 'feed_started_at', None, _PLAIN),
+    ('feed_schedule_time', 'feed_schedule_time', None, _PLAIN),
+
+    # Систематичность
+    ('active_days_total', 'active_days_total', 0, _PLAIN),
+    ('active_days_streak', 'active_days_streak', 0, _PLAIN),
+    ('longest_streak', 'longest_streak', 0, _PLAIN),
+    ('last_active_date', 'last_active_date', None, _PLAIN),
+
+    # Оценка
+    ('assessment_state', 'assessment_state', None, _PLAIN),
+    ('assessment_date', 'assessment_date', None, _PLAIN),
+
+    # Сброс статистики
+    ('stats_reset_date', 'stats_reset_date', None, _PLAIN),
+
+    # Подписка / DT
+    ('trial_started_at', 'trial_started_at', None, _PLAIN),
+    ('dt_connected_at', 'dt_connected_at', None, _PLAIN),
+    ('created_at', 'created_at', None, _PLAIN),
+
+    # Telegram
+    ('tg_username', 'tg_username', None, _PLAIN),
+
+    # Статусы
+    ('onboarding_completed', 'onboarding_completed', False, _PLAIN),
+    ('language', 'language', 'ru', _PLAIN),
+)
+
+# Явный список колонок профиля вместо SELECT *. Legacy bloom_* есть не во всех
+# базах, поэтому не выбираются: fallback _COALESCE сработает, если они в строке.
+INTERN_SELECT = (
+    'SELECT '
+    + ', '.join(dict.fromkeys(field[1] for field in _PROFILE_FIELDS))
+    + ' FROM interns'
+)
+
+# Планы разбора по форме результата (кортеж имён колонок)
+_row_plans: dict[tuple, tuple] = {}
+
+
+def _compile_row_plan(columns: tuple) -> tuple:
+    """Таблица индексов колонок для данной формы строки (строится один раз)."""
+    index = {name: i for i, name in enumerate(columns)}
+    plan = []
+    for field in _PROFILE_FIELDS:
+        key, column, default, kind = field[:4]
+        if kind == _COALESCE:
+            plan.append((key, kind, index.get(column), index.get(field[4]), field[5]))
+        else:
+            plan.append((key, kind, index.get(column), None, default))
+    plan = tuple(plan)
+    _row_plans[columns] = plan
+    return plan
 
-        # Сброс статистики
-        'stats_reset_date': safe_get('stats_reset_date', None),
 
-        # Подписка / DT
-        'trial_started_at': safe_get('trial_started_at', None),
-        'dt_connected_at': safe_get('dt_connected_at', None),
-        'created_at': safe_get('created_at', None),
+def _decode_json_value(value, default):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except (json.JSONDecodeError, TypeError):
+            return copy.copy(default)
+    return value
 
-        # Telegram
-        'tg_username': safe_get('tg_username', None),
 
-        # Статусы
-        'onboarding_completed': safe_get('onboarding_completed', False),
-        'language': safe_get('language', 'ru'),
-    }
+def _row_to_dict(row) -> dict:
+    """Преобразовать строку БД в словарь (план разбора кэшируется по форме строки)"""
+    columns = tuple(row.keys())
+    plan = _row_plans.get(columns) or _compile_row_plan(columns)
+    values = tuple(row.values())
+
+    result = {}
+    for key, kind, idx, extra, default in plan:
+        value = values[idx] if idx is not None else None
+        if kind == _PLAIN:
+            result[key] = default if value is None else value
+        elif kind == _JSON:
+            result[key] = _decode_json_value(value, default)
+        else:
+            if value is None:
+                value = (values[extra] if extra is not None else None) or default
+            result[key] = value
+    return result
 
 
 def _get_default_intern(chat_id: int) -> dict:
@@ -202,21 +355,39 @@ async def update_intern(chat_id: int, **kwargs):
 
     # Normalize: resolve aliases, serialize JSON, zero-pad schedule times
     columns = {}
+    cached = {}  # те же значения в виде, в котором их вернёт get_intern
     for key, value in kwargs.items():
         # JSON-поля
-        if key in ['interests', 'completed_topics', 'current_context']:
-            value = json.dumps(value) if not isinstance(value, str) else value
+        if key in _JSON_FIELDS:
+            if isinstance(value, str):
+                try:
+                    cached[key] = json.loads(value)
+                except (json.JSONDecodeError, TypeError):
+                    cached[key] = [] if key != 'current_context' else {}
+            else:
+                cached[key] = copy.deepcopy(value)
+                value = json.dumps(value)
+            columns[key] = value
+            continue
 
         # Zero-pad schedule times: "7:30" → "07:30"
         if key in ('schedule_time', 'feed_schedule_time', 'schedule_time_2') and value:
             value = value.zfill(5) if isinstance(value, str) and len(value) == 4 else value
 
+        # DATE-колонки возвращаются из БД как date
+        if key in _DATE_FIELDS and isinstance(value, datetime):
+            cached[key] = value.date()
+        else:
+            cached[key] = value
+
         # Синхронизация bloom <-> complexity (aliases → canonical column)
         if key in ('bloom_level', 'complexity_level'):
             columns['complexity_level'] = value
+            cached['complexity_level'] = cached['bloom_level'] = value
             continue
         if key in ('topics_at_current_complexity', 'topics_at_current_bloom'):
             columns['topics_at_current_complexity'] = value
+            cached['topics_at_current_complexity'] = cached['topics_at_current_bloom'] = value
             continue
 
         columns[key] = value
@@ -237,6 +408,7 @@ async def update_intern(chat_id: int, **kwargs):
     pool = await get_pool()
     async with pool.acquire() as conn:
         await conn.execute(query, *params)
+    _write_through(chat_id, cached)
 
     # Инкрементальный sync в ЦД (fire-and-forget)
     try:
@@ -257,6 +429,7 @@ async def update_tg_username(chat_id: int, username: str) -> None:
             'UPDATE interns SET tg_username = $1 WHERE chat_id = $2 AND tg_username IS DISTINCT FROM $1',
             username, chat_id,
         )
+    _write_through(chat_id, {'tg_username': username})
 
 
 async def update_user_state(chat_id: int, state_name: str) -> None:
@@ -273,6 +446,7 @@ async def update_user_state(chat_id: int, state_name: str) -> None:
             'UPDATE interns SET current_state = $1, updated_at = NOW() WHERE chat_id = $2',
             state_name, chat_id
         )
+    _write_through(chat_id, {'current_state': state_name})
     logger.debug(f"[SM] User {chat_id} state updated to: {state_name}")
 
 
@@ -290,74 +464,115 @@ def derive_mode(marathon_status: str, feed_status: str) -> str:
     return 'marathon'
 
 
-async def get_marathon_users_at_time(hour: int, minute: int) -> list:
-    """Получить chat_id пользователей марафона, запланированных на указанное время.
+async def get_marathon_slot_load(slots: List[str]) -> dict[str, int]:
+    """Сколько пользователей марафона запланировано на каждый слот ("HH:MM").
 
-    Используется для пре-генерации контента за N часов до доставки.
+    Returns:
+        dict только для слотов с пользователями: {"09:00": 42, ...}
     """
     pool = await get_pool()
-    time_str = f"{hour:02d}:{minute:02d}"
     async with pool.acquire() as conn:
         rows = await conn.fetch(
-            '''SELECT chat_id FROM interns
-               WHERE schedule_time = $1
+            '''SELECT schedule_time, COUNT(*) as cnt
+               FROM interns
+               WHERE schedule_time = ANY($1)
+                 AND marathon_status = 'active'
+                 AND onboarding_completed = TRUE
+               GROUP BY schedule_time''',
+            slots
+        )
+    return {row['schedule_time']: row['cnt'] for row in rows}
+
+
+async def get_marathon_users_in_slots(slots: List[str]) -> List[tuple]:
+    """Пользователи марафона, запланированные на любой из слотов.
+
+    Returns:
+        list of (chat_id, schedule_time)
+    """
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            '''SELECT chat_id, schedule_time FROM interns
+               WHERE schedule_time = ANY($1)
                  AND marathon_status = 'active'
                  AND onboarding_completed = TRUE''',
-            time_str
+            slots
         )
-    return [row['chat_id'] for row in rows]
+    return [(row['chat_id'], row['schedule_time']) for row in rows]
 
 
 async def get_all_scheduled_interns(hour: int, minute: int) -> List[tuple]:
     """Получить пользователей для отправки по расписанию.
 
+    Один запрос: три ветки UNION ALL, каждая — по своему частичному индексу
+    (idx_interns_marathon_schedule / _feed_schedule / _feed_fallback_schedule).
+
     Returns:
         list of (chat_id, send_type) где send_type = 'marathon' | 'feed' | 'both'
     """
     pool = await get_pool()
     time_str = f"{hour:02d}:{minute:02d}"
     async with pool.acquire() as conn:
-        # Марафон: schedule_time совпадает, марафон активен
-        marathon_rows = await conn.fetch(
-            '''SELECT chat_id FROM interns
+        rows = await conn.fetch(
+            '''SELECT chat_id, 'marathon' AS kind FROM interns
                WHERE schedule_time = $1
                  AND marathon_status = 'active'
-                 AND onboarding_completed = TRUE''',
-            time_str
-        )
-        marathon_ids = {row['chat_id'] for row in marathon_rows}
-
-        # Лента: feed_schedule_time совпадает, лента активна
-        feed_rows = await conn.fetch(
-            '''SELECT chat_id FROM interns
+                 AND onboarding_completed = TRUE
+               UNION ALL
+               -- Лента: feed_schedule_time совпадает, лента активна
+               SELECT chat_id, 'feed' FROM interns
                WHERE feed_schedule_time = $1
                  AND feed_status = 'active'
-                 AND onboarding_completed = TRUE''',
-            time_str
-        )
-        feed_ids = {row['chat_id'] for row in feed_rows}
-
-        # Fallback: feed_schedule_time не задан → используем schedule_time
-        fallback_rows = await conn.fetch(
-            '''SELECT chat_id FROM interns
+                 AND onboarding_completed = TRUE
+               UNION ALL
+               -- Fallback: feed_schedule_time не задан → используем schedule_time
+               SELECT chat_id, 'feed' FROM interns
                WHERE schedule_time = $1
                  AND feed_schedule_time IS NULL
                  AND feed_status = 'active'
                  AND onboarding_completed = TRUE''',
             time_str
         )
-        feed_ids = feed_ids | {row['chat_id'] for row in fallback_rows}
-
-        # Объединяем
-        result = []
-        for cid in marathon_ids | feed_ids:
-            if cid in marathon_ids and cid in feed_ids:
-                result.append((cid, 'both'))
-            elif cid in feed_ids:
-                result.append((cid, 'feed'))
-            else:
-                result.append((cid, 'marathon'))
-        return result
+
+    # Объединяем
+    kinds: dict = {}
+    for row in rows:
+        kinds.setdefault(row['chat_id'], set()).add(row['kind'])
+    return [
+        (cid, 'both' if len(k) == 2 else next(iter(k)))
+        for cid, k in kinds.items()
+    ]
+
+
+async def get_interns(chat_ids: List[int]) -> dict:
+    """Профили пачки пользователей: кэш + один SELECT ... = ANY($1) для остальных.
+
+    Отсутствующие в БД пользователи не создаются (в отличие от get_intern).
+
+    Returns:
+        {chat_id: profile}
+    """
+    result = {}
+    missing = []
+    for chat_id in chat_ids:
+        cached = _intern_cache.get(chat_id)
+        if cached is not None:
+            result[chat_id] = _copy_profile(cached)
+        else:
+            missing.append(chat_id)
+
+    if missing:
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(
+                INTERN_SELECT + ' WHERE chat_id = ANY($1::bigint[])', missing
+            )
+        for row in rows:
+            profile = _row_to_dict(row)
+            _intern_cache.set(row['chat_id'], profile)
+            result[row['chat_id']] = _copy_profile(profile)
+    return result
 
 
 # --- Slot management (auto-stagger) ---
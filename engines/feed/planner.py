@@ -405,6 +405,7 @@ async def suggest_weekly_topics(intern: dict) -> List[Dict]:
     response = await claude.generate(
         system_prompt, "Персонализируй обоснования тем.",
         max_tokens=1000, model=CLAUDE_MODEL_HAIKU,
+        feature="feed_topics", lang=lang,
     )
 
     # 3. Парсим ответ Claude
@@ -641,7 +642,7 @@ async def generate_multi_topic_digest(
         'zh': f"主题：{topics_str}\n深度级别：{depth_level}"
     }.get(lang, f"Темы: {topics_str}\nУровень глубины: {depth_level}")
 
-    response = await claude.generate(system_prompt, user_prompt)
+    response = await claude.generate(system_prompt, user_prompt, feature="feed_digest", lang=lang)
 
     if not response:
         return {
@@ -797,7 +798,7 @@ async def generate_topic_content(
         'zh': f"主题：{topic.get('title')}\n描述：{topic.get('description', '')}"
     }.get(lang, f"Тема: {topic.get('title')}\nОписание: {topic.get('description', '')}")
 
-    response = await claude.generate(system_prompt, user_prompt)
+    response = await claude.generate(system_prompt, user_prompt, feature="feed_topic", lang=lang)
 
     if not response:
         return {
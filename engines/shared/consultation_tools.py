@@ -407,7 +407,8 @@ def load_tier_prompt(tier: int) -> str:
         "Отвечаешь на вопросы пользователя {name}.\n\n"
         "{lang_instruction}\n\n"
         "Используй tools для поиска информации.\n"
-        "НЕ выдумывай факты.\n\n"
+        "НЕ выдумывай факты.\n"
+        "{request_section}\n\n"
         "{lang_reminder}"
     )
     logger.warning(f"Tier prompt T{tier} not found at {path}, using fallback")
@@ -426,6 +427,25 @@ def fill_tier_prompt(template: str, **kwargs) -> str:
     return result
 
 
+CACHE_BREAK = "{cache_break}"
+
+
+def to_cached_system(prompt: str):
+    """Заполненный шаблон → system prompt с кэшируемым префиксом.
+
+    Всё до {cache_break} (роль, методология, правила, знания о боте) одинаково
+    для всех пользователей тира и кэшируется; после — имя, профиль, контекст
+    конкретного запроса ({request_section}), напоминание о языке.
+    Шаблон без маркера возвращается строкой как есть.
+    """
+    from clients.claude import cached_system
+
+    stable, sep, dynamic = prompt.partition(CACHE_BREAK)
+    if not sep:
+        return prompt
+    return cached_system([stable], [dynamic.replace(CACHE_BREAK, "")])
+
+
 def invalidate_tier_prompt_cache():
     """Сброс кеша tier prompts (для hot reload)."""
     _tier_prompt_cache.clear()
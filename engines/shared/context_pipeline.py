@@ -6,7 +6,7 @@ TIER_PIPELINE определяет, какие collectors запускаются
 Collectors запускаются параллельно через asyncio.gather.
 
 Архитектурное решение (DP.ARCH.002):
-- T1 Expert: user_profile + bot_context
+- T1 Expert: user_profile + bot_context + request_context
 - T2 Mentor: + standard_claude
 - T3 Co-thinker: + personal_claude
 - T4 Architect: = T3 (future: + progress, plans)
@@ -48,6 +48,20 @@ async def collect_bot_context(
     return ("bot_section", section)
 
 
+async def collect_request_context(
+    intern: dict, lang: str, request_context: str = "", **kwargs
+) -> CollectorResult:
+    """Контекст конкретного запроса (L1, уточнение, ЦД, рекомендация) → {request_section}.
+
+    Стоит после {cache_break}: меняется от запроса к запросу и не должен
+    попадать в кэшируемый префикс вместе с {bot_section}.
+    """
+    request_context = request_context.strip()
+    if not request_context:
+        return ("request_section", "")
+    return ("request_section", f"\nКОНТЕКСТ ЗАПРОСА:\n{request_context}")
+
+
 async def collect_standard_claude(
     intern: dict, lang: str, **kwargs
 ) -> CollectorResult:
@@ -73,10 +87,12 @@ async def collect_personal_claude(
 # =============================================================================
 
 TIER_PIPELINE: Dict[int, List] = {
-    1: [collect_user_profile, collect_bot_context],
-    2: [collect_user_profile, collect_bot_context, collect_standard_claude],
-    3: [collect_user_profile, collect_bot_context, collect_standard_claude, collect_personal_claude],
-    4: [collect_user_profile, collect_bot_context, collect_standard_claude, collect_personal_claude],
+    1: [collect_user_profile, collect_bot_context, collect_request_context],
+    2: [collect_user_profile, collect_bot_context, collect_request_context, collect_standard_claude],
+    3: [collect_user_profile, collect_bot_context, collect_request_context, collect_standard_claude,
+        collect_personal_claude],
+    4: [collect_user_profile, collect_bot_context, collect_request_context, collect_standard_claude,
+        collect_personal_claude],
 }
 
 
@@ -90,6 +106,7 @@ async def assemble_context(
     lang: str,
     bot_context: str = "",
     personal_claude_md: str = "",
+    request_context: str = "",
 ) -> Dict[str, str]:
     """Запускает collectors для тира параллельно, возвращает dict placeholder → value.
 
@@ -97,12 +114,14 @@ async def assemble_context(
         tier: тир обслуживания (1-4)
         intern: профиль пользователя из bot DB
         lang: язык пользователя
-        bot_context: self-knowledge бота
+        bot_context: self-knowledge бота (одинаков для всех запросов)
         personal_claude_md: personal CLAUDE.md из GitHub
+        request_context: контекст конкретного запроса
 
     Returns:
         Dict с ключами для fill_tier_prompt:
-        {user_profile, bot_section, standard_section, personal_section, dynamic_sections}
+        {user_profile, bot_section, request_section, standard_section,
+         personal_section, dynamic_sections}
     """
     collectors = TIER_PIPELINE.get(tier, TIER_PIPELINE[1])
 
@@ -112,6 +131,7 @@ async def assemble_context(
         lang=lang,
         bot_context=bot_context,
         personal_claude_md=personal_claude_md,
+        request_context=request_context,
     )
 
     # Запускаем параллельно
@@ -124,6 +144,7 @@ async def assemble_context(
     sections: Dict[str, str] = {
         "user_profile": "",
         "bot_section": "",
+        "request_section": "",
         "standard_section": "",
         "personal_section": "",
         "dynamic_sections": "",
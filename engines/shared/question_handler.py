@@ -17,6 +17,7 @@ from typing import Optional, List, Tuple, Dict, Callable, Awaitable
 from config import get_logger, ONTOLOGY_RULES
 from core.intent import get_question_keywords
 from clients import claude, mcp_knowledge
+from clients.claude import ChunkCallback
 from db.queries.qa import save_qa, get_qa_history
 from .retrieval import enhanced_search, get_retrieval
 from .context import (
@@ -429,7 +430,7 @@ async def generate_answer(
     user_prompt = user_prompts.get(lang, user_prompts['ru'])
 
     # Генерируем ответ
-    answer = await claude.generate(system_prompt, user_prompt)
+    answer = await claude.generate(system_prompt, user_prompt, feature="consultation", lang=lang)
 
     if not answer:
         answer = f"К сожалению, {name}, не удалось получить ответ. Попробуйте переформулировать вопрос или спросить позже."
@@ -448,6 +449,8 @@ async def handle_question_with_tools(
     tier: int = 1,
     is_refinement: bool = False,
     conversation_messages: Optional[List[Dict]] = None,
+    on_chunk: Optional[ChunkCallback] = None,
+    request_context: Optional[str] = None,
 ) -> Tuple[str, List[str]]:
     """Обрабатывает вопрос через Claude tool_use (все тиры T1-T4).
 
@@ -464,13 +467,16 @@ async def handle_question_with_tools(
         question: текст вопроса
         intern: профиль пользователя
         context_topic: текущая тема
-        bot_context: self-knowledge бота
+        bot_context: self-knowledge бота (кэшируемая часть промпта)
         has_digital_twin: подключён ли ЦД (определяет набор tools)
         personal_claude_md: персональный CLAUDE.md из GitHub (T3)
         progress_callback: callback для отображения прогресса
         tier: тир обслуживания (1-4, default 1)
         conversation_messages: multi-turn conversation history
             (list of {role, content} dicts from persistent session)
+        on_chunk: потоковый вывод ответа (TelegramStreamRenderer.feed)
+        request_context: контекст этого запроса (L1, уточнение, ЦД, рекомендация) —
+            идёт после {cache_break}, не ломая кэш префикса
 
     Returns:
         Tuple[answer, sources] - ответ и список источников
@@ -480,6 +486,7 @@ async def handle_question_with_tools(
         execute_tool,
         load_tier_prompt,
         fill_tier_prompt,
+        to_cached_system,
     )
 
     chat_id = intern.get('chat_id')
@@ -525,6 +532,7 @@ async def handle_question_with_tools(
         lang=lang,
         bot_context=bot_context or "",
         personal_claude_md=personal_claude_md or "",
+        request_context=request_context or "",
     )
 
     # Загружаем шаблон промпта и подставляем переменные
@@ -571,12 +579,14 @@ async def handle_question_with_tools(
     token_limit = 4000 if is_refinement else 1500
 
     answer = await claude.generate_with_tools(
-        system_prompt=system_prompt,
+        system_prompt=to_cached_system(system_prompt),
         messages=messages,
         tools=tools,
         tool_executor=tool_executor,
         max_tokens=token_limit,
         max_tool_rounds=3,
+        lang=lang,
+        on_chunk=on_chunk,
     )
 
     await report_progress(ProcessingStage.DONE, 100)
@@ -660,5 +670,5 @@ async def answer_with_context(
     }
     user_prompt = user_prompts.get(lang, user_prompts['ru'])
 
-    answer = await claude.generate(system_prompt, user_prompt)
+    answer = await claude.generate(system_prompt, user_prompt, feature="consultation", lang=lang)
     return answer or "Не удалось получить ответ. Попробуйте позже."
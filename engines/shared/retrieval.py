@@ -8,18 +8,28 @@
 - QueryExpander: расширение запросов + fuzzy correction опечаток
 - SemanticDeduplicator: умная дедупликация
 - FallbackStrategy: стратегия при пустых результатах
+- Локальный BM25-индекс: все чанки, когда-либо полученные от MCP;
+  отвечает, когда MCP недоступен (circuit breaker) или ничего не нашёл
 - EnhancedRetrieval: основной класс, объединяющий всё
 """
 
 import re
+import time
 import hashlib
 import asyncio
+import queue
+import threading
 from difflib import get_close_matches
-from typing import Optional, List, Tuple, Dict, Set
+from typing import Optional, List, Tuple, Dict, Set, FrozenSet
 from dataclasses import dataclass, field
 
 from config import get_logger
+from config.settings import (
+    LOCAL_INDEX_ENABLED, LOCAL_INDEX_PATH, LOCAL_INDEX_MAX_DOCS, LOCAL_INDEX_SAVE_INTERVAL_SEC,
+)
 from clients import mcp_knowledge
+from helpers.bm25 import BM25Index, term_frequencies
+from helpers.minhash import minhash_signature, lsh_keys
 
 logger = get_logger(__name__)
 
@@ -87,30 +97,50 @@ SYNONYMS: Dict[str, str] = {
 # DATA CLASSES
 # =============================================================================
 
-@dataclass
+_KEY_PHRASE_RE = re.compile(r'\b[а-яёa-z]{4,}\b')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+@dataclass(slots=True)
 class RetrievalResult:
-    """Результат поиска с метаданными"""
+    """Результат поиска с метаданными
+
+    Хеш текста, ключевые фразы и MinHash-сигнатура вычисляются один раз
+    при первом обращении (дедупликация сравнивает их многократно).
+    """
     text: str
     source: str
     source_type: str  # "pack", "guides", or "ds"
     relevance_score: float = 0.0
     date: Optional[str] = None
     original_item: dict = field(default_factory=dict)
+    _text_hash: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    _key_phrases: Optional[FrozenSet[str]] = field(default=None, init=False, repr=False, compare=False)
+    _signature: Optional[Tuple[int, ...]] = field(default=None, init=False, repr=False, compare=False)
 
     @property
     def text_hash(self) -> str:
         """Хеш для сравнения похожести"""
-        # Нормализуем текст для сравнения
-        normalized = re.sub(r'\s+', ' ', self.text.lower().strip())
-        return hashlib.md5(normalized[:500].encode()).hexdigest()
+        if self._text_hash is None:
+            # Нормализуем текст для сравнения
+            normalized = _WHITESPACE_RE.sub(' ', self.text.lower().strip())
+            self._text_hash = hashlib.md5(normalized[:500].encode()).hexdigest()
+        return self._text_hash
 
     @property
-    def key_phrases(self) -> Set[str]:
+    def key_phrases(self) -> FrozenSet[str]:
         """Извлекаем ключевые фразы для семантического сравнения"""
-        text_lower = self.text.lower()
-        # Извлекаем слова длиннее 4 символов
-        words = set(re.findall(r'\b[а-яёa-z]{4,}\b', text_lower))
-        return words
+        if self._key_phrases is None:
+            # Слова длиннее 4 символов
+            self._key_phrases = frozenset(_KEY_PHRASE_RE.findall(self.text.lower()))
+        return self._key_phrases
+
+    @property
+    def signature(self) -> Tuple[int, ...]:
+        """MinHash-сигнатура ключевых фраз (для LSH-бакетов)"""
+        if self._signature is None:
+            self._signature = minhash_signature(self.key_phrases)
+        return self._signature
 
 
 @dataclass
@@ -239,7 +269,12 @@ class QueryExpander:
 # =============================================================================
 
 class SemanticDeduplicator:
-    """Умная дедупликация на основе семантического сходства"""
+    """Умная дедупликация на основе семантического сходства
+
+    Кандидаты в дубликаты ищутся через LSH-бакеты MinHash-сигнатур,
+    точный коэффициент Жаккара считается только для кандидатов —
+    почти линейно по числу результатов вместо попарного O(n²).
+    """
 
     def __init__(self, similarity_threshold: float = 0.6):
         self.similarity_threshold = similarity_threshold
@@ -259,10 +294,7 @@ class SemanticDeduplicator:
             return True
 
         # 2. Проверка по ключевым фразам (семантическое сходство)
-        phrases1 = result1.key_phrases
-        phrases2 = result2.key_phrases
-
-        similarity = self.jaccard_similarity(phrases1, phrases2)
+        similarity = self.jaccard_similarity(result1.key_phrases, result2.key_phrases)
 
         return similarity >= self.similarity_threshold
 
@@ -277,20 +309,33 @@ class SemanticDeduplicator:
         # Сортируем по score чтобы оставлять лучшие
         sorted_results = sorted(results, key=lambda r: r.relevance_score, reverse=True)
 
-        unique_results = []
+        unique_results: List[RetrievalResult] = []
+        seen_hashes: Set[str] = set()
+        buckets: Dict[tuple, List[int]] = {}
 
         for result in sorted_results:
-            # Проверяем, похож ли на уже добавленные
-            is_duplicate = False
-            for existing in unique_results:
-                if self.are_similar(result, existing):
-                    is_duplicate = True
-                    logger.debug(f"Deduplicator: пропущен дубль "
-                               f"(similarity >= {self.similarity_threshold})")
-                    break
+            # 1. Идентичный текст
+            is_duplicate = result.text_hash in seen_hashes
 
+            # 2. Кандидаты из общих LSH-бакетов → точная проверка
+            keys = lsh_keys(result.signature)
             if not is_duplicate:
-                unique_results.append(result)
+                candidates = {i for key in keys for i in buckets.get(key, ())}
+                for i in candidates:
+                    if self.are_similar(result, unique_results[i]):
+                        is_duplicate = True
+                        break
+
+            if is_duplicate:
+                logger.debug(f"Deduplicator: пропущен дубль "
+                           f"(similarity >= {self.similarity_threshold})")
+                continue
+
+            index = len(unique_results)
+            unique_results.append(result)
+            seen_hashes.add(result.text_hash)
+            for key in keys:
+                buckets.setdefault(key, []).append(index)
 
         removed = len(results) - len(unique_results)
         if removed > 0:
@@ -351,6 +396,123 @@ class FallbackStrategy:
         return fallback_queries[:4]  # Максимум 4 fallback запроса
 
 
+# =============================================================================
+# ЛОКАЛЬНЫЙ BM25-ИНДЕКС
+# =============================================================================
+
+# Чанки MCP индексируются вне пути запроса: запрос только кладёт их в очередь,
+# поток-индексатор токенизирует и передаёт частоты в event loop (call_soon_threadsafe),
+# где они вставляются в индекс — сам индекс трогает только event loop.
+_INDEX_QUEUE_MAX = 2000
+
+_local_index: Optional[BM25Index] = None
+_local_index_loading: Optional[asyncio.Task] = None
+_local_index_saved_at = 0.0
+_local_index_saving = False
+_index_queue: "queue.Queue" = queue.Queue(maxsize=_INDEX_QUEUE_MAX)  # (loop, doc_id, text, meta)
+_index_pending: Set[str] = set()
+_indexer: Optional[threading.Thread] = None
+
+
+async def setup_local_index() -> None:
+    """Загрузить индекс с диска в отдельном потоке (при старте бота)."""
+    global _local_index
+    if not LOCAL_INDEX_ENABLED or _local_index is not None:
+        return
+    try:
+        index = await asyncio.to_thread(BM25Index.load, LOCAL_INDEX_PATH, max_docs=LOCAL_INDEX_MAX_DOCS)
+        logger.info(f"LocalIndex: загружено {len(index)} чанков из {LOCAL_INDEX_PATH}")
+    except Exception as e:
+        logger.warning(f"LocalIndex: не удалось загрузить {LOCAL_INDEX_PATH}: {e}")
+        index = BM25Index(max_docs=LOCAL_INDEX_MAX_DOCS)
+    if _local_index is None:
+        _local_index = index
+
+
+def get_local_index() -> Optional[BM25Index]:
+    """Индекс чанков MCP; None — выключен или ещё загружается.
+
+    Если setup_local_index() не вызывали, загрузка запускается в фоне —
+    запрос её не ждёт.
+    """
+    global _local_index_loading
+    if not LOCAL_INDEX_ENABLED:
+        return None
+    if _local_index is None and _local_index_loading is None:
+        _local_index_loading = asyncio.create_task(setup_local_index())
+    return _local_index
+
+
+def _index_worker() -> None:
+    """Поток-индексатор: токенизация чанков из очереди."""
+    while True:
+        loop, doc_id, text, meta = _index_queue.get()
+        try:
+            tf = term_frequencies(text)
+        except Exception as e:
+            logger.warning(f"LocalIndex: ошибка индексации {doc_id}: {e}")
+            tf = {}
+        try:
+            loop.call_soon_threadsafe(_apply_indexed, doc_id, text, meta, tf)
+        except RuntimeError:  # event loop закрыт — бот останавливается
+            pass
+
+
+def _apply_indexed(doc_id: str, text: str, meta: dict, tf: Dict[str, int]) -> None:
+    """Вставка готовых частот в индекс (в event loop)."""
+    _index_pending.discard(doc_id)
+    index = _local_index
+    if index is not None and tf and index.add(doc_id, text, meta, tf=tf):
+        _maybe_save_local_index()
+
+
+def _enqueue_for_index(index: BM25Index, results: List["RetrievalResult"]) -> None:
+    """Поставить новые чанки в очередь индексатора (без токенизации в запросе)."""
+    global _indexer
+    if _indexer is None or not _indexer.is_alive():
+        _indexer = threading.Thread(target=_index_worker, name="local-bm25-indexer", daemon=True)
+        _indexer.start()
+    loop = asyncio.get_running_loop()
+    for r in results:
+        if r.text_hash in index:
+            index.add(r.text_hash, r.text)  # уже есть — только освежить, без токенизации
+            continue
+        if r.text_hash in _index_pending:
+            continue
+        try:
+            _index_queue.put_nowait((loop, r.text_hash, r.text, {
+                'source': r.source, 'source_type': r.source_type, 'date': r.date,
+            }))
+        except queue.Full:  # индексатор не успевает — чанк придёт снова с другим запросом
+            return
+        _index_pending.add(r.text_hash)
+
+
+async def save_local_index() -> None:
+    """Сохранить индекс на диск (периодически и при остановке бота)."""
+    global _local_index_saved_at, _local_index_saving
+    index = _local_index
+    if index is None or not index.dirty or _local_index_saving:
+        return
+    _local_index_saving = True
+    _local_index_saved_at = time.monotonic()
+    data = index.dump()
+    index.dirty = False
+    try:
+        await asyncio.to_thread(BM25Index.write, LOCAL_INDEX_PATH, data)
+        logger.debug(f"LocalIndex: сохранено {len(data['docs'])} чанков")
+    except Exception as e:
+        index.dirty = True
+        logger.warning(f"LocalIndex: не удалось сохранить: {e}")
+    finally:
+        _local_index_saving = False
+
+
+def _maybe_save_local_index() -> None:
+    if time.monotonic() - _local_index_saved_at >= LOCAL_INDEX_SAVE_INTERVAL_SEC:
+        asyncio.create_task(save_local_index())
+
+
 # =============================================================================
 # ENHANCED RETRIEVAL — ГЛАВНЫЙ КЛАСС
 # =============================================================================
@@ -470,6 +632,41 @@ class EnhancedRetrieval:
             if result:
                 results.append(result)
 
+        index = get_local_index()
+        if index is None:
+            return results
+        if results:
+            _enqueue_for_index(index, results)
+            return results
+
+        # MCP недоступен или ничего не нашёл — отвечаем из локального индекса
+        return await self._search_local(index, query, total_limit)
+
+    async def _search_local(self, index: BM25Index, query: str, limit: int) -> List[RetrievalResult]:
+        """Поиск по локальному BM25-индексу."""
+        from core.tracing import span
+
+        async with span("retrieval.local_bm25", docs=len(index)):
+            hits = index.search(query, limit=limit)
+        if not hits:
+            return []
+
+        # BM25 не сравним с cosine score MCP: раскладываем локальные результаты
+        # по нижней части шкалы — выше порога фильтра, ниже уверенных ответов MCP
+        top_score = hits[0][0]
+        floor = self.config.min_relevance_score
+        results = [
+            RetrievalResult(
+                text=text,
+                source=meta.get('source') or "Материалы Aisystant",
+                source_type=meta.get('source_type', 'pack'),
+                relevance_score=floor + 0.3 * score / top_score,
+                date=meta.get('date'),
+            )
+            for score, text, meta in hits
+        ]
+        logger.info(f"LocalIndex: MCP без результатов, локально найдено {len(results)} "
+                    f"для '{query[:50]}'")
         return results
 
     def _parse_result(self, item: dict, source_type: str) -> Optional[RetrievalResult]:
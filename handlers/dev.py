@@ -4,6 +4,7 @@
 Доступны только для DEVELOPER_CHAT_ID.
 """
 
+import html
 import logging
 import os
 
@@ -165,21 +166,57 @@ async def cmd_health(message: Message):
 
     from db.queries.dev_stats import get_table_sizes, get_pending_content_count
     from db.queries.feedback import get_report_stats
+    from db.queries.cache import get_cache_stats
+    from db.queries.jobs import get_job_stats
+    from clients.mcp import MCPClient
+    from clients.claude import ClaudeClient
+    from core.job_queue import get_worker_stats
+    from core.safe_bot import get_send_limiter_stats
+    from core.telemetry import get_telemetry_stats
 
     try:
         tables = await get_table_sizes()
         pending = await get_pending_content_count()
         feedback = await get_report_stats()
+        jobs = await get_job_stats()
     except Exception as e:
         logger.error(f"[Dev] /health error: {e}")
         await message.answer("Ошибка загрузки состояния системы.")
         return
 
     sep = "\u2500" * 20
+    cache = get_cache_stats()
+    mcp_cache = MCPClient.get_search_cache_stats()
+    prompt_cache = ClaudeClient.get_prompt_cache_stats()
+    limiter = ClaudeClient.get_limiter_stats()
+    inflight = "/".join(map(str, limiter['inflight_by_lane']))
+    waiting = "/".join(map(str, limiter['waiting_by_lane']))
+    baselines = ", ".join(f"{key}: {ms} мс" for key, ms in limiter['baseline_ms'].items())
+    worker = get_worker_stats()
+    sends = get_send_limiter_stats()
+    telemetry = get_telemetry_stats()
+    telemetry_lines = (
+        f"  В очереди: {telemetry['queued_traces']} трейсов | открытых сессий: {telemetry['open_sessions']}"
+        f" | выгрузка: {telemetry['last_flush_ms']} мс\n"
+        f"  Записано: {telemetry['written']['traces']} трейсов, {telemetry['written']['sessions']} сессий"
+        f" | отброшено: {telemetry['dropped']['traces']}/{telemetry['dropped']['sessions']}"
+        f" | ошибок: {telemetry['failed_flushes']}\n"
+        if telemetry else "  Не запущен\n"
+    )
+    by_status = jobs['by_status']
+    oldest = f"{jobs['oldest_ready_sec']:.0f} с" if jobs['oldest_ready_sec'] is not None else "—"
+    failed_kinds = ", ".join(f"{f['kind']}: {f['count']}" for f in jobs['failed_24h']) or "нет"
+    worker_line = (
+        f"  Worker: {worker['running']}/{worker['concurrency']} | выполнено: {worker['completed']}"
+        f" | ошибок: {worker['failed']}\n"
+        if worker else "  Worker в этом процессе не запущен\n"
+    )
 
     table_lines = ""
     for r in tables:
         cnt = r['count'] if r['count'] >= 0 else "ERR"
+        if r.get('estimated'):
+            cnt = f"~{cnt}"
         table_lines += f"  {r['table']}: {cnt}\n"
 
     text = (
@@ -188,11 +225,46 @@ async def cmd_health(message: Message):
         f"{table_lines}\n"
         f"<b>Марафон</b>\n"
         f"  Ожидает контент: {pending}\n\n"
+        f"<b>Очередь задач</b>\n"
+        f"  Ждут: {by_status.get('pending', 0)} (готовы: {jobs['ready']}, старейшая: {oldest})"
+        f" | в работе: {by_status.get('running', 0)}\n"
+        f"  Провалены за 24ч: {failed_kinds}\n"
+        f"{worker_line}\n"
         f"<b>Обратная связь</b>\n"
         f"  \U0001f195 Новые: {feedback.get('new_count', 0)}"
         f" | \U0001f534 Плохо: {feedback.get('red_count', 0)}"
         f" | \U0001f7e1 Средне: {feedback.get('yellow_count', 0)}"
-        f" | \U0001f7e2 Хорошо: {feedback.get('green_count', 0)}\n"
+        f" | \U0001f7e2 Хорошо: {feedback.get('green_count', 0)}\n\n"
+        f"<b>Кеш контента</b>\n"
+        f"  L1: {cache['l1_hits']} | L2: {cache['l2_hits']} | промахи: {cache['misses']}"
+        f" | негатив: {cache['negative_hits']}\n"
+        f"  В памяти: {cache['l1_entries']} ({cache['l1_bytes'] // 1024} КБ)"
+        f" | вытеснено: {cache['evictions']} | склеено: {cache['coalesced']}\n\n"
+        f"<b>Кеш поиска MCP</b>\n"
+        f"  Снапшот: {mcp_cache['snapshot_hits']} | память: {mcp_cache['hits']}"
+        f" | из БД: {mcp_cache['persisted_hits']}"
+        f" | промахи: {mcp_cache['misses']} | склеено: {mcp_cache['coalesced']}\n"
+        f"  В памяти: {mcp_cache['entries']} ({mcp_cache['bytes'] // 1024} КБ)"
+        f" | вытеснено: {mcp_cache['evictions']}\n\n"
+        f"<b>Prompt caching (Claude)</b>\n"
+        f"  Запросов: {prompt_cache['requests']}"
+        f" | из кэша: {prompt_cache['cache_read_input_tokens']} ток."
+        f" | в кэш: {prompt_cache['cache_creation_input_tokens']} ток.\n"
+        f"  Без кэша: {prompt_cache['input_tokens']} ток."
+        f" | доля кэша: {prompt_cache['cache_hit_ratio']:.0%}\n\n"
+        f"<b>Лимит Claude API</b> (польз./доставка/пре-ген.)\n"
+        f"  Лимит: {limiter['limit']} | в работе: {inflight}"
+        f" | ждут: {waiting}\n"
+        f"  429/529: {limiter['overloads']} | замедления: {limiter['slowdowns']}"
+        f" | базовый TTFT: {baselines or '—'}\n\n"
+        f"<b>Отправка в Telegram</b> (ответы/рассылки)\n"
+        f"  Отправлено: {sends['sent'][0]}/{sends['sent'][1]}"
+        f" | ждут: {sends['waiting'][0]}/{sends['waiting'][1]}"
+        f" | ср. ожидание: {sends['avg_wait_ms'][0]}/{sends['avg_wait_ms'][1]} мс\n"
+        f"  RetryAfter: {sends['retry_afters']} | пауза рассылок: {sends['broadcast_paused_sec']} с"
+        f" | токенов: {sends['tokens']}/{sends['global_rate']:.0f}\n\n"
+        f"<b>Телеметрия</b> (трейсы, сессии)\n"
+        f"{telemetry_lines}"
     )
 
     await message.answer(text, parse_mode="HTML")
@@ -205,9 +277,12 @@ async def cmd_latency(message: Message):
         return
 
     from db.queries.traces import get_latency_report, classify_command, get_color, THRESHOLDS
+    from db.queries.llm_usage import get_llm_usage_report
+    from db.instrumentation import get_query_stats
 
     try:
         report = await get_latency_report(hours=24)
+        llm = await get_llm_usage_report(hours=24)
     except Exception as e:
         logger.error(f"[Dev] /latency error: {e}")
         await message.answer("Ошибка загрузки отчёта по латентности.")
@@ -235,6 +310,17 @@ async def cmd_latency(message: Message):
     for r in report['slowest_spans'][:6]:
         span_lines += f"  {r['name']}: {r['avg_ms']}мс сред. | макс={r['max_ms']}мс\n"
 
+    # Запросы к БД: топ по суммарному времени (с запуска процесса)
+    db_lines = ""
+    for q in get_query_stats(limit=5):
+        db_lines += (
+            f"  {html.escape(q['callsite'])}: n={q['count']} | p50={q['p50_ms']}мс p95={q['p95_ms']}мс"
+            f" | всего {q['total_ms'] / 1000:.1f}с | ~{q['avg_rows']} строк\n"
+            f"    <code>{html.escape(q['fingerprint'][:90])}</code>\n"
+        )
+    if not db_lines:
+        db_lines = "  \u2014 нет данных\n"
+
     # Красная зона
     red_lines = ""
     if report['red_traces']:
@@ -244,6 +330,24 @@ async def cmd_latency(message: Message):
     else:
         red_lines = "  \u2014 нет\n"
 
+    # Claude API: TTFT и скорость генерации по фичам
+    ls = llm['summary']
+    llm_lines = ""
+    for r in llm['by_feature'][:8]:
+        lang = f"/{r['lang']}" if r['lang'] else ""
+        llm_lines += (
+            f"  {r['feature']}{lang} ({_short_model(r['model'])}): "
+            f"TTFT p50={r['ttft_p50_ms']}мс p95={r['ttft_p95_ms']}мс"
+            f" | {r['tps_p50']} ток/с | n={r['calls']}\n"
+        )
+    if not llm_lines:
+        llm_lines = "  \u2014 нет данных\n"
+    peak = llm['peak_hour']
+    peak_line = (
+        f"  Пик: {peak['hour']:%H:00} МСК — {peak['calls']} вызовов, {peak['output_tokens']} ток. выхода\n"
+        if peak else ""
+    )
+
     text = (
         f"<b>Отчёт по латентности (24ч)</b>\n{sep}\n\n"
         f"<b>Сводка</b>\n"
@@ -252,7 +356,12 @@ async def cmd_latency(message: Message):
         f"<b>Пороги</b>\n{legend}\n"
         f"<b>По командам</b>\n{cmd_lines}\n"
         f"<b>Медленные операции</b>\n{span_lines}\n"
-        f"<b>Красная зона</b>\n{red_lines}"
+        f"<b>Запросы к БД</b> (с запуска, топ по времени)\n{db_lines}\n"
+        f"<b>Красная зона</b>\n{red_lines}\n"
+        f"<b>Claude API</b>\n"
+        f"  Вызовов: {ls['calls']} | TTFT p50: {ls['ttft_p50_ms']}мс | p95: {ls['ttft_p95_ms']}мс\n"
+        f"{peak_line}"
+        f"{llm_lines}"
     )
 
     text = truncate_safe(text)
@@ -333,6 +442,23 @@ async def cmd_analytics(message: Message):
     await message.answer(text, parse_mode="HTML")
 
 
+def _short_model(model: str) -> str:
+    """claude-sonnet-4-20250514 → sonnet-4"""
+    parts = model.removeprefix("claude-").split("-")
+    if parts and parts[-1].isdigit() and len(parts[-1]) == 8:
+        parts = parts[:-1]
+    return "-".join(parts) or model
+
+
+def _format_tokens(count: int) -> str:
+    """1234567 → 1.2M, 12345 → 12.3K"""
+    if count >= 1_000_000:
+        return f"{count / 1_000_000:.1f}M"
+    if count >= 1_000:
+        return f"{count / 1_000:.1f}K"
+    return str(count)
+
+
 def _format_analytics(report: dict) -> str:
     """Форматирование аналитического отчёта в HTML."""
     sep = "\u2500" * 20
@@ -341,6 +467,7 @@ def _format_analytics(report: dict) -> str:
     q = report['quality']
     r = report['retention']
     tr = report['trends']
+    llm = report['llm']
 
     # Trends arrows
     dau_arrow = "\u2197\ufe0f" if tr['dau_change_pct'] > 0 else ("\u2198\ufe0f" if tr['dau_change_pct'] < 0 else "\u2794")
@@ -356,6 +483,12 @@ def _format_analytics(report: dict) -> str:
     avg_min = s['avg_duration_sec'] // 60
     avg_sec = s['avg_duration_sec'] % 60
 
+    # Claude: токены по фичам
+    llm_features = ", ".join(
+        f"{f['feature']} {_format_tokens(f['input_tokens'])}/{_format_tokens(f['output_tokens'])}"
+        for f in llm.get('top_features', [])
+    ) or "\u2014"
+
     # Latency color
     lat_emoji = "\U0001f7e2" if q['avg_ms'] < 3000 else ("\U0001f7e1" if q['avg_ms'] < 8000 else "\U0001f534")
 
@@ -372,6 +505,11 @@ def _format_analytics(report: dict) -> str:
         f"  {lat_emoji} Avg latency: {q['avg_ms']}ms | P95: {q['p95_ms']}ms\n"
         f"  Red-zone (>8s): {q['red_zone']} запросов\n"
         f"  QA helpful: {q['qa_helpful_rate']}% ({q['qa_total']} консультаций)\n\n"
+        f"<b>\U0001f916 Claude API (24ч)</b>\n"
+        f"  Вызовов: {llm['calls']} | TTFT p50: {llm['ttft_p50_ms']}ms | P95: {llm['ttft_p95_ms']}ms\n"
+        f"  Токены вход/выход: {_format_tokens(llm['input_tokens'])}/{_format_tokens(llm['output_tokens'])}"
+        f" | из кэша: {_format_tokens(llm['cache_read_tokens'])}\n"
+        f"  По фичам (вход/выход): {llm_features}\n\n"
         f"<b>\U0001f4c8 Retention</b>\n"
         f"  D1: {r['d1']}% | D7: {r['d7']}% | D30: {r['d30']}%\n\n"
         f"<b>\U0001f525 Тренды (vs прошлая неделя)</b>\n"
@@ -472,6 +610,20 @@ async def cmd_delivery(message: Message):
 
     s = report['summary']
 
+    # Пре-генерация: прогноз готовности по слотам против факта
+    from core.pregen_planner import get_pregen_planner
+    planner = get_pregen_planner()
+    pregen_lines = ""
+    for r in list(planner.reports)[-6:]:
+        actual = r['actual_done'].astimezone(r['slot'].tzinfo).strftime('%H:%M') if r['actual_done'] else "—"
+        pregen_lines += (
+            f"  {r['slot']:%H:%M}: готово {r['on_time']}/{r['jobs']}"
+            f" | прогноз {r['projected_done']:%H:%M}, факт {actual}\n"
+        )
+    for slot, proj in sorted(planner.projections.items())[:6]:
+        pregen_lines += f"  \u23f3 {slot:%H:%M}: {proj['jobs']} задач, прогноз {proj['projected_done']:%H:%M}\n"
+    empty = "  нет данных\n"
+
     text = (
         f"<b>Доставка марафона</b>\n{sep}\n\n"
         f"<b>Сводка</b>\n"
@@ -479,6 +631,7 @@ async def cmd_delivery(message: Message):
         f"  \U0001f7e2 Отправлено: {s['sent']} (прочитано: {s['sent_read']})\n"
         f"  \u23f3 Время не наступило: {s['not_yet']}\n"
         f"  \U0001f534 Пропущено: {s['missed']}\n\n"
+        f"<b>Пре-генерация по слотам</b>\n{pregen_lines or empty}\n"
         f"<b>Пользователи</b>\n{user_lines}"
     )
 
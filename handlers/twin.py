@@ -104,6 +104,8 @@ async def cmd_twin(message: Message):
                 pool = await get_pool()
                 async with pool.acquire() as conn:
                     await conn.execute('UPDATE interns SET dt_connected_at = NULL WHERE chat_id = $1', telegram_user_id)
+                from db.queries.users import patch_cached_intern
+                patch_cached_intern(telegram_user_id, dt_connected_at=None)
             except Exception:
                 pass
             await message.answer(t('twin.disconnected', lang))
@@ -264,6 +266,8 @@ async def callback_twin_disconnect(callback: CallbackQuery):
         pool = await get_pool()
         async with pool.acquire() as conn:
             await conn.execute('UPDATE interns SET dt_connected_at = NULL WHERE chat_id = $1', telegram_user_id)
+        from db.queries.users import patch_cached_intern
+        patch_cached_intern(telegram_user_id, dt_connected_at=None)
     except Exception:
         pass
     await callback.answer(t('twin.disconnected_alert', lang), show_alert=True)
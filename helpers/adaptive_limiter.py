@@ -0,0 +1,162 @@
+"""
+Адаптивный лимит одновременных запросов (AIMD) с приоритетными полосами.
+
+Лимит не фиксирован:
+- растёт на ~1 за «окно» успешных ответов (additive increase: +1/limit на ответ);
+- сжимается в backoff раз при перегрузке (429/529) и понемногу — когда
+  латентность первого токена заметно выше базовой (multiplicative decrease).
+Базовая латентность — минимум с медленным подъёмом: быстро опускается
+к лучшему наблюдению, медленно привыкает к новому уровню. Считается отдельно
+по ключу (модель, вид вызова): у Haiku и Sonnet разный нормальный TTFT,
+и общая база принимала бы каждый ответ Sonnet за замедление.
+
+Полосы: меньший номер — выше приоритет. Ожидающие пропускаются строго
+по приоритету, а полоса p занимает не больше lane_shares[p] от лимита —
+фоновая работа не может выбрать все слоты, остаток ждёт живых пользователей.
+Рассчитан на один event loop.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Sequence
+
+
+class AdaptiveLimiter:
+    """Семафор с адаптивным лимитом и приоритетной очередью."""
+
+    def __init__(
+        self,
+        initial: int = 20,
+        min_limit: int = 2,
+        max_limit: int = 64,
+        lane_shares: Sequence[float] = (1.0,),
+        backoff: float = 0.5,
+        latency_tolerance: float = 2.0,
+        latency_backoff: float = 0.9,
+        cooldown: float = 5.0,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.lane_shares = tuple(lane_shares)
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.latency_backoff = latency_backoff
+        self.cooldown = cooldown  # не чаще одного сжатия за cooldown секунд
+
+        self._limit = float(initial)
+        self._inflight = 0
+        self._inflight_by_lane: List[int] = [0] * len(self.lane_shares)
+        self._waiters: list = []  # heap: [lane, seq, future]
+        self._seq = itertools.count()
+        self._baselines: Dict[str, float] = {}
+        self._last_decrease = float('-inf')
+        self.overloads = 0
+        self.slowdowns = 0
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self._limit))
+
+    def baseline_ms(self, key: str = '') -> Optional[float]:
+        return self._baselines.get(key)
+
+    def _lane(self, lane: int) -> int:
+        return min(max(lane, 0), len(self.lane_shares) - 1)
+
+    def _can_admit(self, lane: int) -> bool:
+        cap = max(1, int(self.limit * self.lane_shares[lane]))
+        return self._inflight < cap
+
+    @asynccontextmanager
+    async def acquire(self, lane: int = 0):
+        """Занять слот в полосе lane на время блока."""
+        lane = self._lane(lane)
+        ahead = self._waiters and self._waiters[0][0] <= lane
+        if not ahead and self._can_admit(lane):
+            self._take(lane)
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, [lane, next(self._seq), future])
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Слот уже передан, но ждущий отменён — вернуть
+                    self._release(lane)
+                raise
+        try:
+            yield
+        finally:
+            self._release(lane)
+
+    def _take(self, lane: int) -> None:
+        self._inflight += 1
+        self._inflight_by_lane[lane] += 1
+
+    def _release(self, lane: int) -> None:
+        self._inflight -= 1
+        self._inflight_by_lane[lane] -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        """Передать свободные слоты ожидающим — строго по приоритету."""
+        while self._waiters:
+            lane, _, future = self._waiters[0]
+            if future.done():  # отменён, пока ждал
+                heapq.heappop(self._waiters)
+                continue
+            if not self._can_admit(lane):
+                break
+            heapq.heappop(self._waiters)
+            self._take(lane)
+            future.set_result(None)
+
+    # ─── Обратная связь ───
+
+    def _decrease(self, factor: float) -> bool:
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return False
+        self._last_decrease = now
+        self._limit = max(float(self.min_limit), self._limit * factor)
+        return True
+
+    def on_overload(self) -> None:
+        """Сервер ответил 429/529: сжать лимит в backoff раз."""
+        if self._decrease(self.backoff):
+            self.overloads += 1
+
+    def on_success(self, latency_ms: Optional[float] = None, key: str = '') -> None:
+        """Успешный ответ; latency_ms — время до первого токена (если известно),
+        key — с чьей базой сравнивать (обычно модель)."""
+        if latency_ms is not None and latency_ms > 0:
+            baseline = self._baselines.get(key)
+            if baseline is None or latency_ms < baseline:
+                baseline = latency_ms
+            else:
+                baseline += 0.01 * (latency_ms - baseline)
+            self._baselines[key] = baseline
+            if latency_ms > baseline * self.latency_tolerance:
+                if self._decrease(self.latency_backoff):
+                    self.slowdowns += 1
+                return
+        self._limit = min(float(self.max_limit), self._limit + 1 / max(self._limit, 1.0))
+        self._wake()
+
+    def stats(self) -> dict:
+        waiting = [0] * len(self.lane_shares)
+        for lane, _, future in self._waiters:
+            if not future.done():
+                waiting[lane] += 1
+        return {
+            'limit': self.limit,
+            'inflight': self._inflight,
+            'inflight_by_lane': list(self._inflight_by_lane),
+            'waiting_by_lane': waiting,
+            'baseline_ms': {key: round(ms) for key, ms in self._baselines.items()},
+            'overloads': self.overloads,
+            'slowdowns': self.slowdowns,
+        }
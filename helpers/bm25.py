@@ -0,0 +1,211 @@
+"""
+BM25-индекс в памяти — локальный поиск без эмбеддингов.
+
+Токенизатор учитывает русский язык: ё→е, стоп-слова, отсечение типичных
+окончаний (лёгкий стемминг без внешних зависимостей). Индекс инвертированный;
+на диск (JSON) сохраняются документы с частотами терминов — при загрузке
+постинги собираются без повторной токенизации.
+Не потокобезопасен — рассчитан на один event loop; токенизацию (term_frequencies)
+можно вынести в другой поток и передать готовые частоты в add(tf=...).
+"""
+
+import heapq
+import json
+import math
+import os
+import re
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+_WORD_RE = re.compile(r'[а-яёa-z0-9]+')
+
+STOP_WORDS = frozenset("""
+и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по только
+ее мне было вот от меня еще нет о из ему теперь когда даже ну ли если уже или ни быть
+был него до вас нибудь опять уж вам ведь там потом себя ничего ей может они тут где есть
+надо ней для мы тебя их чем была сам чтоб без будто чего раз тоже себе под будет ж тогда
+кто этот того потому этого какой совсем ним здесь этом один почти мой тем чтобы нее были
+куда зачем всех никогда можно при наконец два об другой хоть после над больше тот через
+эти нас про всего них какая много разве три эту моя впрочем хорошо свою этой перед иногда
+лучше чуть том нельзя такой им более всегда конечно всю между это
+the a an and or of to in is are be for on with as by at it this that from
+""".split())
+
+# Окончания, от длинных к коротким: «собранность» и «собранный» → «собран»
+_ENDINGS = tuple(sorted((
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ость', 'ости',
+    'ать', 'ять', 'ить', 'еть', 'ует', 'уют', 'ала', 'ила',
+    'ой', 'ей', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ую', 'юю',
+    'ам', 'ям', 'ах', 'ях', 'ом', 'ем', 'ов', 'ев', 'ию', 'ия', 'ии', 'ью',
+    'ы', 'и', 'а', 'я', 'о', 'е', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True))
+_MIN_STEM = 3
+
+
+def stem(word: str) -> str:
+    """Отрезает типичное русское окончание, оставляя основу не короче 3 букв."""
+    if word.isascii():
+        return word
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Текст → список основ (без стоп-слов и однобуквенных токенов)."""
+    words = _WORD_RE.findall(text.lower().replace('ё', 'е'))
+    return [stem(w) for w in words if len(w) > 1 and w not in STOP_WORDS]
+
+
+def term_frequencies(text: str) -> Dict[str, int]:
+    """Текст → {основа: число вхождений} (не трогает индекс — можно в другом потоке)."""
+    tf: Dict[str, int] = {}
+    for token in tokenize(text):
+        tf[token] = tf.get(token, 0) + 1
+    return tf
+
+
+class _Doc:
+    __slots__ = ('text', 'meta', 'tf', 'length')
+
+    def __init__(self, text: str, meta: dict, tf: Dict[str, int], length: int):
+        self.text = text
+        self.meta = meta
+        self.tf = tf
+        self.length = length
+
+
+class BM25Index:
+    """Инвертированный индекс с ранжированием Okapi BM25.
+
+    При превышении max_docs вытесняются самые старые документы.
+    """
+
+    def __init__(self, max_docs: int = 20000, k1: float = 1.5, b: float = 0.75):
+        self.max_docs = max_docs
+        self.k1 = k1
+        self.b = b
+        self._docs: 'OrderedDict[str, _Doc]' = OrderedDict()
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._total_length = 0
+        self._norms: Dict[str, float] = {}  # doc_id → k1·(1 − b + b·len/avg), пересчёт после изменений
+        self._norms_valid = False
+        self.dirty = False
+
+    def add(self, doc_id: str, text: str, meta: Optional[dict] = None,
+            tf: Optional[Dict[str, int]] = None) -> bool:
+        """Добавить документ. False — такой doc_id уже есть или текст пустой.
+
+        tf — заранее посчитанные term_frequencies(text).
+        """
+        if doc_id in self._docs:
+            self._docs.move_to_end(doc_id)
+            return False
+        if tf is None:
+            tf = term_frequencies(text)
+        if not tf:
+            return False
+
+        length = sum(tf.values())
+        for token, count in tf.items():
+            self._postings.setdefault(token, {})[doc_id] = count
+        self._docs[doc_id] = _Doc(text, meta or {}, tf, length)
+        self._total_length += length
+        self._norms_valid = False
+        self.dirty = True
+
+        while len(self._docs) > self.max_docs:
+            self.remove(next(iter(self._docs)))
+        return True
+
+    def remove(self, doc_id: str) -> None:
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        for token in doc.tf:
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[token]
+        self._total_length -= doc.length
+        self._norms_valid = False
+        self.dirty = True
+
+    def search(self, query: str, limit: int = 5) -> List[Tuple[float, str, dict]]:
+        """Топ документов по BM25: [(score, text, meta)], по убыванию score."""
+        n_docs = len(self._docs)
+        if not n_docs:
+            return []
+        if not self._norms_valid:
+            k1, b, avg_length = self.k1, self.b, self._total_length / n_docs
+            self._norms = {
+                doc_id: k1 * (1 - b + b * doc.length / avg_length)
+                for doc_id, doc in self._docs.items()
+            }
+            self._norms_valid = True
+        norms = self._norms
+        k1_plus_1 = self.k1 + 1
+
+        scores: Dict[str, float] = {}
+        for token in set(tokenize(query)):
+            postings = self._postings.get(token)
+            if not postings:
+                continue
+            df = len(postings)
+            weight = math.log(1 + (n_docs - df + 0.5) / (df + 0.5)) * k1_plus_1
+            get = scores.get
+            for doc_id, tf in postings.items():
+                scores[doc_id] = get(doc_id, 0.0) + weight * tf / (tf + norms[doc_id])
+
+        docs = self._docs
+        top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [(score, docs[doc_id].text, docs[doc_id].meta) for doc_id, score in top]
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._docs
+
+    # ─── Persistence ───
+
+    def dump(self) -> dict:
+        """Снимок документов для сохранения (можно писать на диск в другом потоке)."""
+        return {
+            'version': 2,
+            'docs': [[doc_id, doc.text, doc.meta, doc.tf] for doc_id, doc in self._docs.items()],
+        }
+
+    @staticmethod
+    def write(path: Path, data: dict) -> None:
+        """Атомарно записать dump() в файл."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + '.tmp')
+        tmp.write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+        os.replace(tmp, path)
+
+    def save(self, path: Path) -> None:
+        self.write(path, self.dump())
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path: Path, **kwargs) -> 'BM25Index':
+        """Индекс из файла; нет файла — пустой индекс.
+
+        Версия 2 хранит частоты терминов; файлы версии 1 (только тексты)
+        токенизируются заново. Синхронная — в event loop вызывать через
+        asyncio.to_thread.
+        """
+        index = cls(**kwargs)
+        path = Path(path)
+        if not path.exists():
+            return index
+        data = json.loads(path.read_text(encoding='utf-8'))
+        for doc_id, text, meta, *rest in data.get('docs', []):
+            index.add(doc_id, text, meta, tf=rest[0] if rest else None)
+        index.dirty = False
+        return index
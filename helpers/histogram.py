@@ -0,0 +1,83 @@
+"""
+Логарифмическая гистограмма латентности (упрощённая HDR-гистограмма).
+
+Значение (мс) попадает в корзину floor(log2(ms) * SUB_BUCKETS): SUB_BUCKETS корзин
+на каждую степень двойки → относительная погрешность перцентиля ≤ ~9%.
+Число корзин фиксировано (BUCKETS), поэтому гистограммы складываются поэлементно —
+часовые агрегаты (db/queries/rollups.py) сливаются в отчёт за любой период
+без обращения к сырым трейсам.
+
+Та же формула корзины считается в SQL (см. BUCKET_SQL в db/queries/rollups.py).
+"""
+
+import math
+from typing import Iterable, List, Optional
+
+SUB_BUCKETS = 8
+BUCKETS = 22 * SUB_BUCKETS  # до 2^22 мс (~70 мин); всё, что больше, — в последней корзине
+
+
+def bucket_index(value_ms: float) -> int:
+    """Номер корзины для значения в мс."""
+    if value_ms < 1:
+        return 0
+    return min(BUCKETS - 1, int(math.log2(value_ms) * SUB_BUCKETS))
+
+
+def bucket_value(index: int) -> float:
+    """Представитель корзины — геометрическая середина её границ."""
+    return 2 ** ((index + 0.5) / SUB_BUCKETS)
+
+
+class LogHistogram:
+    """Счётчики по корзинам + точные count / total / max."""
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self, counts: Optional[Iterable[int]] = None, total: float = 0.0, max_value: float = 0.0):
+        self.counts: List[int] = list(counts) if counts is not None else [0] * BUCKETS
+        if len(self.counts) < BUCKETS:
+            self.counts.extend([0] * (BUCKETS - len(self.counts)))
+        self.count = sum(self.counts)
+        self.total = total
+        self.max = max_value
+
+    def record(self, value_ms: float, n: int = 1) -> None:
+        self.counts[bucket_index(value_ms)] += n
+        self.count += n
+        self.total += value_ms * n
+        if value_ms > self.max:
+            self.max = value_ms
+
+    def add_bucket(self, index: int, n: int, total: float, max_value: float) -> None:
+        """Добавить уже сгруппированную корзину (строку агрегата из БД)."""
+        self.counts[min(max(index, 0), BUCKETS - 1)] += n
+        self.count += n
+        self.total += total
+        if max_value > self.max:
+            self.max = max_value
+
+    def merge(self, other: 'LogHistogram') -> None:
+        for i, n in enumerate(other.counts):
+            if n:
+                self.counts[i] += n
+        self.count += other.count
+        self.total += other.total
+        if other.max > self.max:
+            self.max = other.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q: float) -> float:
+        """Перцентиль (q в [0, 1]); не больше наблюдавшегося максимума."""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bucket_value(i), self.max)
+        return self.max
@@ -0,0 +1,64 @@
+"""
+MinHash-сигнатуры и LSH-бакеты для поиска почти-дубликатов.
+
+One-permutation MinHash: каждый токен хешируется один раз и попадает
+в одну из num_bins корзин, в корзине хранится минимум. Пустые корзины
+заполняются из ближайшей непустой справа (densification), поэтому
+сигнатуры сопоставимы и для коротких текстов.
+
+Доля совпавших позиций двух сигнатур ≈ коэффициент Жаккара множеств токенов.
+LSH: сигнатура режется на полосы по rows позиций; тексты с общей полосой —
+кандидаты в дубликаты (проверяются точно).
+
+Хеш — встроенный hash(): сигнатуры сравнимы только в пределах процесса.
+"""
+
+from typing import Iterable, Tuple
+
+_MASK = (1 << 64) - 1
+_EMPTY = _MASK
+
+
+def minhash_signature(tokens: Iterable[str], num_bins: int = 64) -> Tuple[int, ...]:
+    """Сигнатура множества токенов. Пустое множество → пустой кортеж."""
+    bins = [_EMPTY] * num_bins
+    for token in tokens:
+        h = hash(token) & _MASK
+        index = h % num_bins
+        value = h // num_bins
+        if value < bins[index]:
+            bins[index] = value
+
+    filled = [i for i, value in enumerate(bins) if value != _EMPTY]
+    if not filled:
+        return ()
+    if len(filled) < num_bins:
+        # Densification: пустая корзина берёт значение следующей непустой
+        # (по кругу) со сдвигом на расстояние — совпадает у одинаковых множеств
+        nxt = filled[0] + num_bins
+        for i in range(num_bins - 1, -1, -1):
+            if bins[i] == _EMPTY:
+                j = nxt % num_bins
+                bins[i] = bins[j] + (nxt - i) * (_MASK // num_bins // num_bins)
+            else:
+                nxt = i
+    return tuple(bins)
+
+
+def estimate_jaccard(sig1: Tuple[int, ...], sig2: Tuple[int, ...]) -> float:
+    """Оценка коэффициента Жаккара по двум сигнатурам одной длины."""
+    if not sig1 or not sig2:
+        return 0.0
+    return sum(a == b for a, b in zip(sig1, sig2)) / len(sig1)
+
+
+def lsh_keys(signature: Tuple[int, ...], rows: int = 2) -> Tuple[tuple, ...]:
+    """Ключи LSH-бакетов: (номер полосы, значения полосы).
+
+    rows=2 при 64 корзинах (32 полосы) почти не пропускает пары с
+    Жаккаром ≥ 0.5; ложных кандидатов больше, но они отсеиваются проверкой.
+    """
+    return tuple(
+        (band, signature[start:start + rows])
+        for band, start in enumerate(range(0, len(signature), rows))
+    )
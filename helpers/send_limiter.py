@@ -0,0 +1,149 @@
+"""
+Ограничитель отправки в Telegram: token bucket на весь бот и на каждый чат.
+
+Лимиты Telegram Bot API:
+- ~30 сообщений/сек на бота в целом;
+- ~1 сообщение/сек в личный чат (короткие всплески допустимы);
+- ~20 сообщений/мин в группу.
+Превышение → 429 RetryAfter, при систематическом — flood-бан.
+
+Полосы: 0 — интерактивные ответы, 1 — рассылки. Рассылка берёт общий токен,
+только если в ведре остаётся reserve токенов сверх него и нет ждущих
+интерактивных отправок: ответы пользователю уходят сразу, а рассылка в
+установившемся режиме всё равно идёт с полной скоростью ведра.
+
+RetryAfter: pause() ставит на паузу чат, а для рассылки — всю полосу рассылок
+(интерактивные ответы продолжаются). Рассчитан на один event loop.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+INTERACTIVE = 0
+BROADCAST = 1
+
+
+class TokenBucket:
+    """Ведро токенов: rate в секунду, не больше burst накопленных."""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate: float, burst: float, now: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float, reserve: float = 0.0) -> float:
+        """Через сколько секунд будет токен (с запасом reserve). 0 — уже есть."""
+        self._refill(now)
+        need = 1.0 + reserve - self.tokens
+        return max(0.0, need / self.rate)
+
+    def take(self) -> None:
+        self.tokens -= 1.0
+
+
+class SendLimiter:
+    """Глобальное ведро + ведро на чат + приоритет интерактивных отправок."""
+
+    def __init__(
+        self,
+        global_rate: float = 25.0,
+        chat_rate: float = 1.0,
+        chat_burst: float = 3.0,
+        group_rate: float = 20 / 60,
+        broadcast_reserve: float = 5.0,
+        max_chats: int = 10000,
+    ):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.broadcast_reserve = min(broadcast_reserve, max(global_rate - 1.0, 0.0))
+        self.max_chats = max_chats
+
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: 'OrderedDict[int, TokenBucket]' = OrderedDict()
+        self._chat_paused: Dict[int, float] = {}
+        self._broadcast_paused = 0.0
+        self._waiting = [0, 0]
+        self.sent = [0, 0]
+        self.waited_sec = [0.0, 0.0]
+        self.retry_afters = 0
+
+    def _chat_bucket(self, chat_id: int, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if chat_id < 0:  # группа / канал
+                bucket = TokenBucket(self.group_rate, 1.0, now)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst, now)
+            self._chats[chat_id] = bucket
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    def _delay(self, chat_id: int, lane: int, now: float) -> float:
+        delay = self._chat_paused.get(chat_id, 0.0) - now
+        delay = max(delay, self._chat_bucket(chat_id, now).delay(now))
+        if lane == INTERACTIVE:
+            return max(delay, self._global.delay(now))
+        delay = max(delay, self._broadcast_paused - now)
+        delay = max(delay, self._global.delay(now, self.broadcast_reserve))
+        if self._waiting[INTERACTIVE]:
+            delay = max(delay, 1.0 / self._global.rate)
+        return delay
+
+    async def acquire(self, chat_id: int, lane: int = INTERACTIVE) -> float:
+        """Дождаться права на отправку в chat_id. Возвращает время ожидания (сек)."""
+        lane = BROADCAST if lane else INTERACTIVE
+        start = time.monotonic()
+        self._waiting[lane] += 1
+        try:
+            while True:
+                now = time.monotonic()
+                delay = self._delay(chat_id, lane, now)
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+        finally:
+            self._waiting[lane] -= 1
+        self._chat_bucket(chat_id, now).take()
+        self._global.take()
+        self._chat_paused.pop(chat_id, None)
+        waited = now - start
+        self.sent[lane] += 1
+        self.waited_sec[lane] += waited
+        return waited
+
+    def pause(self, chat_id: int, seconds: float, lane: int = INTERACTIVE) -> None:
+        """Telegram ответил RetryAfter: не слать в чат (и рассылки) seconds секунд."""
+        until = time.monotonic() + seconds
+        self.retry_afters += 1
+        self._chat_paused[chat_id] = max(self._chat_paused.get(chat_id, 0.0), until)
+        if lane == BROADCAST:
+            self._broadcast_paused = max(self._broadcast_paused, until)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            'global_rate': self._global.rate,
+            'tokens': round(min(self._global.burst, self._global.tokens
+                                + (now - self._global.updated) * self._global.rate), 1),
+            'waiting': list(self._waiting),
+            'sent': list(self.sent),
+            'avg_wait_ms': [
+                round(1000 * w / n) if n else 0 for w, n in zip(self.waited_sec, self.sent)
+            ],
+            'retry_afters': self.retry_afters,
+            'broadcast_paused_sec': max(0.0, round(self._broadcast_paused - now, 1)),
+            'chats': len(self._chats),
+        }
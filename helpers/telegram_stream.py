@@ -0,0 +1,198 @@
+"""
+Потоковый вывод ответа LLM в Telegram через правку сообщений.
+
+Текст приходит фрагментами (StreamChunk из clients.claude: .text, .reset).
+Рендерер:
+- показывает только завершённые абзацы (\\n\\n вне ```-блока): первое
+  сообщение уходит, как только готов первый абзац, незакрытая разметка
+  не мигает в чате;
+- конвертирует в HTML (md_to_html) только новые абзацы, готовые берёт из кэша;
+- правит сообщение не чаще min_interval (лимит Telegram ~1 правка/сек на чат),
+  при RetryAfter пропускает правки до конца паузы;
+- при переполнении (MAX_TG_LEN) продолжает в новом сообщении (split_message_safe);
+- finish() выводит окончательный текст целиком и вешает клавиатуру
+  на последнее сообщение.
+
+Не зависит от aiogram: bot — объект с send_message / edit_message_text / delete_message.
+
+Usage:
+    renderer = TelegramStreamRenderer(bot, chat_id)
+    answer = await renderer.consume(claude.stream(system_prompt, user_prompt))
+    await renderer.finish(answer, reply_markup=kb)
+"""
+
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, List, Optional
+
+from helpers.markdown_to_html import md_to_html
+from helpers.message_split import MAX_TG_LEN, split_message_safe
+
+logger = logging.getLogger(__name__)
+
+_PARAGRAPH = "\n\n"
+_FENCE = "```"
+
+
+class TelegramStreamRenderer:
+    """Отрисовка потокового ответа в одном или нескольких сообщениях чата."""
+
+    def __init__(self, bot, chat_id: int, min_interval: float = 1.2, max_len: int = MAX_TG_LEN):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.min_interval = min_interval
+        self.max_len = max_len
+
+        self._text = ""                      # Markdown текущего ответа
+        self._done = 0                       # граница уже разобранных абзацев в _text
+        self._paragraphs: List[str] = []     # HTML завершённых абзацев
+        self._version = 0                    # растёт при каждом изменении _paragraphs
+        self._messages: List[list] = []      # [message_id, показанный HTML]
+        self._next_edit = 0.0                # monotonic: раньше не править
+        self._flush_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._closed = False
+
+    @property
+    def text(self) -> str:
+        """Накопленный текст ответа (Markdown)."""
+        return self._text
+
+    @property
+    def started(self) -> bool:
+        """Отправлено ли уже хотя бы одно сообщение."""
+        return bool(self._messages)
+
+    async def feed(self, chunk) -> None:
+        """Принять фрагмент потока (ChunkCallback для ClaudeClient)."""
+        if self._closed:
+            return
+        if chunk.reset:
+            # Текст раунда оказался преамбулой к tool_use — ответ начнётся заново
+            self._text = ""
+            self._done = 0
+            if self._paragraphs:
+                self._paragraphs = []
+                self._version += 1
+            return
+        self._text += chunk.text
+        if self._collect_paragraphs():
+            self._schedule()
+
+    async def consume(self, chunks: AsyncIterator) -> str:
+        """Прочитать весь поток (ClaudeClient.stream) и вернуть текст ответа."""
+        async for chunk in chunks:
+            await self.feed(chunk)
+        return self._text
+
+    async def finish(self, text: str, reply_markup=None) -> None:
+        """Показать окончательный текст (с источниками, ссылками) и клавиатуру.
+
+        Лишние сообщения от промежуточного вывода удаляются.
+        Если поток ничего не успел показать — просто отправляет ответ.
+        """
+        self._closed = True
+        task = self._flush_task
+        if task and not task.done():
+            # Спящую задачу отменяем; идущий запрос к Telegram дожидаемся,
+            # иначе отправленное сообщение не попадёт в _messages
+            if not self._lock.locked():
+                task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self._sync(md_to_html(text) if text else "", reply_markup, final=True)
+
+    # ─── Внутреннее ───
+
+    def _collect_paragraphs(self) -> bool:
+        """Перенести завершённые абзацы из _text в _paragraphs (HTML)."""
+        start = search = self._done
+        added = False
+        while True:
+            end = self._text.find(_PARAGRAPH, search)
+            if end < 0:
+                break
+            paragraph = self._text[start:end]
+            if paragraph.count(_FENCE) % 2:
+                # Внутри блока кода пустая строка — не граница абзаца
+                search = end + len(_PARAGRAPH)
+                continue
+            if paragraph.strip():
+                self._paragraphs.append(md_to_html(paragraph))
+                added = True
+            start = search = end + len(_PARAGRAPH)
+        self._done = start
+        if added:
+            self._version += 1
+        return added
+
+    def _schedule(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        """Выводить новые абзацы, пока они появляются, с паузой min_interval."""
+        while not self._closed:
+            delay = self._next_edit - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self._closed:
+                return
+            version = self._version
+            try:
+                await self._sync(_PARAGRAPH.join(self._paragraphs))
+            except Exception as e:
+                logger.warning(f"[Stream] chat {self.chat_id}: render failed: {e}")
+                return
+            if version == self._version:
+                return
+
+    async def _sync(self, html: str, reply_markup=None, final: bool = False) -> None:
+        """Привести сообщения чата к html (разбитому по max_len)."""
+        parts = split_message_safe(html, self.max_len) if html else []
+        async with self._lock:
+            for i, part in enumerate(parts):
+                markup = reply_markup if final and i == len(parts) - 1 else None
+                if i < len(self._messages):
+                    if self._messages[i][1] != part or markup is not None:
+                        await self._edit(i, part, markup, final)
+                else:
+                    msg = await self.bot.send_message(
+                        self.chat_id, part, parse_mode="HTML", reply_markup=markup,
+                    )
+                    self._messages.append([msg.message_id, part])
+            if final:
+                for message_id, _ in self._messages[len(parts):]:
+                    try:
+                        await self.bot.delete_message(chat_id=self.chat_id, message_id=message_id)
+                    except Exception as e:
+                        logger.debug(f"[Stream] delete failed: {e}")
+                del self._messages[len(parts):]
+            self._next_edit = max(self._next_edit, time.monotonic() + self.min_interval)
+
+    async def _edit(self, index: int, html: str, reply_markup, final: bool) -> None:
+        message_id = self._messages[index][0]
+        for attempt in range(2):
+            try:
+                await self.bot.edit_message_text(
+                    html, chat_id=self.chat_id, message_id=message_id,
+                    parse_mode="HTML", reply_markup=reply_markup,
+                )
+                self._messages[index][1] = html
+                return
+            except Exception as e:
+                retry_after = getattr(e, "retry_after", None)
+                if "not modified" in str(e):
+                    self._messages[index][1] = html
+                    return
+                if retry_after is None:
+                    raise
+                if not final or attempt:
+                    # Flood control: промежуточные правки пропускаем до конца паузы
+                    self._next_edit = time.monotonic() + retry_after
+                    logger.info(f"[Stream] chat {self.chat_id}: flood control {retry_after}s")
+                    return
+                await asyncio.sleep(retry_after)
@@ -0,0 +1,83 @@
+"""
+In-process LRU-кэш с TTL.
+
+Общий примитив для кэшей в памяти процесса (профили, контент, результаты поиска):
+ограничен по числу записей и, опционально, по суммарному размеру (байтам),
+устаревшие записи удаляются лениво при чтении.
+Не потокобезопасен — рассчитан на один event loop.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+_MISSING = object()
+
+
+class TTLCache:
+    """LRU с ограничением по числу записей / байтам и временем жизни записи."""
+
+    def __init__(self, maxsize: int, ttl: float, max_bytes: int = 0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes  # 0 = без ограничения по размеру
+        self._data: 'OrderedDict[Hashable, tuple[float, Any, int]]' = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key, _MISSING)
+        if item is _MISSING:
+            self.misses += 1
+            return default
+        expires_at, value, size = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self._bytes -= size
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, size: int = 0) -> None:
+        if self.maxsize <= 0 or (self.max_bytes and size > self.max_bytes):
+            return
+        old = self._data.pop(key, None)
+        if old is not None:
+            self._bytes -= old[2]
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value, size)
+        self._bytes += size
+        while len(self._data) > self.maxsize or (self.max_bytes and self._bytes > self.max_bytes):
+            _, (_, _, evicted_size) = self._data.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.pop(key, _MISSING)
+        if item is _MISSING:
+            return default
+        self._bytes -= item[2]
+        return item[1]
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        item = self._data.get(key)
+        return item is not None and item[0] >= time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._data),
+            'bytes': self._bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
@@ -9,13 +9,16 @@ Endpoints:
 - GET /auth/twin/callback — OAuth callback от Digital Twin
 - GET /auth/github/callback — OAuth callback от GitHub
 - GET /health — health check для Railway
+- GET /metrics — метрики процесса в формате Prometheus (core/metrics.py)
 """
 
 import asyncio
+import hmac
 from aiohttp import web
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 from config import get_logger, OAUTH_SERVER_PORT
+from config.settings import METRICS_TOKEN
 from clients.linear_oauth import linear_oauth
 from clients.digital_twin import digital_twin
 from clients.github_oauth import github_oauth
@@ -37,6 +40,21 @@ async def health_handler(request: web.Request) -> web.Response:
     return web.Response(text="OK", status=200)
 
 
+async def metrics_handler(request: web.Request) -> web.Response:
+    """Метрики для Prometheus / Grafana Agent (вместо запросов к Neon).
+
+    Без METRICS_TOKEN эндпоинт не отдаётся (404): сервер публичный.
+    """
+    if not METRICS_TOKEN:
+        return web.Response(text="Not Found", status=404)
+    auth = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(auth, f"Bearer {METRICS_TOKEN}"):
+        return web.Response(text="Unauthorized", status=401)
+
+    from core.metrics import render_metrics
+    return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8")
+
+
 async def linear_callback_handler(request: web.Request) -> web.Response:
     """Обрабатывает OAuth callback от Linear.
 
@@ -293,6 +311,8 @@ async def twin_callback_handler(request: web.Request) -> web.Response:
                 'UPDATE interns SET dt_connected_at = NOW() WHERE chat_id = $1',
                 telegram_user_id,
             )
+        from db.queries.users import invalidate_intern
+        invalidate_intern(telegram_user_id)
     except Exception as e:
         logger.warning(f"Failed to persist DT connection for {telegram_user_id}: {e}")
 
@@ -537,6 +557,7 @@ def create_oauth_app() -> web.Application:
     """Создаёт aiohttp приложение для OAuth."""
     app = web.Application()
     app.router.add_get("/health", health_handler)
+    app.router.add_get("/metrics", metrics_handler)
     app.router.add_get("/auth/linear/callback", linear_callback_handler)
     app.router.add_get("/auth/twin/callback", twin_callback_handler)
     app.router.add_get("/auth/github/callback", github_callback_handler)
@@ -41,6 +41,8 @@ from clients.digital_twin import digital_twin
 from clients.github_oauth import github_oauth
 from i18n import t
 from helpers.markdown_to_html import md_to_html
+from helpers.telegram_stream import TelegramStreamRenderer
+from config.settings import CONSULTATION_STREAMING, STREAM_EDIT_INTERVAL_SEC
 
 logger = logging.getLogger(__name__)
 
@@ -322,11 +324,15 @@ class ConsultationState(BaseState):
 
         return None
 
-    async def _answer_bot_question(self, user, question: str, lang: str, previous_answer: str = None) -> str:
+    async def _answer_bot_question(
+        self, user, question: str, lang: str, previous_answer: str = None,
+        renderer: Optional[TelegramStreamRenderer] = None,
+    ) -> str:
         """Быстрый путь: ответ на вопрос о боте (L2).
 
         1. Проверить FAQ → мгновенный ответ (пропускается при refinement)
-        2. Иначе → Claude с self-knowledge (без MCP-поиска)
+        2. Иначе → Claude с self-knowledge (без MCP-поиска),
+           с renderer — ответ выводится по мере генерации
         """
         # Попробовать FAQ (не при refinement — пользователь уже видел FAQ или L2 ответ)
         if not previous_answer:
@@ -390,7 +396,16 @@ class ConsultationState(BaseState):
         user_prompt = f"Вопрос: {question}" if lang == 'ru' else f"Question: {question}"
         # Bot FAQ (L2) — простая задача, Haiku достаточно
         from config import CLAUDE_MODEL_HAIKU
-        answer = await claude.generate(system_prompt, user_prompt, max_tokens=max_tokens, model=CLAUDE_MODEL_HAIKU)
+        if renderer:
+            answer = await renderer.consume(claude.stream(
+                system_prompt, user_prompt, max_tokens=max_tokens, model=CLAUDE_MODEL_HAIKU,
+                feature="bot_faq", lang=lang,
+            ))
+        else:
+            answer = await claude.generate(
+                system_prompt, user_prompt, max_tokens=max_tokens, model=CLAUDE_MODEL_HAIKU,
+                feature="bot_faq", lang=lang,
+            )
         return answer or t('consultation.error', lang)
 
     async def _load_session_context(self, user) -> dict:
@@ -584,11 +599,19 @@ class ConsultationState(BaseState):
                 # Продлеваем typing на время тяжёлой операции (>5 сек)
                 typing_task = self._keep_typing(chat_id)
 
+                # Ответ выводится по абзацам по мере генерации, finish() — окончательный вид
+                renderer = None
+                if CONSULTATION_STREAMING and chat_id:
+                    renderer = TelegramStreamRenderer(
+                        self.bot, chat_id, min_interval=STREAM_EDIT_INTERVAL_SEC,
+                    )
+
                 if is_bot_q and not deep_search:
                     # --- L2: вопрос о боте → Claude + self-knowledge (без MCP) ---
                     answer = await self._answer_bot_question(
                         user, question, lang,
                         previous_answer=previous_answer if is_refinement else None,
+                        renderer=renderer,
                     )
                     _answer_for_history = answer
                     response = self._format_response(answer, [], lang)
@@ -609,11 +632,14 @@ class ConsultationState(BaseState):
                     # --- L3: предметный вопрос → tool_use для ВСЕХ тиров (T1-T4) ---
                     context_topic = self._get_current_topic(user)
                     intern_dict = self._user_to_dict(user)
+                    # Self-knowledge одинаков для всех → кэшируемый префикс промпта;
+                    # всё, что зависит от запроса, копится в request_context ({request_section})
                     bot_context = get_self_knowledge(lang)
+                    request_context = ""
 
-                    # L1 structured data → prepend to bot_context
+                    # L1 structured data → prepend to request_context
                     if structured_context:
-                        bot_context = structured_context + "\n\n" + bot_context
+                        request_context = structured_context + "\n\n" + request_context
 
                     # Refinement: inject previous answer
                     if is_refinement and previous_answer:
@@ -621,13 +647,13 @@ class ConsultationState(BaseState):
                             'ru': f"\n\nПРЕДЫДУЩИЙ ОТВЕТ (пользователь хочет подробнее):\n{previous_answer[:800]}\n\nДай более детальный, глубокий ответ. Раскрой аспекты, которые не были затронуты выше.",
                             'en': f"\n\nPREVIOUS ANSWER (user wants more detail):\n{previous_answer[:800]}\n\nGive a more detailed answer. Cover aspects not addressed above.",
                         }.get(lang, f"\n\nPREVIOUS ANSWER:\n{previous_answer[:800]}\n\nGive more detail.")
-                        bot_context += refinement_instruction
+                        request_context += refinement_instruction
                     elif deep_search:
                         depth_instruction = {
                             'ru': "\n\nИНСТРУКЦИЯ ГЛУБИНЫ: Дай развёрнутый ответ, используя ВСЕ доступные фрагменты из контекста. Если в контексте есть связи между темами — покажи их. Если есть примеры — приведи. НО НЕ выдумывай то, чего в контексте нет.",
                             'en': "\n\nDEPTH INSTRUCTION: Give a comprehensive answer using ALL available context fragments. Show connections between topics if present. Cite examples from context. But DO NOT invent what is not in the context.",
                         }.get(lang, "\n\nDEPTH INSTRUCTION: Use ALL context fragments. Do not invent.")
-                        bot_context += depth_instruction
+                        request_context += depth_instruction
 
                     # L1 structured data for deep search
                     if deep_search and not is_refinement and not structured_context:
@@ -635,7 +661,7 @@ class ConsultationState(BaseState):
                         if hit:
                             sc = format_structured_context(hit, lang)
                             if sc:
-                                bot_context = sc + "\n\n" + bot_context
+                                request_context = sc + "\n\n" + request_context
 
                     # Определяем тир (DP.ARCH.002)
                     user_chat_id = self._get_chat_id(user)
@@ -648,7 +674,7 @@ class ConsultationState(BaseState):
                         if dt_paths:
                             dt_context = await fetch_dt_context(user_chat_id, dt_paths)
                             if dt_context:
-                                bot_context = dt_context + "\n\n" + bot_context
+                                request_context = dt_context + "\n\n" + request_context
 
                     # C6: Goal → Program matching (DP.ARCH.002 § 12.8)
                     user_goals = intern_dict.get('goals', '') or ''
@@ -665,7 +691,7 @@ class ConsultationState(BaseState):
                                 'en': f"\n\nPERSONAL RECOMMENDATION: Based on user goals, the best-fit program is «{pname}»: {purl}. Mention this if the question is about development, learning, or 'what's next'.",
                             }.get(lang, '')
                             if goal_hint:
-                                bot_context += goal_hint
+                                request_context += goal_hint
 
                     from engines.shared import handle_question_with_tools
                     from engines.shared.consultation_tools import get_personal_claude_md
@@ -682,11 +708,13 @@ class ConsultationState(BaseState):
                         intern=intern_dict,
                         context_topic=context_topic,
                         bot_context=bot_context,
+                        request_context=request_context,
                         has_digital_twin=has_dt,
                         personal_claude_md=personal_claude,
                         tier=tier,
                         is_refinement=is_refinement,
                         conversation_messages=history_messages,
+                        on_chunk=renderer.feed if renderer else None,
                     )
                     logger.info(f"Consultation: T{tier} tool_use path for user {user_chat_id}")
                     _answer_for_history = answer
@@ -710,7 +738,10 @@ class ConsultationState(BaseState):
                 if qa_id:
                     reply_markup = _build_feedback_keyboard(qa_id, refinement_round, lang)
 
-                await self.send(user, md_to_html(response), parse_mode="HTML", reply_markup=reply_markup)
+                if renderer:
+                    await renderer.finish(response, reply_markup=reply_markup)
+                else:
+                    await self.send(user, md_to_html(response), parse_mode="HTML", reply_markup=reply_markup)
 
         except Exception as e:
             if typing_task:
@@ -940,6 +940,8 @@ class SettingsState(BaseState):
             pool = await get_pool()
             async with pool.acquire() as conn:
                 await conn.execute('UPDATE interns SET dt_connected_at = NULL WHERE chat_id = $1', chat_id)
+            from db.queries.users import patch_cached_intern
+            patch_cached_intern(chat_id, dt_connected_at=None)
         except Exception:
             pass
 
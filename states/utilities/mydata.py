@@ -586,6 +586,7 @@ class MyDataState(BaseState):
                 system_prompt=system_prompt,
                 user_prompt=f"{'Объясни' if mode == 'why' else 'Как улучшить'} мои данные в категории «{cat_label}»",
                 max_tokens=1000, model=CLAUDE_MODEL_HAIKU,
+                feature="mydata", lang=lang,
             )
         except Exception as e:
             logger.error(f"MyData explain error: {e}")
@@ -849,6 +850,8 @@ class MyDataState(BaseState):
                    WHERE chat_id = $1''',
                 chat_id,
             )
+        from db.queries.users import invalidate_intern
+        invalidate_intern(chat_id)
         await self.send(
             user, f"✅ {t('mydata.stats_reset_done', lang)}",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[
@@ -976,36 +979,32 @@ class MyDataState(BaseState):
 
     async def _get_context(self, chat_id: int) -> Optional[dict]:
         from db import get_pool
+        from core.storage import flush_fsm_chat
+        await flush_fsm_chat(chat_id)
         pool = await get_pool()
         async with pool.acquire() as conn:
-            row = await conn.fetchrow(
-                'SELECT data FROM fsm_states WHERE chat_id = $1', chat_id,
+            raw = await conn.fetchval(
+                "SELECT data -> 'mydata_context' FROM fsm_states WHERE chat_id = $1", chat_id,
             )
-            if row and row['data']:
+            if raw:
                 try:
-                    data = json.loads(row['data'])
-                    return data.get('mydata_context')
+                    return json.loads(raw)
                 except (json.JSONDecodeError, TypeError):
                     pass
         return None
 
     async def _save_context(self, chat_id: int, ctx: dict) -> None:
         from db import get_pool
+        from core.storage import flush_fsm_chat
+        await flush_fsm_chat(chat_id)
         pool = await get_pool()
         async with pool.acquire() as conn:
-            row = await conn.fetchrow(
-                'SELECT data FROM fsm_states WHERE chat_id = $1', chat_id,
-            )
-            data = {}
-            if row and row['data']:
-                try:
-                    data = json.loads(row['data'])
-                except (json.JSONDecodeError, TypeError):
-                    data = {}
-            data['mydata_context'] = ctx
             await conn.execute(
-                'UPDATE fsm_states SET data = $1 WHERE chat_id = $2',
-                json.dumps(data), chat_id,
+                """UPDATE fsm_states
+                   SET data = COALESCE(data, '{}'::jsonb) || jsonb_build_object('mydata_context', $1::jsonb),
+                       version = version + 1
+                   WHERE chat_id = $2""",
+                json.dumps(ctx, ensure_ascii=False), chat_id,
             )
 
     async def _clear_context(self, chat_id: int) -> None:
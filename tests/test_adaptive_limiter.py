@@ -0,0 +1,127 @@
+"""
+Тест адаптивного лимита запросов (helpers/adaptive_limiter.py):
+строгий приоритет полос, доля лимита для фоновой работы,
+сжатие при перегрузке и рост при здоровом API.
+
+Запуск: python -m pytest tests/test_adaptive_limiter.py -v -s
+Или просто: python tests/test_adaptive_limiter.py
+"""
+
+import sys
+import os
+import asyncio
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers.adaptive_limiter import AdaptiveLimiter
+
+
+def test_priority_order():
+    """Освободившийся слот получает самая важная полоса, а не первая в очереди"""
+
+    async def run():
+        limiter = AdaptiveLimiter(initial=1, min_limit=1, lane_shares=(1.0, 1.0, 1.0))
+        order = []
+        release = asyncio.Event()
+
+        async def holder():
+            async with limiter.acquire(0):
+                await release.wait()
+
+        async def worker(name, lane):
+            async with limiter.acquire(lane):
+                order.append(name)
+
+        first = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        tasks = [
+            asyncio.create_task(worker("pregen", 2)),
+            asyncio.create_task(worker("delivery", 1)),
+            asyncio.create_task(worker("user", 0)),
+        ]
+        await asyncio.sleep(0)
+        assert limiter.stats()["waiting_by_lane"] == [1, 1, 1]
+        release.set()
+        await asyncio.gather(first, *tasks)
+        return order
+
+    order = asyncio.run(run())
+    assert order == ["user", "delivery", "pregen"]
+    print("✅ Limiter: пользователь → доставка → пре-генерация")
+
+
+def test_background_share_leaves_room():
+    """Пре-генерация не занимает больше своей доли — пользователь не ждёт"""
+
+    async def run():
+        limiter = AdaptiveLimiter(initial=4, min_limit=1, lane_shares=(1.0, 0.75, 0.5))
+        release = asyncio.Event()
+
+        async def pregen():
+            async with limiter.acquire(2):
+                await release.wait()
+
+        tasks = [asyncio.create_task(pregen()) for _ in range(5)]
+        await asyncio.sleep(0)
+        stats = limiter.stats()
+        assert stats["inflight_by_lane"][2] == 2
+        assert stats["waiting_by_lane"][2] == 3
+
+        # Интерактивный запрос проходит сразу, несмотря на очередь пре-генерации
+        async with limiter.acquire(0):
+            assert limiter.stats()["inflight"] == 3
+
+        release.set()
+        await asyncio.gather(*tasks)
+        assert limiter.stats()["inflight"] == 0
+
+    asyncio.run(run())
+    print("✅ Limiter: фоновая полоса ограничена своей долей")
+
+
+def test_aimd_feedback():
+    """429 сжимает лимит вдвое (не чаще cooldown), успехи растят его на ~1 за окно"""
+    limiter = AdaptiveLimiter(initial=20, min_limit=4, max_limit=48, cooldown=60)
+
+    limiter.on_overload()
+    limiter.on_overload()  # та же волна 429 — повторно не сжимаем
+    assert limiter.limit == 10
+    assert limiter.stats()["overloads"] == 1
+
+    for _ in range(12):
+        limiter.on_success(500)
+    assert limiter.limit == 11
+
+    # TTFT втрое выше базового — признак очереди на стороне API
+    limiter._last_decrease = float('-inf')
+    limiter.on_success(1500)
+    assert limiter.limit < 11
+    assert limiter.stats()["slowdowns"] == 1
+    print(f"✅ Limiter: AIMD, limit={limiter.limit}, baseline={limiter.baseline_ms()} мс")
+
+
+def test_mixed_models_keep_limit():
+    """Быстрый Haiku вперемешку с медленным Sonnet — у каждой модели своя база, лимит не сползает"""
+    limiter = AdaptiveLimiter(initial=20, min_limit=2, max_limit=64, cooldown=0)
+
+    for i in range(300):
+        limiter.on_success(300 + i % 50, "haiku")
+        limiter.on_success(2500 + i % 400, "sonnet")
+
+    assert limiter.stats()["slowdowns"] == 0
+    assert limiter.limit >= 20
+    assert limiter.baseline_ms("haiku") < 400 and limiter.baseline_ms("sonnet") > 2000
+
+    # Настоящее замедление Sonnet по-прежнему сжимает лимит
+    before = limiter.limit
+    limiter.on_success(9000, "sonnet")
+    assert limiter.limit < before
+    print(f"✅ Limiter: смешанная нагрузка, limit={limiter.limit}, базы={limiter.stats()['baseline_ms']}")
+
+
+if __name__ == "__main__":
+    test_priority_order()
+    test_background_share_leaves_room()
+    test_aimd_feedback()
+    test_mixed_models_keep_limit()
@@ -0,0 +1,191 @@
+"""
+Тест локального BM25-индекса (helpers/bm25.py): русский токенизатор,
+ранжирование, сохранение на диск и скорость поиска (< 5 мс);
+индексация чанков MCP вне пути запроса (engines/shared/retrieval.py).
+
+Запуск: python -m pytest tests/test_bm25_index.py -v -s
+Или просто: python tests/test_bm25_index.py
+"""
+
+import sys
+import os
+import asyncio
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DOCS = 5000
+
+VOCABULARY = (
+    "собранность внимание фокус агентность мастерство практика саморазвитие слот "
+    "трекер заметки экзокортекс мышление система роль метод рабочий продукт выгорание "
+    "прокрастинация привычка ритм время планирование неделя результат цель стратегия "
+    "мировоззрение обучение знания модель теория понятие объект деятельность проект"
+).split()
+
+
+def _make_corpus(count: int) -> list:
+    """Чанки по 120 слов: термины программы + «длинный хвост» по Ципфу"""
+    rng = random.Random(42)
+    tail = [f"слово{i}" for i in range(3000)]
+    words = VOCABULARY + tail
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    return [
+        (f"doc-{i}", " ".join(rng.choices(words, weights, k=120)))
+        for i in range(count)
+    ]
+
+
+def test_tokenizer_russian_forms():
+    """Формы одного слова сводятся к одной основе, стоп-слова отбрасываются"""
+    from helpers.bm25 import tokenize
+
+    assert tokenize("Собранность") == tokenize("собранный")
+    assert tokenize("внимания") == tokenize("внимание")
+    assert tokenize("ещё и не") == []
+    print("✅ Токенизатор: словоформы и стоп-слова")
+
+
+def test_ranking_and_persistence():
+    """Релевантный документ выше, индекс переживает сохранение/загрузку"""
+    from helpers.bm25 import BM25Index
+
+    index = BM25Index(max_docs=3)
+    index.add("a", "Слот саморазвития — регулярное время для практики", {"source": "guide-1"})
+    index.add("b", "Выгорание возникает при перегрузке и отсутствии отдыха", {"source": "guide-2"})
+    index.add("c", "Экзокортекс: заметки как внешний мозг", {"source": "guide-3"})
+    assert not index.add("a", "дубль")  # повторный чанк только освежает 'a'
+
+    hits = index.search("как не выгореть при перегрузках", limit=2)
+    assert hits and hits[0][2]["source"] == "guide-2"
+
+    index.add("d", "Трекер помогает видеть прогресс")  # вытесняет самый старый — 'b'
+    assert "b" not in index and "a" in index and len(index) == 3
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "index.json"
+        index.save(path)
+        loaded = BM25Index.load(path, max_docs=3)
+    assert len(loaded) == 3 and not loaded.dirty
+    assert loaded.search("заметки внешний мозг")[0][2]["source"] == "guide-3"
+    assert not loaded.search("выгорание")
+    print("✅ BM25: ранжирование, вытеснение, сохранение")
+
+
+def test_load_without_retokenizing():
+    """Файл хранит частоты терминов — загрузка не токенизирует тексты заново"""
+    import helpers.bm25 as bm25
+
+    index = bm25.BM25Index(max_docs=DOCS)
+    for doc_id, text in _make_corpus(2000):
+        index.add(doc_id, text)
+
+    original = bm25.tokenize
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "index.json"
+        index.save(path)
+
+        def forbidden(text):
+            raise AssertionError("load() не должен токенизировать")
+
+        bm25.tokenize = forbidden
+        try:
+            start = time.perf_counter()
+            loaded = bm25.BM25Index.load(path, max_docs=DOCS)
+            load_ms = (time.perf_counter() - start) * 1000
+        finally:
+            bm25.tokenize = original
+
+    query = "собранность и фокус внимания"
+    assert len(loaded) == 2000
+    assert [hit[2] for hit in loaded.search(query)] == [hit[2] for hit in index.search(query)]
+    print(f"✅ BM25: 2000 чанков загружены за {load_ms:.0f} мс без токенизации")
+
+
+def test_mcp_chunks_indexed_off_request_path():
+    """Результаты MCP ставятся в очередь, токенизирует поток-индексатор"""
+    try:
+        import engines.shared.retrieval as retrieval
+    except ImportError:
+        print("⏭️ LocalIndex: пропущен (нет зависимостей бота)")
+        return
+    from helpers.bm25 import BM25Index
+
+    request_thread = threading.get_ident()
+    tokenized_in = set()
+    original_tf = retrieval.term_frequencies
+
+    def tracking_tf(text):
+        tokenized_in.add(threading.get_ident())
+        return original_tf(text)
+
+    index = BM25Index(max_docs=100)
+    results = [
+        retrieval.RetrievalResult(text=text, source=f"guide-{i}", source_type="guides")
+        for i, (_, text) in enumerate(_make_corpus(20))
+    ]
+
+    async def scenario():
+        retrieval._enqueue_for_index(index, results)
+        retrieval._enqueue_for_index(index, results)  # повтор, пока в очереди, — не дублируется
+        assert len(index) == 0 and len(retrieval._index_pending) == 20
+        for _ in range(200):
+            if len(index) == 20:
+                break
+            await asyncio.sleep(0.01)
+
+    patches = [
+        ('term_frequencies', tracking_tf),
+        ('_local_index', index),
+        ('_maybe_save_local_index', lambda: None),
+    ]
+    originals = {name: getattr(retrieval, name) for name, _ in patches}
+    try:
+        for name, value in patches:
+            setattr(retrieval, name, value)
+        asyncio.run(scenario())
+    finally:
+        for name, value in originals.items():
+            setattr(retrieval, name, value)
+
+    assert len(index) == 20 and not retrieval._index_pending
+    assert tokenized_in and request_thread not in tokenized_in
+    print("✅ LocalIndex: чанки MCP индексируются в отдельном потоке")
+
+
+def test_search_latency():
+    """Поиск по корпусу из 5000 чанков укладывается в 5 мс"""
+    from helpers.bm25 import BM25Index
+
+    index = BM25Index(max_docs=DOCS)
+    for doc_id, text in _make_corpus(DOCS):
+        index.add(doc_id, text)
+
+    queries = [
+        "как сохранить собранность и фокус внимания",
+        "рабочий продукт недели",
+        "выгорание и прокрастинация",
+        "стратегия обучения и мировоззрение",
+    ]
+    runs = 50
+    start = time.perf_counter()
+    for _ in range(runs):
+        for query in queries:
+            index.search(query, limit=10)
+    avg_ms = (time.perf_counter() - start) * 1000 / (runs * len(queries))
+
+    print(f"\n📊 BM25: {DOCS} чанков, поиск {avg_ms:.2f} мс")
+    assert avg_ms < 5
+
+
+if __name__ == "__main__":
+    test_tokenizer_russian_forms()
+    test_ranking_and_persistence()
+    test_load_without_retokenizing()
+    test_mcp_chunks_indexed_off_request_path()
+    test_search_latency()
@@ -0,0 +1,104 @@
+"""
+Тест примитивов кэширования: TTLCache (LRU + TTL + бюджет по байтам) и SingleFlight.
+
+Запуск: python -m pytest tests/test_cache_helpers.py -v
+Или просто: python tests/test_cache_helpers.py
+"""
+
+import sys
+import os
+import asyncio
+import time
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_ttl_cache_lru_and_ttl():
+    """LRU-вытеснение по числу записей и истечение по TTL"""
+    from helpers.ttl_cache import TTLCache
+
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1  # 'a' становится самым свежим
+    cache.set('c', 3)           # вытесняет 'b'
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.evictions == 1
+
+    cache.set('short', 'x', ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get('short') is None
+    print("✅ TTLCache: LRU и TTL")
+
+
+def test_ttl_cache_byte_budget():
+    """Бюджет по байтам: вытесняются старые записи, слишком большие не кладутся"""
+    from helpers.ttl_cache import TTLCache
+
+    cache = TTLCache(maxsize=100, ttl=60, max_bytes=10)
+    cache.set('a', 'aaaa', size=4)
+    cache.set('b', 'bbbb', size=4)
+    cache.set('c', 'cccc', size=4)  # 12 > 10 → вытесняет 'a'
+    assert 'a' not in cache and 'b' in cache and 'c' in cache
+    assert cache.stats()['bytes'] == 8
+
+    cache.set('huge', 'x' * 50, size=50)
+    assert 'huge' not in cache
+    cache.pop('b')
+    assert cache.stats()['bytes'] == 4
+    print("✅ TTLCache: бюджет по байтам")
+
+
+def test_singleflight_coalesces_concurrent_calls():
+    """Одновременные вызовы с одним ключом — одно выполнение"""
+    from helpers.singleflight import SingleFlight
+
+    flight = SingleFlight()
+    runs = 0
+
+    async def work():
+        nonlocal runs
+        runs += 1
+        await asyncio.sleep(0.01)
+        return 'result'
+
+    async def scenario():
+        results = await asyncio.gather(*(flight.do('k', work) for _ in range(10)))
+        assert results == ['result'] * 10
+        # После завершения ключ свободен — новый вызов выполняется заново
+        await flight.do('k', work)
+
+    asyncio.run(scenario())
+    assert runs == 2
+    assert flight.coalesced == 9
+    assert len(flight) == 0
+    print("✅ SingleFlight: 10 вызовов → 1 выполнение")
+
+
+def test_singleflight_propagates_errors():
+    """Ошибка доставляется всем ожидающим"""
+    from helpers.singleflight import SingleFlight
+
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def scenario():
+        results = await asyncio.gather(
+            *(flight.do('k', fail) for _ in range(3)), return_exceptions=True,
+        )
+        assert all(isinstance(r, ValueError) for r in results)
+
+    asyncio.run(scenario())
+    print("✅ SingleFlight: ошибки пробрасываются")
+
+
+if __name__ == "__main__":
+    test_ttl_cache_lru_and_ttl()
+    test_ttl_cache_byte_budget()
+    test_singleflight_coalesces_concurrent_calls()
+    test_singleflight_propagates_errors()
@@ -0,0 +1,147 @@
+"""
+Тест отправки напоминаний (core/scheduler.py::check_reminders):
+накопившиеся напоминания забираются пачками, отправляются параллельно,
+итог пачки пишется одним запросом, ошибки возвращаются в очередь в конце.
+Постановка напоминаний в scheduled_check — пачками по мере доставки.
+
+Запуск: python -m pytest tests/test_check_reminders.py -v -s
+Или просто: python tests/test_check_reminders.py
+"""
+
+import sys
+import os
+import asyncio
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_backlog_drains_in_chunks():
+    """1200 напоминаний → 3 пачки, 3 запроса «отправлено», 1 возврат ошибок"""
+    try:
+        import core.scheduler as scheduler
+        import db.queries.reminders as queries
+    except ImportError:
+        print("⏭️ Reminders: пропущен (нет зависимостей бота)")
+        return
+
+    pending = [dict(id=i, chat_id=1000 + i, reminder_type='+1h') for i in range(1200)]
+    calls = {'claim': 0, 'sent': [], 'released': []}
+    running = {'now': 0, 'max': 0}
+
+    async def fake_claim(now, limit):
+        calls['claim'] += 1
+        chunk = pending[:limit]
+        del pending[:limit]
+        return chunk
+
+    async def fake_mark(ids):
+        calls['sent'].append(len(ids))
+
+    async def fake_release(ids):
+        calls['released'].append(sorted(ids))
+
+    async def fake_interns(chat_ids):
+        return {}
+
+    async def fake_send(chat_id, reminder_type, bot, intern=None):
+        running['now'] += 1
+        running['max'] = max(running['max'], running['now'])
+        await asyncio.sleep(0.001)
+        running['now'] -= 1
+        if chat_id == 1007:
+            raise RuntimeError("Telegram server error")
+        if chat_id == 1008:
+            raise RuntimeError("Forbidden: bot was blocked by the user")
+
+    patches = [
+        (queries, 'claim_due_reminders', fake_claim),
+        (queries, 'mark_reminders_sent', fake_mark),
+        (queries, 'release_reminders', fake_release),
+        (scheduler, 'get_interns', fake_interns),
+        (scheduler, 'send_reminder', fake_send),
+        (scheduler, '_get_bot', lambda: None),
+    ]
+    originals = [(obj, name, getattr(obj, name)) for obj, name, _ in patches]
+    for obj, name, fn in patches:
+        setattr(obj, name, fn)
+    try:
+        asyncio.run(scheduler.check_reminders())
+    finally:
+        for obj, name, fn in originals:
+            setattr(obj, name, fn)
+
+    assert calls['claim'] == 3  # 500 + 500 + 200
+    assert calls['sent'] == [499, 500, 200]  # заблокировавший бота тоже «отправлен»
+    assert calls['released'] == [[7]]
+    assert 1 < running['max'] <= scheduler._REMINDER_CONCURRENCY
+    print(f"✅ Reminders: {sum(calls['sent'])} отправлено за {calls['claim']} пачки, "
+          f"параллельно до {running['max']}")
+
+
+def test_slot_reminders_survive_crash():
+    """Слот оборвался посередине — напоминания уже получившим урок записаны"""
+    try:
+        import core.scheduler as scheduler
+    except ImportError:
+        print("⏭️ Reminders: пропущен (нет зависимостей бота)")
+        return
+
+    from datetime import datetime
+
+    scheduled = [(1000 + i, 'marathon') for i in range(5)]
+    written = []
+
+    async def fake_scheduled(hour, minute):
+        return scheduled
+
+    async def fake_interns(chat_ids):
+        return {}
+
+    async def fake_contents(keys):
+        return {}
+
+    async def fake_send_topic(chat_id, bot, intern=None, contents=None, reminders=None):
+        if chat_id == 1004:
+            raise asyncio.CancelledError()  # редеплой посреди слота
+        reminders.append(chat_id)
+        await asyncio.sleep(0)
+
+    async def fake_schedule_reminders(chat_ids):
+        written.append(sorted(chat_ids))
+
+    async def fake_check_reminders():
+        raise AssertionError("слот не должен дойти до check_reminders")
+
+    patches = [
+        (scheduler, '_REMINDER_CHUNK', 2),
+        (scheduler, 'moscow_now', lambda: datetime(2026, 10, 16, 9, 7, tzinfo=scheduler.MOSCOW_TZ)),
+        (scheduler, 'get_all_scheduled_interns', fake_scheduled),
+        (scheduler, 'get_interns', fake_interns),
+        (scheduler, 'get_marathon_contents', fake_contents),
+        (scheduler, 'send_scheduled_topic', fake_send_topic),
+        (scheduler, 'schedule_reminders', fake_schedule_reminders),
+        (scheduler, 'check_reminders', fake_check_reminders),
+        (scheduler, '_get_bot', lambda: None),
+    ]
+    originals = [(obj, name, getattr(obj, name)) for obj, name, _ in patches]
+    for obj, name, fn in patches:
+        setattr(obj, name, fn)
+    try:
+        try:
+            asyncio.run(scheduler.scheduled_check())
+        except asyncio.CancelledError:
+            pass
+        else:
+            raise AssertionError("ожидался обрыв слота")
+    finally:
+        for obj, name, fn in originals:
+            setattr(obj, name, fn)
+
+    assert sorted(sum(written, [])) == [1000, 1001, 1002, 1003]
+    print(f"✅ Reminders: после обрыва слота записано {len(written)} пачки напоминаний")
+
+
+if __name__ == "__main__":
+    test_backlog_drains_in_chunks()
+    test_slot_reminders_survive_crash()
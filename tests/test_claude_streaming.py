@@ -0,0 +1,175 @@
+"""
+Тест потокового вызова Claude API (clients/claude.py::_api_call_streaming):
+обрыв посреди ответа → повтор; в ответ и в поток не попадает текст
+оборванной попытки; TTFT повтора не включает паузу после 429.
+
+Запуск: python -m pytest tests/test_claude_streaming.py -v -s
+Или просто: python tests/test_claude_streaming.py
+"""
+
+import sys
+import os
+import json
+import asyncio
+from types import SimpleNamespace
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _sse(text: str) -> bytes:
+    event = {"type": "content_block_delta", "delta": {"type": "text_delta", "text": text}}
+    return f"data: {json.dumps(event, ensure_ascii=False)}\n".encode()
+
+
+class FakeResponse:
+    """Ответ API: отдаёт строки SSE, None в списке — обрыв по неактивности."""
+
+    def __init__(self, lines, status=200, headers=None):
+        self.status = status
+        self.headers = headers or {}
+        self._lines = list(lines)
+        self.content = self
+
+    async def readline(self):
+        if not self._lines:
+            return b""
+        line = self._lines.pop(0)
+        if line is None:
+            raise asyncio.TimeoutError()
+        return line
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeSession:
+    """Сессия aiohttp: по одному заготовленному ответу на попытку."""
+
+    closed = False
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.posts = 0
+
+    def post(self, url, **kwargs):
+        self.posts += 1
+        return self.responses.pop(0)
+
+
+def _run_streaming(responses, allow_partial=True):
+    """Вызов _api_call_streaming с фейковой сессией; (result, chunks, usage)."""
+    from clients.claude import ClaudeClient
+    claude_module = sys.modules[ClaudeClient.__module__]  # clients.claude — экземпляр клиента
+
+    from helpers.adaptive_limiter import AdaptiveLimiter
+
+    chunks = []
+    usage = {}
+    clock = [0.0]
+
+    async def on_chunk(chunk):
+        chunks.append(chunk)
+
+    async def fake_sleep(delay):
+        clock[0] += delay  # время идёт, но тест не ждёт
+
+    session = FakeSession(responses)
+    fake_asyncio = SimpleNamespace(**{**vars(asyncio), "sleep": fake_sleep})
+    patches = [
+        (claude_module, "asyncio", fake_asyncio),
+        (claude_module, "time", SimpleNamespace(perf_counter=lambda: clock[0])),
+        (ClaudeClient, "_session", session),
+        (ClaudeClient, "_limiter", AdaptiveLimiter()),
+    ]
+    originals = [(obj, name, getattr(obj, name)) for obj, name, _ in patches]
+    try:
+        for obj, name, value in patches:
+            setattr(obj, name, value)
+        client = ClaudeClient()
+        result = asyncio.run(client._api_call_streaming(
+            {"model": "test"}, allow_partial=allow_partial, usage=usage, on_chunk=on_chunk,
+        ))
+    finally:
+        for obj, name, value in originals:
+            setattr(obj, name, value)
+    assert not session.responses  # каждая попытка — отдельный запрос
+    return result, chunks, usage
+
+
+def _streamed_after_reset(chunks) -> str:
+    """Текст, который остался в Telegram: всё после последнего reset."""
+    text = []
+    for chunk in chunks:
+        if chunk.reset:
+            text = []
+        else:
+            text.append(chunk.text)
+    return "".join(text)
+
+
+def test_midstream_timeout_retry_does_not_duplicate():
+    """Таймаут посреди ответа: повтор начинает ответ заново, без хвоста первой попытки"""
+    try:
+        import clients.claude  # noqa: F401
+    except ImportError:
+        print("⏭️ Claude streaming: пропущен (нет зависимостей бота)")
+        return
+
+    result, chunks, _ = _run_streaming([
+        FakeResponse([_sse("Системное "), _sse("мышле"), None]),
+        FakeResponse([_sse("Системное "), _sse("мышление — "), _sse("это подход.")]),
+    ])
+
+    assert result == "Системное мышление — это подход."
+    assert sum(1 for c in chunks if c.reset) == 1
+    assert _streamed_after_reset(chunks) == result
+    print("✅ Claude streaming: повтор после обрыва не склеивается с частичным ответом")
+
+
+def test_partial_kept_when_retry_also_fails():
+    """Обе попытки оборвались — возвращается самый длинный частичный ответ"""
+    try:
+        import clients.claude  # noqa: F401
+    except ImportError:
+        print("⏭️ Claude streaming: пропущен (нет зависимостей бота)")
+        return
+
+    result, _, _ = _run_streaming([
+        FakeResponse([_sse("Длинный частичный "), _sse("ответ"), None]),
+        FakeResponse([_sse("Коро"), None]),
+    ])
+    assert result == "Длинный частичный ответ"
+
+    result, _, _ = _run_streaming([
+        FakeResponse([_sse("Частичный"), None]),
+        FakeResponse([None]),
+    ], allow_partial=False)
+    assert result is None
+    print("✅ Claude streaming: частичный ответ сохраняется, если повтор не удался")
+
+
+def test_ttft_excludes_retry_after_sleep():
+    """После 429 TTFT считается от начала повтора, а не от первой попытки"""
+    try:
+        import clients.claude  # noqa: F401
+    except ImportError:
+        print("⏭️ Claude streaming: пропущен (нет зависимостей бота)")
+        return
+
+    result, _, usage = _run_streaming([
+        FakeResponse([], status=429, headers={"retry-after": "5"}),
+        FakeResponse([_sse("Ответ")]),
+    ])
+    assert result == "Ответ"
+    assert usage["ttft_ms"] < 1000, usage
+    print(f"✅ Claude streaming: TTFT повтора {usage['ttft_ms']} мс (без 5 с retry-after)")
+
+
+if __name__ == "__main__":
+    test_midstream_timeout_retry_does_not_duplicate()
+    test_partial_kept_when_retry_also_fails()
+    test_ttft_excludes_retry_after_sleep()
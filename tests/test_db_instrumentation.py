@@ -0,0 +1,90 @@
+"""
+Тест инструментации запросов (db/instrumentation.py): отпечаток SQL,
+место вызова, span в текущем трейсе, агрегаты по отпечатку.
+
+Запуск: python -m pytest tests/test_db_instrumentation.py -v -s
+Или просто: python tests/test_db_instrumentation.py
+"""
+
+import sys
+import os
+import asyncio
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_fingerprint():
+    """Литералы и пробелы не плодят отдельные отпечатки; $N и BEGIN — особо"""
+    from db.instrumentation import fingerprint
+
+    a = fingerprint("SELECT * FROM interns\n   WHERE chat_id = 42 AND name = 'Bob'")
+    b = fingerprint("SELECT * FROM interns WHERE chat_id = 7 AND name = 'O''Neil'")
+    assert a == b == "SELECT * FROM interns WHERE chat_id = ? AND name = ?"
+    assert fingerprint("SELECT * FROM t WHERE id = $1 AND col2 > 5") == "SELECT * FROM t WHERE id = $1 AND col2 > ?"
+    assert fingerprint("BEGIN ISOLATION LEVEL READ COMMITTED") is None
+    print("✅ DB instrumentation: отпечатки запросов")
+
+
+def test_queries_recorded_into_trace():
+    """Запрос через InstrumentedConnection → сумма в трейсе + агрегат с местом вызова"""
+    try:
+        import asyncpg
+        import db.instrumentation as inst
+        from core.tracing import start_trace, get_current_trace
+    except ImportError:
+        print("⏭️ DB instrumentation: пропущен (нет зависимостей бота)")
+        return
+
+    async def fake_fetch(self, query, *args, **kwargs):
+        await asyncio.sleep(0.002)
+        return [{'chat_id': 1}, {'chat_id': 2}]
+
+    async def fake_execute(self, query, *args, **kwargs):
+        return "UPDATE 3"
+
+    patches = [
+        (asyncpg.Connection, 'fetch', fake_fetch),
+        (asyncpg.Connection, 'execute', fake_execute),
+    ]
+    originals = [(obj, name, getattr(obj, name)) for obj, name, _ in patches]
+    for obj, name, fn in patches:
+        setattr(obj, name, fn)
+
+    conn = object.__new__(inst.InstrumentedConnection)
+
+    async def get_scheduled(hour):
+        return await conn.fetch(f"SELECT chat_id FROM interns WHERE schedule_time = '{hour}:00'")
+
+    async def run():
+        start_trace(user_id=1, command="/learn", state="test")
+        for hour in range(3):
+            await get_scheduled(hour)
+        await conn.execute("UPDATE interns SET x = 1 WHERE chat_id = ANY($1)", [1, 2, 3])
+        await conn.execute("BEGIN")
+        return get_current_trace()
+
+    inst.reset_query_stats()
+    try:
+        trace = asyncio.run(run())
+    finally:
+        for obj, name, fn in originals:
+            setattr(obj, name, fn)
+
+    assert trace.spans == []  # по запросу span не добавляется — только сумма
+    db_span = trace.db_span()
+    assert db_span.name == "db" and db_span.metadata['count'] == 4 and db_span.metadata['rows'] == 9
+    assert db_span.metadata['slowest'] == "tests/test_db_instrumentation.py:get_scheduled"
+    top = inst.get_query_stats()
+    inst.reset_query_stats()
+    assert len(top) == 2  # три часа — один отпечаток, BEGIN не учитывается
+    scan = top[0]
+    assert scan['callsite'] == "tests/test_db_instrumentation.py:get_scheduled"
+    assert scan['count'] == 3 and scan['avg_rows'] == 2 and scan['p50_ms'] >= 1
+    assert top[1]['avg_rows'] == 3
+    print(f"✅ DB instrumentation: {scan['callsite']} n={scan['count']} p95={scan['p95_ms']}мс")
+
+
+if __name__ == "__main__":
+    test_fingerprint()
+    test_queries_recorded_into_trace()
@@ -0,0 +1,124 @@
+"""
+Тест дедупликации результатов поиска (SemanticDeduplicator) на MinHash + LSH.
+
+Сравнивает с прежней попарной O(n²) реализацией: тот же набор уникальных
+результатов и заметно меньше времени на 60 результатах (fallback-запросы).
+
+Запуск: python -m pytest tests/test_dedup_minhash.py -v -s
+Или просто: python tests/test_dedup_minhash.py
+"""
+
+import sys
+import os
+import random
+import time
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORDS = (
+    "собранность внимание фокус агентность мастерство практика саморазвитие слот "
+    "трекер заметки экзокортекс мышление система роль метод рабочий продукт выгорание "
+    "прокрастинация привычка ритм время планирование неделя результат цель стратегия "
+    "мировоззрение обучение знания модель теория понятие объект деятельность проект"
+).split() + [f"термин{i}" for i in range(400)]
+
+
+def _make_texts(count: int) -> list:
+    """Группы почти-дубликатов: база + несколько перефразировок"""
+    rng = random.Random(7)
+    texts = []
+    while len(texts) < count:
+        base = rng.sample(WORDS, 300)
+        texts.append(" ".join(base))
+        for _ in range(rng.randint(0, 3)):
+            variant = list(base)
+            for i in rng.sample(range(len(variant)), 20):
+                variant[i] = rng.choice(WORDS)
+            texts.append(" ".join(variant))
+    return texts[:count]
+
+
+def _legacy_deduplicate(results, threshold):
+    """Прежняя реализация: попарное сравнение, хеш и фразы — на каждое сравнение"""
+    import hashlib
+    import re
+
+    def text_hash(r):
+        normalized = re.sub(r'\s+', ' ', r.text.lower().strip())
+        return hashlib.md5(normalized[:500].encode()).hexdigest()
+
+    def key_phrases(r):
+        return set(re.findall(r'\b[а-яёa-z]{4,}\b', r.text.lower()))
+
+    def similar(a, b):
+        if text_hash(a) == text_hash(b):
+            return True
+        s1, s2 = key_phrases(a), key_phrases(b)
+        if not s1 or not s2:
+            return False
+        return len(s1 & s2) / len(s1 | s2) >= threshold
+
+    unique = []
+    for r in sorted(results, key=lambda r: r.relevance_score, reverse=True):
+        if not any(similar(r, u) for u in unique):
+            unique.append(r)
+    return unique
+
+
+def test_dedup_matches_legacy_and_is_faster():
+    """MinHash + LSH: тот же результат, что и попарное сравнение, но быстрее"""
+    try:
+        from engines.shared.retrieval import RetrievalResult, SemanticDeduplicator
+    except ImportError:
+        print("⏭️ Dedup: пропущен (нет зависимостей бота)")
+        return
+
+    rng = random.Random(1)
+    texts = _make_texts(60)
+
+    def make_results():
+        return [
+            RetrievalResult(text=t, source=f"s{i}", source_type="guides",
+                            relevance_score=rng.random())
+            for i, t in enumerate(texts)
+        ]
+
+    legacy_input = make_results()
+    start = time.perf_counter()
+    legacy = _legacy_deduplicate(legacy_input, 0.6)
+    legacy_time = time.perf_counter() - start
+
+    new_input = [
+        RetrievalResult(text=r.text, source=r.source, source_type=r.source_type,
+                        relevance_score=r.relevance_score)
+        for r in legacy_input
+    ]
+    start = time.perf_counter()
+    deduped = SemanticDeduplicator(0.6).deduplicate(new_input)
+    new_time = time.perf_counter() - start
+
+    assert [r.source for r in deduped] == [r.source for r in legacy]
+    assert len(deduped) < len(texts)
+
+    print(f"\n📊 {len(texts)} результатов → {len(deduped)} уникальных: "
+          f"legacy={legacy_time * 1000:.1f}ms, minhash={new_time * 1000:.1f}ms")
+    assert new_time < legacy_time
+
+
+def test_minhash_estimates_jaccard():
+    """Оценка по сигнатурам близка к точному коэффициенту Жаккара"""
+    from helpers.minhash import minhash_signature, estimate_jaccard
+
+    a = set(WORDS[:200])
+    b = set(WORDS[50:250])  # Жаккар = 150 / 250 = 0.6
+    estimate = estimate_jaccard(minhash_signature(a, 256), minhash_signature(b, 256))
+    assert abs(estimate - 0.6) < 0.15
+    assert minhash_signature(a) == minhash_signature(set(a))
+    assert minhash_signature(set()) == ()
+    print(f"✅ MinHash: оценка Жаккара {estimate:.2f} (точно 0.60)")
+
+
+if __name__ == "__main__":
+    test_dedup_matches_legacy_and_is_faster()
+    test_minhash_estimates_jaccard()
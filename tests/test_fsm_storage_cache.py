@@ -0,0 +1,240 @@
+"""
+Бенчмарк FSM-хранилища: число обращений к БД на один апдейт.
+
+Сравнивает PostgresStorage (снимок строки на апдейт, update_data одним
+UPDATE) и CachedPostgresStorage (LRU + write-behind); снимок не переживает апдейт.
+Вместо PostgreSQL — фейковый пул, считающий запросы.
+
+Запуск: python -m pytest tests/test_fsm_storage_cache.py -v -s
+Или просто: python tests/test_fsm_storage_cache.py
+"""
+
+import sys
+import os
+import asyncio
+import json
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CHATS = 20
+UPDATES = 500
+
+
+class FakeConn:
+    """Минимальная эмуляция fsm_states поверх dict."""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def fetchrow(self, query, chat_id):
+        self.pool.calls += 1
+        row = self.pool.rows.get(chat_id)
+        if row is None:
+            return None
+        return {'state': row['state'], 'data': row['data'], 'version': row['version']}
+
+    async def execute(self, query, chat_id, value):
+        self.pool.calls += 1
+        self._write(query, chat_id, value)
+
+    async def fetchval(self, query, chat_id, value):
+        # update_data ... RETURNING data
+        self.pool.calls += 1
+        return self._write(query, chat_id, value)['data']
+
+    def _write(self, query, chat_id, value):
+        row = self.pool.rows.setdefault(chat_id, {'state': None, 'data': '{}', 'version': 0})
+        if 'SET state' in query:
+            row['state'] = value
+        elif '||' in query:
+            row['data'] = json.dumps({**json.loads(row['data']), **json.loads(value)})
+        else:
+            row['data'] = value
+        row['version'] += 1
+        return row
+
+    async def fetch(self, query, chat_ids, states, datas, versions, channel, instance_id):
+        # Батчевый upsert с проверкой версии (CachedPostgresStorage.flush)
+        self.pool.calls += 1
+        written = []
+        for chat_id, state, data, version in zip(chat_ids, states, datas, versions):
+            row = self.pool.rows.get(chat_id)
+            if row is not None and row['version'] != version:
+                continue
+            self.pool.rows[chat_id] = {'state': state, 'data': data, 'version': version + 1}
+            written.append({'chat_id': chat_id, 'version': version + 1})
+        return written
+
+
+class FakePool:
+    def __init__(self):
+        self.rows = {}
+        self.calls = 0
+
+    def acquire(self):
+        pool = self
+
+        class _Ctx:
+            async def __aenter__(self):
+                return FakeConn(pool)
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return _Ctx()
+
+
+async def _simulate(storage, pool):
+    """Типичный апдейт: 2 middleware читают state, хендлер читает/обновляет data и state."""
+    from aiogram.fsm.storage.base import StorageKey
+    from core.storage import fsm_snapshot_scope
+
+    for i in range(UPDATES):
+        key = StorageKey(bot_id=1, chat_id=i % CHATS, user_id=i % CHATS)
+        with fsm_snapshot_scope():  # FSMSnapshotMiddleware
+            await storage.get_state(key)   # FSMContextMiddleware
+            await storage.get_state(key)   # LoggingMiddleware
+            await storage.get_state(key)   # TracingMiddleware
+            await storage.get_data(key)
+            await storage.update_data(key, {'step': i})
+            await storage.set_state(key, f'state_{i % 3}')
+    await storage.close()
+    return pool.calls / UPDATES
+
+
+def _run(storage_cls, **kwargs):
+    import core.storage as storage_module
+
+    pool = FakePool()
+
+    async def _get_pool():
+        return pool
+
+    original = storage_module.get_pool
+    storage_module.get_pool = _get_pool
+    try:
+        storage = storage_cls(**kwargs)
+        per_update = asyncio.run(_simulate(storage, pool))
+    finally:
+        storage_module.get_pool = original
+    return per_update, pool, storage
+
+
+def test_fsm_cache_db_calls_per_update():
+    """Кэш снижает число обращений к БД на апдейт и сохраняет последние данные"""
+    try:
+        from core.storage import PostgresStorage, CachedPostgresStorage
+    except ImportError:
+        print("⏭️ FSM cache: пропущен (нет aiogram/asyncpg)")
+        return
+
+    base, base_pool, _ = _run(PostgresStorage)
+    cached, cached_pool, storage = _run(
+        CachedPostgresStorage, flush_interval_ms=50, listen=False,
+    )
+    print(f"\n📊 DB calls/update: PostgresStorage={base:.2f}, CachedPostgresStorage={cached:.3f}")
+    print(f"   cache stats: {storage.stats}")
+
+    assert base >= 3, base
+    assert cached < 0.2, cached
+
+    # Итоговое состояние в "БД" совпадает
+    for chat_id, row in base_pool.rows.items():
+        cached_row = cached_pool.rows[chat_id]
+        assert cached_row['state'] == row['state']
+        assert json.loads(cached_row['data']) == json.loads(row['data'])
+    print("✅ FSM cache: итоговые данные совпадают")
+
+
+def test_fsm_cache_version_conflict():
+    """Запись поверх чужой версии не применяется, запись кэша сбрасывается"""
+    try:
+        from aiogram.fsm.storage.base import StorageKey
+        import core.storage as storage_module
+    except ImportError:
+        print("⏭️ FSM cache conflict: пропущен (нет aiogram/asyncpg)")
+        return
+
+    pool = FakePool()
+
+    async def _get_pool():
+        return pool
+
+    async def _scenario():
+        storage = storage_module.CachedPostgresStorage(flush_interval_ms=1000, listen=False)
+        key = StorageKey(bot_id=1, chat_id=42, user_id=42)
+        await storage.set_state(key, 'ours')
+        await storage.flush()
+        # Другая реплика записала строку
+        pool.rows[42] = {'state': 'theirs', 'data': '{}', 'version': 5}
+        await storage.set_state(key, 'stale')
+        await storage.flush()
+        assert storage.stats['conflicts'] == 1
+        assert await storage.get_state(key) == 'theirs'
+        await storage.close()
+
+    original = storage_module.get_pool
+    storage_module.get_pool = _get_pool
+    try:
+        asyncio.run(_scenario())
+    finally:
+        storage_module.get_pool = original
+    print("✅ FSM cache: конфликт версий обработан")
+
+
+def test_snapshot_scoped_to_update():
+    """Снимок живёт только внутри fsm_snapshot_scope: вне его и в задачах после апдейта — чтение из БД"""
+    try:
+        from aiogram.fsm.storage.base import StorageKey
+        import core.storage as storage_module
+    except ImportError:
+        print("⏭️ FSM snapshot: пропущен (нет aiogram/asyncpg)")
+        return
+
+    pool = FakePool()
+    pool.rows[7] = {'state': 'a', 'data': '{}', 'version': 1}
+
+    async def _get_pool():
+        return pool
+
+    async def _scenario():
+        storage = storage_module.PostgresStorage()
+        key = StorageKey(bot_id=1, chat_id=7, user_id=7)
+
+        # Вне апдейта снимка нет — каждое чтение идёт в БД
+        await storage.get_state(key)
+        await storage.get_state(key)
+        assert pool.calls == 2
+
+        go = asyncio.Event()
+        seen = []
+
+        async def spawned():  # задача, порождённая хендлером, переживает апдейт
+            await go.wait()
+            seen.append(await storage.get_state(key))
+
+        with storage_module.fsm_snapshot_scope():
+            assert await storage.get_state(key) == 'a'
+            assert await storage.get_state(key) == 'a'
+            assert pool.calls == 3
+            task = asyncio.create_task(spawned())
+
+        pool.rows[7]['state'] = 'b'  # следующий апдейт сменил состояние
+        go.set()
+        await task
+        assert seen == ['b']
+
+    original = storage_module.get_pool
+    storage_module.get_pool = _get_pool
+    try:
+        asyncio.run(_scenario())
+    finally:
+        storage_module.get_pool = original
+    print("✅ FSM snapshot: только в рамках апдейта")
+
+
+if __name__ == "__main__":
+    test_fsm_cache_db_calls_per_update()
+    test_fsm_cache_version_conflict()
+    test_snapshot_scoped_to_update()
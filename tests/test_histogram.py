@@ -0,0 +1,103 @@
+"""
+Тест логарифмической гистограммы (helpers/histogram.py) и сборки отчёта
+латентности из часовых агрегатов + хвоста сырых трейсов (db/queries/rollups.py).
+
+Запуск: python -m pytest tests/test_histogram.py -v -s
+Или просто: python tests/test_histogram.py
+"""
+
+import sys
+import os
+import asyncio
+import random
+from datetime import datetime, timezone
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers.histogram import LogHistogram, bucket_index
+
+
+def test_percentile_error():
+    """p50/p95/p99 по гистограмме — в пределах 10% от точных"""
+    rnd = random.Random(42)
+    values = [rnd.lognormvariate(7, 1) for _ in range(20000)]  # ~1 с, длинный хвост
+    hist = LogHistogram()
+    for v in values:
+        hist.record(v)
+
+    values.sort()
+    for q in (0.5, 0.95, 0.99):
+        exact = values[int(q * len(values)) - 1]
+        approx = hist.percentile(q)
+        assert abs(approx - exact) / exact < 0.1, (q, exact, approx)
+    assert hist.count == 20000 and hist.max == values[-1]
+    print(f"✅ Histogram: p95={hist.percentile(0.95):.0f} мс (точно {values[int(0.95 * 20000) - 1]:.0f})")
+
+
+def test_merge_equals_combined():
+    """Сумма часовых гистограмм = гистограмма за весь период"""
+    rnd = random.Random(7)
+    combined = LogHistogram()
+    hours = []
+    for _ in range(24):
+        h = LogHistogram()
+        for _ in range(100):
+            v = rnd.uniform(0, 30000)
+            h.record(v)
+            combined.record(v)
+        hours.append(h)
+
+    merged = LogHistogram()
+    for h in hours:
+        merged.merge(h)
+    assert merged.counts == combined.counts
+    assert merged.percentile(0.95) == combined.percentile(0.95)
+    assert bucket_index(0.5) == 0 and bucket_index(10 ** 9) == len(merged.counts) - 1
+    print("✅ Histogram: 24 часовых корзины сливаются без потерь")
+
+
+def test_trace_stats_rollup_plus_tail():
+    """get_trace_stats: готовые часы из trace_rollups + сырые трейсы после границы"""
+    try:
+        from db.queries.rollups import get_trace_stats, summarize
+    except ImportError:
+        print("⏭️ Rollups: пропущен (нет зависимостей бота)")
+        return
+
+    now = datetime.now(timezone.utc)
+    watermark = now.replace(minute=0, second=0, microsecond=0)
+    rolled = LogHistogram()
+    for v in (100, 200, 300):
+        rolled.record(v)
+
+    class FakeConn:
+        async def fetchval(self, sql, *args):
+            return watermark
+
+        async def fetch(self, sql, *args):
+            if 'FROM trace_rollups' in sql:
+                return [dict(kind='command', name='/learn', count=3, total_ms=600.0, max_ms=300.0,
+                             red_count=0, slow_count=0, hist=rolled.counts)]
+            assert args[0] == watermark  # хвост — только после границы
+            if 'jsonb_array_elements' in sql:
+                return [dict(bucket=watermark, name='claude.generate', idx=bucket_index(9000),
+                             n=1, total=9000.0, max_ms=9000.0)]
+            if 'AS idx' in sql:
+                return [dict(bucket=watermark, name='/learn', idx=bucket_index(9000),
+                             n=1, total=9000.0, max_ms=9000.0)]
+            return [dict(bucket=watermark, name='/learn', total_ms=9000.0)]
+
+    stats = asyncio.run(get_trace_stats(FakeConn(), 24))
+    learn = stats[('command', '/learn')]
+    assert learn.hist.count == 4 and learn.hist.max == 9000.0
+    assert learn.red == 1 and learn.slow == 1  # /learn — тяжёлая, красная выше 8 с
+    assert stats[('span', 'claude.generate')].hist.count == 1
+    assert summarize(stats, 'command').hist.total == 9600.0
+    print("✅ Rollups: отчёт = часы из агрегатов + хвост трейсов")
+
+
+if __name__ == "__main__":
+    test_percentile_error()
+    test_merge_equals_combined()
+    test_trace_stats_rollup_plus_tail()
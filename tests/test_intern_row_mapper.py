@@ -0,0 +1,190 @@
+"""
+Микро-бенчмарк маппера строки interns → dict.
+
+Сравнивает компилируемый маппер (db/queries/users.py::_row_to_dict)
+с прежней реализацией на замыканиях safe_get/safe_json на 10k строк.
+
+Запуск: python -m pytest tests/test_intern_row_mapper.py -v -s
+Или просто: python tests/test_intern_row_mapper.py
+"""
+
+import sys
+import os
+import json
+import time
+from datetime import date
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ROWS = 10_000
+
+# Колонки interns в порядке SELECT * (+ лишние, которые маппер пропускает)
+COLUMNS = (
+    'chat_id', 'name', 'occupation', 'role', 'domain', 'interests', 'motivation', 'goals',
+    'experience_level', 'difficulty_preference', 'learning_style', 'study_duration',
+    'current_problems', 'desires', 'schedule_time', 'schedule_time_2', 'topic_order',
+    'mode', 'current_context', 'current_state', 'marathon_status', 'marathon_start_date',
+    'marathon_paused_at', 'current_topic_index', 'completed_topics', 'topics_today',
+    'last_topic_date', 'complexity_level', 'topics_at_current_complexity', 'bloom_level',
+    'topics_at_current_bloom', 'feed_status', 'feed_started_at', 'feed_schedule_time',
+    'active_days_total', 'active_days_streak', 'longest_streak', 'last_active_date',
+    'assessment_state', 'assessment_date', 'stats_reset_date', 'trial_started_at',
+    'dt_connected_at', 'created_at', 'updated_at', 'tg_username', 'onboarding_completed',
+    'language', 'conversion_stage', 'referral_source', 'notes_repo', 'timezone',
+    'tier_override', 'last_digest_at', 'last_feedback_at', 'pref_1', 'pref_2', 'pref_3',
+    'pref_4', 'pref_5',
+)
+
+
+class FakeRecord:
+    """Эмуляция asyncpg.Record: доступ по имени и индексу, keys()/values()."""
+
+    __slots__ = ('_values', '_index')
+
+    def __init__(self, values, index):
+        self._values = values
+        self._index = index
+
+    def keys(self):
+        return iter(COLUMNS)
+
+    def values(self):
+        return iter(self._values)
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return self._values[key]
+        return self._values[self._index[key]]
+
+    def __len__(self):
+        return len(self._values)
+
+
+def _legacy_row_to_dict(row) -> dict:
+    """Прежняя реализация (до компилируемого маппера) — эталон для сравнения"""
+    def safe_get(key, default=''):
+        return row[key] if key in row.keys() and row[key] is not None else default
+
+    def safe_json(key, default=None):
+        if default is None:
+            default = []
+        val = safe_get(key, '[]')
+        try:
+            return json.loads(val) if isinstance(val, str) else val
+        except:
+            return default
+
+    return {
+        'chat_id': row['chat_id'],
+        'name': safe_get('name', ''),
+        'occupation': safe_get('occupation', ''),
+        'role': safe_get('role', ''),
+        'domain': safe_get('domain', ''),
+        'interests': safe_json('interests', []),
+        'motivation': safe_get('motivation', ''),
+        'experience_level': safe_get('experience_level', ''),
+        'difficulty_preference': safe_get('difficulty_preference', ''),
+        'learning_style': safe_get('learning_style', ''),
+        'study_duration': safe_get('study_duration', 15),
+        'current_problems': safe_get('current_problems', ''),
+        'desires': safe_get('desires', ''),
+        'goals': safe_get('goals', ''),
+        'schedule_time': safe_get('schedule_time', '09:00'),
+        'schedule_time_2': safe_get('schedule_time_2', None),
+        'topic_order': safe_get('topic_order', 'default'),
+        'mode': safe_get('mode', 'marathon'),
+        'current_context': safe_json('current_context', {}),
+        'current_state': safe_get('current_state', None),
+        'marathon_status': safe_get('marathon_status', 'not_started'),
+        'marathon_start_date': safe_get('marathon_start_date', None),
+        'marathon_paused_at': safe_get('marathon_paused_at', None),
+        'current_topic_index': safe_get('current_topic_index', 0),
+        'completed_topics': safe_json('completed_topics', []),
+        'topics_today': safe_get('topics_today', 0),
+        'last_topic_date': safe_get('last_topic_date', None),
+        'complexity_level': safe_get('complexity_level', None) if safe_get('complexity_level', None) is not None else (safe_get('bloom_level', 1) or 1),
+        'topics_at_current_complexity': safe_get('topics_at_current_complexity', None) if safe_get('topics_at_current_complexity', None) is not None else (safe_get('topics_at_current_bloom', 0) or 0),
+        'bloom_level': safe_get('complexity_level', None) if safe_get('complexity_level', None) is not None else (safe_get('bloom_level', 1) or 1),
+        'topics_at_current_bloom': safe_get('topics_at_current_complexity', None) if safe_get('topics_at_current_complexity', None) is not None else (safe_get('topics_at_current_bloom', 0) or 0),
+        'feed_status': safe_get('feed_status', 'not_started'),
+        'feed_started_at': safe_get('feed_started_at', None),
+        'feed_schedule_time': safe_get('feed_schedule_time', None),
+        'active_days_total': safe_get('active_days_total', 0),
+        'active_days_streak': safe_get('active_days_streak', 0),
+        'longest_streak': safe_get('longest_streak', 0),
+        'last_active_date': safe_get('last_active_date', None),
+        'assessment_state': safe_get('assessment_state', None),
+        'assessment_date': safe_get('assessment_date', None),
+        'stats_reset_date': safe_get('stats_reset_date', None),
+        'trial_started_at': safe_get('trial_started_at', None),
+        'dt_connected_at': safe_get('dt_connected_at', None),
+        'created_at': safe_get('created_at', None),
+        'tg_username': safe_get('tg_username', None),
+        'onboarding_completed': safe_get('onboarding_completed', False),
+        'language': safe_get('language', 'ru'),
+    }
+
+
+def _make_rows(count: int) -> list:
+    index = {name: i for i, name in enumerate(COLUMNS)}
+    rows = []
+    for i in range(count):
+        values = {name: None for name in COLUMNS}
+        values.update({
+            'chat_id': 100_000 + i,
+            'name': f'User {i}',
+            'occupation': 'инженер',
+            'interests': json.dumps(['системы', 'управление', f'тема {i % 7}'], ensure_ascii=False),
+            'current_context': json.dumps({'topic': i % 50, 'step': 'theory'}),
+            'completed_topics': json.dumps(list(range(i % 30))),
+            'marathon_status': 'active',
+            'marathon_start_date': date(2026, 1, 1 + i % 28),
+            'current_topic_index': i % 30,
+            'complexity_level': None if i % 5 == 0 else 2,
+            'bloom_level': 3,
+            'topics_at_current_complexity': i % 4,
+            'active_days_total': i % 100,
+            'onboarding_completed': True,
+            'language': 'ru' if i % 3 else 'en',
+        })
+        # NULL и битый JSON: разбор должен совпадать с прежним safe_json
+        if i % 11 == 0:
+            values['current_context'] = None
+        if i % 13 == 0:
+            values['interests'] = '{not json'
+        rows.append(FakeRecord(tuple(values[name] for name in COLUMNS), index))
+    return rows
+
+
+def test_row_mapper_matches_legacy_and_is_faster():
+    """Новый маппер даёт тот же dict, что и прежний, и работает быстрее"""
+    try:
+        from db.queries.users import _row_to_dict
+    except ImportError:
+        print("⏭️ Row mapper: пропущен (нет asyncpg)")
+        return
+
+    rows = _make_rows(ROWS)
+
+    for row in rows[:200]:
+        assert _row_to_dict(row) == _legacy_row_to_dict(row)
+
+    start = time.perf_counter()
+    for row in rows:
+        _legacy_row_to_dict(row)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for row in rows:
+        _row_to_dict(row)
+    compiled_time = time.perf_counter() - start
+
+    print(f"\n📊 {ROWS} rows: legacy={legacy_time * 1000:.1f}ms, "
+          f"compiled={compiled_time * 1000:.1f}ms, "
+          f"x{legacy_time / compiled_time:.1f}")
+    assert compiled_time < legacy_time
+
+
+if __name__ == "__main__":
+    test_row_mapper_matches_legacy_and_is_faster()
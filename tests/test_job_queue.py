@@ -0,0 +1,129 @@
+"""
+Тест worker'а очереди задач (core/job_queue.py) на очереди в памяти:
+параллельность не выше concurrency, повтор с backoff после ошибки,
+повтор «самого себя» из обработчика без новой задачи, отказ после max_attempts.
+
+Запуск: python -m pytest tests/test_job_queue.py -v -s
+Или просто: python tests/test_job_queue.py
+"""
+
+import sys
+import os
+import asyncio
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class MemoryQueue:
+    """Подмена db.queries.jobs: та же семантика статусов, без Postgres."""
+
+    def __init__(self):
+        self.jobs = {}
+        self.retries = []
+
+    def add(self, kind, chat_id, topic_index=None, priority=0, max_attempts=3):
+        job_id = len(self.jobs) + 1
+        self.jobs[job_id] = dict(
+            id=job_id, kind=kind, chat_id=chat_id, topic_index=topic_index,
+            priority=priority, attempts=0, max_attempts=max_attempts, status='pending',
+        )
+
+    async def claim_jobs(self, worker_id, kinds, limit):
+        ready = [j for j in self.jobs.values() if j['status'] == 'pending' and j['kind'] in kinds]
+        ready.sort(key=lambda j: (j['priority'], j['id']))
+        claimed = []
+        for job in ready[:limit]:
+            job['status'] = 'running'
+            job['attempts'] += 1
+            claimed.append({k: v for k, v in job.items() if k != 'status'})
+        return claimed
+
+    async def complete_job(self, job_id):
+        self.jobs[job_id]['status'] = 'done'
+
+    async def fail_job(self, job_id, error, retry_in_sec):
+        job = self.jobs[job_id]
+        job['status'] = 'failed' if job['attempts'] >= job['max_attempts'] else 'pending'
+        self.retries.append((job['kind'], retry_in_sec))
+        return job['status']
+
+    async def requeue_stale_jobs(self, minutes):
+        return 0
+
+    async def release_jobs(self, job_ids):
+        pass
+
+
+def test_worker_retries_and_concurrency():
+    """Ошибка → повтор с backoff ×2; retry_current_job → повтор; лимит параллельности"""
+    try:
+        import core.job_queue as job_queue
+        import db.queries.jobs as queries
+        from clients.claude import Priority
+    except ImportError:
+        print("⏭️ Job queue: пропущен (нет зависимостей бота)")
+        return
+
+    memory = MemoryQueue()
+    originals = {name: getattr(queries, name) for name in (
+        'claim_jobs', 'complete_job', 'fail_job', 'requeue_stale_jobs', 'release_jobs')}
+    handlers = dict(job_queue._handlers)
+    calls = {'flaky': 0, 'self_retry': 0}
+    running = {'now': 0, 'max': 0}
+
+    async def slow(chat_id, topic_index):
+        running['now'] += 1
+        running['max'] = max(running['max'], running['now'])
+        await asyncio.sleep(0.02)
+        running['now'] -= 1
+
+    async def flaky(chat_id, topic_index):
+        calls['flaky'] += 1
+        if calls['flaky'] == 1:
+            raise RuntimeError("Claude API 529")
+
+    async def self_retry(chat_id, topic_index):
+        calls['self_retry'] += 1
+        # Код доставки сам ловит ошибку и «ставит повтор» — это та же задача
+        assert await job_queue.enqueue('self_retry', chat_id) is False
+
+    async def run():
+        job_queue.register_job_handler('slow', slow, priority=Priority.PREGEN)
+        job_queue.register_job_handler('flaky', flaky, backoff_sec=0, max_attempts=3)
+        job_queue.register_job_handler('self_retry', self_retry, backoff_sec=0, max_attempts=2)
+        for chat_id in range(6):
+            memory.add('slow', chat_id, topic_index=chat_id)
+        memory.add('flaky', 100)
+        memory.add('self_retry', 200, max_attempts=2)
+
+        worker = job_queue.JobWorker(concurrency=3, poll_interval=0.01)
+        worker.start()
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if all(j['status'] in ('done', 'failed') for j in memory.jobs.values()):
+                break
+        await worker.stop()
+        return worker
+
+    for name in originals:
+        setattr(queries, name, getattr(memory, name))
+    try:
+        worker = asyncio.run(run())
+    finally:
+        for name, fn in originals.items():
+            setattr(queries, name, fn)
+        job_queue._handlers.clear()
+        job_queue._handlers.update(handlers)
+
+    statuses = {j['kind']: j['status'] for j in memory.jobs.values()}
+    assert running['max'] <= 3
+    assert statuses == {'slow': 'done', 'flaky': 'done', 'self_retry': 'failed'}
+    assert calls == {'flaky': 2, 'self_retry': 2}
+    assert ('flaky', 0) in memory.retries
+    assert worker.completed == 7 and worker.failed == 3
+    print(f"✅ Job queue: {worker.completed} выполнено, {worker.failed} неудач, макс. параллельно {running['max']}")
+
+
+if __name__ == "__main__":
+    test_worker_retries_and_concurrency()
@@ -0,0 +1,71 @@
+"""
+Тест учёта вызовов Claude API: usage из SSE-событий, TTFT в span,
+пакетная выгрузка строк llm_usage (core/llm_usage.py).
+
+Запуск: python -m pytest tests/test_llm_usage.py -v -s
+Или просто: python tests/test_llm_usage.py
+"""
+
+import sys
+import os
+import asyncio
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_usage_recorded_to_span_and_queue():
+    """message_start + message_delta → токены в span, одна строка в очереди"""
+    try:
+        from clients.claude import ClaudeClient, _collect_usage
+        import core.llm_usage as llm_usage
+    except ImportError:
+        print("⏭️ LLM usage: пропущен (нет зависимостей бота)")
+        return
+
+    usage = {}
+    _collect_usage({"type": "message_start", "message": {"usage": {
+        "input_tokens": 120, "cache_read_input_tokens": 2000, "output_tokens": 1,
+    }}}, usage)
+    _collect_usage({"type": "message_delta", "usage": {"output_tokens": 350}}, usage)
+    usage.update(ttft_ms=640.0, duration_ms=4200.0)
+
+    async def run():
+        recorder = llm_usage.LLMUsageRecorder()
+        written = []
+        llm_usage._recorder = recorder
+        try:
+            metadata = {}
+            ClaudeClient._record_usage(usage, metadata, "claude-sonnet", "content", "ru")
+            # Вызов без ответа API (followers singleflight, ошибки) не пишется
+            ClaudeClient._record_usage({"duration_ms": 10.0}, {}, "claude-sonnet", "content", "ru")
+
+            import db.queries.llm_usage as queries
+            original = queries.insert_llm_usage
+
+            async def fake_insert(rows):
+                written.extend(rows)
+            queries.insert_llm_usage = fake_insert
+            try:
+                await recorder.flush()
+            finally:
+                queries.insert_llm_usage = original
+        finally:
+            llm_usage._recorder = None
+        return metadata, written
+
+    metadata, written = asyncio.run(run())
+
+    assert metadata["input_tokens"] == 120
+    assert metadata["output_tokens"] == 350
+    assert metadata["cache_read_input_tokens"] == 2000
+    assert metadata["ttft_ms"] == 640.0
+    assert len(written) == 1
+    feature, model, lang, _user, inp, out, cache_read, cache_write, ttft, duration, _ts = written[0]
+    assert (feature, model, lang) == ("content", "claude-sonnet", "ru")
+    assert (inp, out, cache_read, cache_write, ttft, duration) == (120, 350, 2000, 0, 640.0, 4200.0)
+    print("✅ LLM usage: span + одна строка llm_usage")
+
+
+if __name__ == "__main__":
+    test_usage_recorded_to_span_and_queue()
@@ -0,0 +1,134 @@
+"""
+Тест кэша MCPClient.search() (clients/mcp.py): повторный запрос в пределах
+MCP_CACHE_TTL_SEC отдаётся из памяти, после TTL идёт снова на сервер,
+одновременные одинаковые запросы склеиваются в один вызов сервера.
+
+Запуск: python -m pytest tests/test_mcp_search_cache.py -v -s
+Или просто: python tests/test_mcp_search_cache.py
+"""
+
+import sys
+import os
+import json
+import asyncio
+from types import SimpleNamespace
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TTL = 60
+
+
+class FakeServer:
+    """MCP сервер: считает вызовы search, отвечает не сразу."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def call(self, tool_name, arguments):
+        assert tool_name == "search"
+        self.calls += 1
+        for _ in range(3):
+            await asyncio.sleep(0)  # ответ в полёте — остальные запросы успевают прийти
+        results = [{"filename": "ds.md", "content": arguments["query"], "score": 0.9}]
+        return {"content": [{"type": "text", "text": json.dumps(results, ensure_ascii=False)}]}
+
+
+def _run_with_cache(scenario):
+    """scenario(client, server, clock) в изолированном кэше с ручными часами."""
+    import helpers.ttl_cache as ttl_cache_module
+    from helpers.ttl_cache import TTLCache
+    from helpers.singleflight import SingleFlight
+    from clients.mcp import MCPClient
+    mcp_module = sys.modules[MCPClient.__module__]
+
+    server = FakeServer()
+    clock = [1000.0]
+    patches = [
+        (mcp_module, "get_snapshot", lambda: None),
+        (mcp_module, "MCP_CACHE_TTL_SEC", TTL),
+        (mcp_module, "MCP_CACHE_PERSIST_DAYS", 0),
+        (ttl_cache_module, "time", SimpleNamespace(monotonic=lambda: clock[0])),
+        (MCPClient, "_search_cache", TTLCache(maxsize=100, ttl=TTL)),
+        (MCPClient, "_search_flight", SingleFlight()),
+        (MCPClient, "_call", server.call),
+    ]
+    originals = [(obj, name, getattr(obj, name)) for obj, name, _ in patches]
+    try:
+        for obj, name, value in patches:
+            setattr(obj, name, value)
+        client = MCPClient("http://knowledge.test/mcp", name="Test")
+        return asyncio.run(scenario(client, server, clock))
+    finally:
+        for obj, name, value in originals:
+            setattr(obj, name, value)
+
+
+def test_search_cache_hit_within_ttl():
+    """Повтор в пределах TTL — из кэша; результат — копия, мутация не портит кэш"""
+    try:
+        import clients.mcp  # noqa: F401
+    except ImportError:
+        print("⏭️ MCP search cache: пропущен (нет зависимостей бота)")
+        return
+
+    async def scenario(client, server, clock):
+        first = await client.search("Системное мышление", limit=3)
+        first[0]["content"] = "изменено вызывающим кодом"
+        clock[0] += TTL - 1
+        second = await client.search("  системное   МЫШЛЕНИЕ ", limit=3)
+        return server.calls, second
+
+    calls, second = _run_with_cache(scenario)
+    assert calls == 1
+    assert second[0]["content"] == "Системное мышление"
+    print("✅ MCP search cache: повтор в пределах TTL не ходит на сервер")
+
+
+def test_search_cache_expires_after_ttl():
+    """После TTL запись устаревает — запрос снова идёт на сервер"""
+    try:
+        import clients.mcp  # noqa: F401
+    except ImportError:
+        print("⏭️ MCP search cache: пропущен (нет зависимостей бота)")
+        return
+
+    async def scenario(client, server, clock):
+        await client.search("Роли", limit=3)
+        clock[0] += TTL + 1
+        await client.search("Роли", limit=3)
+        after_expiry = server.calls
+        await client.search("Роли", limit=3)
+        return after_expiry, server.calls
+
+    after_expiry, total = _run_with_cache(scenario)
+    assert after_expiry == 2
+    assert total == 2  # обновлённая запись снова живёт TTL
+    print("✅ MCP search cache: устаревшая запись перезапрашивается")
+
+
+def test_concurrent_identical_searches_coalesced():
+    """Одновременные одинаковые запросы — один вызов сервера, у всех один результат"""
+    try:
+        import clients.mcp  # noqa: F401
+    except ImportError:
+        print("⏭️ MCP search cache: пропущен (нет зависимостей бота)")
+        return
+
+    async def scenario(client, server, clock):
+        results = await asyncio.gather(*[client.search("Агентность", limit=5) for _ in range(10)])
+        other = await client.search("Агентность", limit=3)  # другой limit — другой ключ
+        return server.calls, results, other
+
+    calls, results, other = _run_with_cache(scenario)
+    assert calls == 2
+    assert all(r == results[0] for r in results)
+    assert results[0][0]["content"] == "Агентность"
+    assert other == results[0]
+    print("✅ MCP search cache: 10 одновременных запросов → 1 вызов сервера")
+
+
+if __name__ == "__main__":
+    test_search_cache_hit_within_ttl()
+    test_search_cache_expires_after_ttl()
+    test_concurrent_identical_searches_coalesced()
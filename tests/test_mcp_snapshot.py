@@ -0,0 +1,179 @@
+"""
+Тест офлайн-снапшота Knowledge MCP (clients/mcp_snapshot.py): сборка снапшота,
+ответы MCPClient.search() из него без сети, и откат к серверу, если снапшота
+нет или он устарел.
+
+Запуск: python -m pytest tests/test_mcp_snapshot.py -v -s
+Или просто: python tests/test_mcp_snapshot.py
+"""
+
+import sys
+import os
+import json
+import asyncio
+import tempfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SERVER = "http://knowledge.test/mcp"
+
+QUERIES = [
+    {"query": "Системное мышление", "limit": 3, "source": None, "source_type": None},
+    {"query": "Роли и методы", "limit": 4, "source": None, "source_type": "guides"},
+]
+
+
+class FakeKnowledge:
+    """MCP для сборки: ответ по каждому запросу, один запрос — с ошибкой."""
+
+    base_url = SERVER
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+
+    async def _search_remote(self, args):
+        if args["query"] in self.failing:
+            return [], False
+        return [{"filename": "ds.md", "content": f"снапшот: {args['query']}"}], True
+
+
+def _run_with_snapshot(path: Path, scenario):
+    """scenario() с KNOWLEDGE_SNAPSHOT_PATH=path и сброшенным состоянием загрузчика."""
+    import clients.mcp_snapshot as snapshot_module
+    from clients.mcp import MCPClient
+
+    server_calls = []
+
+    async def fake_call(self, tool_name, arguments):
+        server_calls.append(arguments["query"])
+        results = [{"filename": "live.md", "content": f"сервер: {arguments['query']}"}]
+        return {"content": [{"type": "text", "text": json.dumps(results, ensure_ascii=False)}]}
+
+    patches = [
+        (snapshot_module, "KNOWLEDGE_SNAPSHOT_PATH", path),
+        (snapshot_module, "collect_queries", lambda: [dict(q) for q in QUERIES]),
+        (snapshot_module, "_snapshot", None),
+        (snapshot_module, "_loaded_mtime", None),
+        (snapshot_module, "_checked_at", None),
+        (snapshot_module, "_stale_logged", False),
+        (MCPClient, "_call", fake_call),
+    ]
+    originals = [(obj, name, getattr(obj, name)) for obj, name, _ in patches]
+    try:
+        for obj, name, value in patches:
+            setattr(obj, name, value)
+        return scenario(snapshot_module, MCPClient, server_calls)
+    finally:
+        if snapshot_module._snapshot is not None:
+            snapshot_module._snapshot.close()
+        for obj, name, value in originals:
+            setattr(obj, name, value)
+
+
+def _reload(snapshot_module):
+    """Следующий get_snapshot() перечитает индекс, не дожидаясь RELOAD_INTERVAL."""
+    snapshot_module._checked_at = None
+    snapshot_module._loaded_mtime = None
+
+
+def test_build_snapshot_and_lookup():
+    """Сборка пишет JSONL + индекс; lookup по нормализованному ключу, без упавших запросов"""
+    try:
+        import clients.mcp  # noqa: F401
+    except ImportError:
+        print("⏭️ MCP snapshot: пропущен (нет зависимостей бота)")
+        return
+
+    def scenario(snapshot_module, MCPClient, server_calls):
+        path = snapshot_module.KNOWLEDGE_SNAPSHOT_PATH
+        client = FakeKnowledge(failing={"Роли и методы"})
+        report = asyncio.run(snapshot_module.build_snapshot(path, client=client))
+        assert report == {"queries": 2, "stored": 1, "failed": ["Роли и методы"]}
+        assert path.exists() and not path.with_name(path.name + ".tmp").exists()
+
+        snapshot = snapshot_module.KnowledgeSnapshot(path)
+        try:
+            assert snapshot.server == SERVER and snapshot.is_fresh() and len(snapshot) == 1
+            key = snapshot_module.snapshot_key("  системное МЫШЛЕНИЕ ", 3)
+            assert snapshot.lookup(key) == [{"filename": "ds.md", "content": "снапшот: Системное мышление"}]
+            assert snapshot.lookup(snapshot_module.snapshot_key("Системное мышление", 5)) is None
+            assert snapshot.lookup(snapshot_module.snapshot_key("Роли и методы", 4, None, "guides")) is None
+        finally:
+            snapshot.close()
+
+        # Ни одного ответа — прежний снапшот не трогаем
+        report = asyncio.run(snapshot_module.build_snapshot(
+            path, client=FakeKnowledge(failing={q["query"] for q in QUERIES}),
+        ))
+        assert report["stored"] == 0
+        snapshot = snapshot_module.KnowledgeSnapshot(path)
+        try:
+            assert len(snapshot) == 1
+        finally:
+            snapshot.close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _run_with_snapshot(Path(tmp) / "knowledge_snapshot.jsonl", scenario)
+    print("✅ MCP snapshot: сборка и lookup по нормализованному ключу")
+
+
+def test_search_served_from_snapshot_with_fallback():
+    """search() отвечает из свежего снапшота; нет / устарел / другой сервер — идёт в MCP"""
+    try:
+        import clients.mcp  # noqa: F401
+    except ImportError:
+        print("⏭️ MCP snapshot: пропущен (нет зависимостей бота)")
+        return
+
+    def scenario(snapshot_module, MCPClient, server_calls):
+        path = snapshot_module.KNOWLEDGE_SNAPSHOT_PATH
+        client = MCPClient(SERVER, name="Test")
+
+        def search(*args, **kwargs):
+            return asyncio.run(client.search(*args, **kwargs))
+
+        # Кэш выключен — видно каждое обращение к серверу
+        mcp_module = sys.modules[MCPClient.__module__]
+        ttl = mcp_module.MCP_CACHE_TTL_SEC
+        mcp_module.MCP_CACHE_TTL_SEC = 0
+        try:
+            # Снапшота нет
+            assert snapshot_module.get_snapshot() is None
+            assert search("Системное мышление", limit=3)[0]["filename"] == "live.md"
+            assert server_calls == ["Системное мышление"]
+
+            # Свежий снапшот: ответ без сети, промах снапшота — в сервер
+            asyncio.run(snapshot_module.build_snapshot(path, client=FakeKnowledge()))
+            _reload(snapshot_module)
+            assert search("Системное мышление", limit=3)[0]["filename"] == "ds.md"
+            assert search("Роли и методы", limit=4, source_type="guides")[0]["filename"] == "ds.md"
+            assert search("Другая тема", limit=3)[0]["filename"] == "live.md"
+            assert server_calls == ["Системное мышление", "Другая тема"]
+
+            # Снапшот другого сервера не используется
+            other = MCPClient("http://other.test/mcp", name="Other")
+            assert asyncio.run(other.search("Системное мышление", limit=3))[0]["filename"] == "live.md"
+
+            # Устаревший снапшот не используется
+            index_path = path.with_name(path.name + snapshot_module.INDEX_SUFFIX)
+            index = json.loads(index_path.read_text(encoding="utf-8"))
+            index["built_at"] = (datetime.now(timezone.utc) - timedelta(days=365)).isoformat()
+            index_path.write_text(json.dumps(index, ensure_ascii=False), encoding="utf-8")
+            _reload(snapshot_module)
+            assert snapshot_module.get_snapshot() is None
+            assert search("Системное мышление", limit=3)[0]["filename"] == "live.md"
+            assert server_calls[-1] == "Системное мышление" and len(server_calls) == 4
+        finally:
+            mcp_module.MCP_CACHE_TTL_SEC = ttl
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _run_with_snapshot(Path(tmp) / "knowledge_snapshot.jsonl", scenario)
+    print("✅ MCP snapshot: поиск из снапшота, откат к MCP без свежего снапшота")
+
+
+if __name__ == "__main__":
+    test_build_snapshot_and_lookup()
+    test_search_served_from_snapshot_with_fallback()
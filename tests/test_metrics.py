@@ -0,0 +1,106 @@
+"""
+Тест метрик процесса (core/metrics.py): гистограммы span в формате Prometheus,
+ограничение числа серий, отказ одного источника не ломает /metrics.
+
+Запуск: python -m pytest tests/test_metrics.py -v -s
+Или просто: python tests/test_metrics.py
+"""
+
+import sys
+import os
+import asyncio
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _parse(text: str) -> dict:
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_span_histogram_exposition():
+    """Накопительные корзины le=2^k, _sum и _count по span"""
+    try:
+        import core.metrics as metrics
+    except ImportError:
+        print("⏭️ Metrics: пропущен (нет зависимостей бота)")
+        return
+
+    metrics._spans.clear()
+    for ms in (3, 50, 50, 700, 9000):
+        metrics.observe("claude.api", ms)
+
+    def broken(out):
+        raise RuntimeError("source unavailable")
+
+    original = metrics._collect_caches
+    metrics._collect_caches = broken
+    try:
+        samples = _parse(metrics.render_metrics())
+    finally:
+        metrics._collect_caches = original
+        metrics._spans.clear()
+
+    bucket = 'aist_span_duration_ms_bucket{span="claude.api",le="%s"}'
+    assert samples[bucket % 4] == 1
+    assert samples[bucket % 64] == 3
+    assert samples[bucket % 1024] == 4
+    assert samples[bucket % 8192] == 4 and samples[bucket % 16384] == 5
+    assert samples[bucket % '+Inf'] == 5
+    assert samples['aist_span_duration_ms_count{span="claude.api"}'] == 5
+    assert samples['aist_span_duration_ms_sum{span="claude.api"}'] == 9803
+    print(f"✅ Metrics: {len(samples)} сэмплов, гистограмма claude.api корректна")
+
+
+def test_series_limit():
+    """Имена span сверх METRICS_MAX_SERIES сливаются в 'other'"""
+    try:
+        import core.metrics as metrics
+    except ImportError:
+        print("⏭️ Metrics: пропущен (нет зависимостей бота)")
+        return
+
+    metrics._spans.clear()
+    try:
+        for i in range(metrics.METRICS_MAX_SERIES + 50):
+            metrics.observe(f"span.{i}", 1)
+        assert len(metrics._spans) == metrics.METRICS_MAX_SERIES + 1
+        assert metrics._spans['other'].count == 50
+    finally:
+        metrics._spans.clear()
+    print("✅ Metrics: число серий ограничено")
+
+
+def test_metrics_endpoint_denied_without_token():
+    """Без METRICS_TOKEN /metrics не отдаётся, с токеном — только с Bearer"""
+    try:
+        import oauth_server
+    except ImportError:
+        print("⏭️ Metrics endpoint: пропущен (нет aiohttp)")
+        return
+
+    class FakeRequest:
+        def __init__(self, auth=None):
+            self.headers = {"Authorization": auth} if auth else {}
+
+    original = oauth_server.METRICS_TOKEN
+    try:
+        oauth_server.METRICS_TOKEN = ""
+        assert asyncio.run(oauth_server.metrics_handler(FakeRequest("Bearer "))).status == 404
+        oauth_server.METRICS_TOKEN = "secret"
+        assert asyncio.run(oauth_server.metrics_handler(FakeRequest())).status == 401
+        assert asyncio.run(oauth_server.metrics_handler(FakeRequest("Bearer secret"))).status == 200
+    finally:
+        oauth_server.METRICS_TOKEN = original
+    print("✅ Metrics: без токена эндпоинт закрыт")
+
+
+if __name__ == "__main__":
+    test_span_histogram_exposition()
+    test_series_limit()
+    test_metrics_endpoint_denied_without_token()
@@ -0,0 +1,97 @@
+"""
+Тест планировщика пре-генерации (core/pregen_planner.py):
+пик популярного слота растягивается по окну с обычным темпом,
+при нехватке времени темп поднимается ровно до достаточного.
+
+Запуск: python -m pytest tests/test_pregen_planner.py -v -s
+Или просто: python tests/test_pregen_planner.py
+"""
+
+import sys
+import os
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+NOW = datetime(2026, 3, 2, 6, 0, 30, tzinfo=timezone(timedelta(hours=3)))
+
+
+def test_required_rate():
+    """Обычный темп, пока успеваем; иначе — минимально достаточный"""
+    try:
+        from core.pregen_planner import required_rate
+    except ImportError:
+        print("⏭️ PreGen planner: пропущен (нет зависимостей бота)")
+        return
+
+    slot_9 = NOW.replace(hour=9, minute=0, second=0)
+    # 300 задач к 09:00, запас 20 мин: 160 минут хватает с темпом 10/мин
+    assert required_rate(NOW, [(slot_9, 300)], target_per_min=10, safety_min=20) == 10
+
+    # Ещё 200 задач к 06:30 — их надо успеть до 06:10
+    slot_630 = NOW.replace(hour=6, minute=30, second=0)
+    rate = required_rate(NOW, [(slot_9, 300), (slot_630, 200)], target_per_min=10, safety_min=20)
+    assert 21 < rate < 21.1  # 200 задач за 9.5 минут
+    print(f"✅ PreGen planner: темп {rate:.1f}/мин при тесном сроке")
+
+
+def test_spike_spread_across_window():
+    """Слот 09:00 на 300 человек → задачи с 06:00 ровно по 10/мин, прогноз до слота"""
+    try:
+        import core.pregen_planner as planner_mod
+        import core.job_queue as job_queue
+        import db.queries.jobs as jobs_queries
+        import db.queries.users as users_queries
+    except ImportError:
+        print("⏭️ PreGen planner: пропущен (нет зависимостей бота)")
+        return
+
+    slot_9 = NOW.replace(hour=9, minute=0, second=0, microsecond=0)
+    queued = {}
+
+    async def fake_load(slots):
+        return {"09:00": 300} if "09:00" in slots else {}
+
+    async def fake_collect(self, slots):
+        keys = [(chat_id, 5) for chat_id in range(300)]
+        return keys, [slot_9] * len(keys)
+
+    async def fake_backlog(kind):
+        return {'tail': None, 'by_deadline': []}
+
+    async def fake_enqueue_many(kind, keys, run_at=None, deadline=None):
+        queued.update(kind=kind, keys=keys, run_at=run_at, deadline=deadline)
+        return len(keys)
+
+    patches = [
+        (users_queries, 'get_marathon_slot_load', fake_load),
+        (planner_mod.PregenPlanner, '_collect', fake_collect),
+        (jobs_queries, 'get_pending_backlog', fake_backlog),
+        (job_queue, 'enqueue_many', fake_enqueue_many),
+    ]
+    originals = [(obj, name, getattr(obj, name)) for obj, name, _ in patches]
+    for obj, name, fn in patches:
+        setattr(obj, name, fn)
+    try:
+        planner = planner_mod.PregenPlanner(lead_hours=3)
+        added = asyncio.run(planner.run(NOW))
+        again = asyncio.run(planner.run(NOW + timedelta(seconds=20)))  # та же минута
+    finally:
+        for obj, name, fn in originals:
+            setattr(obj, name, fn)
+
+    run_at = queued['run_at']
+    assert added == 300 and again == 0
+    assert run_at[0] == NOW
+    spread = (run_at[-1] - run_at[0]).total_seconds() / 60
+    assert 29 < spread < 30  # 300 задач по 10/мин, а не все в одну минуту
+    projection = planner.projections[slot_9]
+    assert projection['projected_done'] < slot_9 - timedelta(minutes=20)
+    print(f"✅ PreGen planner: 300 задач за {spread:.0f} мин, прогноз {projection['projected_done']:%H:%M}")
+
+
+if __name__ == "__main__":
+    test_required_rate()
+    test_spike_spread_across_window()
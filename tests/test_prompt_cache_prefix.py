@@ -0,0 +1,88 @@
+"""
+Тест кэшируемого префикса system prompt консультации (config/prompts/t*.md):
+всё до {cache_break} одинаково для разных пользователей и запросов,
+контекст запроса (L1, уточнение, ЦД, рекомендация) — после него.
+
+Запуск: python -m pytest tests/test_prompt_cache_prefix.py -v -s
+Или просто: python tests/test_prompt_cache_prefix.py
+"""
+
+import sys
+import os
+import asyncio
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BOT_CONTEXT = "Бот Aist: марафон, лента, консультации."
+
+REQUESTS = (
+    dict(
+        intern={'chat_id': 1, 'name': 'Анна', 'occupation': 'инженер', 'language': 'ru'},
+        context_topic='Системное мышление',
+        request_context="L1: расписание марафона\n\nПЕРСОНАЛЬНАЯ РЕКОМЕНДАЦИЯ: программа «ЛР»",
+        personal_claude_md="Цели Анны",
+    ),
+    dict(
+        intern={'chat_id': 2, 'name': 'Борис', 'occupation': '', 'language': 'ru'},
+        context_topic=None,
+        request_context="ПРЕДЫДУЩИЙ ОТВЕТ (пользователь хочет подробнее):\nО ролях...",
+        personal_claude_md="",
+    ),
+)
+
+
+async def _build_system(tier: int, intern: dict, context_topic, request_context: str, personal_claude_md: str):
+    """Сборка промпта как в handle_question_with_tools (без вызова Claude)."""
+    from engines.shared.context_pipeline import assemble_context
+    from engines.shared.consultation_tools import load_tier_prompt, fill_tier_prompt, to_cached_system
+    from engines.shared.question_handler import ONTOLOGY_RULES
+
+    sections = await assemble_context(
+        tier=tier,
+        intern=intern,
+        lang='ru',
+        bot_context=BOT_CONTEXT,
+        personal_claude_md=personal_claude_md,
+        request_context=request_context,
+    )
+    prompt = fill_tier_prompt(
+        load_tier_prompt(tier),
+        name=intern['name'],
+        occupation_info=f"\nПрофессия/занятие пользователя: {intern['occupation']}" if intern['occupation'] else "",
+        context_info=f"\nТекущая тема изучения: {context_topic}" if context_topic else "",
+        lang_instruction="ВАЖНО: Отвечай на русском языке.",
+        lang_reminder="НАПОМИНАНИЕ: Весь ответ должен быть на РУССКОМ языке!",
+        ontology_rules=ONTOLOGY_RULES,
+        **sections,
+    )
+    return to_cached_system(prompt)
+
+
+def test_cached_block_identical_across_requests():
+    """Кэшируемый блок байт-в-байт совпадает у разных пользователей и запросов"""
+    try:
+        import engines.shared.question_handler  # noqa: F401
+    except ImportError:
+        print("⏭️ Prompt cache: пропущен (нет зависимостей бота)")
+        return
+
+    for tier in (1, 2, 3):
+        systems = [asyncio.run(_build_system(tier, **req)) for req in REQUESTS]
+        for system in systems:
+            assert isinstance(system, list) and len(system) == 2
+            assert 'cache_control' in system[0]
+        cached = [s[0]['text'].encode('utf-8') for s in systems]
+        assert cached[0] == cached[1], f"T{tier}: кэшируемый префикс зависит от запроса"
+        assert BOT_CONTEXT in systems[0][0]['text']
+
+        # Контекст запроса — только в некэшируемом хвосте
+        for req, system in zip(REQUESTS, systems):
+            first_line = req['request_context'].splitlines()[0]
+            assert first_line not in system[0]['text']
+            assert first_line in system[1]['text']
+    print("✅ Prompt cache: префикс T1–T3 не зависит от пользователя и запроса")
+
+
+if __name__ == "__main__":
+    test_cached_block_identical_across_requests()
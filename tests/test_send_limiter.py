@@ -0,0 +1,74 @@
+"""
+Тест ограничителя отправки в Telegram (helpers/send_limiter.py):
+лимит на чат, общий темп, приоритет ответов над рассылкой, пауза по RetryAfter.
+
+Запуск: python -m pytest tests/test_send_limiter.py -v -s
+Или просто: python tests/test_send_limiter.py
+"""
+
+import sys
+import os
+import asyncio
+import time
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers.send_limiter import BROADCAST, INTERACTIVE, SendLimiter
+
+
+def test_chat_and_global_rate():
+    """3 сообщения в один чат при 10/сек без запаса → не быстрее 0.2 с"""
+    limiter = SendLimiter(global_rate=100, chat_rate=10, chat_burst=1)
+
+    async def run():
+        start = time.monotonic()
+        for _ in range(3):
+            await limiter.acquire(42)
+        return time.monotonic() - start
+
+    elapsed = asyncio.run(run())
+    assert elapsed >= 0.19
+    print(f"✅ Send limiter: 3 сообщения в чат за {elapsed:.2f} с")
+
+
+def test_interactive_before_broadcast():
+    """Рассылка на 20 чатов при 20/сек не задерживает ответ пользователю"""
+    limiter = SendLimiter(global_rate=20, broadcast_reserve=5)
+
+    async def run():
+        start = time.monotonic()
+        broadcast = [asyncio.create_task(limiter.acquire(chat_id, BROADCAST)) for chat_id in range(20)]
+        await asyncio.sleep(0.01)
+        reply_wait = await limiter.acquire(1000, INTERACTIVE)
+        await asyncio.gather(*broadcast)
+        return reply_wait, time.monotonic() - start
+
+    reply_wait, total = asyncio.run(run())
+    assert reply_wait < 0.05
+    assert total >= 0.25  # 15 сразу (5 токенов — резерв), остальные по 1/20 с
+    assert limiter.stats()['sent'] == [1, 20]
+    print(f"✅ Send limiter: ответ за {reply_wait * 1000:.0f} мс, рассылка за {total:.2f} с")
+
+
+def test_retry_after_pauses_broadcast():
+    """RetryAfter на рассылке ставит на паузу рассылки, но не ответы"""
+    limiter = SendLimiter(global_rate=100)
+
+    async def run():
+        limiter.pause(1, 0.1, BROADCAST)
+        reply_wait = await limiter.acquire(2, INTERACTIVE)
+        broadcast_wait = await limiter.acquire(3, BROADCAST)
+        return reply_wait, broadcast_wait
+
+    reply_wait, broadcast_wait = asyncio.run(run())
+    assert reply_wait < 0.02
+    assert broadcast_wait >= 0.09
+    assert limiter.stats()['retry_afters'] == 1
+    print(f"✅ Send limiter: рассылка ждала паузу {broadcast_wait:.2f} с")
+
+
+if __name__ == "__main__":
+    test_chat_and_global_rate()
+    test_interactive_before_broadcast()
+    test_retry_after_pauses_broadcast()
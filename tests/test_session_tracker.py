@@ -0,0 +1,69 @@
+"""
+Тест сессий в памяти (core/session_tracker.py): продление запросом,
+закрытие через 30 минут тишины по колесу таймеров, новая сессия после паузы.
+
+Запуск: python -m pytest tests/test_session_tracker.py -v -s
+Или просто: python tests/test_session_tracker.py
+"""
+
+import sys
+import os
+from datetime import datetime, timedelta, timezone
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+T0 = datetime(2026, 3, 2, 9, 0, 0, tzinfo=timezone.utc)
+
+
+def minutes(n: float) -> datetime:
+    return T0 + timedelta(minutes=n)
+
+
+def test_timeout_from_last_request():
+    """Сессия живёт 30 минут после последнего запроса, а не после начала"""
+    try:
+        from core.session_tracker import SessionTracker
+    except ImportError:
+        print("⏭️ Session tracker: пропущен (нет зависимостей бота)")
+        return
+
+    tracker = SessionTracker(timeout_sec=1800, tick_sec=60)
+    tracker.touch(1, "/learn", minutes(0))
+    tracker.touch(1, "cb:next", minutes(20))
+    tracker.touch(2, "/feed", minutes(5))
+
+    # 40-я минута: у 2 — 35 минут тишины, у 1 — только 20
+    assert [s.chat_id for s in tracker.expire(minutes(40))] == [2]
+    closed = tracker.expire(minutes(50.5))
+    assert [s.chat_id for s in closed] == [1]
+    row = closed[0].row()
+    assert row['request_count'] == 2 and row['duration_seconds'] == 20 * 60
+    assert row['entry_point'] == "/learn" and row['exit_point'] == "cb:next"
+    assert len(tracker) == 0
+    print("✅ Session tracker: закрытие по тишине, длительность до последнего запроса")
+
+
+def test_touch_after_pause_starts_new_session():
+    """Запрос после паузы > timeout закрывает старую сессию до обхода колеса"""
+    try:
+        from core.session_tracker import SessionTracker
+    except ImportError:
+        print("⏭️ Session tracker: пропущен (нет зависимостей бота)")
+        return
+
+    tracker = SessionTracker(timeout_sec=1800, tick_sec=60)
+    tracker.touch(1, "/learn", minutes(0))
+    tracker.touch(1, "/feed", minutes(45))
+
+    closed = tracker.expire(minutes(46))
+    assert len(closed) == 1 and closed[0].request_count == 1
+    active = tracker.active()
+    assert len(active) == 1 and active[0].started_at == minutes(45)
+    assert active[0].dirty
+    print("✅ Session tracker: новая сессия после паузы")
+
+
+if __name__ == "__main__":
+    test_timeout_from_last_request()
+    test_touch_after_pause_starts_new_session()
@@ -0,0 +1,125 @@
+"""
+Тест потокового вывода в Telegram (helpers/telegram_stream.py):
+первый абзац уходит сразу, правки не чаще интервала, перенос в новое
+сообщение при переполнении, finish() — окончательный текст и клавиатура.
+
+Запуск: python -m pytest tests/test_telegram_stream.py -v -s
+Или просто: python tests/test_telegram_stream.py
+"""
+
+import sys
+import os
+import asyncio
+import time
+from types import SimpleNamespace
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeBot:
+    """Запоминает вызовы Telegram API и текущий текст сообщений."""
+
+    def __init__(self):
+        self.calls = []
+        self.messages = {}
+        self._next_id = 1
+
+    async def send_message(self, chat_id, text, parse_mode=None, reply_markup=None):
+        message_id = self._next_id
+        self._next_id += 1
+        self.messages[message_id] = text
+        self.calls.append(("send", message_id, time.monotonic(), reply_markup))
+        return SimpleNamespace(message_id=message_id)
+
+    async def edit_message_text(self, text, chat_id, message_id, parse_mode=None, reply_markup=None):
+        self.messages[message_id] = text
+        self.calls.append(("edit", message_id, time.monotonic(), reply_markup))
+
+    async def delete_message(self, chat_id, message_id):
+        del self.messages[message_id]
+        self.calls.append(("delete", message_id, time.monotonic(), None))
+
+
+def _chunk(text="", reset=False):
+    return SimpleNamespace(text=text, reset=reset)
+
+
+def test_first_paragraph_then_throttled_edits():
+    """Незавершённый абзац не показывается, правки идут с интервалом"""
+    from helpers.telegram_stream import TelegramStreamRenderer
+
+    async def run():
+        bot = FakeBot()
+        renderer = TelegramStreamRenderer(bot, chat_id=1, min_interval=0.05)
+        await renderer.feed(_chunk("Первый **абзац"))
+        await asyncio.sleep(0.01)
+        assert not bot.calls  # абзац не закончен
+
+        await renderer.feed(_chunk("** готов.\n\nВторой"))
+        await asyncio.sleep(0.01)
+        assert [c[0] for c in bot.calls] == ["send"]
+        assert bot.messages[1] == "Первый <b>абзац</b> готов."
+
+        for i in range(5):
+            await renderer.feed(_chunk(f" абзац {i}.\n\nЕщё"))
+            await asyncio.sleep(0.005)
+        await asyncio.sleep(0.12)
+
+        edits = [c for c in bot.calls if c[0] == "edit"]
+        assert 1 <= len(edits) <= 3  # 5 абзацев схлопнулись в пару правок
+        gaps = [b[2] - a[2] for a, b in zip(bot.calls, bot.calls[1:])]
+        assert all(gap >= 0.045 for gap in gaps)
+
+        await renderer.finish(renderer.text, reply_markup="kb")
+        assert bot.calls[-1][0] == "edit" and bot.calls[-1][3] == "kb"
+        assert bot.messages[1].endswith("Ещё")
+        return bot
+
+    bot = asyncio.run(run())
+    print(f"✅ Stream: {len(bot.calls)} вызовов API на 7 абзацев")
+
+
+def test_rollover_and_reset():
+    """Переполнение → новое сообщение; reset + finish убирают лишнее"""
+    from helpers.telegram_stream import TelegramStreamRenderer
+
+    async def run():
+        bot = FakeBot()
+        renderer = TelegramStreamRenderer(bot, chat_id=1, min_interval=0.0, max_len=100)
+        for i in range(6):
+            await renderer.feed(_chunk(f"Абзац номер {i}: " + "слово " * 5 + "\n\n"))
+            await asyncio.sleep(0.005)
+        await asyncio.sleep(0.02)
+        assert len(bot.messages) >= 2
+        assert all(len(text) <= 100 for text in bot.messages.values())
+
+        # Раунд ушёл в tool_use: ответ начинается заново и он короче
+        await renderer.feed(_chunk(reset=True))
+        await renderer.feed(_chunk("Короткий ответ"))
+        await renderer.finish("Короткий ответ", reply_markup="kb")
+        assert list(bot.messages.values()) == ["Короткий ответ"]
+        assert any(c[0] == "delete" for c in bot.calls)
+
+    asyncio.run(run())
+    print("✅ Stream: перенос по 4000 символов и сброс преамбулы")
+
+
+def test_finish_without_stream_sends_answer():
+    """Поток ничего не показал (FAQ, ошибка) — finish просто отправляет ответ"""
+    from helpers.telegram_stream import TelegramStreamRenderer
+
+    async def run():
+        bot = FakeBot()
+        renderer = TelegramStreamRenderer(bot, chat_id=1)
+        await renderer.finish("Ответ из FAQ", reply_markup="kb")
+        assert bot.calls == [("send", 1, bot.calls[0][2], "kb")]
+
+    asyncio.run(run())
+    print("✅ Stream: ответ без потока")
+
+
+if __name__ == "__main__":
+    test_first_paragraph_then_throttled_edits()
+    test_rollover_and_reset()
+    test_finish_without_stream_sends_answer()
@@ -0,0 +1,87 @@
+"""
+Тест буфера телеметрии (core/telemetry.py): 300 апдейтов от 3 пользователей —
+один COPY трейсов, контрольная точка сессий, last_active_date раз в день на пользователя,
+переполнение считается в dropped.
+
+Запуск: python -m pytest tests/test_telemetry.py -v -s
+Или просто: python tests/test_telemetry.py
+"""
+
+import sys
+import os
+import asyncio
+from datetime import date
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_batched_flush():
+    """Агрегация сессий, дедупликация DAU, ограничение очереди"""
+    try:
+        import core.telemetry as telemetry
+        import db.queries.traces as traces
+        import db.queries.sessions as sessions
+        import db.queries.activity as activity
+    except ImportError:
+        print("⏭️ Telemetry: пропущен (нет зависимостей бота)")
+        return
+
+    writes = {'traces': [], 'sessions': [], 'active': []}
+
+    async def fake_traces(records):
+        writes['traces'].append(len(records))
+
+    async def fake_sessions(rows):
+        writes['sessions'].append({r['chat_id']: r for r in rows})
+        return [r['id'] or 100 + r['chat_id'] for r in rows]
+
+    async def fake_active(chat_ids, today):
+        writes['active'].append(sorted(chat_ids))
+
+    patches = [
+        (traces, 'insert_traces', fake_traces),
+        (sessions, 'save_sessions', fake_sessions),
+        (activity, 'touch_last_active_dates', fake_active),
+    ]
+    originals = [(obj, name, getattr(obj, name)) for obj, name, _ in patches]
+    for obj, name, fn in patches:
+        setattr(obj, name, fn)
+
+    async def run():
+        writer = telemetry.TelemetryWriter(flush_interval=60, batch_size=1000, max_traces=250,
+                                           checkpoint_interval=0)
+        today = date(2026, 3, 2)
+        for i in range(300):
+            chat_id = 1 + i % 3
+            writer.record_trace((f"t{i}", chat_id, "cb:x", "s", 1.0, "[]", None))
+            writer.record_request(chat_id, "/learn" if i < 3 else "cb:next", today)
+        await writer.flush()
+        # Тот же день: last_active не повторяется; новый день — снова
+        writer.record_request(1, "cb:next", today)
+        await writer.flush()
+        writer.record_request(1, "cb:next", date(2026, 3, 3))
+        await writer.flush()
+        return writer
+
+    try:
+        writer = asyncio.run(run())
+    finally:
+        for obj, name, fn in originals:
+            setattr(obj, name, fn)
+
+    assert writes['traces'] == [250]
+    assert writer.stats()['dropped']['traces'] == 50
+    first = writes['sessions'][0]
+    assert first[1]['request_count'] == 100 and first[1]['id'] is None
+    assert first[1]['commands'] == '["/learn", "cb:next"]'
+    assert first[1]['exit_point'] == 'cb:next' and first[1]['ended_at'] is None
+    second = writes['sessions'][1]  # следующая контрольная точка — только изменившаяся, уже с id
+    assert list(second) == [1] and second[1]['id'] == 101 and second[1]['request_count'] == 101
+    assert writes['active'] == [[1, 2, 3], [1]]  # 3 за первый день, 1 — за второй
+    print(f"✅ Telemetry: 300 апдейтов → {len(writes['traces'])} COPY, "
+          f"{len(writes['sessions'])} пачки сессий, {len(writes['active'])} UPDATE last_active")
+
+
+if __name__ == "__main__":
+    test_batched_flush()
@@ -0,0 +1,71 @@
+"""
+Тест индекса метаданных тем (core/helpers.py::get_topic_index):
+построение из YAML, холодный старт из pickle-кэша, перестройка при изменении файла.
+
+Запуск: python -m pytest tests/test_topic_index.py -v -s
+Или просто: python tests/test_topic_index.py
+"""
+
+import sys
+import os
+import tempfile
+from pathlib import Path
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_index_cache_and_reload():
+    """YAML → индекс → pickle; новый процесс читает кэш; правка файла → перестройка"""
+    try:
+        import core.helpers as helpers
+    except ImportError:
+        print("⏭️ Topic index: пропущен (нет зависимостей бота)")
+        return
+
+    names = ('TOPICS_DIR', 'TOPIC_INDEX_CACHE_PATH', 'TOPIC_INDEX_CHECK_SEC',
+             '_topic_index', '_topic_index_signature', '_topic_index_checked_at')
+    originals = {name: getattr(helpers, name) for name in names}
+    parsed = []
+    parse = helpers._parse_topic_files
+
+    def counting_parse(signature):
+        parsed.append(len(signature))
+        return parse(signature)
+
+    def new_process():
+        helpers._topic_index_signature = None
+        helpers._topic_index_checked_at = float('-inf')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        topics = Path(tmp) / "topics"
+        topics.mkdir()
+        (topics / "1-1-a.yaml").write_text("id: 1-1-a\ntitle: A\n", encoding='utf-8')
+        (topics / "_index.yaml").write_text("id: ignored\n", encoding='utf-8')
+        helpers.TOPICS_DIR = topics
+        helpers.TOPIC_INDEX_CACHE_PATH = Path(tmp) / "data" / "topic_index.pickle"
+        helpers.TOPIC_INDEX_CHECK_SEC = 0
+        helpers._parse_topic_files = counting_parse
+        try:
+            new_process()
+            assert helpers.load_topic_metadata('1-1-a')['title'] == 'A'
+            assert helpers.load_topic_metadata('ignored') is None
+            assert helpers.TOPIC_INDEX_CACHE_PATH.exists()
+
+            new_process()
+            assert helpers.load_topic_metadata('1-1-a')['title'] == 'A'
+            assert parsed == [1]  # второй «процесс» — из кэша, без YAML
+
+            (topics / "1-1-a.yaml").write_text("id: 1-1-a\ntitle: A2\n", encoding='utf-8')
+            assert helpers.load_topic_metadata('1-1-a')['title'] == 'A2'
+            assert parsed == [1, 1]
+        finally:
+            helpers._parse_topic_files = parse
+            for name, value in originals.items():
+                setattr(helpers, name, value)
+
+    print("✅ Topic index: YAML → кэш → перестройка при изменении")
+
+
+if __name__ == "__main__":
+    test_index_cache_and_reload()